@@ -0,0 +1,170 @@
+"""Read and write SAF-T (AO) XML inside ``.zip``, ``.gz`` and ``.xz`` files.
+
+SAF-T files are usually exchanged compressed (``*.xml.zip``). The helpers in
+this module let the commands parse them without extracting to disk: the
+archive member is decompressed while lxml reads it. Plain files keep being
+passed to lxml by name, so nothing changes for uncompressed input.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import gzip
+import lzma
+import zipfile
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+from lxml import etree
+
+COMPRESSIONS = ("zip", "gz", "xz")
+"""Compression formats accepted for input and for the autofix output."""
+
+_SUFFIXES = {f".{name}": name for name in COMPRESSIONS}
+
+
+def compression_of(path: Path | str) -> str | None:
+    """Return ``"zip"``, ``"gz"`` or ``"xz"`` from the suffix of *path*."""
+
+    return _SUFFIXES.get(Path(path).suffix.lower())
+
+
+def is_compressed(path: Path | str) -> bool:
+    """Return whether *path* names a supported compressed file."""
+
+    return compression_of(path) is not None
+
+
+def logical_name(path: Path | str) -> str:
+    """File name of the XML inside *path* (``a.xml.zip`` -> ``a.xml``).
+
+    Archives named without the inner extension (``a.zip``) map to ``a.xml``.
+    """
+
+    path = Path(path)
+    if not is_compressed(path):
+        return path.name
+    name = path.stem
+    if Path(name).suffix.lower() != ".xml":
+        name += ".xml"
+    return name
+
+
+def source_stem(path: Path | str) -> str:
+    """Stem of the XML inside *path* (``a_v.02.xml.zip`` -> ``a_v.02``)."""
+
+    return Path(logical_name(path)).stem
+
+
+def _zip_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    xml_members = [info for info in members if info.filename.lower().endswith(".xml")]
+    if xml_members:
+        return xml_members[0]
+    if len(members) == 1:
+        return members[0]
+    raise ValueError(f"No XML file found in {archive.filename}")
+
+
+@contextlib.contextmanager
+def open_xml(path: Path | str) -> Iterator[IO[bytes]]:
+    """Open the XML in *path* for binary reading, decompressing on the fly.
+
+    For ``.zip`` files the first ``*.xml`` member is used (or the only
+    member, whatever its name).
+    """
+
+    kind = compression_of(path)
+    if kind == "zip":
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(_zip_member(archive)) as handle:
+                yield handle
+    elif kind == "gz":
+        with gzip.open(path, "rb") as handle:
+            yield handle
+    elif kind == "xz":
+        with lzma.open(path, "rb") as handle:
+            yield handle
+    else:
+        with open(path, "rb") as handle:
+            yield handle
+
+
+@contextlib.contextmanager
+def xml_source(path: Path | str) -> Iterator[Any]:
+    """Source for :func:`lxml.etree.parse`/``iterparse``.
+
+    Plain files are given to lxml by name (libxml2 reads them directly);
+    compressed files as a decompressing file object.
+    """
+
+    if is_compressed(path):
+        with open_xml(path) as handle:
+            yield handle
+    else:
+        yield str(path)
+
+
+def read_xml_bytes(path: Path | str) -> bytes:
+    """Return the (decompressed) XML bytes stored in *path*."""
+
+    with open_xml(path) as handle:
+        return handle.read()
+
+
+def parse_xml(
+    path: Path | str, parser: etree.XMLParser | None = None
+) -> etree._ElementTree:
+    """:func:`lxml.etree.parse` for plain or compressed *path*."""
+
+    with xml_source(path) as source:
+        return etree.parse(source, parser)
+
+
+@contextlib.contextmanager
+def open_output(path: Path | str) -> Iterator[IO[bytes]]:
+    """Open *path* for writing, compressing according to its suffix.
+
+    A ``.zip`` output holds a single member named :func:`logical_name`.
+    """
+
+    path = Path(path)
+    kind = compression_of(path)
+    if kind == "zip":
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(logical_name(path), "w", force_zip64=True) as handle:
+                yield handle
+    elif kind == "gz":
+        with gzip.open(path, "wb") as handle:
+            yield handle
+    elif kind == "xz":
+        with lzma.open(path, "wb") as handle:
+            yield handle
+    else:
+        with open(path, "wb") as handle:
+            yield handle
+
+
+def write_tree(tree: etree._ElementTree, path: Path | str, **options: Any) -> None:
+    """``tree.write(path, **options)``, compressing for compressed suffixes."""
+
+    if not is_compressed(path):
+        tree.write(str(path), **options)
+        return
+    with open_output(path) as handle:
+        tree.write(handle, **options)
+
+
+__all__ = [
+    "COMPRESSIONS",
+    "compression_of",
+    "is_compressed",
+    "logical_name",
+    "open_output",
+    "open_xml",
+    "parse_xml",
+    "read_xml_bytes",
+    "source_stem",
+    "write_tree",
+    "xml_source",
+]
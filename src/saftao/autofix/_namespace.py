@@ -45,9 +45,20 @@ def _normalise_node_namespace(node: etree._Element, namespace: str) -> None:
 
 
 def normalise_customer_namespace(
-    root: etree._Element, namespace: str, *, on_fix: Callable[[str], None] | None = None
+    root: etree._Element,
+    namespace: str,
+    *,
+    on_fix: Callable[[str], None] | None = None,
+    cleanup: bool = True,
+    select: Callable[[etree._Element], bool] | None = None,
 ) -> bool:
-    """Rewrite ``Customer`` blocks so that they use the default namespace."""
+    """Rewrite ``Customer`` blocks so that they use the default namespace.
+
+    ``select``, when given, limits the rewrite to the customers it accepts.
+    With ``cleanup=False`` the unused namespace declarations are left in place
+    so the caller can run :func:`lxml.etree.cleanup_namespaces` once the whole
+    document is known (streaming fixes only hold part of it).
+    """
 
     ns = {"n": namespace}
     masterfiles = root.find(".//n:MasterFiles", namespaces=ns)
@@ -59,6 +70,8 @@ def normalise_customer_namespace(
     for customer in customers:
         if not _subtree_has_prefixed_nodes(customer, namespace):
             continue
+        if select is not None and not select(customer):
+            continue
 
         customer_id_el = customer.find(f"./{{{namespace}}}CustomerID")
         if customer_id_el is None:
@@ -75,7 +88,7 @@ def normalise_customer_namespace(
         if on_fix is not None:
             on_fix(customer_id)
 
-    if changed:
+    if changed and cleanup:
         etree.cleanup_namespaces(root)
 
     return changed
@@ -0,0 +1,342 @@
+"""Table-driven line and totals fixes shared by the autofix commands.
+
+``SalesInvoices/Invoice`` and ``WorkingDocuments/WorkDocument`` are fixed the
+same way: every line gets ``DebitAmount``/``CreditAmount`` set to
+``q2(Quantity × UnitPrice)``, a ``Tax`` block with a formatted
+``TaxPercentage`` and a matching ``TaxTableEntry``, and the
+``DocumentTotals`` are recomputed from the lines. :class:`DocumentFamily`
+holds the element names of each family and :class:`LineFixRules` what the
+soft and hard commands do differently (gross identity, ``Tax`` and ordering
+helpers); :class:`DocumentFixer` is the single loop that applies them.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from lxml import etree
+
+from .. import money
+from ..utils import LazyXPath
+
+
+@dataclass(frozen=True)
+class DocumentFamily:
+    """Element names of a family of documents with lines and totals."""
+
+    document: str
+    number: str
+    totals_note: Optional[str] = None
+    """``note`` of the log row written when ``DocumentTotals`` is created."""
+
+
+INVOICE = DocumentFamily("Invoice", "InvoiceNo")
+WORK_DOCUMENT = DocumentFamily("WorkDocument", "DocumentNumber", "WorkDocument")
+
+
+@dataclass(frozen=True)
+class Identity:
+    """How ``GrossTotal`` is derived from the line totals (in micro-units)."""
+
+    note: str
+    gross: Callable[[int, int, etree._Element, str], int]
+
+
+def _gross_full(net: int, tax: int, totals: etree._Element, nsuri: str) -> int:
+    net2 = money.micros_to_cents(net)
+    tax2 = money.micros_to_cents(tax)
+    settlement = money.ZERO
+    withholding = money.ZERO
+
+    amount = totals.find(f"{{{nsuri}}}Settlement/{{{nsuri}}}SettlementAmount")
+    if amount is not None and (amount.text or "").strip():
+        settlement = money.parse_scaled(amount.text, money.ZERO)
+    for tax_el in totals.iterchildren(f"{{{nsuri}}}WithholdingTax"):
+        amount = tax_el.find(f"{{{nsuri}}}WithholdingTaxAmount")
+        if amount is not None and (amount.text or "").strip():
+            withholding = money.add(
+                withholding, money.parse_scaled(amount.text, money.ZERO)
+            )
+    return money.q2(
+        money.add((net2 + tax2, 2), money.neg(money.add(settlement, withholding)))
+    )
+
+
+def _gross_net_plus_tax(net: int, tax: int, totals: etree._Element, nsuri: str) -> int:
+    return money.micros_to_cents(net + tax)
+
+
+FULL_IDENTITY = Identity(
+    "Identidade completa: Net - Settlement + Tax - Withholding", _gross_full
+)
+"""``GrossTotal = q2(Net) - Settlement + q2(Tax) - Withholding``."""
+
+NET_PLUS_TAX = Identity("Identidade simples: Net + Tax", _gross_net_plus_tax)
+"""``GrossTotal = q2(Net + Tax)``, without settlement or withholding."""
+
+
+@dataclass(frozen=True)
+class LineFixRules:
+    """What a command does around the shared line and totals arithmetic.
+
+    ``format_percentage`` formats ``TaxPercentage`` texts,
+    ``tax_region(tax, owner, line, xpath)`` fixes ``TaxCountryRegion``,
+    ``tax_entry(type, code, percentage, owner, line, xpath)`` makes sure the
+    ``TaxTableEntry`` exists and the two ordering hooks reorder the touched
+    ``Line`` and ``DocumentTotals``. With ``drop_duplicate_credit`` a line
+    carrying both amounts keeps only ``DebitAmount``.
+    """
+
+    identity: Identity
+    format_percentage: Callable[[str], str]
+    tax_region: Callable[..., None]
+    tax_entry: Callable[..., None]
+    line_order: Callable[[etree._Element], None]
+    totals_order: Callable[[etree._Element], None]
+    drop_duplicate_credit: bool = False
+
+
+class _NullLog:
+    def log(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+_LINE_FIELDS = ("Quantity", "UnitPrice", "DebitAmount", "CreditAmount", "Tax")
+_TAX_FIELDS = ("TaxType", "TaxCode", "TaxPercentage")
+_TOTALS = ("TaxPayable", "NetTotal", "GrossTotal")
+
+
+@lru_cache(maxsize=None)
+def _qualified(nsuri: str) -> dict[str, str]:
+    names = ("Line", "DocumentTotals", "TaxCountryRegion")
+    names += _LINE_FIELDS + _TAX_FIELDS + _TOTALS
+    return {name: f"{{{nsuri}}}{name}" for name in names}
+
+
+def _children(element: etree._Element) -> dict[Any, etree._Element]:
+    """First child per tag, gathered in a single pass over ``element``."""
+
+    fields: dict[Any, etree._Element] = {}
+    for child in element:
+        fields.setdefault(child.tag, child)
+    return fields
+
+
+def _text(element: Optional[etree._Element]) -> Optional[str]:
+    return None if element is None else (element.text or "").strip()
+
+
+class DocumentFixer:
+    """Fix the lines, ``Tax`` blocks and totals of one document family.
+
+    Build one fixer per document run and call :meth:`fix` for each document;
+    the qualified tag names are resolved once. Without ``logger`` nothing is
+    logged.
+    """
+
+    def __init__(
+        self,
+        family: DocumentFamily,
+        nsuri: str,
+        rules: LineFixRules,
+        logger: Any = None,
+    ) -> None:
+        self.family = family
+        self.nsuri = nsuri
+        self.rules = rules
+        self.logger = logger if logger is not None else _NullLog()
+        self._tags = _qualified(nsuri)
+        self._number = f"{{{nsuri}}}{family.number}"
+
+    def fix(
+        self,
+        document: etree._Element,
+        processed_tax_nodes: set[int],
+        path_of: Callable[[Any], Any] = LazyXPath,
+    ) -> None:
+        """Fix ``document`` in place; ``path_of`` gives the logged XPath."""
+
+        tags, rules, log = self._tags, self.rules, self.logger.log
+        owner = _text(document.find(self._number)) or ""
+        doc_totals = document.find(tags["DocumentTotals"])
+        if doc_totals is None:
+            doc_totals = etree.SubElement(document, tags["DocumentTotals"])
+            if self.family.totals_note is None:
+                log("ADD_NODE", "Criado DocumentTotals", invoice=owner)
+            else:
+                log(
+                    "ADD_NODE",
+                    "Criado DocumentTotals",
+                    invoice=owner,
+                    note=self.family.totals_note,
+                )
+
+        # Acumuladores em micro-unidades (ver saftao.money)
+        net_total = 0
+        tax_total = 0
+        for idx, line in enumerate(document.findall(tags["Line"]), start=1):
+            base, vat = self._fix_line(line, idx, owner, processed_tax_nodes, path_of)
+            net_total += base
+            tax_total += vat
+
+        values = {
+            "TaxPayable": money.micros_to_cents(tax_total),
+            "NetTotal": money.micros_to_cents(net_total),
+            "GrossTotal": rules.identity.gross(
+                net_total, tax_total, doc_totals, self.nsuri
+            ),
+        }
+        current = _children(doc_totals)
+        for name in _TOTALS:
+            el = current.get(tags[name])
+            old = _text(el) if el is not None else ""
+            if el is None:
+                el = etree.SubElement(doc_totals, tags[name])
+            new = money.format_cents(values[name])
+            if old != new:
+                log(
+                    "FIX_TOTAL",
+                    f"{name} ajustado",
+                    invoice=owner,
+                    field=name,
+                    old_value=old or "",
+                    new_value=new,
+                    note=rules.identity.note,
+                )
+            el.text = new
+        rules.totals_order(doc_totals)
+
+    def _fix_line(
+        self,
+        line: etree._Element,
+        idx: int,
+        owner: str,
+        processed_tax_nodes: set[int],
+        path_of: Callable[[Any], Any],
+    ) -> tuple[int, int]:
+        tags, rules, log = self._tags, self.rules, self.logger.log
+        line_no = str(idx)
+        xpath = path_of(line)
+        fields = _children(line)
+
+        qty = money.parse_scaled(_text(fields.get(tags["Quantity"])), money.ZERO)
+        unit = money.parse_scaled(_text(fields.get(tags["UnitPrice"])), money.ZERO)
+        base = money.line_base(qty, unit)
+        amount = money.format_cents(money.micros_to_cents(base))
+
+        debit_el = fields.get(tags["DebitAmount"])
+        credit_el = fields.get(tags["CreditAmount"])
+        if (debit_el is None) != (credit_el is None):
+            # Ajuste de montante por linha (mantém-se o campo já existente)
+            name = "DebitAmount" if credit_el is None else "CreditAmount"
+            el = debit_el if credit_el is None else credit_el
+            old = _text(el) or ""
+            if old != amount:
+                log(
+                    "FIX_LINE_AMOUNT",
+                    f"{name} ajustado para q2(qty*unit)",
+                    invoice=owner,
+                    line=line_no,
+                    field=name,
+                    old_value=old,
+                    new_value=amount,
+                    xpath=xpath,
+                )
+            el.text = amount
+        else:
+            # ambos presentes ou ambos ausentes -> DebitAmount
+            if debit_el is None:
+                debit_el = etree.SubElement(line, tags["DebitAmount"])
+                log(
+                    "ADD_NODE",
+                    "Adicionado DebitAmount na linha",
+                    invoice=owner,
+                    line=line_no,
+                    field="DebitAmount",
+                    xpath=xpath,
+                )
+            elif rules.drop_duplicate_credit:
+                line.remove(credit_el)
+                log(
+                    "REMOVE_NODE",
+                    "Removido CreditAmount (duplicado)",
+                    invoice=owner,
+                    line=line_no,
+                    field="CreditAmount",
+                    xpath=xpath,
+                )
+            debit_el.text = amount
+
+        tax = fields.get(tags["Tax"])
+        if tax is None:
+            tax = etree.SubElement(line, tags["Tax"])
+            for name, text in (
+                ("TaxType", "IVA"),
+                ("TaxCode", "NOR"),
+                ("TaxCountryRegion", "AO"),
+                ("TaxPercentage", "14"),
+            ):
+                etree.SubElement(tax, tags[name]).text = text
+            log(
+                "ADD_NODE",
+                "Criado bloco Tax na linha",
+                invoice=owner,
+                line=line_no,
+                field="Tax",
+                xpath=xpath,
+            )
+
+        tax_fields = _children(tax)
+        ttype = _text(tax_fields.get(tags["TaxType"])) or "IVA"
+        tcode = _text(tax_fields.get(tags["TaxCode"])) or "NOR"
+        tperc_el = tax_fields.get(tags["TaxPercentage"])
+        if tperc_el is None:
+            tperc_el = etree.SubElement(tax, tags["TaxPercentage"])
+            tperc_el.text = "14"
+            log(
+                "ADD_NODE",
+                "Adicionado TaxPercentage em Tax",
+                invoice=owner,
+                line=line_no,
+                field="TaxPercentage",
+                new_value="14",
+                xpath=xpath,
+            )
+        else:
+            old = _text(tperc_el) or ""
+            new = rules.format_percentage(old or "0")
+            if old != new:
+                log(
+                    "FIX_TAX_PERCENT",
+                    "Formatado TaxPercentage (inteiro ou 2 casas)",
+                    invoice=owner,
+                    line=line_no,
+                    field="TaxPercentage",
+                    old_value=old,
+                    new_value=new,
+                    xpath=xpath,
+                )
+            tperc_el.text = new
+
+        rules.tax_region(tax, owner, idx, xpath)
+        processed_tax_nodes.add(id(tax))
+
+        tperc = money.parse_scaled(tperc_el.text, money.ZERO)
+        vat = money.line_tax(base, tperc)
+        rules.tax_entry(ttype, tcode, money.scaled_str(tperc), owner, idx, xpath)
+        rules.line_order(line)
+        return base, vat
+
+
+__all__ = [
+    "DocumentFamily",
+    "DocumentFixer",
+    "FULL_IDENTITY",
+    "INVOICE",
+    "Identity",
+    "LineFixRules",
+    "NET_PLUS_TAX",
+    "WORK_DOCUMENT",
+]
@@ -0,0 +1,131 @@
+"""Limit the autofix to what a validation issue log points at.
+
+A :class:`FixScope` is built from the rows of a ``validate`` log (see
+:func:`saftao.logging.read_issue_log`) and tells the fixers whether a
+document, a ``MasterFiles`` entry or the ``Header`` was referenced:
+
+* documents by their number (``invoice`` column or ``document_id``);
+* customers by ``CustomerID`` (``customer_id``);
+* entries and the ``Header`` by the XPath of any issue below them;
+* anything by the source line of an ``XSD_ERROR`` inside it;
+* the ``Header`` also by the ``HDR_*``/``HEADER_*`` codes.
+"""
+
+from __future__ import annotations
+
+import json
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Mapping, Optional
+
+from lxml import etree
+
+from ..logging import read_issue_log
+
+_NUMBERS = ("InvoiceNo", "DocumentNumber", "PaymentRefNo")
+_KINDS = ("Invoice", "WorkDocument", "Payment")
+_HEADER_CODES = ("HDR_", "HEADER_")
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _extra(value: Any) -> dict[str, Any]:
+    if isinstance(value, dict):
+        return value
+    try:
+        extra = json.loads(_text(value) or "{}")
+    except ValueError:
+        return {}
+    return extra if isinstance(extra, dict) else {}
+
+
+@dataclass
+class FixScope:
+    """Documents and ``MasterFiles`` entries referenced by an issue log."""
+
+    documents: set[str] = field(default_factory=set)
+    customers: set[str] = field(default_factory=set)
+    paths: set[str] = field(default_factory=set)
+    """Issue XPaths and all their ancestors."""
+    lines: list[int] = field(default_factory=list)
+    """Sorted source lines of the ``XSD_ERROR`` rows."""
+    header: bool = False
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> "FixScope":
+        scope = cls()
+        lines: set[int] = set()
+        for row in rows:
+            code = _text(row.get("code"))
+            extra = _extra(row.get("extra"))
+            number = _text(row.get("invoice"))
+            kind, _, rest = number.partition(" ")
+            if kind in _KINDS and rest.strip():
+                # ``"Invoice FT 1/2"``: document_type + document_id
+                number = rest.strip()
+            if number:
+                scope.documents.add(number)
+            for key, target in (
+                ("document_id", scope.documents),
+                ("customer_id", scope.customers),
+            ):
+                value = _text(extra.get(key))
+                if value:
+                    target.add(value)
+            xpath = _text(row.get("xpath"))
+            while xpath.startswith("/") and xpath not in scope.paths:
+                scope.paths.add(xpath)
+                xpath = xpath.rsplit("/", 1)[0]
+            if code == "XSD_ERROR" and _text(row.get("line")).isdigit():
+                lines.add(int(_text(row.get("line"))))
+            if code.startswith(_HEADER_CODES):
+                scope.header = True
+        scope.lines = sorted(lines)
+        return scope
+
+    def covers(self, element: etree._Element, path: Optional[str] = None) -> bool:
+        """Whether ``element`` (at XPath ``path``, if known) was referenced.
+
+        Documents are matched without ``path``: every row the validator
+        writes for a document carries its number.
+        """
+
+        local = etree.QName(element).localname
+        if local == "Header" and self.header:
+            return True
+        if path is not None and path in self.paths:
+            return True
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            name = etree.QName(child).localname
+            if name in _NUMBERS:
+                if _text(child.text) in self.documents:
+                    return True
+            elif name == "CustomerID" and local == "Customer":
+                if _text(child.text) in self.customers:
+                    return True
+        return self._has_line(element)
+
+    def _has_line(self, element: etree._Element) -> bool:
+        start = element.sourceline
+        if not self.lines or start is None:
+            return False
+        last = element
+        while len(last):
+            last = last[-1]
+        end = last.sourceline or start
+        index = bisect_left(self.lines, start)
+        return index < len(self.lines) and self.lines[index] <= end
+
+
+def load_scope(path: Path | str) -> FixScope:
+    """Build a :class:`FixScope` from an issue log (xlsx, csv, jsonl, sqlite)."""
+
+    return FixScope.from_rows(read_issue_log(path))
+
+
+__all__ = ["FixScope", "load_scope"]
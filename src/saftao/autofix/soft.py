@@ -2,19 +2,21 @@
 
 from __future__ import annotations
 
+import contextlib
 import functools
 import os
+import sqlite3
 import unicodedata
-from dataclasses import dataclass
-from math import ceil
+from dataclasses import dataclass, fields
 from pathlib import Path
-from typing import Iterable, Sequence, TYPE_CHECKING
+from typing import Iterable, Iterator, Sequence, TYPE_CHECKING
 
 if TYPE_CHECKING:
     import tkinter as tk
 
 from lxml import etree
 
+from ..cache import CACHE_DIRNAME
 from ..logging import ExcelLogger, ExcelLoggerConfig
 from ..rules import (
     collect_invoice_customer_ids,
@@ -66,6 +68,13 @@ class _CustomerRecord:
     shipping_country: str = ""
 
 
+_RECORD_FIELDS = tuple(
+    field.name for field in fields(_CustomerRecord) if field.name != "source_path"
+)
+_CUSTOMER_INDEX_VERSION = 1
+_SQLITE_MAX_PARAMS = 500
+
+
 def apply_soft_fixes(path: Path) -> Iterable[ValidationIssue]:
     """Apply non-destructive corrections to the given file.
 
@@ -110,26 +119,34 @@ def normalize_invoice_type_vd_tree(
 
     issues: list[ValidationIssue] = []
     for invoice in invoices:
-        invoice_type = _find_child(invoice, "InvoiceType", ns_uri)
-        if invoice_type is None:
-            continue
-        value = (invoice_type.text or "").strip()
-        if value.upper() != "VD":
-            continue
-
-        invoice_no = _find_child_text(invoice, "InvoiceNo", ns_uri) or "(sem número)"
-        invoice_type.text = "FR"
-        issues.append(
-            ValidationIssue(
-                f"Invoice '{invoice_no}': InvoiceType 'VD' substituído por 'FR'.",
-                code="FIX_INVOICE_TYPE",
-                details={"invoice": invoice_no},
-            )
-        )
+        issue = normalize_invoice_type_vd_invoice(invoice, ns_uri)
+        if issue is not None:
+            issues.append(issue)
 
     return issues
 
 
+def normalize_invoice_type_vd_invoice(
+    invoice: etree._Element, ns_uri: str
+) -> ValidationIssue | None:
+    """Apply the ``VD`` → ``FR`` normalisation to a single ``Invoice``."""
+
+    invoice_type = _find_child(invoice, "InvoiceType", ns_uri)
+    if invoice_type is None:
+        return None
+    value = (invoice_type.text or "").strip()
+    if value.upper() != "VD":
+        return None
+
+    invoice_no = _find_child_text(invoice, "InvoiceNo", ns_uri) or "(sem número)"
+    invoice_type.text = "FR"
+    return ValidationIssue(
+        f"Invoice '{invoice_no}': InvoiceType 'VD' substituído por 'FR'.",
+        code="FIX_INVOICE_TYPE",
+        details={"invoice": invoice_no},
+    )
+
+
 def ensure_invoice_customers_exported(path: Path) -> Iterable[ValidationIssue]:
     """Ensure every customer referenced by an invoice is present in MasterFiles.
 
@@ -163,11 +180,27 @@ def ensure_invoice_customers_exported_tree(
     invoice_ids = collect_invoice_customer_ids(root, ns_uri) or []
     work_doc_ids = collect_workdocument_customer_ids(root, ns_uri) or []
     payment_ids = collect_payment_customer_ids(root, ns_uri) or []
+
+    return export_missing_customers(
+        root, ns_uri, (invoice_ids, work_doc_ids, payment_ids)
+    )
+
+
+def export_missing_customers(
+    root: etree._Element, ns_uri: str, groups: Iterable[Iterable[str]]
+) -> list[ValidationIssue]:
+    """Add to ``MasterFiles`` the customers of ``groups`` that are missing.
+
+    ``groups`` holds the ``CustomerID`` values of invoices, work documents and
+    payments (in that order); only ``MasterFiles`` needs to be present under
+    ``root``, so streaming fixes can pass the IDs gathered while reading.
+    """
+
     existing_ids = collect_masterfile_customer_ids(root, ns_uri)
 
     combined_ids: list[str] = []
     seen: set[str] = set()
-    for group in (invoice_ids, work_doc_ids, payment_ids):
+    for group in groups:
         for customer_id in group:
             if customer_id in seen:
                 continue
@@ -210,27 +243,36 @@ def log_soft_fixes(issues: Iterable[ValidationIssue], *, destination: Path) -> N
     logger.write_rows(issues)
 
 
-def _gather_customer_records(missing_ids: list[str]) -> dict[str, _CustomerRecord]:
+def customer_listing_path() -> Path | None:
+    """Customer listing used to add missing customers without asking.
+
+    ``BWB_SAFTAO_CUSTOMER_FILE`` wins over ``Listagem_de_Clientes.xlsx`` in
+    the addons folder; ``None`` when neither is available.
+    """
+
     env_path = os.environ.get(_EXCEL_ENV_VARIABLE)
     if env_path:
-        excel_path = Path(env_path).expanduser()
-        if not excel_path.exists():
-            raise FileNotFoundError(
-                f"O ficheiro Excel definido em {_EXCEL_ENV_VARIABLE} não existe: {excel_path}"
-            )
-        return _map_records_for_missing_ids(excel_path, missing_ids)
-
+        return Path(env_path).expanduser()
     default_excel = _DEFAULT_ADDONS_DIR / _DEFAULT_CUSTOMER_FILENAME
-    if default_excel.exists():
-        return _map_records_for_missing_ids(default_excel, missing_ids)
+    return default_excel if default_excel.exists() else None
+
 
-    return _gather_records_interactively(missing_ids)
+def _gather_customer_records(missing_ids: list[str]) -> dict[str, _CustomerRecord]:
+    excel_path = customer_listing_path()
+    if excel_path is None:
+        return _gather_records_interactively(missing_ids)
+    if not excel_path.exists():
+        raise FileNotFoundError(
+            f"O ficheiro Excel definido em {_EXCEL_ENV_VARIABLE} não existe: "
+            f"{excel_path}"
+        )
+    return _map_records_for_missing_ids(excel_path, missing_ids)
 
 
 def _map_records_for_missing_ids(
     excel_path: Path, missing_ids: list[str]
 ) -> dict[str, _CustomerRecord]:
-    records = _load_records_from_excel(excel_path)
+    records = _lookup_customer_records(excel_path, missing_ids)
     result: dict[str, _CustomerRecord] = {}
     missing_from_file: list[str] = []
     for customer_id in missing_ids:
@@ -507,66 +549,177 @@ def _prompt_for_customer_file(
 
 
 def _load_records_from_excel(path: Path) -> dict[str, dict[str, str]]:
+    records = {
+        record["customer_id"]: record for record in _iter_records_from_excel(path)
+    }
+    if not records:
+        raise ValueError(
+            "Nenhum registo de cliente válido foi encontrado no ficheiro Excel."
+        )
+    return records
+
+
+def _iter_records_from_excel(path: Path) -> Iterator[dict[str, str]]:
+    """Percorrer as linhas da listagem sem as carregar todas em memória."""
+
     from openpyxl import load_workbook
 
     if not path.exists():
         raise FileNotFoundError(f"Ficheiro Excel não encontrado: {path}")
 
     workbook = load_workbook(path, read_only=True, data_only=True)
-    sheet = workbook.active
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("O ficheiro Excel não contém dados.")
+
+        column_map = _build_column_map(header)
+        optional_columns = _find_optional_columns(header)
+
+        for row in rows:
+            if row is None:
+                continue
+            customer_id = _normalise_excel_value(_value_at(row, column_map["codigo"]))
+            if not customer_id:
+                continue
+            shipping_address = _extract_optional_value(
+                row, optional_columns["shipping_address"]
+            )
+            shipping_city = _extract_optional_value(
+                row, optional_columns["shipping_city"]
+            )
+            shipping_country_raw = _extract_optional_value(
+                row, optional_columns["shipping_country"]
+            )
+            shipping_country = (
+                _resolve_country_code(shipping_country_raw)
+                if shipping_country_raw
+                else ""
+            )
+
+            yield {
+                "customer_id": customer_id,
+                "company_name": _normalise_excel_value(
+                    _value_at(row, column_map["nome"])
+                ),
+                "tax_id": _normalise_excel_value(
+                    _value_at(row, column_map["contribuinte"])
+                ),
+                "address": _normalise_excel_value(
+                    _value_at(row, column_map["morada"])
+                ),
+                "city": _normalise_excel_value(
+                    _value_at(row, column_map["localidade"])
+                ),
+                "country": _resolve_country_code(
+                    _normalise_excel_value(_value_at(row, column_map["pais"]))
+                ),
+                "telephone": _normalise_excel_value(
+                    _value_at(row, column_map["telemovel"])
+                ),
+                "shipping_address": shipping_address,
+                "shipping_city": shipping_city,
+                "shipping_country": shipping_country,
+            }
+    finally:
+        workbook.close()
 
-    rows = list(sheet.iter_rows(values_only=True))
-    workbook.close()
-    if not rows:
-        raise ValueError("O ficheiro Excel não contém dados.")
 
-    header = rows[0]
-    column_map = _build_column_map(header)
-    optional_columns = _find_optional_columns(header)
+def _customer_index_path(path: Path) -> Path:
+    return path.parent / CACHE_DIRNAME / f"{path.name}.sqlite"
 
-    records: dict[str, dict[str, str]] = {}
-    for row in rows[1:]:
-        if row is None:
-            continue
-        customer_id = _normalise_excel_value(_value_at(row, column_map["codigo"]))
-        if not customer_id:
-            continue
-        shipping_address = _extract_optional_value(
-            row, optional_columns["shipping_address"]
-        )
-        shipping_city = _extract_optional_value(row, optional_columns["shipping_city"])
-        shipping_country_raw = _extract_optional_value(
-            row, optional_columns["shipping_country"]
+
+def _customer_index_stamp(path: Path) -> str:
+    """Identifica a versão da listagem (e da tabela de países) indexada."""
+
+    stat = path.stat()
+    parts = [_CUSTOMER_INDEX_VERSION, path.resolve(), stat.st_mtime_ns, stat.st_size]
+    if _COUNTRY_CODES_PATH.exists():
+        parts.append(_COUNTRY_CODES_PATH.stat().st_mtime_ns)
+    return ":".join(str(part) for part in parts)
+
+
+def _lookup_customer_records(
+    path: Path, customer_ids: Sequence[str]
+) -> dict[str, dict[str, str]]:
+    """Registos de ``customer_ids`` lidos do índice SQLite da listagem.
+
+    O índice fica em ``.saftao-cache`` junto ao ficheiro Excel e é refeito
+    quando o ficheiro muda (caminho, data de modificação ou tamanho). Se não
+    for possível usá-lo, a listagem é lida por inteiro, como até aqui.
+    """
+
+    if not path.exists():
+        raise FileNotFoundError(f"Ficheiro Excel não encontrado: {path}")
+
+    stamp = _customer_index_stamp(path)
+    index_path = _customer_index_path(path)
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.closing(sqlite3.connect(index_path)) as connection:
+            if _customer_index_version(connection) != stamp:
+                _build_customer_index(connection, path, stamp)
+            return _query_customer_index(connection, customer_ids)
+    except (OSError, sqlite3.Error):
+        records = _load_records_from_excel(path)
+        return {
+            customer_id: records[customer_id]
+            for customer_id in customer_ids
+            if customer_id in records
+        }
+
+
+def _customer_index_version(connection: sqlite3.Connection) -> str | None:
+    try:
+        row = connection.execute("SELECT stamp FROM listing").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def _build_customer_index(
+    connection: sqlite3.Connection, path: Path, stamp: str
+) -> None:
+    columns = ", ".join(_RECORD_FIELDS)
+    placeholders = ", ".join("?" for _ in _RECORD_FIELDS)
+    with connection:
+        connection.execute("DROP TABLE IF EXISTS listing")
+        connection.execute("DROP TABLE IF EXISTS customers")
+        connection.execute(
+            f"CREATE TABLE customers ({_RECORD_FIELDS[0]} TEXT PRIMARY KEY, "
+            + ", ".join(f"{name} TEXT" for name in _RECORD_FIELDS[1:])
+            + ")"
         )
-        shipping_country = (
-            _resolve_country_code(shipping_country_raw)
-            if shipping_country_raw
-            else ""
+        connection.executemany(
+            f"INSERT OR REPLACE INTO customers ({columns}) VALUES ({placeholders})",
+            (
+                tuple(record[name] for name in _RECORD_FIELDS)
+                for record in _iter_records_from_excel(path)
+            ),
         )
+        if connection.execute("SELECT 1 FROM customers LIMIT 1").fetchone() is None:
+            raise ValueError(
+                "Nenhum registo de cliente válido foi encontrado no ficheiro Excel."
+            )
+        connection.execute("CREATE TABLE listing (stamp TEXT)")
+        connection.execute("INSERT INTO listing VALUES (?)", (stamp,))
 
-        records[customer_id] = {
-            "customer_id": customer_id,
-            "company_name": _normalise_excel_value(_value_at(row, column_map["nome"])),
-            "tax_id": _normalise_excel_value(
-                _value_at(row, column_map["contribuinte"])
-            ),
-            "address": _normalise_excel_value(_value_at(row, column_map["morada"])),
-            "city": _normalise_excel_value(_value_at(row, column_map["localidade"])),
-            "country": _resolve_country_code(
-                _normalise_excel_value(_value_at(row, column_map["pais"]))
-            ),
-            "telephone": _normalise_excel_value(
-                _value_at(row, column_map["telemovel"])
-            ),
-            "shipping_address": shipping_address,
-            "shipping_city": shipping_city,
-            "shipping_country": shipping_country,
-        }
 
-    if not records:
-        raise ValueError(
-            "Nenhum registo de cliente válido foi encontrado no ficheiro Excel."
+def _query_customer_index(
+    connection: sqlite3.Connection, customer_ids: Sequence[str]
+) -> dict[str, dict[str, str]]:
+    wanted = list(dict.fromkeys(customer_ids))
+    records: dict[str, dict[str, str]] = {}
+    for start in range(0, len(wanted), _SQLITE_MAX_PARAMS):
+        chunk = wanted[start : start + _SQLITE_MAX_PARAMS]
+        cursor = connection.execute(
+            f"SELECT {', '.join(_RECORD_FIELDS)} FROM customers "
+            f"WHERE customer_id IN ({', '.join('?' for _ in chunk)})",
+            chunk,
         )
+        for row in cursor:
+            records[row[0]] = dict(zip(_RECORD_FIELDS, row))
     return records
 
 
@@ -746,6 +899,7 @@ def add_element(parent: etree._Element, name: str, text: str) -> etree._Element:
     add_element(customer, "SelfBillingIndicator", "0")
 
 
+@functools.lru_cache(maxsize=None)
 def _resolve_country_code(raw_value: str) -> str:
     value = (raw_value or "").strip()
     if not value:
@@ -1,9 +1,19 @@
-"""Utilities to repair ``WorkDocument`` tag balancing issues."""
+"""Utilities to repair ``WorkDocument`` tag balancing issues.
+
+:class:`WorkDocumentBalanceReader` applies the repair while the XML is being
+read, so the commands can hand it straight to ``etree.parse``/``iterparse``
+instead of rewriting the input file first.
+"""
 
 from __future__ import annotations
 
+import contextlib
+import io
 import re
 from pathlib import Path
+from typing import IO, Callable, Optional
+
+from .. import archive
 
 _ENCODING_DECLARATION = re.compile(
     r"(<\?xml\\b[^>]*\\bencoding\\s*=\\s*)([\"\'])([^\"\']*)(\2)",
@@ -11,6 +21,41 @@
 )
 
 _WORK_DOCUMENT_TAG = re.compile(r"<(/?)WorkDocument\b[^>]*>")
+_WORK_DOCUMENT_TAG_BYTES = re.compile(
+    rb"<(/?)WorkDocument\b[^>]*>|(</WorkingDocuments\b[^>]*>)"
+)
+_CHUNK_SIZE = 1 << 16
+
+
+class _Balancer:
+    """Stack of the open ``WorkDocument`` tags (with their indentation)."""
+
+    def __init__(self) -> None:
+        self.stack: list[str] = []
+        self.changed = False
+
+    def tag(self, closing: bool, indent: str) -> tuple[str, bool]:
+        """Text to insert before a tag and whether the tag is kept."""
+
+        if closing:
+            if self.stack:
+                self.stack.pop()
+                return "", True
+            # Duplicate closing tag – drop it.
+            self.changed = True
+            return "", False
+        # Close any previously open WorkDocument blocks before starting a
+        # new one.
+        prefix = self.close_all()
+        self.stack.append(indent)
+        return prefix, True
+
+    def close_all(self) -> str:
+        parts = []
+        while self.stack:
+            parts.append(f"</WorkDocument>\n{self.stack.pop()}")
+            self.changed = True
+        return "".join(parts)
 
 
 def repair_workdocument_balance(text: str) -> tuple[str, bool]:
@@ -36,51 +81,157 @@ def repair_workdocument_balance(text: str) -> tuple[str, bool]:
         modifications were applied.
     """
 
-    stack: list[str] = []
+    balancer = _Balancer()
     output: list[str] = []
     last_end = 0
-    changed = False
 
     for match in _WORK_DOCUMENT_TAG.finditer(text):
         start, end = match.span()
         output.append(text[last_end:start])
+        prefix, keep = balancer.tag(
+            match.group(1) == "/", _detect_indent(text, start)
+        )
+        output.append(prefix)
+        if keep:
+            output.append(match.group(0))
+        last_end = end
+
+    output.append(balancer.close_all() + text[last_end:])
+    return "".join(output), balancer.changed
+
 
-        indent = _detect_indent(text, start)
-        tag_text = match.group(0)
-        is_closing = match.group(1) == "/"
+class WorkDocumentBalanceReader(io.RawIOBase):
+    """Binary stream of ``source`` with the ``WorkDocument`` tags balanced.
 
-        if is_closing:
-            if stack:
-                stack.pop()
-                output.append(tag_text)
+    The tags are repaired as in :func:`repair_workdocument_balance`, over
+    the bytes: the tag names and indentation are ASCII, so any
+    ASCII-compatible encoding passes through undecoded together with its
+    XML declaration. The scan keeps only an unfinished tag between chunks.
+    ``WorkDocument`` blocks still open at ``</WorkingDocuments>`` (or at the
+    end of the input) are closed there. ``changed`` is ``True`` once a
+    repair was made; it is final when the stream has been read to the end.
+    ``source`` is closed at the end of the input (``on_close`` is called).
+    """
+
+    def __init__(
+        self,
+        source: IO[bytes],
+        *,
+        on_close: Optional[Callable[[], None]] = None,
+        chunk_size: int = _CHUNK_SIZE,
+    ) -> None:
+        super().__init__()
+        self._source = source
+        self._on_close = on_close
+        self._chunk_size = chunk_size
+        self._balancer = _Balancer()
+        self._pending = bytearray()
+        self._carry = b""
+        self._indent: Optional[bytes] = b""
+        self._eof = False
+
+    @property
+    def changed(self) -> bool:
+        return self._balancer.changed
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending and not self._eof:
+            chunk = self._source.read(self._chunk_size)
+            if chunk:
+                self._scan(self._carry + chunk, final=False)
             else:
-                # Duplicate closing tag – drop it.
-                changed = True
+                self._scan(self._carry, final=True)
+                self._eof = True
+                self.close()
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        del self._pending[:size]
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self._source.close()
+            if self._on_close is not None:
+                self._on_close()
+        super().close()
+
+    def _scan(self, data: bytes, *, final: bool) -> None:
+        balancer = self._balancer
+        position = 0
+        for match in _WORK_DOCUMENT_TAG_BYTES.finditer(data):
+            start, end = match.span()
+            self._emit(data[position:start])
+            if match.group(2) is not None:
+                prefix, keep = balancer.close_all(), True
+            else:
+                indent = (self._indent or b"").decode("ascii")
+                prefix, keep = balancer.tag(match.group(1) == b"/", indent)
+            self._pending += prefix.encode("ascii")
+            if keep:
+                self._emit(match.group(0))
+            position = end
+        rest = data[position:]
+        self._carry = b""
+        if final:
+            self._emit(rest)
+            self._pending += balancer.close_all().encode("ascii")
+            return
+        cut = rest.rfind(b"<")
+        if cut != -1 and b">" not in rest[cut:]:
+            # Possibly a tag split across chunks: scan it with the next one.
+            self._carry = rest[cut:]
+            rest = rest[:cut]
+        self._emit(rest)
+
+    def _emit(self, data: bytes) -> None:
+        """Copy source bytes, tracking the indentation of the current line."""
+
+        self._pending += data
+        newline = data.rfind(b"\n")
+        if newline != -1:
+            line = data[newline + 1 :]
+        elif self._indent is not None:
+            line = self._indent + data
         else:
-            if stack:
-                # Close any previously open WorkDocument blocks before
-                # starting a new one.
-                while stack:
-                    prev_indent = stack.pop()
-                    output.append(f"</WorkDocument>\n{prev_indent}")
-                    changed = True
-            stack.append(indent)
-            output.append(tag_text)
+            return
+        self._indent = None if line.strip() else line
 
-        last_end = end
 
-    tail = text[last_end:]
-    if stack:
-        changed = True
-        closing_parts = []
-        while stack:
-            prev_indent = stack.pop()
-            closing_parts.append(f"</WorkDocument>\n{prev_indent}")
-        tail = "".join(closing_parts) + tail
+def open_balanced_xml(path: Path | str) -> WorkDocumentBalanceReader:
+    """:class:`WorkDocumentBalanceReader` over the (decompressed) XML in *path*."""
 
-    output.append(tail)
-    fixed = "".join(output)
-    return fixed, changed
+    stack = contextlib.ExitStack()
+    try:
+        handle = stack.enter_context(archive.open_xml(path))
+    except BaseException:
+        stack.close()
+        raise
+    return WorkDocumentBalanceReader(handle, on_close=stack.close)
+
+
+class BalancedSource:
+    """Factory of :func:`open_balanced_xml` streams over the same ``path``.
+
+    Each call returns a new stream, e.g. for the two ``iterparse`` passes or
+    a ``recover=True`` retry; ``repaired`` tells whether any of them needed
+    a repair.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._readers: list[WorkDocumentBalanceReader] = []
+
+    def __call__(self) -> WorkDocumentBalanceReader:
+        reader = open_balanced_xml(self.path)
+        self._readers.append(reader)
+        return reader
+
+    @property
+    def repaired(self) -> bool:
+        return any(reader.changed for reader in self._readers)
 
 
 def repair_workdocument_balance_in_file(path: Path) -> bool:
@@ -89,15 +240,29 @@ def repair_workdocument_balance_in_file(path: Path) -> bool:
     Returns ``True`` when modifications were required and applied.
     """
 
-    original, encoding = _read_text_with_fallback(path)
-    fixed, changed = repair_workdocument_balance(original)
+    fixed, changed = repair_workdocument_balance_bytes(path.read_bytes())
     if changed:
-        if encoding.lower() != "utf-8":
-            fixed = _ensure_utf8_encoding_declaration(fixed)
-        path.write_text(fixed, encoding="utf-8")
+        path.write_bytes(fixed)
     return changed
 
 
+def repair_workdocument_balance_bytes(data: bytes) -> tuple[bytes, bool]:
+    """Repair ``WorkDocument`` tag balance issues in the XML ``data``.
+
+    Used for sources that cannot be rewritten in place (e.g. compressed
+    files). Returns ``data`` unchanged when no repair is needed; otherwise
+    the repaired document encoded as UTF-8.
+    """
+
+    original, encoding = _decode_with_fallback(data)
+    fixed, changed = repair_workdocument_balance(original)
+    if not changed:
+        return data, False
+    if encoding.lower() != "utf-8":
+        fixed = _ensure_utf8_encoding_declaration(fixed)
+    return fixed.encode("utf-8"), True
+
+
 def _detect_indent(text: str, pos: int) -> str:
     """Return the whitespace indentation for the line preceding ``pos``."""
 
@@ -112,10 +277,9 @@ def _detect_indent(text: str, pos: int) -> str:
     return indent
 
 
-def _read_text_with_fallback(path: Path) -> tuple[str, str]:
-    """Return the text for ``path`` using UTF-8 with legacy fallbacks."""
+def _decode_with_fallback(data: bytes) -> tuple[str, str]:
+    """Decode ``data`` using UTF-8 with legacy fallbacks."""
 
-    data = path.read_bytes()
     try:
         return data.decode("utf-8"), "utf-8"
     except UnicodeDecodeError:
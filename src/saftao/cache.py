@@ -0,0 +1,175 @@
+"""Reuse autofix results for inputs that were already fixed.
+
+An autofix run is fully determined by the input bytes, the AGT rules index
+(``rules_updates/agt/index.json``), the XSD used for validation, the code of
+this package and the command line options that change the output. The
+:class:`ResultCache` keeps, per output folder, the XML and log produced for
+each such :class:`CacheKey`, so a repeated run can point at them instead of
+parsing, fixing and validating again (and creating another ``_v.NN`` file).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Mapping, Optional
+
+from .rules_updates import RULES_DIR, sha256sum
+
+CACHE_DIRNAME = ".saftao-cache"
+CACHE_VERSION = 1
+RULES_INDEX = RULES_DIR / "agt" / "index.json"
+
+_PACKAGE_ROOT = Path(__file__).resolve().parent
+
+
+def file_digest(path: Optional[Path]) -> str:
+    """SHA-256 of ``path``, or ``""`` when there is no such file."""
+
+    if path is None or not Path(path).is_file():
+        return ""
+    return sha256sum(Path(path))
+
+
+@lru_cache(maxsize=None)
+def package_version() -> str:
+    """Installed version plus a digest of the package sources.
+
+    The digest makes a development checkout (or an edited install) count as
+    a new version, since any change to the fixers may change their output.
+    """
+
+    try:
+        version = metadata.version("saftao")
+    except metadata.PackageNotFoundError:
+        version = "0"
+    digest = hashlib.sha256()
+    for path in sorted(_PACKAGE_ROOT.rglob("*.py")):
+        digest.update(path.relative_to(_PACKAGE_ROOT).as_posix().encode())
+        digest.update(path.read_bytes())
+    return f"{version}+{digest.hexdigest()[:12]}"
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    """Everything an autofix output depends on."""
+
+    command: str
+    input_sha256: str
+    rules_sha256: str
+    xsd_sha256: str
+    package: str
+    options: Mapping[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls,
+        command: str,
+        source: Path,
+        xsd_path: Optional[Path],
+        options: Mapping[str, Any] | None = None,
+    ) -> "CacheKey":
+        return cls(
+            command=command,
+            input_sha256=file_digest(source),
+            rules_sha256=file_digest(RULES_INDEX),
+            xsd_sha256=file_digest(xsd_path),
+            package=package_version(),
+            options=dict(options or {}),
+        )
+
+    @property
+    def digest(self) -> str:
+        data = json.dumps(
+            [CACHE_VERSION, asdict(self)], sort_keys=True, default=str
+        ).encode()
+        return hashlib.sha256(data).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    """Output of an earlier run and the exit code it ended with."""
+
+    output: Path
+    log: Optional[Path]
+    exit_code: int
+    output_sha256: str
+
+
+class ResultCache:
+    """Cache entries kept as small JSON files in ``directory``.
+
+    An entry is only returned while its output is unchanged on disk (same
+    SHA-256) and its log still exists.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+
+    @classmethod
+    def for_output_dir(cls, output_dir: Path) -> "ResultCache":
+        return cls(Path(output_dir) / CACHE_DIRNAME)
+
+    def _entry(self, key: CacheKey) -> Path:
+        return self.directory / f"{key.digest}.json"
+
+    def lookup(self, key: CacheKey) -> Optional[CachedResult]:
+        try:
+            data = json.loads(self._entry(key).read_text(encoding="utf-8"))
+            result = CachedResult(
+                output=Path(data["output"]),
+                log=Path(data["log"]) if data.get("log") else None,
+                exit_code=int(data["exit_code"]),
+                output_sha256=data["output_sha256"],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if result.log is not None and not result.log.is_file():
+            return None
+        if file_digest(result.output) != result.output_sha256:
+            return None
+        return result
+
+    def store(
+        self,
+        key: CacheKey,
+        output: Path,
+        log: Optional[Path],
+        exit_code: int,
+    ) -> CachedResult:
+        result = CachedResult(
+            output=Path(output).resolve(),
+            log=Path(log).resolve() if log is not None else None,
+            exit_code=exit_code,
+            output_sha256=file_digest(output),
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "key": asdict(key),
+            "output": str(result.output),
+            "log": str(result.log) if result.log is not None else None,
+            "exit_code": result.exit_code,
+            "output_sha256": result.output_sha256,
+        }
+        path = self._entry(key)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(
+            json.dumps(entry, ensure_ascii=False, default=str), encoding="utf-8"
+        )
+        temporary.replace(path)
+        return result
+
+
+__all__ = [
+    "CACHE_DIRNAME",
+    "CacheKey",
+    "CachedResult",
+    "RULES_INDEX",
+    "ResultCache",
+    "file_digest",
+    "package_version",
+]
@@ -7,7 +7,7 @@
 from dataclasses import dataclass
 from typing import Callable, Iterable, Mapping, Sequence
 
-from .commands import autofix_hard, autofix_soft, report, validator_strict
+from .commands import apply_plan, autofix_hard, autofix_soft, report, validator_strict
 
 CommandCallable = Callable[[list[str] | None], int | None]
 
@@ -62,6 +62,13 @@ def run(self, argv: list[str] | None) -> int:
         legacy_script="scripts/saft_ao_autofix_hard.py",
         module="saftao.commands.autofix_hard",
     ),
+    CommandSpec(
+        name="apply-plan",
+        summary="Aplicação de um plano gravado por 'autofix-soft --plan'.",
+        handler=apply_plan.main,
+        legacy_script="",
+        module="saftao.commands.apply_plan",
+    ),
     CommandSpec(
         name="report",
         summary="Geração de relatório com totais contabilísticos e outros documentos.",
@@ -0,0 +1,140 @@
+"""Optional NumPy kernels for batch checks over SAF-T (AO) amount columns.
+
+The scalar code in :mod:`saftao.money` handles one value at a time. Once the
+line values of many documents are extracted into ``int64`` columns – the
+``units`` and ``scale`` of each :data:`~saftao.money.Scaled` value plus the
+index of the owning document – the same fixed-point operations become vector
+arithmetic, and per-document sums are segment sums (:func:`segment_sum`).
+
+Every kernel reproduces the corresponding :mod:`saftao.money` function
+exactly, as long as the intermediate values fit ``int64``. Callers use
+:func:`fits_int64` to find the rows where that is not guaranteed and send
+them through the scalar path instead.
+
+NumPy is optional: :data:`np` is ``None`` when it is not installed and
+:func:`available` reports whether the kernels can be used.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+try:
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - optional dependency
+    np = None
+
+# Largest power of ten usable as a factor; 10**18 < 2**63.
+MAX_EXPONENT = 18
+# Magnitude limit for intermediate values, with headroom for ``2 * x + f``
+# in the rounding and for the float estimates of :func:`fits_int64`.
+INT64_LIMIT = float(2**60)
+
+_POW10 = (
+    np.array([10**exponent for exponent in range(MAX_EXPONENT + 1)], dtype=np.int64)
+    if np is not None
+    else None
+)
+
+
+def available() -> bool:
+    """Return whether NumPy is installed."""
+
+    return np is not None
+
+
+def fits_int64(
+    left: Any, right: Any, left_scale: Any, right_scale: Any, places: int
+) -> Any:
+    """Rows where ``round_half_up(left * right, scale, places)`` fits ``int64``.
+
+    ``scale`` is ``left_scale + right_scale``. The estimate uses ``float64``
+    magnitudes, so a row is rejected well before an exact overflow.
+    """
+
+    scale = left_scale + right_scale
+    grow = np.clip(places - scale, 0, None)
+    magnitude = np.abs(left.astype(np.float64)) * np.abs(right.astype(np.float64))
+    ok = (scale - places <= MAX_EXPONENT) & (grow <= MAX_EXPONENT)
+    return ok & (magnitude * np.power(10.0, grow) < INT64_LIMIT)
+
+
+def round_half_up(units: Any, scale: Any, places: int) -> Any:
+    """Vector :func:`saftao.money.round_half_up` (ties away from zero)."""
+
+    units = np.asarray(units, dtype=np.int64)
+    shift = places - np.asarray(scale, dtype=np.int64)
+    result = np.empty_like(units)
+    grow = shift >= 0
+    result[grow] = units[grow] * _POW10[shift[grow]]
+    shrink = ~grow
+    factor = _POW10[-shift[shrink]]
+    values = units[shrink]
+    rounded = (2 * np.abs(values) + factor) // (2 * factor)
+    result[shrink] = np.where(values < 0, -rounded, rounded)
+    return result
+
+
+def rescale(units: Any, scale: Any, target: int) -> Any:
+    """Express ``units / 10**scale`` with ``target`` decimals (``scale <= target``)."""
+
+    return np.asarray(units, dtype=np.int64) * _POW10[target - np.asarray(scale)]
+
+
+def line_base(
+    quantity: Any, quantity_scale: Any, unit_price: Any, unit_price_scale: Any
+) -> Any:
+    """Vector :func:`saftao.money.line_base`: ``q6(Quantity * UnitPrice)``."""
+
+    return round_half_up(quantity * unit_price, quantity_scale + unit_price_scale, 6)
+
+
+def line_tax(base_micros: Any, percentage: Any, percentage_scale: Any) -> Any:
+    """Vector :func:`saftao.money.line_tax`: ``q6(base * TaxPercentage / 100)``."""
+
+    return round_half_up(base_micros * percentage, 6 + percentage_scale + 2, 6)
+
+
+def micros_to_cents(micros: Any) -> Any:
+    """Vector :func:`saftao.money.micros_to_cents`."""
+
+    return round_half_up(micros, np.full(len(micros), 6, dtype=np.int64), 2)
+
+
+def segment_starts(owners: Any, count: int) -> Any:
+    """Start offset of each owner's rows in ``owners`` (sorted document indexes)."""
+
+    return np.searchsorted(owners, np.arange(count, dtype=np.int64))
+
+
+def segment_sum(values: Any, owners: Any, count: int) -> Any:
+    """Per-owner sums of ``values`` with :func:`numpy.add.reduceat`.
+
+    ``owners`` holds the (sorted) document index of each row; documents
+    without rows sum to zero, which ``reduceat`` alone does not guarantee.
+    """
+
+    values = np.asarray(values, dtype=np.int64)
+    result = np.zeros(count, dtype=np.int64)
+    if not len(values):
+        return result
+    starts = segment_starts(owners, count)
+    present = np.flatnonzero(np.diff(np.append(starts, len(values))) > 0)
+    result[present] = np.add.reduceat(values, starts[present])
+    return result
+
+
+__all__ = [
+    "INT64_LIMIT",
+    "MAX_EXPONENT",
+    "available",
+    "fits_int64",
+    "line_base",
+    "line_tax",
+    "micros_to_cents",
+    "np",
+    "rescale",
+    "round_half_up",
+    "segment_starts",
+    "segment_sum",
+]
@@ -1,6 +1,7 @@
 """Colecção de comandos de linha de comandos expostos por ``saftao.cli``."""
 
 __all__ = [
+    "apply_plan",
     "autofix_hard",
     "autofix_soft",
     "report",
@@ -0,0 +1,105 @@
+"""Aplicar a um ficheiro SAF-T (AO) o plano gravado por ``autofix-soft --plan``.
+
+O XML original é lido uma única vez: os troços sem alterações são copiados e
+os do plano voltam a ser serializados com os campos alterados. O resultado é
+gravado como a versão seguinte (``*_v.xx.xml``) e validado pelo XSD, tal como
+no ``autofix-soft``.
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Sequence
+
+from .. import archive
+from ..autofix.workdocument_balance import open_balanced_xml
+from ..plan import PlanError, apply_plan, read_plan
+from .autofix_soft import default_xsd_path, next_version_paths, validate_xsd_file
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Aplica ao ficheiro SAF-T o plano de alterações gravado por "
+            "'autofix-soft --plan'."
+        )
+    )
+    parser.add_argument("plan", type=Path, help="Plano (.json ou .sqlite)")
+    parser.add_argument("xml", type=Path, help="Ficheiro SAF-T de origem do plano")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        help="Pasta onde gravar o XML corrigido (por omissão a do original).",
+    )
+    parser.add_argument(
+        "--xsd",
+        dest="xsd_path",
+        type=Path,
+        help="Caminho para o XSD a usar na validação.",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=archive.COMPRESSIONS,
+        help="Gravar o XML corrigido directamente comprimido neste formato.",
+    )
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.xml.exists():
+        print(f"[ERRO] Ficheiro não encontrado: {args.xml}")
+        return 2
+    try:
+        plan = read_plan(args.plan)
+    except PlanError as exc:
+        print(f"[ERRO] Plano inválido: {exc}")
+        return 2
+
+    output_dir = (args.output_dir or args.xml.parent).expanduser()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_ok, out_bad, version_suffix = next_version_paths(
+        args.xml, output_dir, args.compress
+    )
+    try:
+        with archive.open_output(out_ok) as output:
+            opener = open_balanced_xml if plan.repaired else archive.open_xml
+            with opener(args.xml) as source:
+                apply_plan(plan, source, output)
+    except PlanError as exc:
+        out_ok.unlink(missing_ok=True)
+        print(f"[ERRO] O plano não corresponde a {args.xml}: {exc}")
+        return 2
+
+    version_label = version_suffix.lstrip("_")
+    applied = f"{len(plan.edits)} alterações aplicadas"
+    xsd_path = args.xsd_path or default_xsd_path()
+    if not (xsd_path and Path(xsd_path).exists()):
+        print(
+            f"[OK] XML {version_label} ({applied}) criado em: {out_ok} "
+            "(não foi possível validar XSD)"
+        )
+        return 0
+    ok, errs = validate_xsd_file(out_ok, Path(xsd_path))
+    if ok:
+        print(
+            f"[OK] XML {version_label} ({applied}, válido por XSD em {xsd_path}) "
+            f"criado em: {out_ok}"
+        )
+        return 0
+    out_ok.replace(out_bad)
+    print(
+        f"[ALERTA] XML {version_label} ({applied}) criado em: {out_bad}, "
+        f"mas NÃO passou o XSD ({xsd_path}):"
+    )
+    for message in errs[:50]:
+        print(" -", message)
+    if len(errs) > 50:
+        print(f"   (+{len(errs) - 50} erros adicionais)")
+    return 2
+
+
+if __name__ == "__main__":  # pragma: no cover - execução directa
+    raise SystemExit(main())
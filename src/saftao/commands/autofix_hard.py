@@ -12,6 +12,12 @@
 - Grava versões numeradas do XML original (``*_v.xx.xml``); quando o XSD falha
   acrescenta-se ``_invalido`` ao nome.
 - Permite definir uma pasta de destino alternativa através de ``--output-dir``.
+- Com ``--workers N`` as faturas são corrigidas em ``N`` processos, em lotes;
+  o resultado é o mesmo da execução sequencial.
+- Um pedido repetido (mesma entrada, regras, XSD, versão e opções) devolve o
+  XML e o log da execução anterior sem recalcular; ``--force`` recalcula.
+- Com ``--log-format`` grava também um log das etapas
+  (``NOME_XML_YYYYMMDDTHHMMSSZ_autofix_hard.<formato>``) na pasta de destino.
 
 Uso::
 
@@ -21,8 +27,11 @@
 import argparse
 import re
 import sys
-from decimal import ROUND_HALF_UP, Decimal, InvalidOperation, getcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal, getcontext
 from pathlib import Path
+from typing import Any, Callable
 
 from lxml import etree
 from saftao.autofix._header import (
@@ -31,10 +40,20 @@
     normalise_tax_registration_number,
 )
 from saftao.autofix._namespace import normalise_customer_namespace
-from saftao.autofix.workdocument_balance import (
-    repair_workdocument_balance_in_file,
+from saftao.autofix.documents import (
+    INVOICE,
+    NET_PLUS_TAX,
+    DocumentFixer,
+    LineFixRules,
 )
+from saftao.autofix.workdocument_balance import BalancedSource
+from saftao.cache import CacheKey, CachedResult, ResultCache
+from saftao.logging import LOG_FORMATS, IssueSink, open_issue_sink
+from saftao import archive
 from saftao.rules import iter_tax_elements
+from saftao.schema import compiled_schema
+from saftao.splice import SpliceWriter
+from saftao.tax_table import TaxKey, TaxTable, load_tax_table, tax_key
 
 # Precisão alta para cálculo
 getcontext().prec = 28
@@ -43,21 +62,8 @@
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
 
 NS_DEFAULT = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
-AMT2 = Decimal("0.01")
-AMT6 = Decimal("0.000001")
-HUNDRED = Decimal("100")
-
-
-def q2(v: Decimal) -> Decimal:
-    return v.quantize(AMT2, rounding=ROUND_HALF_UP)
-
-
-def q6(v: Decimal) -> Decimal:
-    return v.quantize(AMT6, rounding=ROUND_HALF_UP)
-
-
-def fmt2(x: Decimal) -> str:
-    return f"{x:.2f}"
+# Faturas por lote enviado a cada processo com ``--workers``.
+INVOICE_BATCH_SIZE = 250
 
 
 def fmt_pct(txt: str) -> str:
@@ -71,15 +77,6 @@ def fmt_pct(txt: str) -> str:
     return f"{v:.2f}"
 
 
-def parse_decimal(text: str, default: Decimal = Decimal("0")) -> Decimal:
-    if text is None:
-        return default
-    try:
-        return Decimal(text.strip())
-    except (InvalidOperation, ValueError):
-        return default
-
-
 def detect_ns(tree: etree._ElementTree) -> str:
     root = tree.getroot()
     if root.tag.startswith("{") and "}" in root.tag:
@@ -195,8 +192,6 @@ def _ensure(tag: str, default: str) -> bool:
     return changed
 
 
-
-
 def normalise_masterfile_customers(root, nsuri: str) -> None:
     """Remove explicit namespace prefixes from MasterFiles customers."""
 
@@ -242,50 +237,125 @@ def ensure_tax_country_region(tax_el, nsuri: str, default: str = "AO") -> None:
 # --- Construção / fixes -------------------------------------------------------
 
 
-def ensure_tax_table_entry(root, nsuri: str, ttype: str, tcode: str, tperc_text: str):
+def ensure_tax_table_entry(
+    table: TaxTable, root, nsuri: str, ttype: str, tcode: str, tperc_text: str
+):
     """
-    Garante TaxTableEntry(type, code, percentage). Se não existir, cria um mínimo:
-    TaxType, TaxCode, Description, TaxPercentage (com ordem certa).
+    Garante TaxTableEntry(type, code, percentage) no índice ``table`` do
+    documento. Se não existir, cria um mínimo: TaxType, TaxCode, Description,
+    TaxPercentage (com ordem certa).
     """
-    ns = {"n": nsuri}
-    mf = root.find(".//n:MasterFiles", namespaces=ns)
-    if mf is None:
-        mf = etree.SubElement(root, f"{{{nsuri}}}MasterFiles")
-    tt = mf.find("./n:TaxTable", namespaces=ns)
-    if tt is None:
-        tt = etree.SubElement(mf, f"{{{nsuri}}}TaxTable")
-
-    # já existe?
-    for entry in tt.findall("./n:TaxTableEntry", namespaces=ns):
-        e_type = get_text(entry.find("./n:TaxType", namespaces=ns)) or "IVA"
-        e_code = get_text(entry.find("./n:TaxCode", namespaces=ns)) or "NOR"
-        e_pct = get_text(entry.find("./n:TaxPercentage", namespaces=ns)) or "0"
-        try:
-            if (
-                e_type == ttype
-                and e_code == tcode
-                and Decimal(e_pct) == Decimal(tperc_text)
-            ):
-                # garantir também a ordem correta
-                ensure_taxtable_entry_order(entry, nsuri)
-                return
-        except Exception:
-            continue
+    if tax_key(ttype, tcode, tperc_text) in table:
+        return
+
+    if table.element is None:
+        ns = {"n": nsuri}
+        mf = root.find(".//n:MasterFiles", namespaces=ns)
+        if mf is None:
+            mf = etree.SubElement(root, f"{{{nsuri}}}MasterFiles")
+        table.element = etree.SubElement(mf, f"{{{nsuri}}}TaxTable")
 
     # criar nova entrada mínima
-    new = etree.SubElement(tt, f"{{{nsuri}}}TaxTableEntry")
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxType")
-    el.text = ttype or "IVA"
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxCode")
-    el.text = tcode or "NOR"
-    el = etree.SubElement(new, f"{{{nsuri}}}Description")
-    el.text = "Auto-added for consistency"
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxPercentage")
-    el.text = fmt_pct(tperc_text)
+    new = table.insert(ttype, tcode, fmt_pct(tperc_text))
     ensure_taxtable_entry_order(new, nsuri)
 
 
-def fix_xml(tree: etree._ElementTree, path: Path) -> etree._ElementTree:
+def line_rules(root, nsuri: str, table: TaxTable) -> LineFixRules:
+    """Regras do modo *hard* para o motor partilhado de linhas e totais.
+
+    ``GrossTotal`` é ``q2(Net + Tax)`` e as linhas com ``DebitAmount`` e
+    ``CreditAmount`` ficam só com ``DebitAmount``; nada é registado.
+    """
+
+    def tax_entry(ttype: str, tcode: str, tperc: str, *_context) -> None:
+        ensure_tax_table_entry(table, root, nsuri, ttype, tcode, tperc)
+
+    return _line_rules(nsuri, tax_entry)
+
+
+def _line_rules(nsuri: str, tax_entry: Callable[..., None]) -> LineFixRules:
+    return LineFixRules(
+        identity=NET_PLUS_TAX,
+        format_percentage=fmt_pct,
+        tax_region=lambda tax, *_context: ensure_tax_country_region(tax, nsuri),
+        tax_entry=tax_entry,
+        line_order=lambda line: ensure_line_order(line, nsuri),
+        totals_order=lambda totals: ensure_document_totals_order(totals, nsuri),
+        drop_duplicate_credit=True,
+    )
+
+
+def _fix_invoice_batch(
+    nsuri: str, tax_index: frozenset[TaxKey], fragments: list[bytes]
+) -> tuple[list[bytes], list[tuple[str, str, str]]]:
+    """Corrigir fragmentos ``Invoice`` serializados.
+
+    Corre num processo do ``ProcessPoolExecutor``. Devolve as faturas
+    corrigidas e, pela ordem em que foram pedidas, as entradas da TaxTable
+    que faltam em ``tax_index`` (o processo principal acrescenta-as).
+    """
+
+    table = TaxTable(tax_index)
+    missing: list[tuple[str, str, str]] = []
+
+    def tax_entry(ttype: str, tcode: str, tperc: str, *_context) -> None:
+        key = tax_key(ttype, tcode, tperc)
+        if key in table:
+            return
+        if key is not None:
+            table.add(key)
+        missing.append((ttype, tcode, tperc))
+
+    fixer = DocumentFixer(INVOICE, nsuri, _line_rules(nsuri, tax_entry))
+    fixed = []
+    for fragment in fragments:
+        invoice = etree.fromstring(fragment)
+        fixer.fix(invoice, set())
+        fixed.append(etree.tostring(invoice))
+    return fixed, missing
+
+
+def _fix_invoices_parallel(
+    invoices: list, root, nsuri: str, tax_table: TaxTable, workers: int
+) -> None:
+    """Corrigir ``invoices`` em lotes, em ``workers`` processos.
+
+    Os lotes são recolhidos pela ordem do documento: o conteúdo de cada
+    fatura é substituído pelo corrigido (o elemento mantém-se, para o
+    ``--splice``) e as entradas da TaxTable em falta são acrescentadas pela
+    mesma ordem da execução sequencial.
+    """
+
+    pending: list[tuple[Future, list]] = []
+
+    def collect() -> None:
+        future, batch = pending.pop(0)
+        fixed, missing = future.result()
+        for invoice, fragment in zip(batch, fixed):
+            replacement = etree.fromstring(fragment)
+            invoice.text = replacement.text
+            invoice[:] = list(replacement)
+        for ttype, tcode, tperc in missing:
+            ensure_tax_table_entry(tax_table, root, nsuri, ttype, tcode, tperc)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(invoices), INVOICE_BATCH_SIZE):
+            batch = invoices[start : start + INVOICE_BATCH_SIZE]
+            fragments = [etree.tostring(invoice, with_tail=False) for invoice in batch]
+            future = executor.submit(
+                _fix_invoice_batch, nsuri, tax_table.keys(), fragments
+            )
+            pending.append((future, batch))
+            # Limitar o número de lotes em voo (e a memória retida).
+            while len(pending) > workers * 2:
+                collect()
+        while pending:
+            collect()
+
+
+def fix_xml(
+    tree: etree._ElementTree, path: Path, workers: int = 1
+) -> etree._ElementTree:
     nsuri = detect_ns(tree)
     ns = {"n": nsuri}
     root = tree.getroot()
@@ -298,92 +368,20 @@ def fix_xml(tree: etree._ElementTree, path: Path) -> etree._ElementTree:
     ):
         ensure_taxtable_entry_defaults(entry, nsuri)
         ensure_taxtable_entry_order(entry, nsuri)
+    tax_table = load_tax_table(root, nsuri)
 
     # Corrigir faturas
     invoices = root.findall(
         ".//n:SourceDocuments/n:SalesInvoices/n:Invoice", namespaces=ns
     )
-    for inv in invoices:
-        doc_totals = inv.find("./n:DocumentTotals", namespaces=ns)
-        if doc_totals is None:
-            doc_totals = etree.SubElement(inv, f"{{{nsuri}}}DocumentTotals")
-
-        net_total = Decimal("0")
-        tax_total = Decimal("0")
-
-        lines = inv.findall("./n:Line", namespaces=ns)
-        for ln in lines:
-            qty = parse_decimal(get_text(ln.find("./n:Quantity", namespaces=ns)))
-            unit = parse_decimal(get_text(ln.find("./n:UnitPrice", namespaces=ns)))
-            base = q6(qty * unit)
-            base2 = q2(base)
-
-            # Debit/Credit coerente (exclusivo)
-            debit_el = ln.find("./n:DebitAmount", namespaces=ns)
-            credit_el = ln.find("./n:CreditAmount", namespaces=ns)
-            if debit_el is not None and credit_el is None:
-                debit_el.text = fmt2(base2)
-            elif credit_el is not None and debit_el is None:
-                credit_el.text = fmt2(base2)
-            else:
-                # ambos presentes ou ambos ausentes -> ficar só com DebitAmount
-                if debit_el is None and credit_el is None:
-                    debit_el = etree.SubElement(ln, f"{{{nsuri}}}DebitAmount")
-                elif debit_el is not None and credit_el is not None:
-                    ln.remove(credit_el)
-                debit_el.text = fmt2(base2)
-
-            # Tax
-            tax = ln.find("./n:Tax", namespaces=ns)
-            if tax is None:
-                tax = etree.SubElement(ln, f"{{{nsuri}}}Tax")
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxType")
-                el.text = "IVA"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCode")
-                el.text = "NOR"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCountryRegion")
-                el.text = "AO"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                el.text = "14"
-
-            ttype = get_text(tax.find("./n:TaxType", namespaces=ns)) or "IVA"
-            tcode = get_text(tax.find("./n:TaxCode", namespaces=ns)) or "NOR"
-            tperc_el = tax.find("./n:TaxPercentage", namespaces=ns)
-            if tperc_el is None:
-                tperc_el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                tperc_el.text = "14"
-            else:
-                tperc_el.text = fmt_pct(get_text(tperc_el) or "0")
-            tperc = parse_decimal(tperc_el.text)
-
-            ensure_tax_country_region(tax, nsuri)
-            processed_tax_nodes.add(id(tax))
-
-            vat = q6(base * tperc / HUNDRED)
-            net_total += base
-            tax_total += vat
-
-            # Garantir TaxTable
-            ensure_tax_table_entry(root, nsuri, ttype, tcode, str(tperc))
-
-            # Ordem mínima na linha (elementos que tocamos)
-            ensure_line_order(ln, nsuri)
-
-        # Totais corrigidos e ordem
-        net2 = q2(net_total)
-        tax2 = q2(tax_total)
-        gross2 = q2(net_total + tax_total)
-
-        def set_total(tag: str, value: Decimal):
-            el = doc_totals.find(f"./n:{tag}", namespaces=ns)
-            if el is None:
-                el = etree.SubElement(doc_totals, f"{{{nsuri}}}{tag}")
-            el.text = fmt2(value)
-
-        set_total("NetTotal", net2)
-        set_total("TaxPayable", tax2)
-        set_total("GrossTotal", gross2)
-        ensure_document_totals_order(doc_totals, nsuri)
+    if workers > 1 and len(invoices) > INVOICE_BATCH_SIZE:
+        _fix_invoices_parallel(invoices, root, nsuri, tax_table, workers)
+    else:
+        invoice_fixer = DocumentFixer(
+            INVOICE, nsuri, line_rules(root, nsuri, tax_table)
+        )
+        for inv in invoices:
+            invoice_fixer.fix(inv, processed_tax_nodes)
 
     payments = root.findall(
         ".//n:SourceDocuments/n:Payments/n:Payment", namespaces=ns
@@ -439,8 +437,7 @@ def default_xsd_path() -> Path | None:
 
 def validate_xsd(tree: etree._ElementTree, xsd_path: Path) -> tuple[bool, list]:
     try:
-        schema_doc = etree.parse(str(xsd_path))
-        schema = etree.XMLSchema(schema_doc)
+        schema = compiled_schema(xsd_path)
         ok = schema.validate(tree)
         errors = []
         if not ok:
@@ -454,86 +451,200 @@ def validate_xsd(tree: etree._ElementTree, xsd_path: Path) -> tuple[bool, list]:
 _VERSION_SUFFIX_RE = re.compile(r"^(?P<base>.*)_v\.(?P<version>\d{2})(?:_invalido)?$")
 
 
-def next_version_paths(source: Path, output_dir: Path) -> tuple[Path, Path, str]:
-    """Determine the next available versioned filenames for the output XML."""
+def next_version_paths(
+    source: Path, output_dir: Path, compression: str | None = None
+) -> tuple[Path, Path, str]:
+    """Determine the next available versioned filenames for the output XML.
+
+    Para ficheiros comprimidos (``*.xml.zip``) a versão é calculada a partir
+    do XML contido; com ``compression`` os caminhos devolvidos terminam na
+    extensão correspondente (``*_v.03.xml.zip``). Uma versão já gravada em
+    qualquer formato não é reutilizada.
+    """
 
-    match = _VERSION_SUFFIX_RE.match(source.stem)
+    name = Path(archive.logical_name(source))
+    match = _VERSION_SUFFIX_RE.match(name.stem)
     if match:
-        base_stem = match.group("base") or source.stem
+        base_stem = match.group("base") or name.stem
         version = max(int(match.group("version")) + 1, 2)
     else:
-        base_stem = source.stem
+        base_stem = name.stem
         version = 2
 
+    extensions = [name.suffix] + [f"{name.suffix}.{c}" for c in archive.COMPRESSIONS]
+    extension = f"{name.suffix}.{compression}" if compression else name.suffix
     while True:
         suffix = f"_v.{version:02d}"
-        ok_path = output_dir / f"{base_stem}{suffix}{source.suffix}"
-        bad_path = output_dir / f"{base_stem}{suffix}_invalido{source.suffix}"
-        if not ok_path.exists() and not bad_path.exists():
-            return ok_path, bad_path, suffix
+        stems = (f"{base_stem}{suffix}", f"{base_stem}{suffix}_invalido")
+        if not any(
+            (output_dir / f"{stem}{ext}").exists()
+            for stem in stems
+            for ext in extensions
+        ):
+            return (
+                output_dir / f"{stems[0]}{extension}",
+                output_dir / f"{stems[1]}{extension}",
+                suffix,
+            )
         version += 1
 
 
+# --- Log -----------------------------------------------------------
+
+
+class RunLogger:
+    """Log das etapas do auto-fix gravado em ``log_format`` (opcional).
+
+    Sem ``log_format`` as chamadas a :meth:`log` são ignoradas e apenas as
+    mensagens no terminal são produzidas, como até aqui.
+    """
+
+    COLUMNS = ["timestamp", "action_code", "message", "note"]
+    WIDTHS = {"A": 21, "B": 22, "C": 60, "D": 80}
+
+    def __init__(
+        self, base_name: str, output_dir: Path, log_format: str | None = None
+    ):
+        self.sink: IssueSink | None = None
+        self.path: Path | None = None
+        if log_format:
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+            self.sink = open_issue_sink(
+                output_dir / f"{base_name}_{stamp}_autofix_hard",
+                self.COLUMNS,
+                log_format,
+                widths=self.WIDTHS,
+            )
+            self.path = self.sink.path
+
+    def log(self, action_code: str, message: str, *, note: str = "") -> None:
+        if self.sink is not None:
+            self.sink.write(
+                [datetime.utcnow().isoformat(), action_code, message, note]
+            )
+
+    def flush(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+
+
+def _open_source(in_path: Path) -> BalancedSource:
+    """Origem de ``in_path`` com o equilíbrio de ``WorkDocument`` reparado.
+
+    A reparação é feita durante a leitura (também nos ``.zip``/``.gz``/``.xz``,
+    sem extracção para disco) e o ficheiro de entrada nunca é alterado. Cada
+    chamada da origem devolve um novo fluxo para ``etree.parse``/``iterparse``;
+    ``repaired`` só é definitivo depois de uma leitura completa.
+    """
+
+    return BalancedSource(in_path)
+
+
+def write_output(
+    tree: etree._ElementTree, out_path: Path, splice: SpliceWriter | None = None
+) -> None:
+    """Gravar o XML corrigido, reaproveitando o original com ``splice``."""
+
+    if splice is None:
+        archive.write_tree(
+            tree, out_path, pretty_print=True, xml_declaration=True, encoding="UTF-8"
+        )
+        return
+    splice.write(out_path)
+    if not splice.spliced:
+        print(
+            "[ALERTA] Não foi possível reaproveitar o XML original; "
+            "ficheiro gravado por inteiro."
+        )
+
+
 # --- Main ----------------------------------------------------------
 
 
-def main(argv: list[str] | None = None) -> None:
-    parser = argparse.ArgumentParser(description="Auto-Fix SAF-T (AO) precisão alta")
-    parser.add_argument("xml", help="Ficheiro SAF-T a corrigir.")
-    parser.add_argument(
-        "--xsd",
-        dest="xsd_path",
-        help="Caminho para o XSD a usar na validação.",
-    )
-    parser.add_argument(
-        "--output-dir",
-        dest="output_dir",
-        help="Pasta onde gravar o XML corrigido.",
+def _cache_key(args: argparse.Namespace, in_path: Path) -> CacheKey:
+    """Chave da cache: entrada, regras, XSD, versão e opções que mudam o XML."""
+
+    xsd_path = Path(args.xsd_path).expanduser() if args.xsd_path else default_xsd_path()
+    return CacheKey.build(
+        "autofix-hard",
+        in_path,
+        xsd_path,
+        {
+            "xsd": args.xsd_path,
+            "log_format": args.log_format,
+            "compress": args.compress,
+            "splice": args.splice,
+        },
     )
-    args = parser.parse_args(argv)
 
-    in_path = Path(args.xml)
-    if not in_path.exists():
-        for base in (Path.cwd(), SCRIPT_DIR, PROJECT_ROOT):
-            candidate = base / in_path.name
-            if candidate.exists():
-                in_path = candidate
-                break
-        else:
-            print(f"[ERRO] Ficheiro não encontrado: {in_path}")
-            sys.exit(2)
 
-    in_path = in_path.resolve()
+def _exit_with_cached(cached: CachedResult) -> None:
+    """Repetição de um pedido já calculado: indicar o resultado anterior."""
 
-    if args.output_dir:
-        output_dir = Path(args.output_dir).expanduser()
-    else:
-        output_dir = in_path.parent
+    print(
+        "[OK] Mesma entrada, regras, XSD e versão de uma execução anterior; "
+        f"XML em: {cached.output}"
+    )
+    if cached.log is not None:
+        print(f"[OK] Log em: {cached.log}")
+    print("     (use --force para recalcular)")
+    sys.exit(cached.exit_code)
+
+
+def _store_result(
+    cache: ResultCache,
+    key: CacheKey,
+    out_paths: tuple[Path, Path],
+    log_path: Path | None,
+    exit_code: Any,
+) -> None:
+    """Guardar na cache o XML gravado (válido ou ``_invalido``) por esta execução."""
+
+    output = next((path for path in out_paths if path.exists()), None)
+    if output is None or exit_code not in (0, 2):
+        return
     try:
-        output_dir.mkdir(parents=True, exist_ok=True)
+        cache.store(key, output, log_path, exit_code)
     except OSError as exc:
-        print(f"[ERRO] Não foi possível criar a pasta de destino '{output_dir}': {exc}")
-        sys.exit(2)
-    output_dir = output_dir.resolve()
+        print(f"[ALERTA] Não foi possível actualizar a cache: {exc}")
 
-    if repair_workdocument_balance_in_file(in_path):
-        print(
-            "[INFO] Inseridos encerramentos em falta de WorkDocument antes do parse."
-        )
 
+def _run(
+    args: argparse.Namespace, in_path: Path, output_dir: Path, logger: RunLogger
+) -> None:
+    """Corrigir ``in_path`` conforme ``args``; termina sempre com ``sys.exit``."""
+
+    source = _open_source(in_path)
     try:
-        tree = etree.parse(str(in_path))
+        tree = etree.parse(source())
     except Exception as ex:
         print(f"[ERRO] Falha no parse do XML: {ex}")
+        logger.log("XML_PARSE_ERROR", "Falha no parse do XML", note=str(ex))
+        logger.flush()
         sys.exit(2)
+    if source.repaired:
+        print(
+            "[INFO] Inseridos encerramentos em falta de WorkDocument durante o parse."
+        )
+        logger.log(
+            "FIX_WORKDOCUMENT_TAGS",
+            "Inseridos encerramentos em falta de WorkDocument",
+        )
 
-    tree = fix_xml(tree, in_path)
+    splice = SpliceWriter(tree, source().read()) if args.splice else None
+    tree = fix_xml(tree, in_path, workers=args.workers)
 
     # validar XSD se disponível
     if args.xsd_path:
         cli_xsd_path = Path(args.xsd_path).expanduser()
         if not cli_xsd_path.exists():
             print(f"[ERRO] XSD especificado não encontrado: {cli_xsd_path.resolve()}")
+            logger.log(
+                "XSD_NOT_FOUND",
+                "XSD fornecido não encontrado",
+                note=str(cli_xsd_path.resolve()),
+            )
+            logger.flush()
             sys.exit(2)
         xsd_path: Path | None = cli_xsd_path.resolve()
     else:
@@ -541,23 +652,24 @@ def main(argv: list[str] | None = None) -> None:
         if xsd_path is not None:
             xsd_path = xsd_path.resolve()
 
-    out_ok, out_bad, version_suffix = next_version_paths(in_path, output_dir)
+    out_ok, out_bad, version_suffix = next_version_paths(
+        in_path, output_dir, args.compress
+    )
     version_label = version_suffix.lstrip("_")
 
     if xsd_path and xsd_path.exists():
         ok, errs = validate_xsd(tree, xsd_path)
         if ok:
-            tree.write(
-                str(out_ok), pretty_print=True, xml_declaration=True, encoding="UTF-8"
-            )
-            print(
+            write_output(tree, out_ok, splice)
+            msg = (
                 f"[OK] XML {version_label} (válido por XSD: {xsd_path}) criado em: {out_ok}"
             )
+            print(msg)
+            logger.log("INFO_END", "Fim do Auto-Fix (XSD OK)", note=msg)
+            logger.flush()
             sys.exit(0)
         else:
-            tree.write(
-                str(out_bad), pretty_print=True, xml_declaration=True, encoding="UTF-8"
-            )
+            write_output(tree, out_bad, splice)
             print(
                 f"[ALERTA] XML {version_label} criado em: {out_bad}, mas NÃO passou o XSD {xsd_path}:"
             )
@@ -565,17 +677,123 @@ def main(argv: list[str] | None = None) -> None:
                 print(" -", m)
             if len(errs) > 20:
                 print(f"   (+{len(errs)-20} erros adicionais)")
+            for m in errs:
+                logger.log("XSD_ERROR", "Erro de XSD", note=m)
+            logger.log("INFO_END", "Fim do Auto-Fix (XSD FAIL)", note=str(out_bad))
+            logger.flush()
             sys.exit(2)
     else:
         # Sem XSD, gravamos mesmo assim (não garantimos)
-        tree.write(
-            str(out_ok), pretty_print=True, xml_declaration=True, encoding="UTF-8"
-        )
-        print(
-            f"[OK] XML {version_label} criado em: {out_ok} (não foi possível validar XSD)"
-        )
+        write_output(tree, out_ok, splice)
+        msg = f"[OK] XML {version_label} criado em: {out_ok} (não foi possível validar XSD)"
+        print(msg)
+        logger.log("XSD_MISSING", "XSD não encontrado; validação XSD ignorada")
+        logger.log("INFO_END", "Fim do Auto-Fix (sem XSD)", note=msg)
+        logger.flush()
         sys.exit(0)
 
 
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Auto-Fix SAF-T (AO) precisão alta")
+    parser.add_argument("xml", help="Ficheiro SAF-T a corrigir.")
+    parser.add_argument(
+        "--xsd",
+        dest="xsd_path",
+        help="Caminho para o XSD a usar na validação.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        dest="output_dir",
+        help="Pasta onde gravar o XML corrigido.",
+    )
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        choices=LOG_FORMATS,
+        help=(
+            "Gravar um log das etapas neste formato na pasta de destino "
+            "(por omissão não é criado log)."
+        ),
+    )
+    parser.add_argument(
+        "--compress",
+        choices=archive.COMPRESSIONS,
+        help=(
+            "Gravar o XML corrigido directamente comprimido neste formato "
+            "(ex.: *_v.03.xml.zip)."
+        ),
+    )
+    parser.add_argument(
+        "--splice",
+        action="store_true",
+        help=(
+            "Copiar do ficheiro original tudo o que não foi corrigido e "
+            "reescrever só os elementos alterados."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Número de processos para corrigir as faturas em paralelo "
+            "(por omissão 1). O XML final é idêntico ao da execução sequencial."
+        ),
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help=(
+            "Recalcular mesmo que a mesma entrada já tenha sido corrigida com "
+            "as mesmas regras, XSD e versão (ver pasta .saftao-cache)."
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers deve ser um inteiro positivo")
+
+    in_path = Path(args.xml)
+    if not in_path.exists():
+        for base in (Path.cwd(), SCRIPT_DIR, PROJECT_ROOT):
+            candidate = base / in_path.name
+            if candidate.exists():
+                in_path = candidate
+                break
+        else:
+            print(f"[ERRO] Ficheiro não encontrado: {in_path}")
+            sys.exit(2)
+
+    in_path = in_path.resolve()
+
+    if args.output_dir:
+        output_dir = Path(args.output_dir).expanduser()
+    else:
+        output_dir = in_path.parent
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        print(f"[ERRO] Não foi possível criar a pasta de destino '{output_dir}': {exc}")
+        sys.exit(2)
+    output_dir = output_dir.resolve()
+
+    cache = ResultCache.for_output_dir(output_dir)
+    key = _cache_key(args, in_path)
+    if not args.force:
+        cached = cache.lookup(key)
+        if cached is not None:
+            _exit_with_cached(cached)
+    out_paths = next_version_paths(in_path, output_dir, args.compress)[:2]
+
+    logger = RunLogger(archive.source_stem(in_path), output_dir, args.log_format)
+    logger.log("INFO_START", "Início do Auto-Fix (hard)", note=str(in_path))
+    try:
+        _run(args, in_path, output_dir, logger)
+    except SystemExit as exc:
+        if cache is not None:
+            _store_result(cache, key, out_paths, logger.path, exc.code)
+        raise
+
+
 if __name__ == "__main__":  # pragma: no cover - execução directa
     raise SystemExit(main())
@@ -24,66 +24,90 @@
   * XML: cria versões numeradas do ficheiro original ``*_v.xx.xml``. Quando a
     validação XSD falha é acrescentado ``_invalido`` ao nome.
   * LOG Excel: ``NOME_XML_YYYYMMDDTHHMMSSZ_autofix.xlsx`` (ações aplicadas,
-    antes/depois) na pasta de saída.
+    antes/depois) na pasta de saída; ``--log-format`` permite gravá-lo em
+    CSV, JSON Lines ou SQLite.
 - Permite definir uma pasta de destino alternativa através de ``--output-dir``.
+- Um pedido repetido (mesma entrada, regras, XSD, versão e opções) devolve o
+  XML e o log da execução anterior sem recalcular (ver :mod:`saftao.cache`);
+  ``--force`` recalcula.
+- ``--stream`` corrige documento a documento (duas leituras ``iterparse``),
+  com o mesmo XML e o mesmo log, sem carregar ``SourceDocuments`` em memória.
+- ``--splice`` grava só os elementos alterados e copia o resto do original
+  byte a byte (ver :mod:`saftao.splice`).
+- ``--only-issues LOG`` corrige só os documentos e as entradas do
+  ``MasterFiles`` referidos num log do ``validate``; os restantes são
+  copiados sem alterações (ver :mod:`saftao.autofix.scope`).
+- ``--plan`` não grava XML: guarda as alterações (caminho, campos com o valor
+  antigo e o novo, códigos) em JSON ou SQLite para rever e aplicar depois com
+  ``apply-plan`` (ver :mod:`saftao.plan`).
 
 Uso::
 
     python saft_ao_autofix_soft.py MEU_FICHEIRO.xml [--output-dir PASTA_DESTINO]
+    python saft_ao_autofix_soft.py MEU_FICHEIRO.xml --stream
 """
 
 import argparse
 import re
 import sys
 import traceback
+import uuid
 from datetime import datetime
-from decimal import ROUND_HALF_UP, Decimal, InvalidOperation, getcontext
+from decimal import Decimal, getcontext
+from io import BytesIO
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from lxml import etree
 
-SCRIPT_DIR = Path(__file__).resolve().parent
-PROJECT_ROOT = Path(__file__).resolve().parents[3]
-
 from saftao.autofix._header import (
     ensure_company_address_building_number,
     normalise_company_postal_code,
     normalise_tax_registration_number,
 )
 from saftao.autofix._namespace import normalise_customer_namespace
+from saftao.autofix.scope import FixScope, load_scope
+from saftao.autofix.documents import (
+    FULL_IDENTITY,
+    INVOICE,
+    WORK_DOCUMENT,
+    DocumentFamily,
+    DocumentFixer,
+    LineFixRules,
+)
 from saftao.autofix.soft import (
+    customer_listing_path,
     ensure_invoice_customers_exported_tree,
+    export_missing_customers,
+    normalize_invoice_type_vd_invoice,
     normalize_invoice_type_vd_tree,
 )
-from saftao.autofix.workdocument_balance import (
-    repair_workdocument_balance_in_file,
-)
+from saftao.autofix.workdocument_balance import BalancedSource
+from saftao.cache import CacheKey, CachedResult, ResultCache, file_digest
+from saftao.logging import LOG_FORMATS, open_issue_sink
+from saftao.plan import PLAN_FORMATS, LogRow, build_plan, write_plan
+from saftao import archive
 from saftao.rules import iter_tax_elements, resolve_tax_context
+from saftao.schema import (
+    compiled_schema,
+    locate_schema_errors,
+    schema_error_entries,
+)
+from saftao.splice import SpliceWriter
+from saftao.tax_table import TaxTable, load_tax_table, tax_key
+from saftao.utils import LazyXPath, path_step, relative_path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
 
 # Precisão alta
 getcontext().prec = 28
 
 NS_DEFAULT = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
-AMT2 = Decimal("0.01")
-AMT6 = Decimal("0.000001")
-HUNDRED = Decimal("100")
 
 # ------------------------- Utilitários numéricos -------------------------
 
 
-def q2(v: Decimal) -> Decimal:
-    return v.quantize(AMT2, rounding=ROUND_HALF_UP)
-
-
-def q6(v: Decimal) -> Decimal:
-    return v.quantize(AMT6, rounding=ROUND_HALF_UP)
-
-
-def fmt2(x: Decimal) -> str:
-    return f"{x:.2f}"
-
-
 def fmt_pct(txt: str) -> str:
     """Percentagem coerente: inteiro → '14'; senão 2 casas → '14.25'."""
     try:
@@ -95,15 +119,6 @@ def fmt_pct(txt: str) -> str:
     return f"{v:.2f}"
 
 
-def parse_decimal(text: Optional[str], default: Decimal = Decimal("0")) -> Decimal:
-    if text is None:
-        return default
-    try:
-        return Decimal(text.strip())
-    except (InvalidOperation, ValueError):
-        return default
-
-
 def detect_ns(tree: etree._ElementTree) -> str:
     root = tree.getroot()
     if root.tag.startswith("{") and "}" in root.tag:
@@ -121,6 +136,8 @@ def get_text(el):
 class ExcelLogger:
     """
     Logger em Excel (.xlsx) criado na pasta indicada (ou CWD por omissão).
+    Cada linha é gravada de imediato no *sink* de ``log_format`` (ver
+    :mod:`saftao.logging`); ``flush`` fecha o ficheiro.
     Colunas:
       timestamp, action_code, message, xpath, invoice, line,
       field, old_value, new_value, note, extra
@@ -140,40 +157,45 @@ class ExcelLogger:
         "extra",
     ]
 
-    def __init__(self, base_name: str, output_dir: Path | None = None):
-        from openpyxl import Workbook
-
+    WIDTHS = {
+        "A": 21,
+        "B": 18,
+        "C": 60,
+        "D": 50,
+        "E": 18,
+        "F": 8,
+        "G": 18,
+        "H": 20,
+        "I": 20,
+        "J": 40,
+        "K": 40,
+    }
+
+    def __init__(
+        self,
+        base_name: str,
+        output_dir: Path | None = None,
+        log_format: str = "xlsx",
+    ):
         self.stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
         target_dir = (
             Path(output_dir).expanduser() if output_dir is not None else Path.cwd()
         )
-        self.path = target_dir / f"{base_name}_{self.stamp}_autofix.xlsx"
-        self.wb = Workbook()
-        self.ws = self.wb.active
-        self.ws.title = "AutoFix Log"
-        self.ws.append(self.COLUMNS)
-        widths = {
-            "A": 21,
-            "B": 18,
-            "C": 60,
-            "D": 50,
-            "E": 18,
-            "F": 8,
-            "G": 18,
-            "H": 20,
-            "I": 20,
-            "J": 40,
-            "K": 40,
-        }
-        for col, w in widths.items():
-            self.ws.column_dimensions[col].width = w
+        self.sink = open_issue_sink(
+            target_dir / f"{base_name}_{self.stamp}_autofix",
+            self.COLUMNS,
+            log_format,
+            title="AutoFix Log",
+            widths=self.WIDTHS,
+        )
+        self.path = self.sink.path
 
     def log(
         self,
         action_code: str,
         message: str,
         *,
-        xpath: str = "",
+        xpath: str | LazyXPath = "",
         invoice: str = "",
         line: str = "",
         field: str = "",
@@ -191,7 +213,7 @@ def log(
             datetime.utcnow().isoformat(),
             action_code,
             message,
-            xpath,
+            str(xpath),
             invoice,
             line,
             field,
@@ -200,10 +222,10 @@ def log(
             note,
             extra_text,
         ]
-        self.ws.append(row)
+        self.sink.write(row)
 
     def flush(self):
-        self.wb.save(self.path)
+        self.sink.close()
 
 
 # ------------------------- Logger técnico --------------------------------
@@ -346,9 +368,14 @@ def _ensure(tag: str, default: str, action: str) -> bool:
     return changed
 
 
-
-
-def normalise_masterfile_customers(root, nsuri: str, logger: ExcelLogger) -> None:
+def normalise_masterfile_customers(
+    root,
+    nsuri: str,
+    logger: ExcelLogger,
+    *,
+    cleanup: bool = True,
+    select: Optional[Callable[[Any], bool]] = None,
+) -> bool:
     """Remove explicit namespace prefixes from MasterFiles customers."""
 
     def _log(customer_id: str) -> None:
@@ -361,7 +388,9 @@ def _log(customer_id: str) -> None:
             note="Elemento do MasterFiles movido para o namespace padrão",
         )
 
-    normalise_customer_namespace(root, nsuri, on_fix=_log)
+    return normalise_customer_namespace(
+        root, nsuri, on_fix=_log, cleanup=cleanup, select=select
+    )
 
 
 def normalise_header_tax_registration(root, nsuri: str, logger: ExcelLogger) -> None:
@@ -427,7 +456,7 @@ def ensure_tax_country_region(
     *,
     owner: str,
     line: int | str | None,
-    xpath: str,
+    xpath: str | LazyXPath,
     default: str = "AO",
 ) -> None:
     """Garantir presença e valor de ``TaxCountryRegion`` num bloco ``Tax``."""
@@ -466,16 +495,24 @@ def ensure_tax_country_region(
 # ------------------------- Construção / fixes ----------------------------
 
 
-def normalize_taxtable_percentages(root, nsuri: str, logger: ExcelLogger):
+def normalize_taxtable_percentages(
+    root,
+    nsuri: str,
+    logger: ExcelLogger,
+    select: Optional[Callable[[Any], bool]] = None,
+):
     """
     Normaliza TaxPercentage em todas as TaxTableEntry (inteiro se exato; senão
-    2 casas) e assegura ordem.
+    2 casas) e assegura ordem. Com ``select`` só são tocadas as entradas que
+    aceita.
     """
     ns = {"n": nsuri}
     changed = False
     for entry in root.findall(
         ".//n:MasterFiles/n:TaxTable/n:TaxTableEntry", namespaces=ns
     ):
+        if select is not None and not select(entry):
+            continue
         if ensure_taxtable_entry_defaults(entry, nsuri, logger):
             changed = True
         pct_el = entry.find("./n:TaxPercentage", namespaces=ns)
@@ -502,6 +539,7 @@ def normalize_taxtable_percentages(root, nsuri: str, logger: ExcelLogger):
 
 
 def ensure_tax_table_entry(
+    table: TaxTable,
     root,
     nsuri: str,
     ttype: str,
@@ -510,44 +548,24 @@ def ensure_tax_table_entry(
     logger: ExcelLogger,
     inv_no: str,
     ln_idx: int,
-    ln_xpath: str,
+    ln_xpath: str | LazyXPath,
 ):
-    ns = {"n": nsuri}
-    mf = root.find(".//n:MasterFiles", namespaces=ns)
-    if mf is None:
-        mf = etree.SubElement(root, f"{{{nsuri}}}MasterFiles")
-        logger.log("ADD_NODE", "Criado MasterFiles", note="MasterFiles inexistente")
-
-    tt = mf.find("./n:TaxTable", namespaces=ns)
-    if tt is None:
-        tt = etree.SubElement(mf, f"{{{nsuri}}}TaxTable")
+    # já existe? (índice da TaxTable construído uma vez por documento)
+    if tax_key(ttype, tcode, tperc_text) in table:
+        return
+
+    if table.element is None:
+        ns = {"n": nsuri}
+        mf = root.find(".//n:MasterFiles", namespaces=ns)
+        if mf is None:
+            mf = etree.SubElement(root, f"{{{nsuri}}}MasterFiles")
+            logger.log(
+                "ADD_NODE", "Criado MasterFiles", note="MasterFiles inexistente"
+            )
+        table.element = etree.SubElement(mf, f"{{{nsuri}}}TaxTable")
         logger.log("ADD_NODE", "Criado TaxTable", note="TaxTable inexistente")
 
-    # já existe?
-    for entry in tt.findall("./n:TaxTableEntry", namespaces=ns):
-        e_type = get_text(entry.find("./n:TaxType", namespaces=ns)) or "IVA"
-        e_code = get_text(entry.find("./n:TaxCode", namespaces=ns)) or "NOR"
-        e_pct = get_text(entry.find("./n:TaxPercentage", namespaces=ns)) or "0"
-        try:
-            if (
-                e_type == ttype
-                and e_code == tcode
-                and Decimal(e_pct) == Decimal(tperc_text)
-            ):
-                ensure_taxtable_entry_order(entry)
-                return
-        except Exception:
-            continue
-
-    new = etree.SubElement(tt, f"{{{nsuri}}}TaxTableEntry")
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxType")
-    el.text = ttype or "IVA"
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxCode")
-    el.text = tcode or "NOR"
-    el = etree.SubElement(new, f"{{{nsuri}}}Description")
-    el.text = "Auto-added for consistency"
-    el = etree.SubElement(new, f"{{{nsuri}}}TaxPercentage")
-    el.text = fmt_pct(tperc_text)
+    new = table.insert(ttype, tcode, fmt_pct(tperc_text))
     ensure_taxtable_entry_order(new)
     logger.log(
         "ADD_TAXTABLEENTRY",
@@ -562,19 +580,8 @@ def ensure_tax_table_entry(
     )
 
 
-def fix_xml(
-    tree: etree._ElementTree, in_path: Path, logger: ExcelLogger
-) -> etree._ElementTree:
-    nsuri = detect_ns(tree)
-    ns = {"n": nsuri}
-    root = tree.getroot()
-    processed_tax_nodes: set[int] = set()
-
-    normalise_masterfile_customers(root, nsuri, logger)
-    normalise_header_tax_registration(root, nsuri, logger)
-
-    vd_issues = normalize_invoice_type_vd_tree(tree)
-    for issue in vd_issues:
+def log_invoice_type_issues(issues, logger: ExcelLogger) -> None:
+    for issue in issues:
         logger.log(
             issue.code,
             "InvoiceType normalizado para FR",
@@ -585,444 +592,103 @@ def fix_xml(
             note=issue.message,
         )
 
-    # 1) Normalizar TaxTable (percentagens e ordem)
-    normalize_taxtable_percentages(root, nsuri, logger)
-
-    # 2) Corrigir faturas
-    invoices = root.findall(
-        ".//n:SourceDocuments/n:SalesInvoices/n:Invoice", namespaces=ns
-    )
-    for inv in invoices:
-        inv_no = get_text(inv.find("./n:InvoiceNo", namespaces=ns)) or ""
-        doc_totals = inv.find("./n:DocumentTotals", namespaces=ns)
-        if doc_totals is None:
-            doc_totals = etree.SubElement(inv, f"{{{nsuri}}}DocumentTotals")
-            logger.log("ADD_NODE", "Criado DocumentTotals", invoice=inv_no)
-
-        net_total = Decimal("0")
-        tax_total = Decimal("0")
-
-        lines = inv.findall("./n:Line", namespaces=ns)
-        for idx, ln in enumerate(lines, start=1):
-            ln_xpath = etree.ElementTree(root).getpath(ln)
-
-            qty = parse_decimal(get_text(ln.find("./n:Quantity", namespaces=ns)))
-            unit = parse_decimal(get_text(ln.find("./n:UnitPrice", namespaces=ns)))
-            base = q6(qty * unit)
-            base2 = q2(base)
-
-            debit_el = ln.find("./n:DebitAmount", namespaces=ns)
-            credit_el = ln.find("./n:CreditAmount", namespaces=ns)
-
-            # Ajuste de montante por linha (preferimos manter o campo já existente)
-            if debit_el is not None and credit_el is None:
-                old = get_text(debit_el) or ""
-                new = fmt2(base2)
-                if old != new:
-                    logger.log(
-                        "FIX_LINE_AMOUNT",
-                        "DebitAmount ajustado para q2(qty*unit)",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        old_value=old,
-                        new_value=new,
-                        xpath=ln_xpath,
-                    )
-                debit_el.text = new
-            elif credit_el is not None and debit_el is None:
-                old = get_text(credit_el) or ""
-                new = fmt2(base2)
-                if old != new:
-                    logger.log(
-                        "FIX_LINE_AMOUNT",
-                        "CreditAmount ajustado para q2(qty*unit)",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="CreditAmount",
-                        old_value=old,
-                        new_value=new,
-                        xpath=ln_xpath,
-                    )
-                credit_el.text = new
-            else:
-                # ambos presentes ou ambos ausentes -> ficar só com DebitAmount
-                if debit_el is None and credit_el is not None:
-                    ln.remove(credit_el)
-                    debit_el = etree.SubElement(ln, f"{{{nsuri}}}DebitAmount")
-                    logger.log(
-                        "REMOVE_NODE",
-                        "Removido CreditAmount (duplicado)",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="CreditAmount",
-                        xpath=ln_xpath,
-                    )
-                    logger.log(
-                        "ADD_NODE",
-                        "Adicionado DebitAmount na linha",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        xpath=ln_xpath,
-                    )
-                elif debit_el is None and credit_el is None:
-                    debit_el = etree.SubElement(ln, f"{{{nsuri}}}DebitAmount")
-                    logger.log(
-                        "ADD_NODE",
-                        "Adicionado DebitAmount na linha",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        xpath=ln_xpath,
-                    )
-                debit_el.text = fmt2(base2)
-
-            # Tax
-            tax = ln.find("./n:Tax", namespaces=ns)
-            if tax is None:
-                tax = etree.SubElement(ln, f"{{{nsuri}}}Tax")
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxType")
-                el.text = "IVA"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCode")
-                el.text = "NOR"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCountryRegion")
-                el.text = "AO"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                el.text = "14"
-                logger.log(
-                    "ADD_NODE",
-                    "Criado bloco Tax na linha",
-                    invoice=inv_no,
-                    line=str(idx),
-                    field="Tax",
-                    xpath=ln_xpath,
-                )
-
-            ttype = get_text(tax.find("./n:TaxType", namespaces=ns)) or "IVA"
-            tcode = get_text(tax.find("./n:TaxCode", namespaces=ns)) or "NOR"
-            tperc_el = tax.find("./n:TaxPercentage", namespaces=ns)
-            if tperc_el is None:
-                tperc_el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                tperc_el.text = "14"
-                logger.log(
-                    "ADD_NODE",
-                    "Adicionado TaxPercentage em Tax",
-                    invoice=inv_no,
-                    line=str(idx),
-                    field="TaxPercentage",
-                    new_value="14",
-                    xpath=ln_xpath,
-                )
-            else:
-                old = get_text(tperc_el) or ""
-                new = fmt_pct(old or "0")
-                if old != new:
-                    logger.log(
-                        "FIX_TAX_PERCENT",
-                        "Formatado TaxPercentage (inteiro ou 2 casas)",
-                        invoice=inv_no,
-                        line=str(idx),
-                        field="TaxPercentage",
-                        old_value=old,
-                        new_value=new,
-                        xpath=ln_xpath,
-                )
-                tperc_el.text = new
-
-            ensure_tax_country_region(
-                tax,
-                nsuri,
-                logger,
-                owner=inv_no,
-                line=idx,
-                xpath=ln_xpath,
-            )
-            processed_tax_nodes.add(id(tax))
-
-            tperc = parse_decimal(tperc_el.text)
-            vat = q6(base * tperc / HUNDRED)
-            net_total += base
-            tax_total += vat
-
-            ensure_tax_table_entry(
-                root, nsuri, ttype, tcode, str(tperc), logger, inv_no, idx, ln_xpath
-            )
-            ensure_line_order(ln)
-
-        # Totais (com Settlement e Withholding)
-        net2 = q2(net_total)
-        tax2 = q2(tax_total)
 
-        settlement_amount = Decimal("0")
-        withholding_amount = Decimal("0")
+def log_customer_issues(customer_issues, logger: ExcelLogger) -> None:
+    if customer_issues is None:
+        logger.log(
+            "AUTOADD_CUSTOMER_WARN",
+            "Lista de clientes auto-adicionados devolvida como None",
+        )
+        customer_issues = []
 
-        sett_el = doc_totals.find("./n:Settlement/n:SettlementAmount", namespaces=ns)
-        if sett_el is not None and (sett_el.text or "").strip():
-            settlement_amount = parse_decimal(sett_el.text)
+    for issue in customer_issues:
+        extra: Dict[str, Any] | None = None
+        if issue.details:
+            extra = {
+                key: value
+                for key, value in issue.details.items()
+                if key in {"customer_id", "source"}
+            }
+        logger.log(
+            issue.code,
+            "Cliente adicionado ao MasterFiles",
+            field="Customer",
+            note=issue.message,
+            extra=extra,
+        )
 
-        for w in doc_totals.findall("./n:WithholdingTax", namespaces=ns):
-            wamt_el = w.find("./n:WithholdingTaxAmount", namespaces=ns)
-            if wamt_el is not None and (wamt_el.text or "").strip():
-                withholding_amount += parse_decimal(wamt_el.text)
 
-        gross2 = q2(net2 - settlement_amount + tax2 - withholding_amount)
+def document_fixer(
+    family: DocumentFamily,
+    root,
+    nsuri: str,
+    tax_table: TaxTable,
+    logger: ExcelLogger,
+) -> DocumentFixer:
+    """Motor de linhas e totais (``Invoice``/``WorkDocument``) do modo *soft*.
 
-        def set_total(tag: str, value: Decimal):
-            el = doc_totals.find(f"./n:{tag}", namespaces=ns)
-            old = get_text(el) if el is not None else ""
-            if el is None:
-                el = etree.SubElement(doc_totals, f"{{{nsuri}}}{tag}")
-            new = fmt2(value)
-            if old != new:
-                logger.log(
-                    "FIX_TOTAL",
-                    f"{tag} ajustado",
-                    invoice=inv_no,
-                    field=tag,
-                    old_value=old or "",
-                    new_value=new,
-                    note="Identidade completa: Net - Settlement + Tax - Withholding",
-                )
-            el.text = new
+    As correcções são registadas em ``logger`` e as entradas em falta são
+    acrescentadas a ``tax_table`` (criando ``MasterFiles``/``TaxTable`` em
+    ``root`` se necessário).
+    """
 
-        set_total("TaxPayable", tax2)
-        set_total("NetTotal", net2)
-        set_total("GrossTotal", gross2)
-        ensure_document_totals_order(doc_totals)
+    def tax_region(tax, owner: str, line: int, xpath) -> None:
+        ensure_tax_country_region(
+            tax, nsuri, logger, owner=owner, line=line, xpath=xpath
+        )
 
-    payments = root.findall(
-        ".//n:SourceDocuments/n:Payments/n:Payment", namespaces=ns
-    )
-    for payment in payments:
-        pay_ref = get_text(payment.find("./n:PaymentRefNo", namespaces=ns)) or ""
-        lines = payment.findall("./n:Line", namespaces=ns)
-        for idx, line in enumerate(lines, start=1):
-            line_xpath = etree.ElementTree(root).getpath(line)
-            tax = line.find("./n:Tax", namespaces=ns)
-            if tax is None:
-                continue
-            ensure_tax_country_region(
-                tax,
-                nsuri,
-                logger,
-                owner=pay_ref,
-                line=idx,
-                xpath=line_xpath,
-            )
-            processed_tax_nodes.add(id(tax))
+    def tax_entry(ttype: str, tcode: str, tperc: str, owner: str, line: int, xpath):
+        ensure_tax_table_entry(
+            tax_table, root, nsuri, ttype, tcode, tperc, logger, owner, line, xpath
+        )
 
-    work_docs = root.findall(
-        ".//n:SourceDocuments/n:WorkingDocuments/n:WorkDocument",
-        namespaces=ns,
+    rules = LineFixRules(
+        identity=FULL_IDENTITY,
+        format_percentage=fmt_pct,
+        tax_region=tax_region,
+        tax_entry=tax_entry,
+        line_order=ensure_line_order,
+        totals_order=ensure_document_totals_order,
     )
-    for work_doc in work_docs:
-        doc_no = get_text(
-            work_doc.find("./n:DocumentNumber", namespaces=ns)
-        ) or ""
-        doc_totals = work_doc.find("./n:DocumentTotals", namespaces=ns)
-        if doc_totals is None:
-            doc_totals = etree.SubElement(work_doc, f"{{{nsuri}}}DocumentTotals")
-            logger.log(
-                "ADD_NODE",
-                "Criado DocumentTotals",
-                invoice=doc_no,
-                note="WorkDocument",
-            )
-
-        net_total = Decimal("0")
-        tax_total = Decimal("0")
-
-        lines = work_doc.findall("./n:Line", namespaces=ns)
-        for idx, line in enumerate(lines, start=1):
-            line_xpath = etree.ElementTree(root).getpath(line)
-
-            qty = parse_decimal(get_text(line.find("./n:Quantity", namespaces=ns)))
-            unit = parse_decimal(get_text(line.find("./n:UnitPrice", namespaces=ns)))
-            base = q6(qty * unit)
-            base2 = q2(base)
-
-            debit_el = line.find("./n:DebitAmount", namespaces=ns)
-            credit_el = line.find("./n:CreditAmount", namespaces=ns)
-
-            if debit_el is not None and credit_el is None:
-                old = get_text(debit_el) or ""
-                new = fmt2(base2)
-                if old != new:
-                    logger.log(
-                        "FIX_LINE_AMOUNT",
-                        "DebitAmount ajustado para q2(qty*unit)",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        old_value=old,
-                        new_value=new,
-                        xpath=line_xpath,
-                    )
-                debit_el.text = new
-            elif credit_el is not None and debit_el is None:
-                old = get_text(credit_el) or ""
-                new = fmt2(base2)
-                if old != new:
-                    logger.log(
-                        "FIX_LINE_AMOUNT",
-                        "CreditAmount ajustado para q2(qty*unit)",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="CreditAmount",
-                        old_value=old,
-                        new_value=new,
-                        xpath=line_xpath,
-                    )
-                credit_el.text = new
-            else:
-                if debit_el is None and credit_el is not None:
-                    line.remove(credit_el)
-                    debit_el = etree.SubElement(line, f"{{{nsuri}}}DebitAmount")
-                    logger.log(
-                        "REMOVE_NODE",
-                        "Removido CreditAmount (duplicado)",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="CreditAmount",
-                        xpath=line_xpath,
-                    )
-                    logger.log(
-                        "ADD_NODE",
-                        "Adicionado DebitAmount na linha",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        xpath=line_xpath,
-                    )
-                elif debit_el is None and credit_el is None:
-                    debit_el = etree.SubElement(line, f"{{{nsuri}}}DebitAmount")
-                    logger.log(
-                        "ADD_NODE",
-                        "Adicionado DebitAmount na linha",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="DebitAmount",
-                        xpath=line_xpath,
-                    )
-                debit_el.text = fmt2(base2)
-
-            tax = line.find("./n:Tax", namespaces=ns)
-            if tax is None:
-                tax = etree.SubElement(line, f"{{{nsuri}}}Tax")
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxType")
-                el.text = "IVA"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCode")
-                el.text = "NOR"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxCountryRegion")
-                el.text = "AO"
-                el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                el.text = "14"
-                logger.log(
-                    "ADD_NODE",
-                    "Criado bloco Tax na linha",
-                    invoice=doc_no,
-                    line=str(idx),
-                    field="Tax",
-                    xpath=line_xpath,
-                )
-
-            ttype = get_text(tax.find("./n:TaxType", namespaces=ns)) or "IVA"
-            tcode = get_text(tax.find("./n:TaxCode", namespaces=ns)) or "NOR"
-            tperc_el = tax.find("./n:TaxPercentage", namespaces=ns)
-            if tperc_el is None:
-                tperc_el = etree.SubElement(tax, f"{{{nsuri}}}TaxPercentage")
-                tperc_el.text = "14"
-                logger.log(
-                    "ADD_NODE",
-                    "Adicionado TaxPercentage em Tax",
-                    invoice=doc_no,
-                    line=str(idx),
-                    field="TaxPercentage",
-                    new_value="14",
-                    xpath=line_xpath,
-                )
-            else:
-                old = get_text(tperc_el) or ""
-                new = fmt_pct(old or "0")
-                if old != new:
-                    logger.log(
-                        "FIX_TAX_PERCENT",
-                        "Formatado TaxPercentage (inteiro ou 2 casas)",
-                        invoice=doc_no,
-                        line=str(idx),
-                        field="TaxPercentage",
-                        old_value=old,
-                        new_value=new,
-                        xpath=line_xpath,
-                    )
-                tperc_el.text = new
-
-            ensure_tax_country_region(
-                tax,
-                nsuri,
-                logger,
-                owner=doc_no,
-                line=idx,
-                xpath=line_xpath,
-            )
-            processed_tax_nodes.add(id(tax))
+    return DocumentFixer(family, nsuri, rules, logger)
 
-            try:
-                tperc = parse_decimal(tperc_el.text)
-            except Exception:
-                tperc = Decimal("0")
-            vat = q6(base * tperc / HUNDRED)
-            net_total += base
-            tax_total += vat
-
-            ensure_tax_table_entry(
-                root, nsuri, ttype, tcode, str(tperc), logger, doc_no, idx, line_xpath
-            )
-            ensure_line_order(line)
-
-        net2 = q2(net_total)
-        tax2 = q2(tax_total)
-
-        settlement_amount = Decimal("0")
-        withholding_amount = Decimal("0")
 
-        sett_el = doc_totals.find("./n:Settlement/n:SettlementAmount", namespaces=ns)
-        if sett_el is not None and (sett_el.text or "").strip():
-            settlement_amount = parse_decimal(sett_el.text)
-
-        for w in doc_totals.findall("./n:WithholdingTax", namespaces=ns):
-            wamt_el = w.find("./n:WithholdingTaxAmount", namespaces=ns)
-            if wamt_el is not None and (wamt_el.text or "").strip():
-                withholding_amount += parse_decimal(wamt_el.text)
-
-        gross2 = q2(net2 - settlement_amount + tax2 - withholding_amount)
-
-        def set_work_total(tag: str, value: Decimal) -> None:
-            el = doc_totals.find(f"./n:{tag}", namespaces=ns)
-            old = get_text(el) if el is not None else ""
-            if el is None:
-                el = etree.SubElement(doc_totals, f"{{{nsuri}}}{tag}")
-            new = fmt2(value)
-            if old != new:
-                logger.log(
-                    "FIX_TOTAL",
-                    f"{tag} ajustado",
-                    invoice=doc_no,
-                    field=tag,
-                    old_value=old or "",
-                    new_value=new,
-                    note="Identidade completa: Net - Settlement + Tax - Withholding",
-                )
-            el.text = new
+def fix_payment(
+    payment,
+    nsuri: str,
+    logger: ExcelLogger,
+    processed_tax_nodes: set[int],
+    path_of: Callable[[Any], Any] = LazyXPath,
+) -> None:
+    """Garantir ``TaxCountryRegion`` nas linhas de um ``Payment``."""
+    ns = {"n": nsuri}
+    pay_ref = get_text(payment.find("./n:PaymentRefNo", namespaces=ns)) or ""
+    lines = payment.findall("./n:Line", namespaces=ns)
+    for idx, line in enumerate(lines, start=1):
+        line_xpath = path_of(line)
+        tax = line.find("./n:Tax", namespaces=ns)
+        if tax is None:
+            continue
+        ensure_tax_country_region(
+            tax,
+            nsuri,
+            logger,
+            owner=pay_ref,
+            line=idx,
+            xpath=line_xpath,
+        )
+        processed_tax_nodes.add(id(tax))
 
-        set_work_total("TaxPayable", tax2)
-        set_work_total("NetTotal", net2)
-        set_work_total("GrossTotal", gross2)
-        ensure_document_totals_order(doc_totals)
 
-    doc_tree = etree.ElementTree(root)
-    for tax in iter_tax_elements(root, nsuri):
+def fix_other_taxes(
+    taxes,
+    nsuri: str,
+    logger: ExcelLogger,
+    processed_tax_nodes: set[int],
+    path_of: Callable[[Any], Any] = LazyXPath,
+) -> None:
+    """Garantir ``TaxCountryRegion`` nos ``Tax`` não tratados pelos documentos."""
+    for tax in taxes:
         if id(tax) in processed_tax_nodes:
             continue
         doc_type, doc_id, line_no = resolve_tax_context(tax, nsuri)
@@ -1033,10 +699,94 @@ def set_work_total(tag: str, value: Decimal) -> None:
             logger,
             owner=owner,
             line=line_no or "",
-            xpath=doc_tree.getpath(tax),
+            xpath=path_of(tax),
         )
         processed_tax_nodes.add(id(tax))
 
+
+def _entry_selector(scope: FixScope | None) -> Optional[Callable[[Any], bool]]:
+    """``select`` das entradas de ``Header``/``MasterFiles`` para ``scope``."""
+
+    if scope is None:
+        return None
+    return lambda element: scope.covers(element, element.getroottree().getpath(element))
+
+
+def fix_xml(
+    tree: etree._ElementTree,
+    in_path: Path,
+    logger: ExcelLogger,
+    scope: FixScope | None = None,
+) -> etree._ElementTree:
+    """Aplicar as correcções *soft* a ``tree``.
+
+    Com ``scope`` (``--only-issues``) só são corrigidos os documentos, as
+    entradas do ``MasterFiles`` e o ``Header`` referidos no log de validação;
+    os restantes ficam como estão.
+    """
+
+    nsuri = detect_ns(tree)
+    ns = {"n": nsuri}
+    root = tree.getroot()
+    processed_tax_nodes: set[int] = set()
+    select = _entry_selector(scope)
+
+    def selected(documents):
+        if scope is None:
+            return documents
+        return [document for document in documents if scope.covers(document)]
+
+    normalise_masterfile_customers(root, nsuri, logger, select=select)
+    header = root.find("./n:Header", namespaces=ns)
+    if select is None or (header is not None and select(header)):
+        normalise_header_tax_registration(root, nsuri, logger)
+
+    invoices = selected(
+        root.findall(".//n:SourceDocuments/n:SalesInvoices/n:Invoice", namespaces=ns)
+    )
+    if scope is None:
+        log_invoice_type_issues(normalize_invoice_type_vd_tree(tree), logger)
+    else:
+        issues = [normalize_invoice_type_vd_invoice(inv, nsuri) for inv in invoices]
+        log_invoice_type_issues([issue for issue in issues if issue], logger)
+
+    # 1) Normalizar TaxTable (percentagens e ordem)
+    normalize_taxtable_percentages(root, nsuri, logger, select)
+    tax_table = load_tax_table(root, nsuri)
+
+    # 2) Corrigir faturas
+    invoice_fixer = document_fixer(INVOICE, root, nsuri, tax_table, logger)
+    for inv in invoices:
+        invoice_fixer.fix(inv, processed_tax_nodes)
+
+    payments = selected(
+        root.findall(".//n:SourceDocuments/n:Payments/n:Payment", namespaces=ns)
+    )
+    for payment in payments:
+        fix_payment(payment, nsuri, logger, processed_tax_nodes)
+
+    work_docs = selected(
+        root.findall(
+            ".//n:SourceDocuments/n:WorkingDocuments/n:WorkDocument",
+            namespaces=ns,
+        )
+    )
+    work_fixer = document_fixer(WORK_DOCUMENT, root, nsuri, tax_table, logger)
+    for work_doc in work_docs:
+        work_fixer.fix(work_doc, processed_tax_nodes)
+
+    if scope is None:
+        taxes = iter_tax_elements(root, nsuri)
+    else:
+        taxes = [
+            tax
+            for document in selected(
+                root.findall("./n:SourceDocuments/*/*", namespaces=ns)
+            )
+            for tax in document.xpath(".//*[local-name()='Tax']")
+        ]
+    fix_other_taxes(taxes, nsuri, logger, processed_tax_nodes)
+
     try:
         customer_issues = ensure_invoice_customers_exported_tree(tree)
     except Exception as exc:
@@ -1046,163 +796,607 @@ def set_work_total(tag: str, value: Decimal) -> None:
             note=str(exc),
         )
         raise
+    log_customer_issues(customer_issues, logger)
 
-    if customer_issues is None:
-        logger.log(
-            "AUTOADD_CUSTOMER_WARN",
-            "Lista de clientes auto-adicionados devolvida como None",
-        )
-        customer_issues = []
+    return tree
 
-    for issue in customer_issues:
-        extra: Dict[str, Any] | None = None
-        if issue.details:
-            extra = {
-                key: value
-                for key, value in issue.details.items()
-                if key in {"customer_id", "source"}
-            }
-        logger.log(
-            issue.code,
-            "Cliente adicionado ao MasterFiles",
-            field="Customer",
-            note=issue.message,
-            extra=extra,
-        )
 
-    return tree
+# ------------------------- Modo streaming (iterparse) --------------------
 
+_DOCUMENT_TAGS = {
+    "SalesInvoices": "Invoice",
+    "Payments": "Payment",
+    "WorkingDocuments": "WorkDocument",
+}
 
-# ------------------------- XSD -------------------------------------------
 
+class _FixFailed(Exception):
+    """Falha de uma correcção durante a pré-leitura (não é erro de parse)."""
 
-def default_xsd_path():
-    name = "SAFTAO1.01_01.xsd"
-    search_dirs = [
-        Path.cwd(),
-        SCRIPT_DIR,
-        PROJECT_ROOT,
-        PROJECT_ROOT / "schemas",
-    ]
-    for base in search_dirs:
-        candidate = base / name
-        if candidate.exists():
-            return candidate
-    return None
 
+class _NullLog:
+    """Logger da pré-leitura: as correcções repetem-se (e registam-se) depois."""
 
-def validate_xsd(tree: etree._ElementTree, xsd_path: Path):
-    try:
-        schema_doc = etree.parse(str(xsd_path))
-        schema = etree.XMLSchema(schema_doc)
-        ok = schema.validate(tree)
-        errors = []
-        if not ok:
-            for e in schema.error_log:
-                errors.append(f"line {e.line}: {e.message}")
-        return ok, errors
-    except Exception as ex:
-        return False, [f"XSD validation exception: {ex}"]
+    def log(self, *args: Any, **kwargs: Any) -> None:
+        pass
 
 
-_VERSION_SUFFIX_RE = re.compile(r"^(?P<base>.*)_v\.(?P<version>\d{2})(?:_invalido)?$")
+class _BufferedLog:
+    """Linhas retidas para sair pela ordem do modo DOM (XPath já calculado)."""
 
+    def __init__(self) -> None:
+        self.rows: List[tuple[str, str, Dict[str, Any]]] = []
 
-def next_version_paths(source: Path, output_dir: Path) -> tuple[Path, Path, str]:
-    """Calculate the next available versioned output paths for the XML."""
+    def log(self, action_code: str, message: str, **kwargs: Any) -> None:
+        if "xpath" in kwargs:
+            kwargs["xpath"] = str(kwargs["xpath"])
+        self.rows.append((action_code, message, kwargs))
 
-    match = _VERSION_SUFFIX_RE.match(source.stem)
-    if match:
-        base_stem = match.group("base") or source.stem
-        version = max(int(match.group("version")) + 1, 2)
-    else:
-        base_stem = source.stem
-        version = 2
+    def replay(self, logger: ExcelLogger) -> None:
+        for action_code, message, kwargs in self.rows:
+            logger.log(action_code, message, **kwargs)
+        self.rows.clear()
 
-    while True:
-        suffix = f"_v.{version:02d}"
-        ok_path = output_dir / f"{base_stem}{suffix}{source.suffix}"
-        bad_path = output_dir / f"{base_stem}{suffix}_invalido{source.suffix}"
-        if not ok_path.exists() and not bad_path.exists():
-            return ok_path, bad_path, suffix
-        version += 1
 
+class _DocumentXPath:
+    """XPath (formato ``getpath``) de um elemento de um documento em fluxo."""
 
-# ------------------------- Main ------------------------------------------
+    __slots__ = ("base", "document", "element")
 
+    def __init__(self, base: str, document, element) -> None:
+        self.base = base
+        self.document = document
+        self.element = element
 
-def main(argv: list[str] | None = None) -> None:
-    parser = argparse.ArgumentParser(description="Auto-Fix SAF-T (AO) soft")
-    parser.add_argument("xml", help="Ficheiro SAF-T a corrigir.")
-    parser.add_argument(
-        "--xsd",
-        dest="xsd_path",
-        help="Caminho para o XSD a usar na validação.",
+    def __str__(self) -> str:
+        return self.base + relative_path(self.document, self.element)
+
+
+def _has_text_child(element) -> bool:
+    return element.text is not None or any(
+        child.tail is not None for child in element
     )
-    parser.add_argument(
-        "--output-dir",
-        dest="output_dir",
-        help="Pasta onde gravar o XML corrigido e o log.",
-    )
-    args = parser.parse_args(argv)
 
-    in_path = Path(args.xml)
-    if not in_path.exists():
-        for base in (Path.cwd(), SCRIPT_DIR, PROJECT_ROOT):
-            candidate = base / in_path.name
-            if candidate.exists():
-                in_path = candidate
-                break
-        else:
-            print(f"[ERRO] Ficheiro não encontrado: {in_path}")
-            sys.exit(2)
 
-    in_path = in_path.resolve()
+def _drop_preceding(element) -> None:
+    parent = element.getparent()
+    for sibling in list(element.itersiblings(preceding=True)):
+        parent.remove(sibling)
 
-    if args.output_dir:
-        output_dir = Path(args.output_dir).expanduser()
-    else:
-        output_dir = in_path.parent
-    try:
-        output_dir.mkdir(parents=True, exist_ok=True)
-    except OSError as exc:
-        print(f"[ERRO] Não foi possível criar a pasta de destino '{output_dir}': {exc}")
-        sys.exit(2)
-    output_dir = output_dir.resolve()
 
-    logger = ExcelLogger(base_name=in_path.stem, output_dir=output_dir)
-    logger.log("INFO_START", "Início do Auto-Fix (soft)", extra={"xml": str(in_path)})
+def _iter_source(source, *, recover: bool, release: Callable[[Any], None]):
+    """Percorrer ``source`` com ``iterparse`` por documento de ``SourceDocuments``.
 
-    cli_xsd_path: Path | None = None
-    if args.xsd_path:
-        cli_xsd_path = Path(args.xsd_path).expanduser()
-        if not cli_xsd_path.exists():
-            msg = f"[ERRO] XSD fornecido não encontrado: {cli_xsd_path}"
-            print(msg)
+    Produz ``("source", SourceDocuments)``, ``("section", secção)`` (no início
+    de cada secção), ``("document", elemento)`` no fim de cada elemento de
+    4.º nível de ``SourceDocuments`` e ``("end", raiz)``. ``release`` recebe
+    cada documento no evento seguinte, quando o texto que o segue já foi lido
+    e o elemento pode sair da árvore.
+    """
+
+    context = etree.iterparse(source, events=("start", "end"), recover=recover)
+    depth = 0
+    source_tag = None
+    in_source = False
+    pending = None
+    for event, element in context:
+        if pending is not None:
+            release(pending)
+            pending = None
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                nsuri = detect_ns(element.getroottree())
+                source_tag = f"{{{nsuri}}}SourceDocuments"
+            elif depth == 2 and element.tag == source_tag:
+                in_source = True
+                yield "source", element
+            elif depth == 3 and in_source:
+                yield "section", element
+            continue
+        if depth == 4 and in_source:
+            yield "document", element
+            pending = element
+        elif depth == 2:
+            in_source = False
+        elif depth == 1:
+            yield "end", element
+        depth -= 1
+
+
+class _Section:
+    """Secção de ``SourceDocuments`` (``SalesInvoices``, ``Payments``, ...)."""
+
+    def __init__(self, element, nsuri: str) -> None:
+        self.element = element
+        local = localname(element.tag)
+        self.document_tag = (
+            f"{{{nsuri}}}{_DOCUMENT_TAGS[local]}"
+            if element.tag == f"{{{nsuri}}}{local}" and local in _DOCUMENT_TAGS
+            else None
+        )
+        self.path = ""
+        self.formatted = True
+        self.counts: Dict[tuple[str, str | None], int] = {}
+        self._seen: Dict[tuple[str, str | None], int] = {}
+
+    def count(self, document) -> None:
+        _, key = path_step(document)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if key[0] != "*":
+            self.counts[("*", None)] = self.counts.get(("*", None), 0) + 1
+
+    def locate(self, document) -> str:
+        """Caminho ``getpath`` de ``document`` no ficheiro completo.
+
+        Tem de ser chamado por ordem para todos os elementos da secção.
+        """
+
+        name, key = path_step(document)
+        self._seen[key] = occur = self._seen.get(key, 0) + 1
+        if key[0] != "*":
+            self._seen[("*", None)] = self._seen.get(("*", None), 0) + 1
+        step = f"{name}[{occur}]" if self.counts[key] > 1 else name
+        return f"{self.path}/{step}"
+
+
+class StreamSkeleton:
+    """Resultado da pré-leitura de :func:`scan_stream`.
+
+    ``segments`` é o ficheiro corrigido já serializado, com ``Header`` e
+    ``MasterFiles`` completos (incluindo as ``TaxTableEntry`` e os ``Customer``
+    que os documentos obrigam a acrescentar) e um corte no lugar de cada
+    documento de ``SourceDocuments``; a segunda leitura grava cada documento
+    corrigido entre dois troços consecutivos. Com ``scope`` só são
+    corrigidos os elementos nele referidos (ver :func:`fix_xml`).
+    """
+
+    def __init__(self, scope: FixScope | None = None) -> None:
+        self.scope = scope
+        self.nsuri = NS_DEFAULT
+        self.marker = f"saftao-document-{uuid.uuid4().hex}"
+        self.segments: List[bytes] = []
+        self.sections: List[_Section] = []
+        self.customer_issues: Any = []
+        self.table_keys: frozenset = frozenset()
+        self.had_masterfiles = False
+        self.had_table = False
+        self.namespaces_changed = False
+        self._header_log = _BufferedLog()
+        self._table_log = _BufferedLog()
+        self._invoice_type_issues: list = []
+        self._customer_ids: tuple[list[str], ...] = ([], [], [])
+        self._seen_customers: tuple[set[str], ...] = (set(), set(), set())
+        self._used_prefixes: set[str] = set()
+        self._tax_table: TaxTable | None = None
+        self._fixers: Dict[str, DocumentFixer] = {}
+        self._root = None
+
+    def prepare(self, root) -> None:
+        """Correcções de ``Header``/``MasterFiles`` (antes dos documentos)."""
+
+        self._root = root
+        self.nsuri = nsuri = detect_ns(root.getroottree())
+        select = _entry_selector(self.scope)
+        self.namespaces_changed = normalise_masterfile_customers(
+            root, nsuri, self._header_log, cleanup=False, select=select
+        )
+        header = root.find("./n:Header", namespaces={"n": nsuri})
+        if select is None or (header is not None and select(header)):
+            normalise_header_tax_registration(root, nsuri, self._header_log)
+        normalize_taxtable_percentages(root, nsuri, self._table_log, select)
+        self._tax_table = load_tax_table(root, nsuri)
+        self._fixers = {
+            family.document: document_fixer(
+                family, root, nsuri, self._tax_table, _NullLog()
+            )
+            for family in (INVOICE, WORK_DOCUMENT)
+        }
+        self.table_keys = self._tax_table.keys()
+        self.had_table = self._tax_table.element is not None
+        self.had_masterfiles = (
+            root.find(".//n:MasterFiles", namespaces={"n": nsuri}) is not None
+        )
+
+    def covers(self, document) -> bool:
+        """``document`` deve ser corrigido (está no ``scope``, se houver)."""
+
+        return self.scope is None or self.scope.covers(document)
+
+    def add_document(self, section: _Section, document) -> None:
+        """Aplicar a um documento as correcções que se reflectem fora dele."""
+
+        section.count(document)
+        if section.document_tag is None or document.tag != section.document_tag:
+            return
+        nsuri = self.nsuri
+        kind = localname(document.tag)
+        if self.covers(document):
+            if kind == "Invoice":
+                issue = normalize_invoice_type_vd_invoice(document, nsuri)
+                if issue is not None:
+                    self._invoice_type_issues.append(issue)
+            if kind in self._fixers:
+                self._fixers[kind].fix(document, set())
+
+        group = ("Invoice", "WorkDocument", "Payment").index(kind)
+        ids, seen = self._customer_ids[group], self._seen_customers[group]
+        for node in document.iterdescendants(f"{{{nsuri}}}CustomerID"):
+            text = (node.text or "").strip()
+            if text and text not in seen:
+                seen.add(text)
+                ids.append(text)
+
+        if self.namespaces_changed:
+            for element in document.iter(etree.Element):
+                if element.prefix is not None:
+                    self._used_prefixes.add(element.prefix)
+                for name in element.attrib:
+                    uri = etree.QName(name).namespace
+                    self._used_prefixes.update(
+                        prefix
+                        for prefix, value in element.nsmap.items()
+                        if prefix is not None and value == uri
+                    )
+
+    def finish(self, root, logger: ExcelLogger) -> None:
+        """Acrescentar os clientes em falta e serializar o esqueleto."""
+
+        if self._root is None:
+            self.prepare(root)
+        self._header_log.replay(logger)
+        log_invoice_type_issues(self._invoice_type_issues, logger)
+        self._table_log.replay(logger)
+
+        try:
+            self.customer_issues = export_missing_customers(
+                root, self.nsuri, self._customer_ids
+            )
+        except Exception as exc:
             logger.log(
-                "XSD_NOT_FOUND",
-                "XSD fornecido não encontrado",
-                new_value=str(cli_xsd_path),
+                "AUTOADD_CUSTOMER_FAIL",
+                "Falha ao adicionar clientes em falta",
+                note=str(exc),
+            )
+            raise
+        if self.namespaces_changed:
+            etree.cleanup_namespaces(
+                root, keep_ns_prefixes=sorted(self._used_prefixes)
             )
-            logger.flush()
-            sys.exit(2)
-        cli_xsd_path = cli_xsd_path.resolve()
 
-    if repair_workdocument_balance_in_file(in_path):
-        logger.log(
-            "FIX_WORKDOCUMENT_TAGS",
-            "Inseridos encerramentos em falta de WorkDocument",
+        tree = root.getroottree()
+        for section in self.sections:
+            section.path = tree.getpath(section.element)
+            section.formatted = not any(
+                _has_text_child(element)
+                for element in (section.element, *section.element.iterancestors())
+            )
+        data = BytesIO()
+        tree.write(data, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+        self.segments = data.getvalue().split(f"<!--{self.marker}-->".encode())
+
+
+def scan_stream(
+    source,
+    logger: ExcelLogger,
+    *,
+    recover: bool = False,
+    scope: FixScope | None = None,
+) -> StreamSkeleton:
+    """Primeira leitura de :func:`fix_xml_stream`.
+
+    Mantém ``Header`` e ``MasterFiles`` em memória e substitui cada documento
+    de ``SourceDocuments`` por um comentário marcador, depois de lhe aplicar
+    as correcções que acrescentam entradas à ``TaxTable`` e de recolher os
+    ``CustomerID``. No fim regista as linhas de ``Header``/``MasterFiles`` e
+    acrescenta os clientes em falta.
+    """
+
+    skeleton = StreamSkeleton(scope)
+    section: _Section | None = None
+
+    def release(document) -> None:
+        marker = etree.Comment(skeleton.marker)
+        marker.tail = document.tail
+        document.getparent().replace(document, marker)
+
+    for event, element in _iter_source(source, recover=recover, release=release):
+        try:
+            if event == "source":
+                skeleton.prepare(element.getparent())
+            elif event == "section":
+                section = _Section(element, skeleton.nsuri)
+                skeleton.sections.append(section)
+            elif event == "document":
+                skeleton.add_document(section, element)
+            else:
+                skeleton.finish(element, logger)
+        except Exception as exc:
+            raise _FixFailed(exc) from exc
+    return skeleton
+
+
+class _StreamWriter:
+    """Segunda leitura de :func:`fix_xml_stream`: corrige e grava documentos."""
+
+    def __init__(self, skeleton: StreamSkeleton, output, logger: ExcelLogger) -> None:
+        self.skeleton = skeleton
+        self.output = output
+        self.logger = logger
+        self.nsuri = nsuri = skeleton.nsuri
+        self.marker = f"<!--{skeleton.marker}-->".encode()
+        self.segments = iter(skeleton.segments)
+        self.sections = iter(skeleton.sections)
+        self.section: _Section | None = None
+        self.payments_log = _BufferedLog()
+        self.work_log = _BufferedLog()
+        self.others_log = _BufferedLog()
+
+        # Raiz auxiliar para ``ensure_tax_table_entry``: as entradas já estão
+        # no esqueleto e aqui só se repetem os registos pela ordem do DOM.
+        self.root = etree.Element(f"{{{nsuri}}}AuditFile")
+        self.tax_table = TaxTable(skeleton.table_keys)
+        if skeleton.had_masterfiles:
+            masterfiles = etree.SubElement(self.root, f"{{{nsuri}}}MasterFiles")
+            if skeleton.had_table:
+                self.tax_table.element = etree.SubElement(
+                    masterfiles, f"{{{nsuri}}}TaxTable"
+                )
+        self.invoice_fixer = document_fixer(
+            INVOICE, self.root, nsuri, self.tax_table, logger
+        )
+        self.work_fixer = document_fixer(
+            WORK_DOCUMENT, self.root, nsuri, self.tax_table, self.work_log
+        )
+        self.output.write(next(self.segments))
+
+    def start_section(self, element) -> None:
+        _drop_preceding(element)
+        self.section = next(self.sections)
+
+    def fix_document(self, document) -> None:
+        nsuri = self.nsuri
+        section = self.section
+        base = section.locate(document)
+
+        def path_of(element) -> _DocumentXPath:
+            return _DocumentXPath(base, document, element)
+
+        if self.skeleton.namespaces_changed:
+            etree.cleanup_namespaces(document)
+        if not self.skeleton.covers(document):
+            return  # fora do ``scope``: gravado tal como foi lido
+        processed: set[int] = set()
+        if section.document_tag is not None and document.tag == section.document_tag:
+            kind = localname(document.tag)
+            if kind == "Invoice":
+                normalize_invoice_type_vd_invoice(document, nsuri)
+                self.invoice_fixer.fix(document, processed, path_of)
+            elif kind == "Payment":
+                fix_payment(document, nsuri, self.payments_log, processed, path_of)
+            else:
+                self.work_fixer.fix(document, processed, path_of)
+        taxes = [
+            element
+            for element in document.iter(etree.Element)
+            if localname(element.tag) == "Tax"
+        ]
+        fix_other_taxes(taxes, nsuri, self.others_log, processed, path_of)
+
+    def write_document(self, document) -> None:
+        """Serializar ``document`` tal como ficaria no ficheiro completo.
+
+        O documento é serializado no lugar, entre dois comentários marcadores,
+        para manter a indentação e as declarações de namespace do libxml2; o
+        espaço acrescentado quando o original tem texto entre elementos força
+        o modo sem indentação, como no ficheiro completo.
+        """
+
+        parent = document.getparent()
+        opening = etree.Comment(self.skeleton.marker)
+        closing = etree.Comment(self.skeleton.marker)
+        document.addprevious(opening)
+        document.addnext(closing)
+        if not self.section.formatted:
+            opening.tail = " "
+        data = etree.tostring(
+            document.getroottree().getroot(), encoding="UTF-8", pretty_print=True
+        )
+        _, body, _ = data.split(self.marker)
+        self.output.write(body.strip())
+        self.output.write(next(self.segments))
+        for node in (opening, document, closing):
+            parent.remove(node)
+
+    def finish(self) -> None:
+        if next(self.segments, None) is not None:
+            raise RuntimeError("Leitura em fluxo não corresponde à pré-leitura")
+        self.payments_log.replay(self.logger)
+        self.work_log.replay(self.logger)
+        self.others_log.replay(self.logger)
+        log_customer_issues(self.skeleton.customer_issues, self.logger)
+
+
+def fix_xml_stream(
+    source,
+    skeleton: StreamSkeleton,
+    output,
+    logger: ExcelLogger,
+    *,
+    recover: bool = False,
+) -> None:
+    """Corrigir ``source`` documento a documento e gravar em ``output``.
+
+    ``skeleton`` vem de :func:`scan_stream` sobre o mesmo XML. Só um
+    documento de ``SourceDocuments`` está em memória de cada vez (além de
+    ``Header``/``MasterFiles``); o XML gravado e as linhas do log são os de
+    :func:`fix_xml` seguido de ``write`` com ``pretty_print``.
+    """
+
+    writer = _StreamWriter(skeleton, output, logger)
+    for event, element in _iter_source(
+        source, recover=recover, release=writer.write_document
+    ):
+        if event == "source":
+            _drop_preceding(element)
+        elif event == "section":
+            writer.start_section(element)
+        elif event == "document":
+            writer.fix_document(element)
+    writer.finish()
+
+
+# ------------------------- XSD -------------------------------------------
+
+
+def default_xsd_path():
+    name = "SAFTAO1.01_01.xsd"
+    search_dirs = [
+        Path.cwd(),
+        SCRIPT_DIR,
+        PROJECT_ROOT,
+        PROJECT_ROOT / "schemas",
+    ]
+    for base in search_dirs:
+        candidate = base / name
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def validate_xsd(tree: etree._ElementTree, xsd_path: Path):
+    try:
+        schema = compiled_schema(xsd_path)
+        ok = schema.validate(tree)
+        errors = []
+        if not ok:
+            for e in schema.error_log:
+                errors.append(f"line {e.line}: {e.message}")
+        return ok, errors
+    except Exception as ex:
+        return False, [f"XSD validation exception: {ex}"]
+
+
+def validate_xsd_file(path: Path, xsd_path: Path):
+    """Validar o XML gravado em ``path`` lendo-o com ``iterparse``.
+
+    Usado no modo ``--stream`` e pelo ``apply-plan``: o ficheiro nunca é
+    carregado inteiro. A validação em fluxo do libxml2 não indica linhas,
+    pelo que, se reprovar, os erros são localizados por
+    :func:`~saftao.schema.locate_schema_errors`; as mensagens são as de
+    :func:`validate_xsd` sobre o ficheiro gravado, com as mesmas linhas.
+    """
+
+    try:
+        schema = compiled_schema(xsd_path)
+        with archive.xml_source(path) as source:
+            context = etree.iterparse(source, events=("end",), schema=schema)
+            failure = None
+            try:
+                for _, el in context:
+                    el.clear(keep_tail=True)
+                    parent = el.getparent()
+                    while parent is not None and el.getprevious() is not None:
+                        del parent[0]
+            except etree.XMLSyntaxError as ex:
+                failure = ex
+        entries = schema_error_entries(context.error_log)
+        if entries:
+            entries = locate_schema_errors(path, schema, entries)
+        errors = [f"line {e.line}: {e.message}" for e in entries]
+        if failure is not None and not errors:
+            errors.append(str(failure))
+        return not errors, errors
+    except Exception as ex:
+        return False, [f"XSD validation exception: {ex}"]
+
+
+_VERSION_SUFFIX_RE = re.compile(r"^(?P<base>.*)_v\.(?P<version>\d{2})(?:_invalido)?$")
+
+
+def next_version_paths(
+    source: Path, output_dir: Path, compression: str | None = None
+) -> tuple[Path, Path, str]:
+    """Calculate the next available versioned output paths for the XML.
+
+    Para ficheiros comprimidos (``*.xml.zip``) a versão é calculada a partir
+    do XML contido; com ``compression`` os caminhos devolvidos terminam na
+    extensão correspondente (``*_v.03.xml.zip``). Uma versão já gravada em
+    qualquer formato não é reutilizada.
+    """
+
+    name = Path(archive.logical_name(source))
+    match = _VERSION_SUFFIX_RE.match(name.stem)
+    if match:
+        base_stem = match.group("base") or name.stem
+        version = max(int(match.group("version")) + 1, 2)
+    else:
+        base_stem = name.stem
+        version = 2
+
+    extensions = [name.suffix] + [f"{name.suffix}.{c}" for c in archive.COMPRESSIONS]
+    extension = f"{name.suffix}.{compression}" if compression else name.suffix
+    while True:
+        suffix = f"_v.{version:02d}"
+        stems = (f"{base_stem}{suffix}", f"{base_stem}{suffix}_invalido")
+        if not any(
+            (output_dir / f"{stem}{ext}").exists()
+            for stem in stems
+            for ext in extensions
+        ):
+            return (
+                output_dir / f"{stems[0]}{extension}",
+                output_dir / f"{stems[1]}{extension}",
+                suffix,
+            )
+        version += 1
+
+
+def _open_source(in_path: Path) -> BalancedSource:
+    """Origem de ``in_path`` com o equilíbrio de ``WorkDocument`` reparado.
+
+    A reparação é feita durante a leitura (também nos ``.zip``/``.gz``/``.xz``,
+    sem extracção para disco) e o ficheiro de entrada nunca é alterado. Cada
+    chamada da origem devolve um novo fluxo para ``etree.parse``/``iterparse``;
+    ``repaired`` só é definitivo depois de uma leitura completa.
+    """
+
+    return BalancedSource(in_path)
+
+
+def write_output(
+    tree: etree._ElementTree, out_path: Path, splice: SpliceWriter | None = None
+) -> None:
+    """Gravar o XML corrigido, reaproveitando o original com ``splice``."""
+
+    if splice is None:
+        archive.write_tree(
+            tree, out_path, pretty_print=True, xml_declaration=True, encoding="UTF-8"
+        )
+        return
+    splice.write(out_path)
+    if not splice.spliced:
+        print(
+            "[ALERTA] Não foi possível reaproveitar o XML original; "
+            "ficheiro gravado por inteiro."
         )
 
+
+def _parse_with_recovery(
+    parse: Callable[[bool], Any], logger: ExcelLogger, in_path: Path, output_dir: Path
+) -> Any:
+    """Chamar ``parse(recover)``, repetindo com ``recover=True`` se o XML falhar."""
+
     try:
-        tree = etree.parse(str(in_path))
+        return parse(False)
     except etree.XMLSyntaxError as ex:
         print(f"[ALERTA] Falha no parse do XML: {ex}")
         logger.log("XML_PARSE_ERROR", "Falha no parse do XML", note=str(ex))
         print("[ALERTA] A tentar recuperar o XML com 'recover=True'…")
         try:
-            recover_parser = etree.XMLParser(recover=True)
-            tree = etree.parse(str(in_path), parser=recover_parser)
+            result = parse(True)
+        except _FixFailed:
+            raise
         except Exception as recover_ex:
             print(f"[ERRO] Recuperação falhou: {recover_ex}")
             logger.log(
@@ -1212,7 +1406,7 @@ def main(argv: list[str] | None = None) -> None:
             )
             error_log = write_error_log(
                 output_dir,
-                base_name=in_path.stem,
+                base_name=archive.source_stem(in_path),
                 stage="XML_PARSE_RECOVER_FAIL",
                 exc=recover_ex,
                 context={"xml": str(in_path)},
@@ -1229,12 +1423,15 @@ def main(argv: list[str] | None = None) -> None:
             print(
                 "[ALERTA] XML recuperado com possíveis perdas. Prosseguir com cautela."
             )
+            return result
+    except _FixFailed:
+        raise
     except Exception as ex:
         print(f"[ERRO] Falha no parse do XML: {ex}")
         logger.log("XML_PARSE_ERROR", "Falha no parse do XML", note=str(ex))
         error_log = write_error_log(
             output_dir,
-            base_name=in_path.stem,
+            base_name=archive.source_stem(in_path),
             stage="XML_PARSE_ERROR",
             exc=ex,
             context={"xml": str(in_path)},
@@ -1243,72 +1440,452 @@ def main(argv: list[str] | None = None) -> None:
         logger.flush()
         sys.exit(2)
 
+
+def _exit_fix_error(
+    exc: BaseException, logger: ExcelLogger, in_path: Path, output_dir: Path
+) -> None:
+    print(f"[ERRO] Falha ao aplicar correcções: {exc}")
+    logger.log("FIX_ERROR", "Falha ao aplicar correcções", note=str(exc))
+    error_log = write_error_log(
+        output_dir,
+        base_name=archive.source_stem(in_path),
+        stage="FIX_XML",
+        exc=exc,
+        context={"xml": str(in_path)},
+    )
+    print(f"[ERRO] Log técnico criado em: {error_log}")
+    logger.flush()
+    sys.exit(2)
+
+
+def _exit_with_result(
+    logger: ExcelLogger,
+    out_path: Path,
+    version_label: str,
+    xsd_path: Path | None,
+    errs: List[str],
+) -> None:
+    """Mensagens finais e código de saída (``xsd_path`` ``None``: sem XSD)."""
+
+    if xsd_path is None:
+        msg = (
+            f"[OK] XML {version_label} criado em: {out_path} "
+            "(não foi possível validar XSD)"
+        )
+        print(msg)
+        logger.log("XSD_MISSING", "XSD não encontrado; validação XSD ignorada")
+        logger.log("INFO_END", "Fim do Auto-Fix (sem XSD)", note=msg)
+        logger.flush()
+        sys.exit(0)
+    if not errs:
+        msg = (
+            f"[OK] XML {version_label} (válido por XSD em {xsd_path}) "
+            f"criado em: {out_path}"
+        )
+        print(msg)
+        logger.log("INFO_END", "Fim do Auto-Fix (XSD OK)", note=msg)
+        logger.flush()
+        sys.exit(0)
+    print(
+        f"[ALERTA] XML {version_label} criado em: {out_path}, "
+        f"mas NÃO passou o XSD ({xsd_path}):"
+    )
+    for m in errs[:50]:
+        print(" -", m)
+        logger.log("XSD_ERROR", "Erro de XSD", note=m)
+    if len(errs) > 50:
+        more = f"(+{len(errs)-50} erros adicionais)"
+        print("   " + more)
+        logger.log("XSD_ERROR", "Resumo", note=more)
+    logger.log("INFO_END", "Fim do Auto-Fix (XSD FAIL)")
+    logger.flush()
+    sys.exit(2)
+
+
+class _PlanLog:
+    """Regista em ``logger`` e guarda as linhas para atribuir os códigos do plano."""
+
+    def __init__(self, logger: ExcelLogger) -> None:
+        self.logger = logger
+        self.rows: List[LogRow] = []
+
+    def log(self, action_code: str, message: str, **kwargs: Any) -> None:
+        self.logger.log(action_code, message, **kwargs)
+        self.rows.append(
+            LogRow(
+                action_code,
+                getattr(kwargs.get("xpath"), "element", None),
+                kwargs.get("invoice", ""),
+                kwargs.get("field", ""),
+                kwargs.get("new_value", ""),
+            )
+        )
+
+
+def _log_workdocument_repair(source: BalancedSource, logger: ExcelLogger) -> None:
+    if source.repaired:
+        logger.log(
+            "FIX_WORKDOCUMENT_TAGS",
+            "Inseridos encerramentos em falta de WorkDocument",
+        )
+
+
+def _exit_with_plan(
+    splice: SpliceWriter,
+    rows: List[LogRow],
+    in_path: Path,
+    output_dir: Path,
+    logger: ExcelLogger,
+    plan_format: str,
+    repaired: bool,
+) -> None:
+    """Fluxo ``--plan``: gravar as alterações em vez do XML corrigido."""
+
+    plan = build_plan(
+        splice, source=archive.logical_name(in_path), rows=rows, repaired=repaired
+    )
+    if not splice.spliced:
+        print(
+            "[ALERTA] Não foi possível mapear as correcções no XML original; "
+            "o plano substitui o ficheiro inteiro."
+        )
+    suffix = ".json" if plan_format == "json" else ".sqlite"
+    stem = f"{archive.source_stem(in_path)}_{logger.stamp}"
+    plan_path = write_plan(plan, output_dir / f"{stem}_autofix_plan{suffix}")
+    msg = f"[OK] Plano com {len(plan.edits)} alterações gravado em: {plan_path}"
+    print(msg)
+    logger.log("INFO_END", "Fim do Auto-Fix (plano)", note=msg)
+    logger.flush()
+    sys.exit(0)
+
+
+def _main_stream(
+    source: BalancedSource,
+    in_path: Path,
+    output_dir: Path,
+    logger: ExcelLogger,
+    xsd_path: Path | None,
+    compress: str | None,
+    scope: FixScope | None = None,
+) -> None:
+    """Fluxo ``--stream``: duas leituras ``iterparse`` e validação do ficheiro."""
+
     try:
-        tree = fix_xml(tree, in_path, logger)
-    except Exception as exc:
-        print(f"[ERRO] Falha ao aplicar correcções: {exc}")
-        logger.log("FIX_ERROR", "Falha ao aplicar correcções", note=str(exc))
-        error_log = write_error_log(
+        skeleton, recover = _parse_with_recovery(
+            lambda recover: (
+                scan_stream(source(), logger, recover=recover, scope=scope),
+                recover,
+            ),
+            logger,
+            in_path,
             output_dir,
-            base_name=in_path.stem,
-            stage="FIX_XML",
-            exc=exc,
-            context={"xml": str(in_path)},
         )
-        print(f"[ERRO] Log técnico criado em: {error_log}")
-        logger.flush()
-        sys.exit(2)
+    except _FixFailed as failure:
+        _exit_fix_error(failure.__cause__, logger, in_path, output_dir)
+    _log_workdocument_repair(source, logger)
 
-    xsd_path = cli_xsd_path if cli_xsd_path is not None else default_xsd_path()
-    out_ok, out_bad, version_suffix = next_version_paths(in_path, output_dir)
+    out_ok, out_bad, version_suffix = next_version_paths(
+        in_path, output_dir, compress
+    )
     version_label = version_suffix.lstrip("_")
+    try:
+        with archive.open_output(out_ok) as handle:
+            fix_xml_stream(source(), skeleton, handle, logger, recover=recover)
+    except Exception as exc:
+        out_ok.unlink(missing_ok=True)
+        _exit_fix_error(exc, logger, in_path, output_dir)
 
-    if xsd_path and xsd_path.exists():
-        logger.log("XSD_FOUND", "XSD encontrado", new_value=str(xsd_path))
-        ok, errs = validate_xsd(tree, xsd_path)
-        if ok:
-            tree.write(
-                str(out_ok), pretty_print=True, xml_declaration=True, encoding="UTF-8"
-            )
-            msg = (
-                f"[OK] XML {version_label} (válido por XSD em {xsd_path}) "
-                f"criado em: {out_ok}"
-            )
+    if not (xsd_path and xsd_path.exists()):
+        _exit_with_result(logger, out_ok, version_label, None, [])
+    logger.log("XSD_FOUND", "XSD encontrado", new_value=str(xsd_path))
+    ok, errs = validate_xsd_file(out_ok, xsd_path)
+    if ok:
+        _exit_with_result(logger, out_ok, version_label, xsd_path, [])
+    out_ok.replace(out_bad)
+    _exit_with_result(logger, out_bad, version_label, xsd_path, errs)
+
+
+def _cache_key(args: argparse.Namespace, in_path: Path) -> CacheKey:
+    """Chave da cache: entrada, regras, XSD, versão e opções que mudam o XML.
+
+    Inclui a listagem de clientes usada para acrescentar clientes em falta.
+    """
+
+    xsd_path = Path(args.xsd_path).expanduser() if args.xsd_path else default_xsd_path()
+    listing = customer_listing_path()
+    return CacheKey.build(
+        "autofix-soft",
+        in_path,
+        xsd_path,
+        {
+            "xsd": args.xsd_path,
+            "log_format": args.log_format,
+            "compress": args.compress,
+            "stream": args.stream,
+            "splice": args.splice,
+            "only_issues": file_digest(args.issue_log) if args.issue_log else None,
+            "customers": file_digest(listing) if listing else None,
+        },
+    )
+
+
+def _exit_with_cached(cached: CachedResult) -> None:
+    """Repetição de um pedido já calculado: indicar o resultado anterior."""
+
+    print(
+        "[OK] Mesma entrada, regras, XSD e versão de uma execução anterior; "
+        f"XML em: {cached.output}"
+    )
+    if cached.log is not None:
+        print(f"[OK] Log em: {cached.log}")
+    print("     (use --force para recalcular)")
+    sys.exit(cached.exit_code)
+
+
+def _store_result(
+    cache: ResultCache,
+    key: CacheKey,
+    out_paths: tuple[Path, Path],
+    log_path: Path | None,
+    exit_code: Any,
+) -> None:
+    """Guardar na cache o XML gravado (válido ou ``_invalido``) por esta execução."""
+
+    output = next((path for path in out_paths if path.exists()), None)
+    if output is None or exit_code not in (0, 2):
+        return
+    try:
+        cache.store(key, output, log_path, exit_code)
+    except OSError as exc:
+        print(f"[ALERTA] Não foi possível actualizar a cache: {exc}")
+
+
+def _run(
+    args: argparse.Namespace, in_path: Path, output_dir: Path, logger: ExcelLogger
+) -> None:
+    """Corrigir ``in_path`` conforme ``args``; termina sempre com ``sys.exit``."""
+
+    cli_xsd_path: Path | None = None
+    if args.xsd_path:
+        cli_xsd_path = Path(args.xsd_path).expanduser()
+        if not cli_xsd_path.exists():
+            msg = f"[ERRO] XSD fornecido não encontrado: {cli_xsd_path}"
             print(msg)
-            logger.log("INFO_END", "Fim do Auto-Fix (XSD OK)", note=msg)
-            logger.flush()
-            sys.exit(0)
-        else:
-            tree.write(
-                str(out_bad), pretty_print=True, xml_declaration=True, encoding="UTF-8"
+            logger.log(
+                "XSD_NOT_FOUND",
+                "XSD fornecido não encontrado",
+                new_value=str(cli_xsd_path),
             )
-            print(
-                f"[ALERTA] XML {version_label} criado em: {out_bad}, "
-                f"mas NÃO passou o XSD ({xsd_path}):"
+            logger.flush()
+            sys.exit(2)
+        cli_xsd_path = cli_xsd_path.resolve()
+
+    source = _open_source(in_path)
+    scope = None
+    if args.issue_log is not None:
+        try:
+            scope = load_scope(args.issue_log.expanduser())
+        except (OSError, ValueError) as exc:
+            print(f"[ERRO] Não foi possível ler o log de validação: {exc}")
+            logger.log(
+                "ISSUE_LOG_ERROR",
+                "Log de validação ilegível",
+                new_value=str(args.issue_log),
+                note=str(exc),
             )
-            for m in errs[:50]:
-                print(" -", m)
-                logger.log("XSD_ERROR", "Erro de XSD", note=m)
-            if len(errs) > 50:
-                more = f"(+{len(errs)-50} erros adicionais)"
-                print("   " + more)
-                logger.log("XSD_ERROR", "Resumo", note=more)
-            logger.log("INFO_END", "Fim do Auto-Fix (XSD FAIL)")
             logger.flush()
             sys.exit(2)
-    else:
-        tree.write(
-            str(out_ok), pretty_print=True, xml_declaration=True, encoding="UTF-8"
+        logger.log(
+            "ISSUE_LOG",
+            "Correcções limitadas ao log de validação",
+            new_value=str(args.issue_log),
+            note=f"{len(scope.documents)} documentos referidos",
         )
-        msg = (
-            f"[OK] XML {version_label} criado em: {out_ok} "
-            "(não foi possível validar XSD)"
+
+    xsd_path = cli_xsd_path if cli_xsd_path is not None else default_xsd_path()
+    if args.stream:
+        _main_stream(
+            source, in_path, output_dir, logger, xsd_path, args.compress, scope
         )
-        print(msg)
-        logger.log("XSD_MISSING", "XSD não encontrado; validação XSD ignorada")
-        logger.log("INFO_END", "Fim do Auto-Fix (sem XSD)", note=msg)
-        logger.flush()
-        sys.exit(0)
+
+    tree = _parse_with_recovery(
+        lambda recover: etree.parse(
+            source(), etree.XMLParser(recover=True) if recover else None
+        ),
+        logger,
+        in_path,
+        output_dir,
+    )
+    _log_workdocument_repair(source, logger)
+    splice = None
+    if args.splice or args.plan or scope is not None:
+        # Com ``--only-issues`` os documentos não tocados saem byte a byte.
+        splice = SpliceWriter(tree, source().read())
+    fix_logger = _PlanLog(logger) if args.plan else logger
+
+    try:
+        tree = fix_xml(tree, in_path, fix_logger, scope)
+    except Exception as exc:
+        _exit_fix_error(exc, logger, in_path, output_dir)
+
+    if args.plan:
+        _exit_with_plan(
+            splice,
+            fix_logger.rows,
+            in_path,
+            output_dir,
+            logger,
+            args.plan_format,
+            source.repaired,
+        )
+
+    out_ok, out_bad, version_suffix = next_version_paths(
+        in_path, output_dir, args.compress
+    )
+    version_label = version_suffix.lstrip("_")
+
+    if not (xsd_path and xsd_path.exists()):
+        write_output(tree, out_ok, splice)
+        _exit_with_result(logger, out_ok, version_label, None, [])
+    logger.log("XSD_FOUND", "XSD encontrado", new_value=str(xsd_path))
+    ok, errs = validate_xsd(tree, xsd_path)
+    out_path = out_ok if ok else out_bad
+    write_output(tree, out_path, splice)
+    _exit_with_result(logger, out_path, version_label, xsd_path, [] if ok else errs)
+
+
+# ------------------------- Main ------------------------------------------
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Auto-Fix SAF-T (AO) soft")
+    parser.add_argument("xml", help="Ficheiro SAF-T a corrigir.")
+    parser.add_argument(
+        "--xsd",
+        dest="xsd_path",
+        help="Caminho para o XSD a usar na validação.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        dest="output_dir",
+        help="Pasta onde gravar o XML corrigido e o log.",
+    )
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        choices=LOG_FORMATS,
+        default="xlsx",
+        help="Formato do ficheiro de log (por omissão xlsx).",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=archive.COMPRESSIONS,
+        help=(
+            "Gravar o XML corrigido directamente comprimido neste formato "
+            "(ex.: *_v.03.xml.zip)."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Corrigir documento a documento com iterparse, sem carregar o "
+            "SourceDocuments inteiro em memória (mesmo resultado)."
+        ),
+    )
+    parser.add_argument(
+        "--splice",
+        action="store_true",
+        help=(
+            "Copiar do ficheiro original tudo o que não foi corrigido e "
+            "reescrever só os elementos alterados."
+        ),
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Não gravar o XML: guardar a lista de alterações para aplicar "
+            "depois com 'apply-plan'."
+        ),
+    )
+    parser.add_argument(
+        "--plan-format",
+        choices=PLAN_FORMATS,
+        default="json",
+        help="Formato do plano (por omissão json).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help=(
+            "Recalcular mesmo que a mesma entrada já tenha sido corrigida com "
+            "as mesmas regras, XSD e versão (ver pasta .saftao-cache)."
+        ),
+    )
+    parser.add_argument(
+        "--only-issues",
+        dest="issue_log",
+        type=Path,
+        help=(
+            "Log do 'validate' (xlsx, csv, jsonl ou sqlite): corrigir só os "
+            "documentos e entradas do MasterFiles nele referidos e copiar os "
+            "restantes sem alterações."
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.splice and args.stream:
+        parser.error("--splice não pode ser combinado com --stream")
+    if args.plan and (args.stream or args.compress):
+        parser.error("--plan não pode ser combinado com --stream nem --compress")
+
+    in_path = Path(args.xml)
+    if not in_path.exists():
+        for base in (Path.cwd(), SCRIPT_DIR, PROJECT_ROOT):
+            candidate = base / in_path.name
+            if candidate.exists():
+                in_path = candidate
+                break
+        else:
+            print(f"[ERRO] Ficheiro não encontrado: {in_path}")
+            sys.exit(2)
+
+    in_path = in_path.resolve()
+
+    if args.output_dir:
+        output_dir = Path(args.output_dir).expanduser()
+    else:
+        output_dir = in_path.parent
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        print(f"[ERRO] Não foi possível criar a pasta de destino '{output_dir}': {exc}")
+        sys.exit(2)
+    output_dir = output_dir.resolve()
+
+    cache = key = None
+    if not args.plan:
+        cache = ResultCache.for_output_dir(output_dir)
+        key = _cache_key(args, in_path)
+        if not args.force:
+            cached = cache.lookup(key)
+            if cached is not None:
+                _exit_with_cached(cached)
+    out_paths = next_version_paths(in_path, output_dir, args.compress)[:2]
+
+    logger = ExcelLogger(
+        base_name=archive.source_stem(in_path),
+        output_dir=output_dir,
+        log_format=args.log_format,
+    )
+    logger.log("INFO_START", "Início do Auto-Fix (soft)", extra={"xml": str(in_path)})
+    try:
+        _run(args, in_path, output_dir, logger)
+    except SystemExit as exc:
+        if cache is not None:
+            log_path = getattr(logger, "path", None)
+            _store_result(cache, key, out_paths, log_path, exc.code)
+        raise
 
 
 if __name__ == "__main__":  # pragma: no cover - execução directa
@@ -3,14 +3,25 @@
 from __future__ import annotations
 
 import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from typing import Sequence
 
+from .. import archive, columnar
 from ..schema import load_audit_file
 from ..utils.reporting import (
+    EXPORT_FORMATS,
+    ReportData,
     aggregate_documents,
+    aggregate_documents_stream,
     default_report_destination,
+    merge_reports,
+    parquet_available,
     write_excel_report,
+    write_report_tables,
 )
 
 
@@ -21,19 +32,147 @@ def build_parser() -> argparse.ArgumentParser:
             "listagem de documentos não contabilísticos."
         )
     )
-    parser.add_argument("saft", type=Path, help="Caminho para o ficheiro SAF-T (AO)")
+    parser.add_argument(
+        "saft",
+        type=Path,
+        nargs="+",
+        help=(
+            "Caminho para o ficheiro SAF-T (AO); vários ficheiros ou pastas "
+            "são somados num único relatório."
+        ),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("python", "numpy"),
+        default="python",
+        help=(
+            "Motor de agregação: 'numpy' soma o IVA por taxa de todas as "
+            "faturas numa passagem vectorial (requer numpy)."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Ler o ficheiro com iterparse, libertando cada documento depois de "
+            "somado, em vez de o carregar inteiro em memória."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Número de processos para agregar vários ficheiros em paralelo "
+            "(por omissão 1)."
+        ),
+    )
+    parser.add_argument(
+        "--format",
+        dest="formats",
+        action="append",
+        choices=EXPORT_FORMATS,
+        help=(
+            "Formato de saída; pode ser repetido (por omissão xlsx). csv, jsonl "
+            "e parquet gravam tabelas planas de totais, IVA por taxa e "
+            "documentos não contabilísticos (parquet requer pyarrow)."
+        ),
+    )
     return parser
 
 
+def _expand_inputs(paths: Sequence[Path]) -> list[Path]:
+    """Ficheiros SAF-T indicados: as pastas dão os seus ``.xml``/comprimidos."""
+
+    files: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(
+                sorted(
+                    child
+                    for child in path.iterdir()
+                    if child.is_file()
+                    and (
+                        child.suffix.lower() == ".xml" or archive.is_compressed(child)
+                    )
+                )
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def _file_labels(files: Sequence[Path]) -> list[str]:
+    """Rótulos únicos dos ficheiros na folha "Por ficheiro" e nas tabelas.
+
+    Por omissão o nome do ficheiro sem extensão; os nomes repetidos (p. ex.
+    ``2023/janeiro.xml`` e ``2024/janeiro.xml``) levam o caminho relativo à
+    pasta comum a todos os ficheiros e, se ainda coincidirem, um sufixo
+    numérico.
+    """
+
+    stems = [archive.source_stem(path) for path in files]
+    repeated = {stem for stem, count in Counter(stems).items() if count > 1}
+    folders = [path.resolve().parent for path in files]
+    common = Path(os.path.commonpath(folders)) if repeated else None
+    labels: list[str] = []
+    for stem, folder in zip(stems, folders):
+        label = stem
+        if stem in repeated:
+            label = (folder.relative_to(common) / stem).as_posix()
+        candidate, number = label, 1
+        while candidate in labels:
+            number += 1
+            candidate = f"{label} ({number})"
+        labels.append(candidate)
+    return labels
+
+
+def _aggregate_file(path: Path, stream: bool, backend: str) -> ReportData:
+    """Totais de um ficheiro; corre num processo auxiliar com ``--workers``."""
+
+    if stream:
+        return aggregate_documents_stream(path, backend=backend)
+    _tree, root, namespace = load_audit_file(path)
+    return aggregate_documents(root, namespace, backend=backend)
+
+
 def main(argv: Sequence[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
+    if args.backend == "numpy" and not columnar.available():
+        parser.error("--backend numpy requer o pacote numpy")
+    if args.workers < 1:
+        parser.error("--workers deve ser um inteiro positivo")
+    formats = list(dict.fromkeys(args.formats or ["xlsx"]))
+    if "parquet" in formats and not parquet_available():
+        parser.error("--format parquet requer o pacote pyarrow")
+
+    files = _expand_inputs(args.saft)
+    if not files:
+        parser.error("nenhum ficheiro SAF-T encontrado")
+
+    options = (repeat(args.stream), repeat(args.backend))
+    if args.workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(files))) as pool:
+            reports = list(pool.map(_aggregate_file, files, *options))
+    else:
+        reports = list(map(_aggregate_file, files, *options))
 
-    tree, root, namespace = load_audit_file(args.saft)
-    data = aggregate_documents(root, namespace)
-    destination = default_report_destination(args.saft)
-    write_excel_report(data, destination)
-    print(f"Relatório de totais guardado em: {destination}")
+    by_file = dict(zip(_file_labels(files), reports))
+    data = reports[0] if len(files) == 1 else merge_reports(reports)
+    name = args.saft[0] if len(args.saft) == 1 else None
+    destination = default_report_destination(name)
+    for output_format in formats:
+        if output_format == "xlsx":
+            write_excel_report(
+                data, destination, by_file=by_file if len(files) > 1 else None
+            )
+            print(f"Relatório de totais guardado em: {destination}")
+            continue
+        for path in write_report_tables(by_file, destination, output_format):
+            print(f"Tabela de totais guardada em: {path}")
 
     return 0
 
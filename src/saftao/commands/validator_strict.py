@@ -19,19 +19,32 @@
     WithholdingTaxAmount = soma de
     DocumentTotals/WithholdingTax/WithholdingTaxAmount (se existir)
 
-- Log sempre em Excel (.xlsx) na pasta de execução, com colunas e
-  **sugestões**.
+- Log em Excel (.xlsx) na pasta de execução, com colunas e **sugestões**;
+  ``--log-format`` grava o mesmo log em CSV, JSON Lines ou SQLite.
 
 Requisitos:
     pip install lxml openpyxl
 """
 
 import argparse
+import contextlib
 import sys
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from datetime import datetime
-from decimal import ROUND_HALF_UP, Decimal, InvalidOperation, getcontext
+from decimal import Decimal, getcontext
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 try:  # pragma: no cover - shim only used on Python 3.12+
     from saftao._compat import ensure_modules as _ensure_modules
@@ -48,12 +61,24 @@
 
 from lxml import etree
 
+from saftao import archive, columnar, money
+from saftao.logging import LOG_FORMATS, open_issue_sink
+from saftao.rules import RuleEngine
+from saftao.schema import (
+    compiled_schema,
+    locate_schema_errors,
+    schema_error_entries,
+    schema_errors_from_tree,
+)
+from saftao.tax_table import TaxKey, TaxTable, tax_key
+from saftao.utils import path_step, relative_path, step_matches
+
 try:
+    from saftao.utils import LazyXPath as _PkgLazyXPath
     from saftao.utils import detect_namespace as _pkg_detect_namespace
-    from saftao.utils import parse_decimal as _pkg_parse_decimal
 except Exception:  # pragma: no cover - fallback for standalone usage
+    _PkgLazyXPath = None
     _pkg_detect_namespace = None
-    _pkg_parse_decimal = None
 
 try:  # pragma: no cover - optional integration with ``saftao.validator``
     from saftao import validator as _pkg_validator
@@ -68,17 +93,13 @@
 getcontext().prec = 28
 
 NS_DEFAULT = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
-AMT2 = Decimal("0.01")
-AMT6 = Decimal("0.000001")
-HUNDRED = Decimal("100")
-
-
-def q2(v: Decimal) -> Decimal:
-    return v.quantize(AMT2, rounding=ROUND_HALF_UP)
-
-
-def q6(v: Decimal) -> Decimal:
-    return v.quantize(AMT6, rounding=ROUND_HALF_UP)
+# Faturas por lote enviado a cada processo com ``--workers``.
+INVOICE_BATCH_SIZE = 250
+# Faturas por lote verificado pelo backend ``numpy`` (ver ``_InvoiceColumns``).
+COLUMN_BATCH_SIZE = 2000
+# Limite dos valores inteiros aceites nas colunas ``int64``.
+_INT64_SAFE = 2**59
+BACKENDS = ("python", "numpy")
 
 
 def fd(text: str) -> int:
@@ -89,10 +110,6 @@ def fd(text: str) -> int:
     return 0
 
 
-def fmt2(x: Decimal) -> str:
-    return f"{x:.2f}"
-
-
 def fmt_pct_suggestion(txt: str) -> str:
     """
     Sugere percentagem coerente: inteiro → '14'; caso contrário duas casas →
@@ -110,7 +127,7 @@ def fmt_pct_suggestion(txt: str) -> str:
 class ExcelLogger:
     """
     Logger que grava um .xlsx estruturado para leitura fácil na pasta de
-    execução.
+    execução (ou outro formato de :mod:`saftao.logging`, via ``log_format``).
     """
 
     COLUMNS = [
@@ -134,39 +151,38 @@ class ExcelLogger:
         "extra",
     ]
 
-    def __init__(self, base_name: str):
-        from openpyxl import Workbook
-
+    WIDTHS = {
+        "A": 21,
+        "B": 18,
+        "C": 60,
+        "D": 50,
+        "E": 18,
+        "F": 8,
+        "G": 18,
+        "H": 20,
+        "I": 22,
+        "J": 40,
+        "K": 30,
+        "L": 30,
+        "M": 10,
+        "N": 10,
+        "O": 12,
+        "P": 12,
+        "Q": 12,
+        "R": 40,
+    }
+
+    def __init__(self, base_name: str, log_format: str = "xlsx"):
         self.stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        self.path = Path.cwd() / f"{base_name}_{self.stamp}.xlsx"
-        self.rows: List[Dict[str, Any]] = []
-        self.wb = Workbook()
-        self.ws = self.wb.active
-        self.ws.title = "Log"
-        self.ws.append(self.COLUMNS)
-
-        widths = {
-            "A": 21,
-            "B": 18,
-            "C": 60,
-            "D": 50,
-            "E": 18,
-            "F": 8,
-            "G": 18,
-            "H": 20,
-            "I": 22,
-            "J": 40,
-            "K": 30,
-            "L": 30,
-            "M": 10,
-            "N": 10,
-            "O": 12,
-            "P": 12,
-            "Q": 12,
-            "R": 40,
-        }
-        for col, w in widths.items():
-            self.ws.column_dimensions[col].width = w
+        # As linhas são gravadas à medida que são registadas; ``flush`` fecha
+        # o ficheiro.
+        self.sink = open_issue_sink(
+            Path.cwd() / f"{base_name}_{self.stamp}",
+            self.COLUMNS,
+            log_format,
+            widths=self.WIDTHS,
+        )
+        self.path = self.sink.path
 
     def log(
         self,
@@ -186,7 +202,7 @@ def log(
             "timestamp": datetime.utcnow().isoformat(),
             "code": code,
             "message": message,
-            "xpath": xpath or "",
+            "xpath": str(xpath) if xpath else "",
             "invoice": "",
             "line": "",
             "field": field,
@@ -212,25 +228,10 @@ def log(
         if extra:
             row["extra"] = json.dumps(extra, ensure_ascii=False, separators=(",", ":"))
 
-        self.rows.append(row)
-        self.ws.append([row[c] for c in self.COLUMNS])
+        self.sink.write([row[c] for c in self.COLUMNS])
 
     def flush(self):
-        self.wb.save(self.path)
-
-
-def parse_decimal(text: Optional[str], default: Decimal = Decimal("0")) -> Decimal:
-    """Converter texto em :class:`~decimal.Decimal` com *fallback* configurável."""
-
-    if _pkg_parse_decimal is not None:
-        return _pkg_parse_decimal(text, default=default)
-
-    if text is None:
-        return default
-    try:
-        return Decimal(text)
-    except (InvalidOperation, ValueError):
-        return default
+        self.sink.close()
 
 
 def _log_validator_issue(issue: Any, logger: ExcelLogger) -> None:
@@ -284,29 +285,6 @@ def _log_validator_issue(issue: Any, logger: ExcelLogger) -> None:
     )
 
 
-def _run_additional_validator(
-    tree: etree._ElementTree, logger: ExcelLogger
-) -> bool:
-    """Execute optional checks provided by :mod:`saftao.validator`."""
-
-    if _pkg_validator is None:
-        return True
-
-    try:
-        issues = list(_pkg_validator.validate_tree(tree))
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.log(
-            "VALIDATOR_EXCEPTION",
-            f"Falha ao executar validações adicionais: {exc}",
-        )
-        return False
-
-    for issue in issues:
-        _log_validator_issue(issue, logger)
-
-    return not issues
-
-
 def detect_ns(tree: etree._ElementTree) -> str:
     """Determinar o *namespace* activo no ficheiro SAF-T."""
 
@@ -327,8 +305,7 @@ def validate_schema(
     xml_tree: etree._ElementTree, xsd_path: Path, logger: ExcelLogger
 ) -> bool:
     try:
-        schema_doc = etree.parse(str(xsd_path))
-        schema = etree.XMLSchema(schema_doc)
+        schema = compiled_schema(xsd_path)
         ok = schema.validate(xml_tree)
         if not ok:
             for e in schema.error_log:
@@ -346,38 +323,83 @@ def validate_schema(
         return False
 
 
-def validate_business_rules(tree: etree._ElementTree, logger: ExcelLogger) -> bool:
-    nsuri = detect_ns(tree)
-    ns = {"n": nsuri}
-    ok = _run_additional_validator(tree, logger)
-
-    # Header
-    header = tree.find(".//n:Header", namespaces=ns)
+def _validate_header(
+    header: Optional[etree._Element], ns: Dict[str, str], logger: ExcelLogger
+) -> bool:
     if header is None:
         logger.log("HDR_MISSING", "Header em falta", xpath="/AuditFile/Header")
-        ok = False
-    else:
-        ver = get_text(header.find("./n:AuditFileVersion", namespaces=ns))
-        if ver and ver != "1.01_01":
-            logger.log(
-                "HDR_VERSION",
-                f"AuditFileVersion inesperado '{ver}', esperado '1.01_01'",
-                xpath="/AuditFile/Header/AuditFileVersion",
-                field="AuditFileVersion",
-                current_value=ver,
-            )
+        return False
 
-    # TaxTable index
-    tax_index = set()
-    for t in tree.findall(".//n:MasterFiles/n:TaxTable/n:TaxTableEntry", namespaces=ns):
+    ver = get_text(header.find("./n:AuditFileVersion", namespaces=ns))
+    if ver and ver != "1.01_01":
+        logger.log(
+            "HDR_VERSION",
+            f"AuditFileVersion inesperado '{ver}', esperado '1.01_01'",
+            xpath="/AuditFile/Header/AuditFileVersion",
+            field="AuditFileVersion",
+            current_value=ver,
+        )
+    return True
+
+
+class _StrictRules:
+    """Regras estritas como *visitors* do :class:`~saftao.rules.RuleEngine`.
+
+    Cada ``Line`` de uma ``Invoice`` é verificada quando fica completa e vai
+    acumulando os totais calculados; a identidade dos totais é confrontada no
+    fim da respectiva ``Invoice``. ``ok`` reflecte o resultado agregado.
+    """
+
+    def __init__(
+        self,
+        ns: Dict[str, str],
+        header_logger: ExcelLogger,
+        logger: ExcelLogger,
+        path_of: Callable[[etree._Element], Any],
+    ) -> None:
+        self.ns = ns
+        self.header_logger = header_logger
+        self.logger = logger
+        self.path_of = path_of
+        self.tax_index = TaxTable()
+        self.ok = True
+        self._invoice_tag = f"{{{ns['n']}}}Invoice"
+        self._header_seen = False
+        self._invoice: Optional[etree._Element] = None
+        self._invoice_ok = True
+        self._doc_no = ""
+        self._lines = 0
+        self._net_total = 0
+        self._tax_total = 0
+
+    def register(self, engine: RuleEngine, *, invoices: bool = True) -> None:
+        engine.register("Header", self.header)
+        engine.register("TaxTableEntry", self.tax_table_entry)
+        if invoices:
+            engine.register("Line", self.line)
+            engine.register("Invoice", self.invoice)
+
+    def finish(self) -> bool:
+        if not self._header_seen:
+            _validate_header(None, self.ns, self.header_logger)
+            self.ok = False
+        return self.ok
+
+    def header(self, header: etree._Element) -> None:
+        self._header_seen = True
+        if not _validate_header(header, self.ns, self.header_logger):
+            self.ok = False
+
+    def tax_table_entry(self, t: etree._Element) -> None:
+        ns = self.ns
         ttype = get_text(t.find("./n:TaxType", namespaces=ns)) or "IVA"
         tcode = get_text(t.find("./n:TaxCode", namespaces=ns)) or "NOR"
         tperc_text = get_text(t.find("./n:TaxPercentage", namespaces=ns)) or "0"
         if fd(tperc_text) > 2:
-            logger.log(
+            self.logger.log(
                 "PCT_FORMAT",
                 f"TaxPercentage com > 2 casas decimais: {tperc_text}",
-                xpath=tree.getpath(t.find("./n:TaxPercentage", namespaces=ns)),
+                xpath=self.path_of(t.find("./n:TaxPercentage", namespaces=ns)),
                 field="TaxPercentage",
                 current_value=tperc_text,
                 suggested_value=fmt_pct_suggestion(tperc_text),
@@ -386,21 +408,208 @@ def validate_business_rules(tree: etree._ElementTree, logger: ExcelLogger) -> bo
                     "casas (ex.: 14.25)"
                 ),
             )
-            ok = False
-        tax_index.add((ttype, tcode, parse_decimal(tperc_text)))
+            self.ok = False
+        tperc = money.parse_scaled(tperc_text, money.ZERO)
+        self.tax_index.add(tax_key(ttype, tcode, tperc))
+
+    def _start_invoice(self, inv: etree._Element) -> None:
+        self._invoice = inv
+        self._invoice_ok = True
+        self._doc_no = (
+            get_text(inv.find("./n:InvoiceNo", namespaces=self.ns)) or "UNKNOWN"
+        )
+        self._lines = 0
+        # Acumular com alta precisão (micro-unidades) a partir das linhas
+        self._net_total = 0
+        self._tax_total = 0
+
+    def line(self, ln: etree._Element) -> None:
+        inv = ln.getparent()
+        if inv.tag != self._invoice_tag:
+            return
+        if inv is not self._invoice:
+            self._start_invoice(inv)
+        self._lines += 1
+
+        ns = self.ns
+        logger = self.logger
+        path_of = self.path_of
+        doc_no = self._doc_no
+        i = self._lines
+        ln_xpath = path_of(ln)
+        qty = money.parse_scaled(
+            get_text(ln.find("./n:Quantity", namespaces=ns)), money.ZERO
+        )
+        unit = money.parse_scaled(
+            get_text(ln.find("./n:UnitPrice", namespaces=ns)), money.ZERO
+        )
+        base = money.line_base(qty, unit)
+        base2 = money.micros_to_cents(base)
+        base2_txt = money.format_cents(base2)
+
+        debit_el = ln.find("./n:DebitAmount", namespaces=ns)
+        credit_el = ln.find("./n:CreditAmount", namespaces=ns)
+        debit_txt = get_text(debit_el)
+        credit_txt = get_text(credit_el)
+
+        # 2 casas decimais obrigatórias
+        for tag, txt, el in (
+            ("DebitAmount", debit_txt, debit_el),
+            ("CreditAmount", credit_txt, credit_el),
+        ):
+            if txt is not None and fd(txt) != 2:
+                logger.log(
+                    "AMT_FORMAT",
+                    (f"{tag} deve ter exatamente 2 casas decimais: " f"'{txt}'"),
+                    xpath=path_of(el) if el is not None else ln_xpath,
+                    ctx={"invoice": doc_no, "line": i},
+                    field=tag,
+                    current_value=txt,
+                    suggested_value=money.format_scaled(
+                        money.parse_scaled(txt, money.ZERO)
+                    ),
+                    suggestion_note="Formatar o valor com 2 casas decimais",
+                )
+                self._invoice_ok = False
 
-    # Invoices
-    invoices = tree.findall(
-        ".//n:SourceDocuments/n:SalesInvoices/n:Invoice", namespaces=ns
-    )
-    for inv in invoices:
-        inv_xpath = tree.getpath(inv)
-        doc_no = get_text(inv.find("./n:InvoiceNo", namespaces=ns)) or "UNKNOWN"
+        if debit_txt is not None and credit_txt is None:
+            if money.compare(money.parse_scaled(debit_txt, money.ZERO), (base2, 2)):
+                logger.log(
+                    "AMT_MISMATCH",
+                    f"DebitAmount != q2(qty*unit): {debit_txt} != {base2_txt}",
+                    xpath=(path_of(debit_el) if debit_el is not None else ln_xpath),
+                    ctx={"invoice": doc_no, "line": i},
+                    field="DebitAmount",
+                    current_value=debit_txt,
+                    suggested_value=base2_txt,
+                    suggestion_note=(
+                        "Definir DebitAmount para " "q2(Quantity*UnitPrice)"
+                    ),
+                )
+                self._invoice_ok = False
+        elif credit_txt is not None and debit_txt is None:
+            if money.compare(money.parse_scaled(credit_txt, money.ZERO), (base2, 2)):
+                logger.log(
+                    "AMT_MISMATCH",
+                    f"CreditAmount != q2(qty*unit): {credit_txt} != {base2_txt}",
+                    xpath=(path_of(credit_el) if credit_el is not None else ln_xpath),
+                    ctx={"invoice": doc_no, "line": i},
+                    field="CreditAmount",
+                    current_value=credit_txt,
+                    suggested_value=base2_txt,
+                    suggestion_note=(
+                        "Definir CreditAmount para " "q2(Quantity*UnitPrice)"
+                    ),
+                )
+                self._invoice_ok = False
+        else:
+            logger.log(
+                "AMT_BOTH_NONE_OR_BOTH",
+                "Linha deve ter DebitAmount OU CreditAmount (exclusivo)",
+                xpath=ln_xpath,
+                ctx={"invoice": doc_no, "line": i},
+                suggestion_note=(
+                    "Remover um dos elementos; manter apenas um dos dois"
+                ),
+            )
+            self._invoice_ok = False
+
+        tax = ln.find("./n:Tax", namespaces=ns)
+        ttype = (
+            get_text(tax.find("./n:TaxType", namespaces=ns))
+            if tax is not None
+            else "IVA"
+        )
+        tcode = (
+            get_text(tax.find("./n:TaxCode", namespaces=ns))
+            if tax is not None
+            else "NOR"
+        )
+        tperc_el = (
+            tax.find("./n:TaxPercentage", namespaces=ns)
+            if tax is not None
+            else None
+        )
+        tperc_txt = get_text(tperc_el) if tax is not None else "0"
+        if tperc_txt is None:
+            tperc_txt = "0"
+        if fd(tperc_txt) > 2:
+            logger.log(
+                "PCT_FORMAT",
+                f"TaxPercentage com > 2 casas decimais: {tperc_txt}",
+                xpath=path_of(tperc_el) if tperc_el is not None else ln_xpath,
+                ctx={"invoice": doc_no, "line": i},
+                field="TaxPercentage",
+                current_value=tperc_txt,
+                suggested_value=fmt_pct_suggestion(tperc_txt),
+                suggestion_note="Inteiro se taxa exata; caso contrário 2 casas",
+            )
+            self._invoice_ok = False
+
+        tperc = money.parse_scaled(tperc_txt)
+        if tperc is None:
+            logger.log(
+                "PCT_NOT_DECIMAL",
+                f"TaxPercentage não é decimal: {tperc_txt}",
+                xpath=(path_of(tperc_el) if tperc_el is not None else ln_xpath),
+                ctx={"invoice": doc_no, "line": i},
+                field="TaxPercentage",
+                current_value=tperc_txt,
+                suggested_value="",
+                suggestion_note=("Corrigir para valor decimal (ex.: 14 ou 14.00)"),
+            )
+            tperc = money.ZERO
+            self._invoice_ok = False
+
+        self._net_total += base
+        self._tax_total += money.line_tax(base, tperc)
+
+        if tax_key(ttype, tcode, tperc) not in self.tax_index:
+            logger.log(
+                "TAXTABLE_MISSING",
+                (
+                    "Tax (type={ttype}, code={tcode}, perc={tperc}) não "
+                    "existe na TaxTable"
+                ),
+                xpath=ln_xpath,
+                ctx={"invoice": doc_no, "line": i},
+                field="Tax",
+                current_value=f"{ttype}/{tcode}/{money.scaled_str(tperc)}",
+                suggested_value=(
+                    "ADD TaxTableEntry("
+                    f"{ttype},{tcode},"
+                    f"{fmt_pct_suggestion(money.scaled_str(tperc))})"
+                ),
+                suggestion_note=("Adicionar entrada correspondente na TaxTable"),
+            )
+            self._invoice_ok = False
+
+    def invoice(self, inv: etree._Element) -> None:
+        if inv is not self._invoice:
+            doc_no = get_text(inv.find("./n:InvoiceNo", namespaces=self.ns))
+            self.logger.log(
+                "INV_NO_LINES",
+                "Invoice sem linhas",
+                xpath=self.path_of(inv),
+                ctx={"invoice": doc_no or "UNKNOWN"},
+            )
+            self.ok = False
+            return
+        self._invoice = None
+        if not self._check_totals(inv) or not self._invoice_ok:
+            self.ok = False
+
+    def _check_totals(self, inv: etree._Element) -> bool:
+        ns = self.ns
+        logger = self.logger
+        path_of = self.path_of
+        doc_no = self._doc_no
+        inv_xpath = path_of(inv)
         doc_totals = inv.find("./n:DocumentTotals", namespaces=ns)
 
         # Settlement e WithholdingTax no XML (para usar na identidade do XML)
-        settlement_amount_xml = Decimal("0")
-        withholding_amount_xml = Decimal("0")
+        settlement_amount_xml = money.ZERO
+        withholding_amount_xml = money.ZERO
 
         sett_el = (
             doc_totals.find("./n:Settlement/n:SettlementAmount", namespaces=ns)
@@ -408,7 +617,7 @@ def validate_business_rules(tree: etree._ElementTree, logger: ExcelLogger) -> bo
             else None
         )
         if sett_el is not None and (sett_el.text or "").strip():
-            settlement_amount_xml = parse_decimal(sett_el.text)
+            settlement_amount_xml = money.parse_scaled(sett_el.text, money.ZERO)
 
         for w in (
             doc_totals.findall("./n:WithholdingTax", namespaces=ns)
@@ -417,269 +626,898 @@ def validate_business_rules(tree: etree._ElementTree, logger: ExcelLogger) -> bo
         ):
             wamt_el = w.find("./n:WithholdingTaxAmount", namespaces=ns)
             if wamt_el is not None and (wamt_el.text or "").strip():
-                withholding_amount_xml += parse_decimal(wamt_el.text)
+                withholding_amount_xml = money.add(
+                    withholding_amount_xml, money.parse_scaled(wamt_el.text, money.ZERO)
+                )
+        deductions = money.neg(money.add(settlement_amount_xml, withholding_amount_xml))
 
-        # Acumular com alta precisão a partir das linhas
-        net_total = Decimal("0")
-        tax_total = Decimal("0")
+        net2 = money.micros_to_cents(self._net_total)
+        tax2 = money.micros_to_cents(self._tax_total)
 
-        lines = inv.findall("./n:Line", namespaces=ns)
-        if not lines:
+        # Identidade completa (computada):
+        # GrossExpected = Net2 - SettlementAmount + Tax2 - WithholdingTaxAmount
+        gross_expected = money.q2(money.add((net2 + tax2, 2), deductions))
+
+        if doc_totals is None:
             logger.log(
-                "INV_NO_LINES",
-                "Invoice sem linhas",
+                "TOTALS_MISSING",
+                "DocumentTotals em falta",
                 xpath=inv_xpath,
                 ctx={"invoice": doc_no},
             )
-            ok = False
-            continue
+            return False
 
-        for i, ln in enumerate(lines, start=1):
-            ln_xpath = tree.getpath(ln)
-            qty = parse_decimal(get_text(ln.find("./n:Quantity", namespaces=ns)))
-            unit = parse_decimal(get_text(ln.find("./n:UnitPrice", namespaces=ns)))
-            base = q6(qty * unit)
-            base2 = q2(base)
-
-            debit_el = ln.find("./n:DebitAmount", namespaces=ns)
-            credit_el = ln.find("./n:CreditAmount", namespaces=ns)
-            debit_txt = get_text(debit_el)
-            credit_txt = get_text(credit_el)
-
-            # 2 casas decimais obrigatórias
-            for tag, txt, el in (
-                ("DebitAmount", debit_txt, debit_el),
-                ("CreditAmount", credit_txt, credit_el),
-            ):
-                if txt is not None and fd(txt) != 2:
-                    logger.log(
-                        "AMT_FORMAT",
-                        (f"{tag} deve ter exatamente 2 casas decimais: " f"'{txt}'"),
-                        xpath=tree.getpath(el) if el is not None else ln_xpath,
-                        ctx={"invoice": doc_no, "line": i},
-                        field=tag,
-                        current_value=txt,
-                        suggested_value=fmt2(parse_decimal(txt)),
-                        suggestion_note="Formatar o valor com 2 casas decimais",
-                    )
-                    ok = False
-
-            if debit_txt is not None and credit_txt is None:
-                if parse_decimal(debit_txt) != base2:
-                    logger.log(
-                        "AMT_MISMATCH",
-                        f"DebitAmount != q2(qty*unit): {debit_txt} != {base2}",
-                        xpath=(
-                            tree.getpath(debit_el) if debit_el is not None else ln_xpath
-                        ),
-                        ctx={"invoice": doc_no, "line": i},
-                        field="DebitAmount",
-                        current_value=debit_txt,
-                        suggested_value=fmt2(base2),
-                        suggestion_note=(
-                            "Definir DebitAmount para " "q2(Quantity*UnitPrice)"
-                        ),
-                    )
-                    ok = False
-            elif credit_txt is not None and debit_txt is None:
-                if parse_decimal(credit_txt) != base2:
-                    logger.log(
-                        "AMT_MISMATCH",
-                        f"CreditAmount != q2(qty*unit): {credit_txt} != {base2}",
-                        xpath=(
-                            tree.getpath(credit_el)
-                            if credit_el is not None
-                            else ln_xpath
+        # Garantir 2 casas nos 3 totais e verificar identidade no XML
+        def check_total(tag: str) -> Optional[money.Scaled]:
+            el = doc_totals.find(f"./n:{tag}", namespaces=ns)
+            if el is None or (el.text or "").strip() == "":
+                logger.log(
+                    "TOTAL_TAG_MISSING",
+                    f"{tag} em falta",
+                    xpath=inv_xpath,
+                    ctx={"invoice": doc_no},
+                    field=tag,
+                    suggested_value="",
+                )
+                return None
+            txt = (el.text or "").strip()
+            value = money.parse_scaled(txt, money.ZERO)
+            if fd(txt) != 2:
+                logger.log(
+                    "TOTAL_FORMAT",
+                    f"{tag} deve ter exatamente 2 casas decimais: '{txt}'",
+                    xpath=path_of(el),
+                    ctx={"invoice": doc_no},
+                    field=tag,
+                    current_value=txt,
+                    suggested_value=money.format_scaled(value),
+                    suggestion_note=("Formatar o total com 2 casas decimais"),
+                )
+            return value
+
+        net_xml = check_total("NetTotal")
+        tax_xml = check_total("TaxPayable")
+        gross_xml = check_total("GrossTotal")
+
+        if None not in (net_xml, tax_xml, gross_xml):
+            gross_xml_expected = money.q2(money.add(net_xml, tax_xml, deductions))
+
+            if money.compare(gross_xml, (gross_xml_expected, 2)):
+                net2_txt = money.format_cents(net2)
+                tax2_txt = money.format_cents(tax2)
+                gross_txt = money.format_cents(gross_expected)
+                settlement_txt = money.scaled_str(settlement_amount_xml)
+                withholding_txt = money.scaled_str(withholding_amount_xml)
+                # Mostrar também identidade computada para orientar fix
+                logger.log(
+                    "TOTALS_XML_MISMATCH",
+                    (
+                        "Totais do XML não obedecem à identidade (com "
+                        "settlement/withholding)"
+                    ),
+                    xpath=path_of(doc_totals),
+                    ctx={
+                        "invoice": doc_no,
+                        "xml": (
+                            f"{money.scaled_str(net_xml)}-{settlement_txt}+"
+                            f"{money.scaled_str(tax_xml)}-{withholding_txt}"
+                            f"!={money.scaled_str(gross_xml)}"
                         ),
-                        ctx={"invoice": doc_no, "line": i},
-                        field="CreditAmount",
-                        current_value=credit_txt,
-                        suggested_value=fmt2(base2),
-                        suggestion_note=(
-                            "Definir CreditAmount para " "q2(Quantity*UnitPrice)"
+                        "computed": (
+                            f"{net2_txt}-{settlement_txt}+{tax2_txt}-"
+                            f"{withholding_txt}=={gross_txt}"
                         ),
-                    )
-                    ok = False
-            else:
-                logger.log(
-                    "AMT_BOTH_NONE_OR_BOTH",
-                    "Linha deve ter DebitAmount OU CreditAmount (exclusivo)",
-                    xpath=ln_xpath,
-                    ctx={"invoice": doc_no, "line": i},
+                        "gross": gross_txt,
+                        "net": net2_txt,
+                        "tax": tax2_txt,
+                    },
+                    field="GrossTotal",
+                    current_value=money.format_scaled(gross_xml),
+                    suggested_value=money.format_cents(gross_xml_expected),
                     suggestion_note=(
-                        "Remover um dos elementos; manter apenas um dos dois"
+                        "Definir GrossTotal como NetTotal - Settlement + "
+                        "TaxPayable - Withholding"
                     ),
                 )
-                ok = False
+                return False
 
-            tax = ln.find("./n:Tax", namespaces=ns)
-            ttype = (
-                get_text(tax.find("./n:TaxType", namespaces=ns))
-                if tax is not None
-                else "IVA"
-            )
-            tcode = (
-                get_text(tax.find("./n:TaxCode", namespaces=ns))
-                if tax is not None
-                else "NOR"
-            )
-            tperc_el = (
-                tax.find("./n:TaxPercentage", namespaces=ns)
-                if tax is not None
-                else None
-            )
-            tperc_txt = get_text(tperc_el) if tax is not None else "0"
-            if tperc_txt is None:
-                tperc_txt = "0"
+        return True
+
+
+class _DeferredLog:
+    """Acumula chamadas a ``log`` para as reproduzir mais tarde, por ordem."""
+
+    def __init__(self) -> None:
+        self.entries: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def log(self, code: str, message: str, **kwargs: Any) -> None:
+        xpath = kwargs.get("xpath")
+        if isinstance(xpath, _StreamLocation):
+            xpath.pin()
+        self.entries.append((code, message, kwargs))
+
+    def replay(self, logger: ExcelLogger) -> None:
+        for code, message, kwargs in self.entries:
+            xpath = kwargs.get("xpath")
+            if xpath is not None and not isinstance(xpath, str):
+                kwargs = {**kwargs, "xpath": str(xpath)}
+            logger.log(code, message, **kwargs)
+
+
+class _FragmentLocation:
+    """XPath de um elemento validado noutro processo: fatura + troço relativo."""
+
+    __slots__ = ("base", "suffix")
+
+    def __init__(self, base: Any, suffix: str) -> None:
+        self.base = base
+        self.suffix = suffix
+
+    def __str__(self) -> str:
+        return f"{self.base}{self.suffix}"
+
+
+class _BatchLog:
+    """Logger usado nos processos auxiliares; guarda linhas serializáveis.
+
+    As regras recebem o próprio elemento como ``xpath`` e só as linhas
+    registadas pagam o cálculo do caminho relativo à fatura.
+    """
+
+    def __init__(self) -> None:
+        self.index = 0
+        self.rows: List[Tuple[int, str, str, Dict[str, Any]]] = []
+
+    def log(self, code: str, message: str, **kwargs: Any) -> None:
+        element = kwargs.get("xpath")
+        if isinstance(element, etree._Element):
+            root = element.getroottree().getroot()
+            kwargs["xpath"] = relative_path(root, element)
+        self.rows.append((self.index, code, message, kwargs))
+
+
+def _validate_invoice_batch(
+    nsuri: str,
+    tax_index: FrozenSet[TaxKey],
+    fragments: List[bytes],
+) -> Tuple[bool, List[Tuple[int, str, str, Dict[str, Any]]]]:
+    """Executar as regras de fatura sobre fragmentos ``Invoice`` serializados.
+
+    Corre num processo do ``ProcessPoolExecutor``; a ordem das chamadas é a
+    mesma que o :class:`~saftao.rules.RuleEngine` usaria (linhas e depois a
+    fatura).
+    """
+
+    log = _BatchLog()
+    rules = _StrictRules({"n": nsuri}, log, log, lambda element: element)
+    rules.tax_index = TaxTable(tax_index)
+    line_tag = f"{{{nsuri}}}Line"
+    for index, fragment in enumerate(fragments):
+        log.index = index
+        invoice = etree.fromstring(fragment)
+        for line in invoice.iterchildren(line_tag):
+            rules.line(line)
+        rules.invoice(invoice)
+    return rules.ok, log.rows
+
+
+class _InvoiceBatches:
+    """Envia as faturas, em lotes, para um ``ProcessPoolExecutor``.
+
+    Cada lote leva o índice da TaxTable no momento do envio, como no modo
+    sequencial. Os resultados são recolhidos pela ordem de envio, pelo que as
+    linhas chegam ao log na ordem do documento, idênticas às do modo
+    sequencial.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        workers: int,
+        nsuri: str,
+        rules: _StrictRules,
+        path_of: Callable[[etree._Element], Any],
+    ) -> None:
+        self.executor = executor
+        self.nsuri = nsuri
+        self.rules = rules
+        self.path_of = path_of
+        self.max_pending = workers * 2
+        self._fragments: List[bytes] = []
+        self._bases: List[Any] = []
+        self._pending: List[Tuple[Future, List[Any]]] = []
+
+    def add(self, invoice: etree._Element) -> None:
+        base = self.path_of(invoice)
+        if isinstance(base, _StreamLocation):
+            base.pin()
+        self._bases.append(base)
+        self._fragments.append(etree.tostring(invoice))
+        if len(self._fragments) >= INVOICE_BATCH_SIZE:
+            self._submit()
+
+    def _submit(self) -> None:
+        if not self._fragments:
+            return
+        future = self.executor.submit(
+            _validate_invoice_batch,
+            self.nsuri,
+            self.rules.tax_index.keys(),
+            self._fragments,
+        )
+        self._pending.append((future, self._bases))
+        self._fragments = []
+        self._bases = []
+        # Limitar o número de lotes em voo (e a memória retida).
+        while len(self._pending) > self.max_pending:
+            self._collect_oldest()
+
+    def _collect_oldest(self) -> None:
+        future, bases = self._pending.pop(0)
+        ok, rows = future.result()
+        if not ok:
+            self.rules.ok = False
+        for index, code, message, kwargs in rows:
+            kwargs["xpath"] = _FragmentLocation(bases[index], kwargs["xpath"])
+            self.rules.logger.log(code, message, **kwargs)
+
+    def drain(self) -> None:
+        self._submit()
+        while self._pending:
+            self._collect_oldest()
+
+
+class _InvoiceColumns:
+    """Triagem vectorial (NumPy) das faturas, em lotes de colunas ``int64``.
+
+    Numa só passagem por cada fatura são extraídos ``Quantity``,
+    ``UnitPrice``, ``DebitAmount``/``CreditAmount`` e o índice do documento
+    (por linha) e os totais, ``SettlementAmount`` e ``WithholdingTaxAmount``
+    (por documento). As verificações de formato e da TaxTable ficam nessa
+    passagem; ``DebitAmount == q2(Quantity*UnitPrice)`` e a identidade
+    ``GrossTotal = Net - Settlement + Tax - Withholding`` são calculadas por
+    lote com :mod:`saftao.columnar`.
+
+    Só as faturas assinaladas (ou com valores que não cabem em ``int64``)
+    voltam a passar pelas regras de :class:`_StrictRules`, que produzem as
+    linhas do log; o resultado é por isso idêntico ao do modo sequencial. O
+    lote é verificado antes de cada ``TaxTableEntry`` para manter o índice da
+    TaxTable e a ordem das linhas.
+    """
+
+    def __init__(self, nsuri: str, rules: _StrictRules) -> None:
+        self.rules = rules
+
+        def tag(name: str) -> str:
+            return f"{{{nsuri}}}{name}"
+
+        self._line_tag = tag("Line")
+        self._totals_tag = tag("DocumentTotals")
+        self._amount_tags = {
+            tag("Quantity"): 0,
+            tag("UnitPrice"): 1,
+            tag("DebitAmount"): 2,
+            tag("CreditAmount"): 3,
+            tag("Tax"): 4,
+        }
+        self._tax_tags = (tag("TaxType"), tag("TaxCode"), tag("TaxPercentage"))
+        self._total_tags = (tag("NetTotal"), tag("TaxPayable"), tag("GrossTotal"))
+        self._settlement_path = "./n:Settlement/n:SettlementAmount"
+        self._withholding_path = "./n:WithholdingTax/n:WithholdingTaxAmount"
+        self._reset()
+
+    def _reset(self) -> None:
+        self._invoices: List[etree._Element] = []
+        self._flagged: List[bool] = []
+        self._held: List[Tuple[etree._Element, Callable[[etree._Element], None]]] = []
+        # Colunas por linha
+        self._owner: List[int] = []
+        self._values: List[List[int]] = [[] for _ in range(6)]
+        # Colunas por documento (totais em micro-unidades)
+        self._totals: List[List[int]] = [[] for _ in range(4)]
+        self._withholding_owner: List[int] = []
+        self._withholding: List[int] = []
+
+    def add(self, invoice: etree._Element) -> None:
+        index = len(self._invoices)
+        self._invoices.append(invoice)
+        self._flagged.append(not self._extract(invoice, index))
+        if len(self._invoices) >= COLUMN_BATCH_SIZE:
+            self.flush()
+
+    def hold(
+        self, element: etree._Element, discard: Callable[[etree._Element], None]
+    ) -> None:
+        """Adiar a limpeza de ``element`` (modo streaming) até ao fim do lote.
+
+        Ficam retidas as faturas do lote pendente e os irmãos seguintes, cuja
+        limpeza removeria as faturas anteriores.
+        """
+
+        if (self._invoices and self._invoices[-1] is element) or (
+            self._held and self._held[-1][0].getparent() is element.getparent()
+        ):
+            self._held.append((element, discard))
+        else:
+            discard(element)
+
+    def tax_table_entry(self, entry: etree._Element) -> None:
+        self.flush()
+        self.rules.tax_table_entry(entry)
+
+    def _extract(self, invoice: etree._Element, index: int) -> bool:
+        """Acrescentar as colunas de ``invoice``; ``False`` se exigir as regras."""
+
+        ns = self.rules.ns
+        tax_index = self.rules.tax_index
+        lines = 0
+        rows: List[Tuple[int, ...]] = []
+        for line in invoice.iterchildren(self._line_tag):
+            lines += 1
+            found: List[Optional[etree._Element]] = [None] * 5
+            for child in line:
+                slot = self._amount_tags.get(child.tag)
+                if slot is not None and found[slot] is None:
+                    found[slot] = child
+            qty = money.parse_scaled(get_text(found[0]), money.ZERO)
+            unit = money.parse_scaled(get_text(found[1]), money.ZERO)
+            debit_txt = get_text(found[2])
+            credit_txt = get_text(found[3])
+            if (debit_txt is None) == (credit_txt is None):
+                return False
+            amount_txt = debit_txt if credit_txt is None else credit_txt
+            if fd(amount_txt) != 2:
+                return False
+            amount = money.parse_scaled(amount_txt, money.ZERO)
+            if max(abs(qty[0]), abs(unit[0]), abs(amount[0])) >= _INT64_SAFE:
+                return False
+
+            tax = found[4]
+            if tax is None:
+                ttype, tcode, tperc_txt = "IVA", "NOR", "0"
+            else:
+                ttype, tcode, tperc_txt = (
+                    get_text(tax.find(tag)) for tag in self._tax_tags
+                )
+                tperc_txt = tperc_txt or "0"
             if fd(tperc_txt) > 2:
-                logger.log(
-                    "PCT_FORMAT",
-                    f"TaxPercentage com > 2 casas decimais: {tperc_txt}",
-                    xpath=tree.getpath(tperc_el) if tperc_el is not None else ln_xpath,
-                    ctx={"invoice": doc_no, "line": i},
-                    field="TaxPercentage",
-                    current_value=tperc_txt,
-                    suggested_value=fmt_pct_suggestion(tperc_txt),
-                    suggestion_note="Inteiro se taxa exata; caso contrário 2 casas",
+                return False
+            tperc = money.parse_scaled(tperc_txt)
+            if tperc is None:
+                return False
+            if tax_key(ttype, tcode, tperc) not in tax_index:
+                return False
+            rows.append((*qty, *unit, *amount))
+        if not lines:
+            return False
+
+        doc_totals = invoice.find(self._totals_tag)
+        if doc_totals is None:
+            return False
+        totals: List[int] = []
+        for tag in self._total_tags:
+            el = doc_totals.find(tag)
+            txt = (el.text or "").strip() if el is not None else ""
+            if not txt or fd(txt) != 2:
+                return False
+            totals.append(_micros(money.parse_scaled(txt, money.ZERO)))
+        settlement = 0
+        sett_el = doc_totals.find(self._settlement_path, namespaces=ns)
+        if sett_el is not None and (sett_el.text or "").strip():
+            settlement = _micros(money.parse_scaled(sett_el.text, money.ZERO))
+        withholding: List[int] = []
+        for wamt_el in doc_totals.iterfind(self._withholding_path, namespaces=ns):
+            if (wamt_el.text or "").strip():
+                withholding.append(
+                    _micros(money.parse_scaled(wamt_el.text, money.ZERO))
                 )
-                ok = False
+        if None in totals or settlement is None or None in withholding:
+            return False
+
+        for row in rows:
+            for column, value in zip(self._values, row):
+                column.append(value)
+        self._owner.extend([index] * len(rows))
+        for column, value in zip(self._totals, (*totals, settlement)):
+            column.append(value)
+        self._withholding_owner.extend([index] * len(withholding))
+        self._withholding.extend(withholding)
+        return True
+
+    def _screen(self) -> List[bool]:
+        """Faturas que precisam das regras completas (vector de ``bool``)."""
+
+        np = columnar.np
+        flagged = np.array(self._flagged, dtype=bool)
+        clean = np.flatnonzero(~flagged)
+        count = len(clean)
+        if not count:
+            return flagged.tolist()
+        # Renumerar os documentos sem sinalização para índices contíguos.
+        position = np.zeros(len(flagged), dtype=np.int64)
+        position[clean] = np.arange(count)
+
+        owner = position[np.array(self._owner, dtype=np.int64)]
+        qty, qty_s, unit, unit_s, amount, amount_s = (
+            np.array(column, dtype=np.int64) for column in self._values
+        )
+        safe = columnar.fits_int64(qty, unit, qty_s, unit_s, 6)
+        qty, qty_s, unit, unit_s = (
+            np.where(safe, column, 0) for column in (qty, qty_s, unit, unit_s)
+        )
+        base2 = columnar.micros_to_cents(columnar.line_base(qty, qty_s, unit, unit_s))
+        bad_rows = ~safe | (amount_s != 2) | (amount != base2)
+
+        net, tax, gross, settlement = (
+            np.array(column, dtype=np.int64) for column in self._totals
+        )
+        withholding = columnar.segment_sum(
+            self._withholding,
+            position[np.array(self._withholding_owner, dtype=np.int64)],
+            count,
+        )
+        expected = columnar.micros_to_cents(net + tax - settlement - withholding)
+        bad_docs = columnar.micros_to_cents(gross) != expected
+        bad_docs[owner[bad_rows]] = True
+
+        flagged[clean[bad_docs]] = True
+        return flagged.tolist()
+
+    def flush(self) -> None:
+        if not self._invoices:
+            return
+        rules = self.rules
+        for invoice, flagged in zip(self._invoices, self._screen()):
+            if flagged:
+                for line in invoice.iterchildren(self._line_tag):
+                    rules.line(line)
+                rules.invoice(invoice)
+        for invoice, discard in self._held:
+            discard(invoice)
+        self._reset()
+
+
+def _micros(value: Optional[money.Scaled]) -> Optional[int]:
+    """``value`` em micro-unidades, ou ``None`` se não for exacto em ``int64``."""
+
+    if value is None or value[1] > 6:
+        return None
+    micros = value[0] * 10 ** (6 - value[1])
+    return micros if abs(micros) < _INT64_SAFE else None
+
+
+class _RulePass:
+    """Passagem única: verificações de :mod:`saftao.validator` + regras estritas.
+
+    As linhas ficam retidas até :meth:`finish` para manter a ordem histórica
+    do log: primeiro as validações adicionais, depois ``Header`` e por fim
+    ``TaxTable``/faturas. Com ``executor``, as regras de cada fatura correm
+    em processos auxiliares (ver :class:`_InvoiceBatches`).
+    """
 
+    def __init__(
+        self,
+        nsuri: str,
+        path_of: Callable[[etree._Element], Any],
+        *,
+        executor: Optional[Executor] = None,
+        workers: int = 1,
+        backend: str = "python",
+    ) -> None:
+        self.engine = RuleEngine(nsuri)
+        self.header_log = _DeferredLog()
+        self.strict_log = _DeferredLog()
+        self.rules = _StrictRules(
+            {"n": nsuri}, self.header_log, self.strict_log, path_of
+        )
+        self.batches: Optional[_InvoiceBatches] = None
+        self.columns: Optional[_InvoiceColumns] = None
+        if backend == "numpy":
+            self.columns = _InvoiceColumns(nsuri, self.rules)
+            self.engine.register("Header", self.rules.header)
+            self.engine.register("TaxTableEntry", self.columns.tax_table_entry)
+            self.engine.register("Invoice", self.columns.add)
+        elif executor is None:
+            self.rules.register(self.engine)
+        else:
+            self.rules.register(self.engine, invoices=False)
+            self.batches = _InvoiceBatches(
+                executor, workers, nsuri, self.rules, path_of
+            )
+            self.engine.register("Invoice", self.batches.add)
+        self.extra: Any = None
+        self.extra_errors: List[Exception] = []
+        if _pkg_validator is not None:
+            self.extra = _pkg_validator.ValidatorChecks(nsuri)
+            for kind, handler in self.extra.handlers():
+                self.engine.register(kind, self._guard(handler))
+
+    def _guard(
+        self, handler: Callable[[etree._Element], None]
+    ) -> Callable[[etree._Element], None]:
+        # Uma falha nas validações adicionais não interrompe as regras estritas.
+        def run(element: etree._Element) -> None:
+            if self.extra_errors:
+                return
             try:
-                tperc = Decimal(tperc_txt)
-            except InvalidOperation:
-                logger.log(
-                    "PCT_NOT_DECIMAL",
-                    f"TaxPercentage não é decimal: {tperc_txt}",
-                    xpath=(
-                        tree.getpath(tperc_el) if tperc_el is not None else ln_xpath
-                    ),
-                    ctx={"invoice": doc_no, "line": i},
-                    field="TaxPercentage",
-                    current_value=tperc_txt,
-                    suggested_value="",
-                    suggestion_note=("Corrigir para valor decimal (ex.: 14 ou 14.00)"),
-                )
-                tperc = Decimal("0")
-                ok = False
+                handler(element)
+            except Exception as exc:  # pragma: no cover - defensive
+                self.extra_errors.append(exc)
 
-            vat = q6(base * tperc / HUNDRED)
-            net_total += base
-            tax_total += vat
+        return run
 
-            if (ttype or "IVA", tcode or "NOR", tperc) not in tax_index:
-                logger.log(
-                    "TAXTABLE_MISSING",
-                    (
-                        "Tax (type={ttype}, code={tcode}, perc={tperc}) não "
-                        "existe na TaxTable"
-                    ),
-                    xpath=ln_xpath,
-                    ctx={"invoice": doc_no, "line": i},
-                    field="Tax",
-                    current_value=f"{ttype}/{tcode}/{tperc}",
-                    suggested_value=(
-                        "ADD TaxTableEntry("
-                        f"{ttype},{tcode},{fmt_pct_suggestion(str(tperc))})"
-                    ),
-                    suggestion_note=("Adicionar entrada correspondente na TaxTable"),
-                )
-                ok = False
+    def release(
+        self, element: etree._Element, discard: Callable[[etree._Element], None]
+    ) -> None:
+        """Limpar um documento já processado (modo streaming).
 
-        net2 = q2(net_total)
-        tax2 = q2(tax_total)
+        Com o backend ``numpy`` as faturas ficam retidas até o respectivo lote
+        ser verificado, porque as assinaladas voltam a ser percorridas.
+        """
 
-        # Identidade completa (computada):
-        # GrossExpected = Net2 - SettlementAmount + Tax2 - WithholdingTaxAmount
-        gross_expected = q2(
-            net2 - settlement_amount_xml + tax2 - withholding_amount_xml
-        )
+        if self.columns is not None:
+            self.columns.hold(element, discard)
+        else:
+            discard(element)
 
-        if doc_totals is None:
+    def finish(self, logger: ExcelLogger) -> bool:
+        if self.batches is not None:
+            self.batches.drain()
+        if self.columns is not None:
+            self.columns.flush()
+        strict_ok = self.rules.finish()
+
+        extra_ok = True
+        if self.extra_errors:
             logger.log(
-                "TOTALS_MISSING",
-                "DocumentTotals em falta",
-                xpath=inv_xpath,
-                ctx={"invoice": doc_no},
+                "VALIDATOR_EXCEPTION",
+                f"Falha ao executar validações adicionais: {self.extra_errors[0]}",
             )
-            ok = False
+            extra_ok = False
+        elif self.extra is not None:
+            issues = self.extra.issues()
+            for issue in issues:
+                _log_validator_issue(issue, logger)
+            extra_ok = not issues
+
+        self.header_log.replay(logger)
+        self.strict_log.replay(logger)
+        return extra_ok and strict_ok
+
+
+def _invoice_executor(workers: int) -> ContextManager[Optional[Executor]]:
+    """``ProcessPoolExecutor`` para ``workers > 1``; caso contrário nenhum."""
+
+    if workers > 1:
+        return ProcessPoolExecutor(max_workers=workers)
+    return contextlib.nullcontext()
+
+
+def _check_backend(backend: str, workers: int) -> None:
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {backend!r}")
+    if backend == "numpy":
+        if not columnar.available():
+            raise RuntimeError("O backend 'numpy' requer o pacote numpy")
+        if workers > 1:
+            raise ValueError("O backend 'numpy' não suporta workers > 1")
+
+
+def validate_business_rules(
+    tree: etree._ElementTree,
+    logger: ExcelLogger,
+    *,
+    workers: int = 1,
+    backend: str = "python",
+) -> bool:
+    """Regras estritas sobre a árvore completa.
+
+    ``backend="numpy"`` faz a triagem vectorial das faturas (ver
+    :class:`_InvoiceColumns`); o log é idêntico ao do backend ``python``.
+    """
+
+    _check_backend(backend, workers)
+    with _invoice_executor(workers) as executor:
+        # O XPath só é calculado quando uma linha chega efectivamente ao log.
+        rule_pass = _RulePass(
+            detect_ns(tree),
+            _PkgLazyXPath or tree.getpath,
+            executor=executor,
+            workers=workers,
+            backend=backend,
+        )
+        rule_pass.engine.run(tree.getroot())
+        return rule_pass.finish(logger)
+
+
+# ------------------------- Modo streaming (iterparse) ---------------------
+
+
+class _StreamLocation:
+    """XPath diferido para elementos já descartados pelo ``iterparse``.
+
+    O índice do documento dentro do contentor só é conhecido no fim do
+    ficheiro (``getpath`` omite ``[1]`` quando não existem irmãos), pelo que
+    a string é construída apenas quando a linha é efectivamente registada.
+    O troço relativo ao documento é fixado por :meth:`pin` enquanto os
+    elementos ainda existem; posições nunca registadas não custam nada.
+    """
+
+    __slots__ = (
+        "_tracker",
+        "_container",
+        "_name",
+        "_key",
+        "_occur",
+        "_anchor",
+        "_target",
+        "_suffix",
+    )
+
+    def __init__(
+        self,
+        tracker: "_StreamPathTracker",
+        container: etree._Element,
+        name: str,
+        key: Tuple[str, Optional[str]],
+        occur: int,
+        anchor: etree._Element,
+        target: etree._Element,
+    ) -> None:
+        self._tracker = tracker
+        self._container = container
+        self._name = name
+        self._key = key
+        self._occur = occur
+        self._anchor = anchor
+        self._target = target
+        self._suffix: Optional[str] = None
+
+    def pin(self) -> None:
+        """Calcular o caminho relativo antes de o documento ser limpo."""
+
+        if self._suffix is None:
+            self._suffix = relative_path(self._anchor, self._target)
+            self._anchor = self._target = None
+
+    def __str__(self) -> str:
+        self.pin()
+        base = self._container.getroottree().getpath(self._container)
+        total = self._tracker.count(self._container, self._key)
+        step = f"{self._name}[{self._occur}]" if total > 1 else self._name
+        return f"{base}/{step}{self._suffix}"
+
+
+class _StreamPathTracker:
+    """Contabiliza os irmãos removidos para reconstruir caminhos ``getpath``."""
+
+    def __init__(self, source_tag: str) -> None:
+        self._source_tag = source_tag
+        self._dropped: Dict[etree._Element, Dict[Tuple[str, Optional[str]], int]] = {}
+        self._last_anchor: Optional[etree._Element] = None
+        self._last_occur = 0
+
+    def drop_preceding(self, element: etree._Element) -> None:
+        """Remove os irmãos anteriores de ``element`` (já processados)."""
+
+        parent = element.getparent()
+        if parent is None:
+            return
+        counts = self._dropped.setdefault(parent, {})
+        prev = element.getprevious()
+        while prev is not None:
+            if isinstance(prev.tag, str):
+                _, key = path_step(prev)
+                counts[key] = counts.get(key, 0) + 1
+                if key[0] != "*":
+                    counts[("*", None)] = counts.get(("*", None), 0) + 1
+            parent.remove(prev)
+            prev = element.getprevious()
+
+    def count(self, container: etree._Element, key: Tuple[str, Optional[str]]) -> int:
+        live = sum(1 for child in container if step_matches(child, key))
+        return self._dropped.get(container, {}).get(key, 0) + live
+
+    def locate(self, target: etree._Element) -> Any:
+        """Posição de ``target`` ancorada no elemento que sobrevive à limpeza.
+
+        Dentro de ``SourceDocuments`` a âncora é o documento (4.º nível), cujos
+        irmãos anteriores vão sendo removidos; nas restantes secções é o
+        filho directo da raiz.
+        """
+
+        ancestors = [target, *target.iterancestors()]
+        if len(ancestors) < 2:
+            return target.getroottree().getpath(target)
+        anchor = ancestors[-2]
+        if anchor.tag == self._source_tag and len(ancestors) >= 4:
+            anchor = ancestors[-4]
+        container = anchor.getparent()
+        name, key = path_step(anchor)
+        if anchor is self._last_anchor:
+            # A posição não muda ao remover irmãos anteriores (passam a
+            # contar em ``_dropped``); evita recontar para cada linha.
+            occur = self._last_occur
         else:
-            # Garantir 2 casas nos 3 totais e verificar identidade no XML
-            def check_total(tag: str) -> Decimal:
-                el = doc_totals.find(f"./n:{tag}", namespaces=ns)
-                if el is None or (el.text or "").strip() == "":
-                    logger.log(
-                        "TOTAL_TAG_MISSING",
-                        f"{tag} em falta",
-                        xpath=inv_xpath,
-                        ctx={"invoice": doc_no},
-                        field=tag,
-                        suggested_value="",
-                    )
-                    return None
-                txt = (el.text or "").strip()
-                if fd(txt) != 2:
-                    logger.log(
-                        "TOTAL_FORMAT",
-                        f"{tag} deve ter exatamente 2 casas decimais: '{txt}'",
-                        xpath=tree.getpath(el),
-                        ctx={"invoice": doc_no},
-                        field=tag,
-                        current_value=txt,
-                        suggested_value=fmt2(parse_decimal(txt)),
-                        suggestion_note=("Formatar o total com 2 casas decimais"),
-                    )
-                return parse_decimal(txt)
-
-            net_xml = check_total("NetTotal")
-            tax_xml = check_total("TaxPayable")
-            gross_xml = check_total("GrossTotal")
-
-            if None not in (net_xml, tax_xml, gross_xml):
-                gross_xml_expected = q2(
-                    net_xml - settlement_amount_xml + tax_xml - withholding_amount_xml
+            preceding = sum(
+                1
+                for sib in anchor.itersiblings(preceding=True)
+                if step_matches(sib, key)
+            )
+            occur = self._dropped.get(container, {}).get(key, 0) + preceding + 1
+            self._last_anchor, self._last_occur = anchor, occur
+        return _StreamLocation(self, container, name, key, occur, anchor, target)
+
+
+def validate_business_rules_stream(
+    xml_path: Path,
+    logger: ExcelLogger,
+    *,
+    recover: bool = False,
+    workers: int = 1,
+    backend: str = "python",
+    schema: Optional[etree.XMLSchema] = None,
+    schema_errors: Optional[List[Any]] = None,
+) -> bool:
+    """Versão ``iterparse`` de :func:`validate_business_rules`.
+
+    Os eventos alimentam o mesmo :class:`~saftao.rules.RuleEngine` do modo
+    DOM; cada documento de ``SourceDocuments`` é limpo, juntamente com os
+    irmãos anteriores, logo que as verificações o processam e ``MasterFiles``
+    é libertado no fim do bloco. O pico de memória fica limitado ao maior
+    documento individual. As linhas são emitidas no fim, pela mesma ordem do
+    modo DOM. Com ``backend="numpy"`` as faturas de cada lote só são limpas
+    depois de o lote ser verificado.
+
+    Com ``schema`` o XSD é verificado pelo libxml2 na mesma leitura e os erros
+    XSD são acrescentados a ``schema_errors`` em vez de interromperem as
+    regras. Se o XSD obrigar o libxml2 a parar antes do fim (raiz não
+    reconhecida), as regras são repetidas numa leitura sem XSD.
+    """
+
+    _check_backend(backend, workers)
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(_invoice_executor(workers))
+        rule_pass: Optional[_RulePass] = None
+        tracker: Optional[_StreamPathTracker] = None
+        keep: Tuple[str, ...] = ()
+        depth = 0
+
+        def discard(element: etree._Element) -> None:
+            element.clear()
+            tracker.drop_preceding(element)
+
+        source = stack.enter_context(archive.xml_source(xml_path))
+        context = etree.iterparse(
+            source, events=("start", "end"), recover=recover, schema=schema
+        )
+        events = _schema_guard(context, recover) if schema is not None else context
+        for event, el in events:
+            if rule_pass is None:
+                nsuri = detect_ns(el.getroottree())
+                tracker = _StreamPathTracker(f"{{{nsuri}}}SourceDocuments")
+                rule_pass = _RulePass(
+                    nsuri,
+                    tracker.locate,
+                    executor=executor,
+                    workers=workers,
+                    backend=backend,
                 )
+                keep = (f"{{{nsuri}}}Header", f"{{{nsuri}}}MasterFiles")
+
+            kind = rule_pass.engine.feed(event, el)
+            if event == "start":
+                depth += 1
+                continue
+
+            if kind == "MasterFiles":
+                el.clear()
+            elif depth == 4 and el.getparent().getparent().tag not in keep:
+                rule_pass.release(el, discard)
+            depth -= 1
+        aborted = schema is not None and depth > 0
+
+        if schema is not None and schema_errors is not None:
+            schema_errors.extend(schema_error_entries(context.error_log))
+        if rule_pass is None:  # pragma: no cover - iterparse rejects empty files
+            return False
+        if not aborted:
+            return rule_pass.finish(logger)
+
+    return validate_business_rules_stream(
+        xml_path, logger, recover=recover, workers=workers, backend=backend
+    )
 
-                if gross_xml != gross_xml_expected:
-                    # Mostrar também identidade computada para orientar fix
-                    logger.log(
-                        "TOTALS_XML_MISMATCH",
-                        (
-                            "Totais do XML não obedecem à identidade (com "
-                            "settlement/withholding)"
-                        ),
-                        xpath=tree.getpath(doc_totals),
-                        ctx={
-                            "invoice": doc_no,
-                            "xml": (
-                                f"{net_xml}-{settlement_amount_xml}+{tax_xml}-"
-                                f"{withholding_amount_xml}!={gross_xml}"
-                            ),
-                            "computed": (
-                                f"{net2}-{settlement_amount_xml}+{tax2}-"
-                                f"{withholding_amount_xml}=={gross_expected}"
-                            ),
-                            "gross": str(gross_expected),
-                            "net": str(net2),
-                            "tax": str(tax2),
-                        },
-                        field="GrossTotal",
-                        current_value=fmt2(gross_xml),
-                        suggested_value=fmt2(gross_xml_expected),
-                        suggestion_note=(
-                            "Definir GrossTotal como NetTotal - Settlement + "
-                            "TaxPayable - Withholding"
-                        ),
-                    )
-                    ok = False
 
-                # Se também o nosso cálculo interno não bater, regista mismatch “geral”
-                if gross_expected != q2(
-                    net2 - settlement_amount_xml + tax2 - withholding_amount_xml
-                ):
-                    # (identidade redundante, deixada por clareza)
-                    pass
+def _schema_guard(
+    context: Iterable[Tuple[str, etree._Element]], recover: bool
+) -> Iterator[Tuple[str, etree._Element]]:
+    """Iterar ``context`` (``iterparse`` com XSD) ignorando os erros XSD.
 
-    return ok
+    O libxml2 só levanta o erro XSD no fim da leitura e com a mensagem do
+    primeiro erro XSD, mesmo quando o XML está mal formado; nesse caso a
+    excepção é refeita a partir do erro de parse para seguir o fluxo de
+    recuperação habitual. Os erros vêm do registo do próprio ``iterparse``:
+    o ``error_log`` da excepção pode trazer erros de leituras anteriores.
+    """
+
+    try:
+        yield from context
+    except etree.XMLSyntaxError as ex:
+        if recover:
+            return
+        for e in getattr(context, "error_log", ex.error_log):
+            if e.domain_name != "SCHEMASV" and e.level >= etree.ErrorLevels.ERROR:
+                raise etree.XMLSyntaxError(
+                    f"{e.message}, line {e.line}, column {e.column}",
+                    e.type,
+                    e.line,
+                    e.column,
+                    e.filename,
+                ) from ex
+
+
+def validate_schema_stream(
+    xml_path: Path, xsd_path: Path, logger: ExcelLogger, *, recover: bool = False
+) -> bool:
+    """Validação XSD durante a leitura, sem construir a árvore completa.
+
+    A validação em fluxo do libxml2 não associa linhas aos erros, pelo que
+    esta leitura só decide se o ficheiro passa no XSD; quando reprova, as
+    linhas são obtidas por :func:`locate_schema_errors`, iguais às do modo
+    DOM. Um XML lido com ``recover`` é validado sobre a árvore recuperada,
+    como no modo DOM: o fluxo pára no primeiro erro de estrutura e deixaria
+    passar, por exemplo, os filhos em falta de um ficheiro truncado.
+    """
+
+    try:
+        schema = compiled_schema(xsd_path)
+    except Exception as ex:
+        logger.log(
+            "XSD_EXCEPTION", f"Falha ao executar validação XSD: {ex}", field="XSD"
+        )
+        return False
+
+    if recover:
+        return _log_schema_errors(
+            schema_errors_from_tree(xml_path, schema, recover=True), logger
+        )
+
+    with archive.xml_source(xml_path) as source:
+        context = etree.iterparse(
+            source, events=("end",), schema=schema, recover=recover
+        )
+        try:
+            for _, el in context:
+                el.clear()
+                parent = el.getparent()
+                if parent is None:
+                    continue
+                while el.getprevious() is not None:
+                    del parent[0]
+        except etree.XMLSyntaxError:
+            pass
+        except Exception as ex:
+            logger.log(
+                "XSD_EXCEPTION", f"Falha ao executar validação XSD: {ex}", field="XSD"
+            )
+            return False
+
+    errors = schema_error_entries(context.error_log)
+    if errors:
+        errors = locate_schema_errors(xml_path, schema, errors, recover=recover)
+    return _log_schema_errors(errors, logger)
+
+
+def _log_schema_errors(errors: List[Any], logger: ExcelLogger) -> bool:
+    for e in errors:
+        logger.log(
+            "XSD_ERROR",
+            e.message,
+            ctx={"line": e.line, "level": e.level_name},
+            field="XSD",
+        )
+    return not errors
 
 
 def resolve_xml_path(arg: str) -> Path:
@@ -708,6 +1546,162 @@ def default_xsd_path() -> Optional[Path]:
     return None
 
 
+def _parse_with_recovery(
+    xml_path: Path, logger: ExcelLogger, parse: Callable[[bool], Any]
+) -> Optional[Tuple[Any, bool]]:
+    """Executar ``parse`` e repetir com ``recover=True`` se o XML for inválido.
+
+    Devolve ``(resultado, recuperado)`` ou ``None`` quando o ficheiro não pode
+    ser lido (os erros já ficam registados no ``logger``).
+    """
+
+    try:
+        return parse(False), False
+    except etree.XMLSyntaxError as ex:
+        msg = f"Falha no parse do XML: {ex}"
+        print(f"[ERRO] {msg}", file=sys.stderr)
+        logger.log(
+            "XML_PARSE_ERROR",
+            msg,
+            field="XML",
+            current_value=str(xml_path),
+            suggestion_note=str(ex),
+        )
+        print("[AVISO] A tentar recuperar o XML com 'recover=True'…", file=sys.stderr)
+        try:
+            result = parse(True)
+        except Exception as recover_ex:
+            rec_msg = f"Recuperação do XML falhou: {recover_ex}"
+            print(f"[ERRO] {rec_msg}", file=sys.stderr)
+            logger.log(
+                "XML_PARSE_RECOVER_FAIL",
+                rec_msg,
+                field="XML",
+                current_value=str(xml_path),
+                suggestion_note=str(recover_ex),
+            )
+            return None
+        logger.log(
+            "XML_PARSE_RECOVER_OK",
+            "XML inválido recuperado com parser em modo 'recover'",
+            field="XML",
+            current_value=str(xml_path),
+            suggestion_note=str(ex),
+        )
+        print(
+            "[ALERTA] XML recuperado com possíveis perdas. Prosseguir com cautela.",
+            file=sys.stderr,
+        )
+        return result, True
+    except Exception as ex:
+        msg = f"Falha no parse do XML: {ex}"
+        print(f"[ERRO] {msg}", file=sys.stderr)
+        logger.log("XML_PARSE_ERROR", msg, field="XML", current_value=str(xml_path))
+        return None
+
+
+def _log_name(logger: ExcelLogger) -> str:
+    """Nome do ficheiro de log, para as mensagens da consola."""
+
+    path = getattr(logger, "path", None)
+    return path.name if path is not None else "log"
+
+
+def _validate_dom(
+    xml_path: Path,
+    xsd_path: Optional[Path],
+    logger: ExcelLogger,
+    workers: int = 1,
+    backend: str = "python",
+) -> Optional[Tuple[bool, bool]]:
+    def parse(recover: bool) -> etree._ElementTree:
+        if recover:
+            return archive.parse_xml(xml_path, etree.XMLParser(recover=True))
+        return archive.parse_xml(xml_path)
+
+    parsed = _parse_with_recovery(xml_path, logger, parse)
+    if parsed is None:
+        return None
+    tree, _ = parsed
+
+    schema_ok = True
+    if xsd_path is not None:
+        schema_ok = validate_schema(tree, xsd_path, logger)
+        if not schema_ok:
+            print(f"[FALHA] Validação XSD reprovou (ver {_log_name(logger)}).")
+
+    strict_ok = validate_business_rules(
+        tree, logger, workers=workers, backend=backend
+    )
+    if not strict_ok:
+        print(f"[FALHA] Validação estrita reprovou (ver {_log_name(logger)}).")
+    return schema_ok, strict_ok
+
+
+def _validate_stream(
+    xml_path: Path,
+    xsd_path: Optional[Path],
+    logger: ExcelLogger,
+    workers: int = 1,
+    backend: str = "python",
+    xsd_on_parse: bool = False,
+) -> Optional[Tuple[bool, bool]]:
+    """Fluxo ``--stream``: regras e XSD em passagens ``iterparse`` separadas.
+
+    Com ``xsd_on_parse`` o XSD é verificado na leitura das regras, numa só
+    passagem pelo ficheiro (``--xsd-on-parse``). As linhas das regras ficam
+    retidas até ao fim para manter a ordem do modo DOM (erros de parse, XSD e
+    só depois regras de negócio).
+    """
+
+    schema: Optional[etree.XMLSchema] = None
+    if xsd_on_parse and xsd_path is not None:
+        try:
+            schema = compiled_schema(xsd_path)
+        except Exception:
+            pass  # a passagem XSD separada regista XSD_EXCEPTION
+
+    def parse(recover: bool) -> Tuple[bool, _DeferredLog, List[Any]]:
+        rules_log = _DeferredLog()
+        xsd_errors: List[Any] = []
+        ok = validate_business_rules_stream(
+            xml_path,
+            rules_log,
+            recover=recover,
+            workers=workers,
+            backend=backend,
+            schema=schema,
+            schema_errors=xsd_errors,
+        )
+        return ok, rules_log, xsd_errors
+
+    parsed = _parse_with_recovery(xml_path, logger, parse)
+    if parsed is None:
+        return None
+    (strict_ok, rules_log, xsd_errors), recovered = parsed
+
+    schema_ok = True
+    if schema is not None:
+        # Lido com ``recover``, o fluxo deixa erros XSD por registar (ver
+        # :func:`locate_schema_errors`), mesmo quando não indica nenhum.
+        if xsd_errors or recovered:
+            xsd_errors = locate_schema_errors(
+                xml_path, schema, xsd_errors, recover=recovered
+            )
+        schema_ok = _log_schema_errors(xsd_errors, logger)
+    elif xsd_path is not None:
+        schema_ok = validate_schema_stream(
+            xml_path, xsd_path, logger, recover=recovered
+        )
+    if not schema_ok:
+        print(f"[FALHA] Validação XSD reprovou (ver {_log_name(logger)}).")
+
+    rules_log.replay(logger)
+    if not strict_ok:
+        print(f"[FALHA] Validação estrita reprovou (ver {_log_name(logger)}).")
+    return schema_ok, strict_ok
+
+
 def _launch_gui_from_cli() -> int:
     """Launch the graphical interface when no XML argument is provided."""
 
@@ -747,13 +1741,72 @@ def main(argv: Optional[List[str]] = None) -> int:
             "Se omitido, será utilizada a pesquisa automática padrão."
         ),
     )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Validar com iterparse, documento a documento, sem carregar o "
+            "ficheiro completo em memória (para ficheiros grandes). A memória "
+            "fica limitada, mas o ficheiro é lido uma vez para as regras e "
+            "outra para o XSD, pelo que pode demorar mais do que o modo "
+            "normal; use --xsd-on-parse para uma só leitura. Se o XSD "
+            "reprovar, o ficheiro é lido de novo para obter a linha de cada "
+            "erro."
+        ),
+    )
+    ap.add_argument(
+        "--xsd-on-parse",
+        action="store_true",
+        help=(
+            "Com --stream, verificar o XSD durante a leitura das regras, numa "
+            "só passagem pelo ficheiro, em vez de uma segunda leitura."
+        ),
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Número de processos para validar as faturas em paralelo "
+            "(por omissão 1). O log final é idêntico ao da execução sequencial."
+        ),
+    )
+    ap.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="python",
+        help=(
+            "Motor das regras de linhas e totais: 'numpy' verifica as faturas "
+            "em lotes vectoriais e só percorre as que apresentam erros "
+            "(requer numpy; não combina com --workers)."
+        ),
+    )
+    ap.add_argument(
+        "--log-format",
+        choices=LOG_FORMATS,
+        default="xlsx",
+        help="Formato do ficheiro de log (por omissão xlsx).",
+    )
     args = ap.parse_args(argv)
 
+    if args.workers < 1:
+        ap.error("--workers deve ser um inteiro positivo")
+    if args.xsd_on_parse and not args.stream:
+        ap.error("--xsd-on-parse requer --stream")
+    if args.backend == "numpy":
+        if not columnar.available():
+            ap.error("--backend numpy requer o pacote numpy")
+        if args.workers > 1:
+            ap.error("--backend numpy não pode ser combinado com --workers")
+
     if args.xml is None:
         if args.xsd is not None:
             print(
-                "[ERRO] O caminho para o XSD só pode ser usado em modo linha de comandos. ",
-                "Indique também o XML ou inicie sem argumentos para abrir a interface gráfica.",
+                "[ERRO] O caminho para o XSD só pode ser usado em modo linha de "
+                "comandos. ",
+                "Indique também o XML ou inicie sem argumentos para abrir a "
+                "interface gráfica.",
                 sep="",
                 file=sys.stderr,
             )
@@ -761,7 +1814,9 @@ def main(argv: Optional[List[str]] = None) -> int:
         return _launch_gui_from_cli()
 
     xml_path = resolve_xml_path(args.xml)
-    logger = ExcelLogger(base_name=xml_path.stem)
+    logger = ExcelLogger(
+        base_name=archive.source_stem(xml_path), log_format=args.log_format
+    )
     logger.log("INFO_START", "Início da validação", ctx={"xml": str(xml_path)})
 
     if not xml_path.exists():
@@ -791,62 +1846,23 @@ def main(argv: Optional[List[str]] = None) -> int:
             "XSD_FOUND", "XSD encontrado", field="XSD", current_value=str(xsd_path)
         )
 
-    try:
-        tree = etree.parse(str(xml_path))
-    except etree.XMLSyntaxError as ex:
-        msg = f"Falha no parse do XML: {ex}"
-        print(f"[ERRO] {msg}", file=sys.stderr)
-        logger.log(
-            "XML_PARSE_ERROR",
-            msg,
-            field="XML",
-            current_value=str(xml_path),
-            suggestion_note=str(ex),
+    if args.stream:
+        outcome = _validate_stream(
+            xml_path,
+            xsd_path,
+            logger,
+            args.workers,
+            args.backend,
+            xsd_on_parse=args.xsd_on_parse,
         )
-        print("[AVISO] A tentar recuperar o XML com 'recover=True'…", file=sys.stderr)
-        try:
-            recover_parser = etree.XMLParser(recover=True)
-            tree = etree.parse(str(xml_path), parser=recover_parser)
-        except Exception as recover_ex:
-            rec_msg = f"Recuperação do XML falhou: {recover_ex}"
-            print(f"[ERRO] {rec_msg}", file=sys.stderr)
-            logger.log(
-                "XML_PARSE_RECOVER_FAIL",
-                rec_msg,
-                field="XML",
-                current_value=str(xml_path),
-                suggestion_note=str(recover_ex),
-            )
-            logger.flush()
-            return 2
-        else:
-            logger.log(
-                "XML_PARSE_RECOVER_OK",
-                "XML inválido recuperado com parser em modo 'recover'",
-                field="XML",
-                current_value=str(xml_path),
-                suggestion_note=str(ex),
-            )
-            print(
-                "[ALERTA] XML recuperado com possíveis perdas. Prosseguir com cautela.",
-                file=sys.stderr,
-            )
-    except Exception as ex:
-        msg = f"Falha no parse do XML: {ex}"
-        print(f"[ERRO] {msg}", file=sys.stderr)
-        logger.log("XML_PARSE_ERROR", msg, field="XML", current_value=str(xml_path))
+    else:
+        outcome = _validate_dom(
+            xml_path, xsd_path, logger, args.workers, args.backend
+        )
+    if outcome is None:
         logger.flush()
         return 2
-
-    schema_ok = True
-    if xsd_path is not None:
-        schema_ok = validate_schema(tree, xsd_path, logger)
-        if not schema_ok:
-            print("[FALHA] Validação XSD reprovou (ver Excel).")
-
-    strict_ok = validate_business_rules(tree, logger)
-    if not strict_ok:
-        print("[FALHA] Validação estrita reprovou (ver Excel).")
+    schema_ok, strict_ok = outcome
 
     logger.log(
         "INFO_END",
@@ -856,10 +1872,10 @@ def main(argv: Optional[List[str]] = None) -> int:
     logger.flush()
 
     if schema_ok and strict_ok:
-        print(f"[OK] Validação concluída com sucesso. Log Excel: {logger.path.name}")
+        print(f"[OK] Validação concluída com sucesso. Log: {logger.path.name}")
         return 0
 
-    print(f"[FAIL] Foram detetadas não conformidades. Log Excel: {logger.path.name}")
+    print(f"[FAIL] Foram detetadas não conformidades. Log: {logger.path.name}")
     return 2
 
 
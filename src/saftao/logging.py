@@ -1,17 +1,24 @@
-"""Funções utilitárias para registo estruturado em Excel.
+"""Funções utilitárias para registo estruturado de ocorrências.
 
 O objectivo deste módulo é unificar as múltiplas implementações de
-``ExcelLogger`` existentes nos scripts *legacy*. Enquanto a migração para o
-pacote ``saftao`` não fica concluída, disponibilizamos uma implementação leve
-que garante compatibilidade com a interface esperada pelas novas ferramentas
-como a GUI.
+``ExcelLogger`` existentes nos scripts *legacy*. Os registos são enviados para
+um *sink* (:class:`IssueSink`) que grava cada linha assim que é produzida, sem
+a manter em memória. Estão disponíveis os formatos ``xlsx`` (``openpyxl`` em
+modo ``write_only``), ``csv``, ``jsonl`` e ``sqlite``; utilize
+:func:`open_issue_sink` para escolher o formato a partir do nome e
+:func:`read_issue_log` para voltar a ler um log gravado.
 """
 
 from __future__ import annotations
 
+import csv
+import json
+import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Protocol, Sequence
+from typing import Any, Iterable, Iterator, Mapping, Protocol, Sequence
+
+LOG_FORMATS = ("xlsx", "csv", "jsonl", "sqlite")
 
 
 class RowLike(Protocol):
@@ -21,6 +28,294 @@ def as_cells(self) -> Iterable[str]:
         """Devolve os valores ordenados a escrever na folha."""
 
 
+class IssueSink:
+    """Destino de registos gravados linha a linha.
+
+    As subclasses abrem o ficheiro na construção e escrevem cada linha em
+    :meth:`write`; :meth:`close` conclui a gravação e devolve o caminho final.
+    Pode ser usado como *context manager*.
+    """
+
+    suffix = ""
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        *,
+        title: str = "Log",
+        widths: Mapping[str, float] | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.title = title
+        self.closed = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, row: Sequence[Any]) -> None:
+        """Gravar ``row`` (valores pela ordem de ``columns``)."""
+
+        raise NotImplementedError
+
+    def close(self) -> Path:
+        """Concluir a gravação e devolver o caminho do ficheiro."""
+
+        self.closed = True
+        return self.path
+
+    def __enter__(self) -> "IssueSink":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if not self.closed:
+            self.close()
+
+
+class XlsxIssueSink(IssueSink):
+    """Folha Excel escrita em modo ``write_only`` (linhas vão para disco)."""
+
+    suffix = ".xlsx"
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        *,
+        title: str = "Log",
+        widths: Mapping[str, float] | None = None,
+    ) -> None:
+        from openpyxl import Workbook
+
+        super().__init__(path, columns, title=title, widths=widths)
+        self._workbook = Workbook(write_only=True)
+        self._worksheet = self._workbook.create_sheet(title)
+        # As larguras só podem ser definidas antes da primeira linha.
+        for letter, width in (widths or {}).items():
+            self._worksheet.column_dimensions[letter].width = width
+        if self.columns:
+            self._worksheet.append(self.columns)
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._worksheet.append(list(row))
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._workbook.save(self.path)
+        return super().close()
+
+
+class CsvIssueSink(IssueSink):
+    """Ficheiro CSV (UTF-8, separador ``,``) com cabeçalho."""
+
+    suffix = ".csv"
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        *,
+        title: str = "Log",
+        widths: Mapping[str, float] | None = None,
+    ) -> None:
+        super().__init__(path, columns, title=title, widths=widths)
+        self._handle = self.path.open("w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._handle)
+        if self.columns:
+            self._writer.writerow(self.columns)
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._writer.writerow(["" if value is None else value for value in row])
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._handle.close()
+        return super().close()
+
+
+class JsonlIssueSink(IssueSink):
+    """Um objecto JSON por linha, com as chaves de ``columns``."""
+
+    suffix = ".jsonl"
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        *,
+        title: str = "Log",
+        widths: Mapping[str, float] | None = None,
+    ) -> None:
+        super().__init__(path, columns, title=title, widths=widths)
+        self._handle = self.path.open("w", encoding="utf-8")
+
+    def write(self, row: Sequence[Any]) -> None:
+        values = list(row)
+        if self.columns:
+            record: Any = dict(zip(self.columns, values))
+        else:
+            record = values
+        self._handle.write(
+            json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        )
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._handle.close()
+        return super().close()
+
+
+class SqliteIssueSink(IssueSink):
+    """Base de dados SQLite com uma tabela (``title``) de colunas de texto.
+
+    As linhas são inseridas numa única transacção confirmada em
+    :meth:`close`; um ficheiro existente com o mesmo nome é substituído.
+    """
+
+    suffix = ".sqlite"
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[str],
+        *,
+        title: str = "Log",
+        widths: Mapping[str, float] | None = None,
+    ) -> None:
+        super().__init__(path, columns, title=title, widths=widths)
+        if not self.columns:
+            raise ValueError("SqliteIssueSink requer a lista de colunas")
+        self.path.unlink(missing_ok=True)
+        self._connection = sqlite3.connect(str(self.path))
+        table = _sql_identifier(title)
+        names = ", ".join(_sql_identifier(column) for column in self.columns)
+        self._connection.execute(f"CREATE TABLE {table} ({names})")
+        placeholders = ", ".join("?" for _ in self.columns)
+        self._insert = f"INSERT INTO {table} ({names}) VALUES ({placeholders})"
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._connection.execute(self._insert, [_sql_value(value) for value in row])
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._connection.commit()
+            self._connection.close()
+        return super().close()
+
+
+def _sql_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+_SINKS: dict[str, type[IssueSink]] = {
+    "xlsx": XlsxIssueSink,
+    "csv": CsvIssueSink,
+    "jsonl": JsonlIssueSink,
+    "sqlite": SqliteIssueSink,
+}
+
+
+def open_issue_sink(
+    base: Path | str,
+    columns: Sequence[str],
+    log_format: str = "xlsx",
+    *,
+    title: str = "Log",
+    widths: Mapping[str, float] | None = None,
+) -> IssueSink:
+    """Abrir um :class:`IssueSink` em ``base`` + extensão do ``log_format``."""
+
+    try:
+        sink_cls = _SINKS[log_format]
+    except KeyError:
+        raise ValueError(
+            f"Formato de log desconhecido: {log_format!r} "
+            f"(use um de: {', '.join(LOG_FORMATS)})"
+        ) from None
+    base = Path(base)
+    return sink_cls(
+        base.with_name(base.name + sink_cls.suffix),
+        columns,
+        title=title,
+        widths=widths,
+    )
+
+
+def _read_xlsx(path: Path) -> Iterator[dict[str, Any]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = [str(name or "") for name in next(rows, ())]
+        for row in rows:
+            yield dict(zip(columns, row))
+    finally:
+        workbook.close()
+
+
+def _read_csv(path: Path) -> Iterator[dict[str, Any]]:
+    with path.open(encoding="utf-8", newline="") as handle:
+        yield from csv.DictReader(handle)
+
+
+def _read_jsonl(path: Path) -> Iterator[dict[str, Any]]:
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    yield record
+
+
+def _read_sqlite(path: Path) -> Iterator[dict[str, Any]]:
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        table = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid"
+        ).fetchone()
+        if table is None:
+            return
+        cursor = connection.execute(f"SELECT * FROM {_sql_identifier(table[0])}")
+        columns = [description[0] for description in cursor.description]
+        for row in cursor:
+            yield dict(zip(columns, row))
+    finally:
+        connection.close()
+
+
+_READERS = {
+    ".xlsx": _read_xlsx,
+    ".csv": _read_csv,
+    ".jsonl": _read_jsonl,
+    ".sqlite": _read_sqlite,
+}
+
+
+def read_issue_log(path: Path | str) -> Iterator[dict[str, Any]]:
+    """Ler as linhas de um log gravado por um :class:`IssueSink`.
+
+    O formato é escolhido pela extensão de ``path``; cada linha é devolvida
+    como um dicionário coluna → valor (a primeira folha ou tabela do
+    ficheiro, no caso de ``xlsx`` e ``sqlite``).
+    """
+
+    path = Path(path)
+    try:
+        reader = _READERS[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Formato de log desconhecido: {path.suffix!r} "
+            f"(use um de: {', '.join(LOG_FORMATS)})"
+        ) from None
+    return reader(path)
+
+
 @dataclass(slots=True)
 class ExcelLoggerConfig:
     """Configuração usada pelo :class:`ExcelLogger`."""
@@ -32,11 +327,9 @@ class ExcelLoggerConfig:
 class ExcelLogger:
     """Grava registos em Excel utilizando :mod:`openpyxl`.
 
-    A implementação é propositadamente simples: cada chamada a
-    :meth:`write_rows` cria um novo *workbook* com o cabeçalho fornecido em
-    :class:`ExcelLoggerConfig` e grava as linhas recebidas. Esta abordagem é
-    suficiente para suportar os *stubs* do pacote até que a refatoração total
-    esteja concluída.
+    Cada chamada a :meth:`write_rows` cria um novo ficheiro com o cabeçalho
+    fornecido em :class:`ExcelLoggerConfig`; as linhas são consumidas à medida
+    que são escritas, pelo que ``rows`` pode ser um gerador.
     """
 
     def __init__(self, config: ExcelLoggerConfig) -> None:
@@ -45,27 +338,27 @@ def __init__(self, config: ExcelLoggerConfig) -> None:
     def write_rows(self, rows: Iterable[RowLike | Iterable[str]]) -> Path:
         """Persistir ``rows`` num ficheiro Excel e devolver o caminho final."""
 
-        from openpyxl import Workbook
-
-        destination = Path(self.config.filename)
-        destination.parent.mkdir(parents=True, exist_ok=True)
-
-        workbook = Workbook()
-        worksheet = workbook.active
-        worksheet.title = "Log"
-
-        if self.config.columns:
-            worksheet.append(list(self.config.columns))
-
-        for row in rows:
-            if hasattr(row, "as_cells"):
-                cells = list(row.as_cells())  # type: ignore[arg-type]
-            else:
-                cells = list(row)  # type: ignore[arg-type]
-            worksheet.append(cells)
-
-        workbook.save(destination)
-        return destination
+        sink = XlsxIssueSink(Path(self.config.filename), self.config.columns)
+        with sink:
+            for row in rows:
+                if hasattr(row, "as_cells"):
+                    cells = list(row.as_cells())  # type: ignore[arg-type]
+                else:
+                    cells = list(row)  # type: ignore[arg-type]
+                sink.write(cells)
+        return sink.path
 
 
-__all__ = ["RowLike", "ExcelLoggerConfig", "ExcelLogger"]
+__all__ = [
+    "LOG_FORMATS",
+    "RowLike",
+    "IssueSink",
+    "XlsxIssueSink",
+    "CsvIssueSink",
+    "JsonlIssueSink",
+    "SqliteIssueSink",
+    "open_issue_sink",
+    "read_issue_log",
+    "ExcelLoggerConfig",
+    "ExcelLogger",
+]
@@ -0,0 +1,214 @@
+"""Integer fixed-point arithmetic for SAF-T (AO) amounts and percentages.
+
+The strict rules compute line amounts as ``q6(Quantity * UnitPrice)``, taxes
+as ``q6(base * TaxPercentage / 100)`` and export totals with ``q2``, all with
+``ROUND_HALF_UP``. Doing that with :class:`~decimal.Decimal` means several
+parses and ``quantize`` calls per line; this module does the same work on
+plain integers:
+
+* text is parsed into an exact :data:`Scaled` pair ``(units, scale)`` whose
+  value is ``units / 10**scale`` – no digit is dropped, so ``UnitPrice``
+  values with more than six decimals keep their precision;
+* ``q6`` results are integer micro-units (``10**-6``) and ``q2`` results
+  integer cents, so per-document accumulators are plain ``int`` sums.
+
+Results are numerically identical to the ``Decimal`` code for every finite
+``xs:decimal`` value whose intermediate products fit the default 28-digit
+``Decimal`` context. Two corner cases of the ``Decimal`` implementation are
+not reproduced: ``NaN``/``Infinity`` (invalid ``xs:decimal``) parse as
+invalid, and zero carries no sign (``0.00`` instead of ``-0.00``).
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal, InvalidOperation
+from typing import TypeVar
+
+Scaled = tuple[int, int]
+"""Exact decimal value ``units / 10**scale`` with ``scale >= 0``."""
+
+MICROS = 10**6
+CENTS = 10**2
+ZERO: Scaled = (0, 0)
+
+_T = TypeVar("_T")
+_POW10 = tuple(10**exponent for exponent in range(40))
+
+
+def _pow10(exponent: int) -> int:
+    return _POW10[exponent] if exponent < 40 else 10**exponent
+
+
+def parse_scaled(text: str | None, default: _T = None) -> Scaled | _T:
+    """Parse decimal ``text`` exactly, returning ``default`` when invalid.
+
+    Plain ``[+-]digits[.digits]`` text is handled with :func:`int`; any
+    other spelling accepted by :class:`~decimal.Decimal` (exponents,
+    underscores, trailing blanks after the fraction) goes through it. Empty
+    text and non-finite values are invalid.
+    """
+
+    if text is None:
+        return default
+    whole, _, fraction = text.partition(".")
+    if (not fraction or fraction.isdigit()) and "_" not in whole:
+        try:
+            return (int(whole + fraction), len(fraction))
+        except ValueError:
+            pass
+    try:
+        value = Decimal(text)
+    except (InvalidOperation, ValueError):
+        return default
+    if not value.is_finite():
+        return default
+    sign, digits, exponent = value.as_tuple()
+    units = int("".join(map(str, digits)) or "0")
+    if sign:
+        units = -units
+    if exponent > 0:
+        return (units * _pow10(exponent), 0)
+    return (units, -exponent)
+
+
+def from_decimal(value: Decimal) -> Scaled:
+    """Convert a finite :class:`~decimal.Decimal` into a :data:`Scaled`."""
+
+    scaled = parse_scaled(str(value))
+    if scaled is None:
+        raise ValueError(f"Not a finite decimal: {value!r}")
+    return scaled
+
+
+def to_decimal(value: Scaled) -> Decimal:
+    """Return the :class:`~decimal.Decimal` with the same digits and exponent."""
+
+    units, scale = value
+    return Decimal(f"{units}E-{scale}")
+
+
+def scaled_str(value: Scaled) -> str:
+    """Render ``value`` as ``str(Decimal)`` would for the parsed text."""
+
+    return str(to_decimal(value))
+
+
+def normalize(value: Scaled) -> Scaled:
+    """Drop trailing fractional zeros so equal values compare and hash equal."""
+
+    units, scale = value
+    if units == 0:
+        return ZERO
+    while scale and units % 10 == 0:
+        units //= 10
+        scale -= 1
+    return (units, scale)
+
+
+def add(*values: Scaled) -> Scaled:
+    """Exact sum, kept at the largest scale of the operands (as ``Decimal``)."""
+
+    scale = max((s for _, s in values), default=0)
+    return (sum(u * _pow10(scale - s) for u, s in values), scale)
+
+
+def neg(value: Scaled) -> Scaled:
+    """Return ``-value``."""
+
+    return (-value[0], value[1])
+
+
+def compare(a: Scaled, b: Scaled) -> int:
+    """Return -1, 0 or 1 as ``a`` is smaller than, equal to or larger than ``b``."""
+
+    (ua, sa), (ub, sb) = a, b
+    left = ua * _pow10(max(sb - sa, 0))
+    right = ub * _pow10(max(sa - sb, 0))
+    return (left > right) - (left < right)
+
+
+def round_half_up(units: int, scale: int, places: int) -> int:
+    """Round ``units / 10**scale`` to ``places`` decimals, ties away from zero.
+
+    The result is an integer count of ``10**-places``.
+    """
+
+    if scale <= places:
+        return units * _pow10(places - scale)
+    factor = _pow10(scale - places)
+    # floor(|x| / f + 1/2) == (2|x| + f) // 2f
+    if units >= 0:
+        return (2 * units + factor) // (2 * factor)
+    return -((factor - 2 * units) // (2 * factor))
+
+
+def q6(value: Scaled) -> int:
+    """``quantize(Decimal('0.000001'), ROUND_HALF_UP)`` in micro-units."""
+
+    return round_half_up(value[0], value[1], 6)
+
+
+def q2(value: Scaled) -> int:
+    """``quantize(Decimal('0.01'), ROUND_HALF_UP)`` in cents."""
+
+    return round_half_up(value[0], value[1], 2)
+
+
+def line_base(quantity: Scaled, unit_price: Scaled) -> int:
+    """``q6(Quantity * UnitPrice)`` in micro-units."""
+
+    return round_half_up(quantity[0] * unit_price[0], quantity[1] + unit_price[1], 6)
+
+
+def line_tax(base_micros: int, percentage: Scaled) -> int:
+    """``q6(base * TaxPercentage / 100)`` in micro-units."""
+
+    return round_half_up(base_micros * percentage[0], 6 + percentage[1] + 2, 6)
+
+
+def micros_to_cents(micros: int) -> int:
+    """``q2`` of a micro-unit amount."""
+
+    return round_half_up(micros, 6, 2)
+
+
+def format_cents(cents: int) -> str:
+    """Two-decimal text of ``cents`` (``f"{value:.2f}"``)."""
+
+    sign = "-" if cents < 0 else ""
+    whole, fraction = divmod(abs(cents), CENTS)
+    return f"{sign}{whole}.{fraction:02d}"
+
+
+def format_scaled(value: Scaled, places: int = 2) -> str:
+    """``f"{value:.{places}f}"`` on the equivalent ``Decimal``.
+
+    Formatting follows the current :mod:`decimal` context (half-even by
+    default), exactly like the ``fmt2`` helpers of the commands.
+    """
+
+    return f"{to_decimal(value):.{places}f}"
+
+
+__all__ = [
+    "CENTS",
+    "MICROS",
+    "Scaled",
+    "ZERO",
+    "add",
+    "compare",
+    "format_cents",
+    "format_scaled",
+    "from_decimal",
+    "line_base",
+    "line_tax",
+    "micros_to_cents",
+    "neg",
+    "normalize",
+    "parse_scaled",
+    "q2",
+    "q6",
+    "round_half_up",
+    "scaled_str",
+    "to_decimal",
+]
@@ -0,0 +1,632 @@
+"""Change plans: the edits an autofix run would make, kept for review.
+
+A plan lists the byte ranges of the source XML that the fixes change (see
+:meth:`saftao.splice.SpliceWriter.edits`) with the XPath of each changed
+element, the fields changed inside it (old and new text), a digest of the
+original bytes and the log codes behind it. Plans are saved as compact JSON
+or SQLite; :func:`apply_plan` replays one over a stream of the source in a
+single pass, re-serialising only the changed elements, and checks that the
+source is the one the plan was made for.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, Optional
+
+from lxml import etree
+
+from .splice import _START_TAG_REST, Edit, SpliceWriter
+from .utils import path_step
+
+PLAN_FORMATS = ("json", "sqlite")
+PLAN_VERSION = 2
+
+_DOCUMENT_NUMBERS = ("InvoiceNo", "DocumentNumber", "PaymentRefNo")
+_CHUNK_SIZE = 1 << 20
+
+
+class PlanError(ValueError):
+    """Raised when a plan cannot be read or does not match its source."""
+
+
+@dataclass(frozen=True)
+class FieldEdit:
+    """Change of one field of an edited element.
+
+    ``field`` is the path of the field below the element (``Line[2]/Tax/
+    TaxPercentage``, empty for the element itself). ``old`` and ``new`` are
+    its text or, with ``content``, ``new`` is the markup that replaces its
+    text and children.
+    """
+
+    field: str
+    old: Optional[str]
+    new: Optional[str]
+    content: bool = False
+
+
+@dataclass
+class PlanEdit:
+    """Replace ``source[start:end]``, whose digest is ``digest``.
+
+    The replacement is the original element with ``fields`` applied and
+    re-serialised, or ``new`` when the element cannot be rebuilt that way
+    (new children of a container, changed start tags, the whole source).
+    ``digest`` is ``None`` for insertions and whole-source edits.
+    """
+
+    path: str
+    start: int
+    end: int
+    digest: Optional[str]
+    new: Optional[str] = None
+    fields: tuple[FieldEdit, ...] = ()
+    codes: tuple[str, ...] = ()
+
+
+@dataclass
+class ChangePlan:
+    """Edits for the source XML identified by ``sha256`` and ``size``.
+
+    ``repaired`` records that the ``WorkDocument`` tags were balanced while
+    reading the source, so the same repair precedes :func:`apply_plan`.
+    ``namespaces`` are those of the root, in scope for every edited element.
+    """
+
+    source: str
+    sha256: str
+    size: int
+    encoding: str
+    edits: list[PlanEdit] = field(default_factory=list)
+    repaired: bool = False
+    namespaces: dict[Optional[str], str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class LogRow:
+    """What :func:`build_plan` needs from a log row to attribute its code."""
+
+    code: str
+    element: Any = None
+    owner: str = ""
+    field: str = ""
+    value: str = ""
+
+
+def _local(element: etree._Element) -> str:
+    return etree.QName(element).localname
+
+
+def _document_number(element: etree._Element) -> Optional[str]:
+    parent = element.getparent()
+    grandparent = parent.getparent() if parent is not None else None
+    if grandparent is None or _local(grandparent) != "SourceDocuments":
+        return None
+    for child in element.iterchildren(etree.Element):
+        if _local(child) in _DOCUMENT_NUMBERS:
+            return (child.text or "").strip()
+    return None
+
+
+def _in_source_documents(element: etree._Element) -> bool:
+    return any(_local(node) == "SourceDocuments" for node in element.iterancestors())
+
+
+class _Paths:
+    """``getpath`` for many elements, numbering each parent's children once.
+
+    ``getpath`` counts the preceding siblings of every step, which is
+    quadratic when thousands of documents of one section change.
+    """
+
+    def __init__(self, tree: etree._ElementTree) -> None:
+        self.tree = tree
+        self._steps: dict[Any, dict[Any, str]] = {}
+        self._paths: dict[Any, str] = {}
+
+    def __call__(self, element: etree._Element) -> str:
+        parent = element.getparent()
+        if parent is None:
+            return self.tree.getpath(element)
+        steps = self._steps.get(parent)
+        if steps is None:
+            steps = self._steps[parent] = self._number(parent)
+            self._paths[parent] = self(parent)
+        return f"{self._paths[parent]}/{steps[element]}"
+
+    @staticmethod
+    def _number(parent: etree._Element) -> dict[Any, str]:
+        children = list(parent.iterchildren(etree.Element))
+        named = [path_step(child) for child in children]
+        totals: dict[Any, int] = {}
+        for _, key in named:
+            totals[key] = totals.get(key, 0) + 1
+        seen: dict[Any, int] = {}
+        steps: dict[Any, str] = {}
+        for position, (child, (name, key)) in enumerate(zip(children, named), start=1):
+            if key[0] == "*":
+                # ``*`` is counted among all element siblings.
+                index, total = position, len(children)
+            else:
+                index = seen[key] = seen.get(key, 0) + 1
+                total = totals[key]
+            steps[child] = f"{name}[{index}]" if total > 1 else name
+        return steps
+
+
+def _attribute(edits: list, rows: Iterable[LogRow]) -> list[set[str]]:
+    """Codes per edit, matched to each log row in turn by:
+
+    1. the row's element, or its nearest changed ancestor;
+    2. the document whose number the row names (``invoice``);
+    3. an element named like the row's field holding its new value, in the
+       edits outside ``SourceDocuments`` (header fields, customers, taxes);
+    4. a container that received new children named like the field.
+    """
+
+    codes: list[set[str]] = [set() for _ in edits]
+    by_element: dict[Any, int] = {}
+    by_number: dict[str, int] = {}
+    by_value: dict[tuple[str, str], list[int]] = {}
+    by_child: dict[str, list[int]] = {}
+    for index, edit in enumerate(edits):
+        element = edit.element
+        if edit.start == edit.end:
+            names = {_local(child) for child in element.iterchildren(etree.Element)}
+            for name in names:
+                by_child.setdefault(name, []).append(index)
+            continue
+        if element.getparent() is None:
+            continue  # the root start tag: every row is below it
+        by_element.setdefault(element, index)
+        number = _document_number(element)
+        if number:
+            by_number.setdefault(number, index)
+        elif not _in_source_documents(element):
+            for node in element.iter(etree.Element):
+                key = (_local(node), (node.text or "").strip())
+                matches = by_value.setdefault(key, [])
+                if not matches or matches[-1] != index:
+                    matches.append(index)
+
+    for row in rows:
+        node = row.element
+        while node is not None and node not in by_element:
+            node = node.getparent()
+        if node is not None:
+            matched = [by_element[node]]
+        elif row.owner in by_number:
+            matched = [by_number[row.owner]]
+        else:
+            value = row.value.strip()
+            matched = (by_value.get((row.field, value)) if value else None) or (
+                by_child.get(row.field, [])
+            )
+        for index in matched:
+            codes[index].add(row.code)
+    return codes
+
+
+# -- fields ----------------------------------------------------------------
+
+
+def _same_children(old: etree._Element, new: etree._Element) -> bool:
+    if len(old) != len(new):
+        return False
+    for a, b in zip(old, new):
+        if a.tag != b.tag or a.tail != b.tail:
+            return False
+        if not isinstance(a.tag, str) and a.text != b.text:
+            return False
+    return True
+
+
+def _field_path(element: etree._Element, top: etree._Element) -> str:
+    """Path of ``element`` below ``top``, one ``name[n]`` step per level."""
+
+    steps = []
+    while element is not top:
+        name = _local(element)
+        tag = f"{{*}}{name}"
+        index = 1 + sum(1 for _ in element.itersiblings(tag, preceding=True))
+        total = index + sum(1 for _ in element.itersiblings(tag))
+        steps.append(f"{name}[{index}]" if total > 1 else name)
+        element = element.getparent()
+    return "/".join(reversed(steps))
+
+
+def _content(element: etree._Element) -> Optional[str]:
+    data = etree.tostring(
+        element, encoding="UTF-8", xml_declaration=False, with_tail=False
+    )
+    if data.endswith(b"/>"):
+        return None
+    start = _START_TAG_REST.match(data, 1).end()
+    return data[start : data.rindex(b"</")].decode("utf-8")
+
+
+def _field_edits(old: etree._Element, new: etree._Element) -> Iterator[FieldEdit]:
+    """Fields that differ between ``old`` and ``new``, in document order.
+
+    Both trees are walked together. An element whose children were added,
+    removed or reordered is replaced as a whole (``content``) and its
+    subtree skipped; elements without children compare their text.
+    """
+
+    olds, news = old.iter(etree.Element), new.iter(etree.Element)
+    for a, b in zip(olds, news):
+        if not len(a) and not len(b):
+            if a.text != b.text:
+                yield FieldEdit(_field_path(a, old), a.text, b.text)
+            continue
+        if a.text == b.text and _same_children(a, b):
+            continue
+        yield FieldEdit(_field_path(a, old), None, _content(b), content=True)
+        for _ in a.iterdescendants(etree.Element):
+            next(olds)
+        for _ in b.iterdescendants(etree.Element):
+            next(news)
+
+
+class _Spans:
+    """Parse the source bytes of an element, apply field edits, re-serialise.
+
+    The element is parsed inside a wrapper declaring the root namespaces and
+    written back as :meth:`SpliceWriter.write` would: the original start and
+    end tags around the re-serialised content.
+    """
+
+    def __init__(self, namespaces: dict[Optional[str], str], encoding: str) -> None:
+        self.encoding = encoding
+        wrapper = etree.tostring(etree.Element("_", nsmap=namespaces))
+        self._open = wrapper[: -len(b"/>")] + b">"
+        self._parser = etree.XMLParser(encoding=encoding, huge_tree=True)
+
+    def _parse(self, data: bytes) -> etree._Element:
+        return etree.fromstring(self._open + data + b"</_>", self._parser)
+
+    def parse(self, data: bytes) -> etree._Element:
+        (element,) = self._parse(data)
+        return element
+
+    def apply(self, element: etree._Element, fields: Iterable[FieldEdit]) -> None:
+        for edit in fields:
+            target = element
+            for step in edit.field.split("/") if edit.field else ():
+                name, _, index = step.partition("[")
+                children = target.iterchildren(f"{{*}}{name}")
+                target = next(islice(children, int(index[:-1] or 1) - 1, None), None)
+                if target is None:
+                    raise ValueError(f"field {edit.field} not found")
+            if not edit.content:
+                target.text = edit.new
+                continue
+            content = self._parse((edit.new or "").encode(self.encoding))
+            for child in list(target):
+                target.remove(child)
+            target.text = content.text
+            target.extend(content)
+
+    def serialize(self, data: bytes, element: etree._Element) -> bytes:
+        """``element`` between the start and end tags of its source ``data``."""
+
+        content = etree.tostring(
+            element, encoding=self.encoding, xml_declaration=False, with_tail=False
+        )
+        if content.endswith(b"/>") or data.endswith(b"/>"):
+            raise ValueError("self-closing elements keep no source tags")
+        start = _START_TAG_REST.match(content, 1).end()
+        return (
+            data[: _START_TAG_REST.match(data, 1).end()]
+            + content[start : content.rindex(b"</")]
+            + data[data.rindex(b"</") :]
+        )
+
+
+def _compact(spans: _Spans, edit: Edit, data: bytes) -> Optional[tuple[FieldEdit, ...]]:
+    """Field edits that rebuild ``edit`` from ``data``, or ``None``.
+
+    The edits are replayed on ``data`` and kept only when that gives back the
+    bytes of the splice writer, so :func:`apply_plan` writes the same file.
+    """
+
+    try:
+        element = spans.parse(data)
+        if element.tag != edit.element.tag:
+            return None
+        fields = tuple(_field_edits(element, edit.element))
+        spans.apply(element, fields)
+        if spans.serialize(data, element) != edit.data:
+            return None
+    except (etree.XMLSyntaxError, ValueError, IndexError):
+        return None
+    return fields
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def build_plan(
+    writer: SpliceWriter,
+    *,
+    source: str,
+    rows: Iterable[LogRow] = (),
+    repaired: bool = False,
+) -> ChangePlan:
+    """Collect the edits of ``writer`` (after the fixes) into a plan."""
+
+    edits = list(writer.edits())
+    data = writer.data
+    encoding = writer.encoding if writer.spliced else "UTF-8"
+    path_of = _Paths(writer.tree)
+    root = writer.tree.getroot()
+    plan = ChangePlan(
+        source=source,
+        sha256=hashlib.sha256(data).hexdigest(),
+        size=len(data),
+        encoding=encoding,
+        repaired=repaired,
+        namespaces=writer.namespaces,
+    )
+    spans = _Spans(plan.namespaces, encoding)
+    if writer.spliced:
+        attributed = _attribute(edits, rows)
+    else:
+        attributed = [{row.code for row in rows}]
+    for edit, codes in zip(edits, attributed):
+        old = data[edit.start : edit.end]
+        fields = None
+        parent = edit.element.getparent()
+        if writer.spliced and old and parent is not None:
+            if parent.nsmap == root.nsmap:
+                fields = _compact(spans, edit, old)
+        plan.edits.append(
+            PlanEdit(
+                path=path_of(edit.element),
+                start=edit.start,
+                end=edit.end,
+                digest=_digest(old) if writer.spliced and old else None,
+                new=None if fields is not None else edit.data.decode(encoding),
+                fields=fields or (),
+                codes=tuple(sorted(codes)),
+            )
+        )
+    return plan
+
+
+# -- storage ---------------------------------------------------------------
+
+
+def plan_format(path: Path | str) -> str:
+    """Storage format for ``path``, from its suffix (``.sqlite``/``.db`` or JSON)."""
+
+    return "sqlite" if Path(path).suffix.lower() in (".sqlite", ".db") else "json"
+
+
+def _header(plan: ChangePlan) -> dict[str, Any]:
+    return {
+        "version": PLAN_VERSION,
+        "source": plan.source,
+        "sha256": plan.sha256,
+        "size": plan.size,
+        "encoding": plan.encoding,
+        "repaired": plan.repaired,
+        "namespaces": {prefix or "": uri for prefix, uri in plan.namespaces.items()},
+    }
+
+
+def _edit_row(edit: PlanEdit) -> list[Any]:
+    return [
+        edit.path,
+        edit.start,
+        edit.end,
+        edit.digest,
+        edit.new,
+        ",".join(edit.codes),
+    ]
+
+
+def _field_row(edit: FieldEdit) -> list[Any]:
+    return [edit.field, edit.old, edit.new, int(edit.content)]
+
+
+def write_plan(plan: ChangePlan, path: Path | str) -> Path:
+    """Save ``plan`` to ``path`` as JSON or SQLite (see :func:`plan_format`)."""
+
+    path = Path(path)
+    if plan_format(path) == "json":
+        document = _header(plan)
+        document["edits"] = [
+            _edit_row(edit) + [[_field_row(f) for f in edit.fields]]
+            for edit in plan.edits
+        ]
+        path.write_text(
+            json.dumps(document, ensure_ascii=False, separators=(",", ":")),
+            encoding="utf-8",
+        )
+        return path
+
+    path.unlink(missing_ok=True)
+    connection = sqlite3.connect(str(path))
+    try:
+        connection.execute("CREATE TABLE plan (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE edits (id INTEGER PRIMARY KEY, path TEXT, start INTEGER, "
+            "end INTEGER, digest TEXT, new TEXT, codes TEXT)"
+        )
+        connection.execute(
+            "CREATE TABLE fields (edit INTEGER, field TEXT, old TEXT, new TEXT, "
+            "content INTEGER)"
+        )
+        connection.executemany(
+            "INSERT INTO plan VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in _header(plan).items()],
+        )
+        connection.executemany(
+            "INSERT INTO edits VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [[index] + _edit_row(edit) for index, edit in enumerate(plan.edits)],
+        )
+        connection.executemany(
+            "INSERT INTO fields VALUES (?, ?, ?, ?, ?)",
+            [
+                [index] + _field_row(field)
+                for index, edit in enumerate(plan.edits)
+                for field in edit.fields
+            ],
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    return path
+
+
+def _from_header(header: dict[str, Any]) -> ChangePlan:
+    if header.get("version") != PLAN_VERSION:
+        raise PlanError(f"unsupported plan version: {header.get('version')!r}")
+    return ChangePlan(
+        source=header["source"],
+        sha256=header["sha256"],
+        size=header["size"],
+        encoding=header["encoding"],
+        repaired=bool(header.get("repaired")),
+        namespaces={
+            prefix or None: uri for prefix, uri in header["namespaces"].items()
+        },
+    )
+
+
+def _plan_edit(row: Iterable[Any], fields: Iterable[Iterable[Any]]) -> PlanEdit:
+    path, start, end, digest, new, codes = row
+    return PlanEdit(
+        path,
+        int(start),
+        int(end),
+        digest,
+        new,
+        tuple(FieldEdit(f, o, n, bool(c)) for f, o, n, c in fields),
+        tuple(codes.split(",") if codes else ()),
+    )
+
+
+def read_plan(path: Path | str) -> ChangePlan:
+    """Load a plan saved by :func:`write_plan`."""
+
+    path = Path(path)
+    try:
+        if plan_format(path) == "json":
+            document = json.loads(path.read_text(encoding="utf-8"))
+            plan = _from_header(document)
+            plan.edits = [_plan_edit(row[:-1], row[-1]) for row in document["edits"]]
+        else:
+            connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                header = {
+                    key: json.loads(value)
+                    for key, value in connection.execute("SELECT key, value FROM plan")
+                }
+                plan = _from_header(header)
+                fields: dict[int, list[Any]] = {}
+                for index, *row in connection.execute(
+                    "SELECT edit, field, old, new, content FROM fields ORDER BY rowid"
+                ):
+                    fields.setdefault(index, []).append(row)
+                plan.edits = [
+                    _plan_edit(row, fields.get(index, ()))
+                    for index, *row in connection.execute(
+                        "SELECT id, path, start, end, digest, new, codes FROM edits "
+                        "ORDER BY id"
+                    )
+                ]
+            finally:
+                connection.close()
+    except PlanError:
+        raise
+    except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as exc:
+        raise PlanError(f"invalid plan {path}: {exc}") from exc
+    return plan
+
+
+# -- replay ----------------------------------------------------------------
+
+
+def apply_plan(
+    plan: ChangePlan,
+    source: IO[bytes],
+    output: IO[bytes],
+    *,
+    chunk_size: int = _CHUNK_SIZE,
+) -> None:
+    """Write ``source`` with the plan's edits applied, reading it once.
+
+    Raises :class:`PlanError` when an edit does not match the bytes it
+    replaces or the source is not the one the plan was made for; the output
+    written so far must then be discarded.
+    """
+
+    digest = hashlib.sha256()
+    position = 0
+    spans = _Spans(plan.namespaces, plan.encoding)
+
+    def read(size: int, keep: bool) -> bytes:
+        nonlocal position
+        parts = []
+        while size > 0:
+            chunk = source.read(min(size, chunk_size))
+            if not chunk:
+                raise PlanError("source is shorter than the plan expects")
+            digest.update(chunk)
+            position += len(chunk)
+            size -= len(chunk)
+            if keep:
+                parts.append(chunk)
+            else:
+                output.write(chunk)
+        return b"".join(parts)
+
+    for edit in plan.edits:
+        if edit.start < position or edit.end < edit.start:
+            raise PlanError(f"edits out of order at {edit.path}")
+        read(edit.start - position, keep=False)
+        old = read(edit.end - edit.start, keep=True)
+        if edit.digest is not None and _digest(old) != edit.digest:
+            raise PlanError(f"source does not match the plan at {edit.path}")
+        if edit.new is not None:
+            output.write(edit.new.encode(plan.encoding))
+            continue
+        try:
+            element = spans.parse(old)
+            spans.apply(element, edit.fields)
+            output.write(spans.serialize(old, element))
+        except (etree.XMLSyntaxError, ValueError, IndexError) as exc:
+            raise PlanError(f"cannot apply the plan at {edit.path}: {exc}") from exc
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        position += len(chunk)
+        output.write(chunk)
+    if position != plan.size or digest.hexdigest() != plan.sha256:
+        raise PlanError("source is not the file the plan was made for")
+
+
+__all__ = [
+    "ChangePlan",
+    "FieldEdit",
+    "LogRow",
+    "PLAN_FORMATS",
+    "PlanEdit",
+    "PlanError",
+    "apply_plan",
+    "build_plan",
+    "plan_format",
+    "read_plan",
+    "write_plan",
+]
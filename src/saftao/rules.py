@@ -2,10 +2,26 @@
 
 from __future__ import annotations
 
-from typing import Iterable, Iterator, List
+from typing import Callable, Iterable, Iterator, List
 
 from lxml import etree
 
+ELEMENT_KINDS = (
+    "Header",
+    "MasterFiles",
+    "Customer",
+    "TaxTableEntry",
+    "Invoice",
+    "Line",
+    "Tax",
+)
+
+_DOCUMENT_FAMILIES = {
+    "SalesInvoices": "Invoice",
+    "Payments": "Payment",
+    "WorkingDocuments": "WorkDocument",
+}
+
 
 def _namespace_map(namespace: str) -> dict[str, str] | None:
     """Return the namespace mapping for XPath lookups."""
@@ -154,6 +170,135 @@ def resolve_tax_context(
     return "", "", line_no
 
 
+class RuleEngine:
+    """Dispatch SAF-T elements to the checks registered for their kind.
+
+    Checks register for one of :data:`ELEMENT_KINDS` and receive each
+    matching element once it is complete (``end`` event), so the whole
+    document is scanned a single time regardless of how many checks run. The
+    same engine is driven by :meth:`run` over an in-memory tree or by feeding
+    it ``iterparse`` events directly.
+
+    Elements are classified as the lookups in this module would find them:
+
+    * ``Header`` / ``MasterFiles`` – the first such element in the document;
+    * ``Customer`` – direct children of that ``MasterFiles``;
+    * ``TaxTableEntry`` – ``MasterFiles/TaxTable/TaxTableEntry``;
+    * ``Invoice`` – ``SourceDocuments/SalesInvoices/Invoice``;
+    * ``Line`` – ``Line`` children of an ``Invoice``, ``Payment`` or
+      ``WorkDocument`` under ``SourceDocuments``;
+    * ``Tax`` – any element named ``Tax`` below ``SourceDocuments``.
+
+    Checks see elements in document order; the XSD places ``Header`` and
+    ``MasterFiles`` before ``SourceDocuments``.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self._handlers: dict[str, list[Callable[[etree._Element], None]]] = {
+            kind: [] for kind in ELEMENT_KINDS
+        }
+        self._tags = {
+            name: f"{{{namespace}}}{name}" if namespace else name
+            for name in (
+                "Header",
+                "MasterFiles",
+                "Customer",
+                "TaxTable",
+                "TaxTableEntry",
+                "SourceDocuments",
+                "Line",
+                *_DOCUMENT_FAMILIES,
+                *_DOCUMENT_FAMILIES.values(),
+            )
+        }
+        self._documents = {
+            self._tags[family]: self._tags[document]
+            for family, document in _DOCUMENT_FAMILIES.items()
+        }
+        self._candidates = {
+            self._tags[kind]: kind
+            for kind in ELEMENT_KINDS
+            if kind != "Tax"
+        }
+        self._path: list[str] = []
+        self._header: etree._Element | None = None
+        self._masterfiles: etree._Element | None = None
+        self._in_source = 0
+
+    def register(
+        self, kind: str, handler: Callable[[etree._Element], None]
+    ) -> None:
+        """Call ``handler`` with every complete element of ``kind``."""
+
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown element kind: {kind}")
+        self._handlers[kind].append(handler)
+
+    def run(self, root: etree._Element) -> None:
+        """Walk ``root`` once and dispatch every element to its checks."""
+
+        feed = self.feed
+        for event, element in etree.iterwalk(root, events=("start", "end")):
+            feed(event, element)
+
+    def feed(self, event: str, element: etree._Element) -> str | None:
+        """Process one ``start``/``end`` event and return the dispatched kind."""
+
+        tag = element.tag
+        if not isinstance(tag, str):
+            return None
+        tags = self._tags
+
+        if event == "start":
+            self._path.append(tag)
+            if tag == tags["SourceDocuments"]:
+                self._in_source += 1
+            elif tag == tags["Header"] and self._header is None:
+                self._header = element
+            elif tag == tags["MasterFiles"] and self._masterfiles is None:
+                self._masterfiles = element
+            return None
+
+        kind = self._candidates.get(tag)
+        if kind is not None:
+            kind = self._classify(kind, element)
+        elif self._in_source and (tag == "Tax" or tag.endswith("}Tax")):
+            kind = "Tax"
+        self._path.pop()
+        if tag == tags["SourceDocuments"]:
+            self._in_source -= 1
+        if kind is not None:
+            for handler in self._handlers[kind]:
+                handler(element)
+        return kind
+
+    def _classify(self, kind: str, element: etree._Element) -> str | None:
+        """Confirm that ``element`` sits where ``kind`` is expected."""
+
+        tags = self._tags
+        path = self._path
+        if kind == "Header":
+            matches = element is self._header
+        elif kind == "MasterFiles":
+            matches = element is self._masterfiles
+        elif kind == "Customer":
+            matches = (
+                self._masterfiles is not None
+                and element.getparent() is self._masterfiles
+            )
+        elif kind == "TaxTableEntry":
+            matches = path[-3:-1] == [tags["MasterFiles"], tags["TaxTable"]]
+        elif kind == "Invoice":
+            matches = path[-3:-1] == [tags["SourceDocuments"], tags["SalesInvoices"]]
+        else:
+            matches = (
+                path[-4:-3] == [tags["SourceDocuments"]]
+                and self._documents.get(path[-3]) == path[-2]
+            )
+        return kind if matches else None
+
+
 def _find_child_text(
     element: etree._Element, namespace: str, tag: str
 ) -> str | None:
@@ -175,6 +320,8 @@ def _find_child_by_localname(
 
 
 __all__ = [
+    "ELEMENT_KINDS",
+    "RuleEngine",
     "collect_invoice_customer_ids",
     "collect_masterfile_customer_ids",
     "collect_payment_customer_ids",
@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import hashlib
+import threading
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Iterable, NamedTuple, Tuple
 
 from lxml import etree
 
+from .archive import open_xml, parse_xml
 from .utils import detect_namespace
 
 _PACKAGE_ROOT = Path(__file__).resolve().parent
@@ -22,10 +25,226 @@ def load_schema(name: str) -> Path:
     return path
 
 
+class SchemaRegistry:
+    """Compiled :class:`lxml.etree.XMLSchema` objects kept for the process.
+
+    Compiling the SAF-T XSD costs far more than validating a small file, so
+    every command asks the registry instead of building its own schema.
+    Entries are keyed by the resolved path, the modification time and the
+    SHA-256 of the file: an edited XSD is recompiled, while repeated calls
+    only pay for a ``stat``. The file is hashed once per (path, mtime, size).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._digests: dict[tuple[str, int, int], str] = {}
+        self._schemas: dict[tuple[str, int, str], etree.XMLSchema] = {}
+
+    def get(self, path: Path | str) -> etree.XMLSchema:
+        """Return the compiled schema for *path*, compiling it if needed."""
+
+        resolved = Path(path).resolve()
+        stat = resolved.stat()
+        name = str(resolved)
+        with self._lock:
+            stat_key = (name, stat.st_mtime_ns, stat.st_size)
+            digest = self._digests.get(stat_key)
+            if digest is None:
+                digest = hashlib.sha256(resolved.read_bytes()).hexdigest()
+                self._digests[stat_key] = digest
+            key = (name, stat.st_mtime_ns, digest)
+            schema = self._schemas.get(key)
+            if schema is None:
+                schema = etree.XMLSchema(etree.parse(name))
+                # Only the current version of each file is kept.
+                for stale in [k for k in self._schemas if k[0] == name]:
+                    del self._schemas[stale]
+                self._schemas[key] = schema
+            return schema
+
+    def clear(self) -> None:
+        """Forget every compiled schema."""
+
+        with self._lock:
+            self._digests.clear()
+            self._schemas.clear()
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
+
+
+def compiled_schema(path: Path | str) -> etree.XMLSchema:
+    """Return the compiled XSD at *path* from :data:`SCHEMA_REGISTRY`."""
+
+    return SCHEMA_REGISTRY.get(path)
+
+
+class SchemaError(NamedTuple):
+    """An XSD error with the line that validating the whole tree reports."""
+
+    message: str
+    line: int
+    level_name: str
+
+
+def schema_error_entries(error_log: Iterable[Any]) -> list[Any]:
+    """Return the XSD validity errors (``SCHEMASV`` domain) of *error_log*."""
+
+    return [e for e in error_log if e.domain_name == "SCHEMASV"]
+
+
+class _TagReader:
+    """``iterparse`` source that hands out the XML one tag (up to ``>``) at a time.
+
+    Each read produces the events of a single tag, so an XSD error shows up in
+    the ``error_log`` at the event of the element that caused it.
+    """
+
+    def __init__(self, source: Any, block_size: int = 1 << 16) -> None:
+        self._source = source
+        self._block_size = block_size
+        self._buffer = b""
+        self._offset = 0
+        self.reads = 0
+
+    def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        while True:
+            end = self._buffer.find(b">", self._offset)
+            if end >= 0:
+                chunk = self._buffer[self._offset : end + 1]
+                self._offset = end + 1
+                return chunk
+            rest = self._buffer[self._offset :]
+            more = self._source.read(self._block_size)
+            self._buffer, self._offset = rest + more, 0
+            if not more:
+                self._buffer = b""
+                return rest
+
+
+# libxml2 messages that only a tree validation reproduces: identity
+# constraint (``xs:unique``/``xs:key``/``xs:keyref``) errors are raised at the
+# end of their scope, with no element to attach them to, and after a content
+# model error the streaming validator may stop checking the rest of the
+# document, identity constraints included.
+_TREE_ONLY_ERRORS = (
+    "key-sequence",
+    "This element is not expected",
+    "Missing child element(s)",
+)
+
+
+def _schema_error_element(message: str) -> str | None:
+    """Name (``{ns}local``) of the element quoted in a libxml2 message."""
+
+    if not message.startswith("Element '"):
+        return None
+    end = message.find("'", len("Element '"))
+    return message[len("Element '") : end] if end > 0 else None
+
+
+def schema_errors_from_tree(
+    path: Path | str, schema: etree.XMLSchema, *, recover: bool = False
+) -> list[SchemaError]:
+    """Validate the whole tree of *path* and return its XSD errors."""
+
+    if recover:
+        tree = parse_xml(path, etree.XMLParser(recover=True))
+    else:
+        tree = parse_xml(path)
+    schema.validate(tree)
+    return [SchemaError(e.message, e.line, e.level_name) for e in schema.error_log]
+
+
+def locate_schema_errors(
+    path: Path | str,
+    schema: etree.XMLSchema,
+    errors: list[Any],
+    *,
+    recover: bool = False,
+) -> list[SchemaError]:
+    """Validate *path* again as a stream to find the line of each XSD error.
+
+    *errors* are the (line-less) errors of an earlier streaming validation.
+    The XML is read one tag at a time (:class:`_TagReader`) and each new
+    error gets the ``sourceline`` of the element that raised it, the same
+    line libxml2 reports when validating the tree.
+
+    The whole tree is validated instead, at the cost of memory, when the XML
+    could only be read with ``recover`` (libxml2 stops validating the stream
+    at the first structural error), when there are
+    :data:`_TREE_ONLY_ERRORS`, or when an error cannot be located (or the
+    number of errors changes).
+    """
+
+    if recover or any(
+        marker in e.message for e in errors for marker in _TREE_ONLY_ERRORS
+    ):
+        return schema_errors_from_tree(path, schema, recover=recover)
+
+    located: list[SchemaError] = []
+    pending: list[Any] = []
+    complete = True
+    seen = 0
+    with open_xml(path) as source:
+        reader = _TagReader(source)
+        context = etree.iterparse(reader, events=("start", "end"), schema=schema)
+        last_read = reader.reads
+        try:
+            for event, el in context:
+                if reader.reads != last_read:
+                    # Events of a new tag: errors that do not name the
+                    # elements of the previous tag do not belong to them.
+                    complete = complete and not pending
+                    pending, last_read = [], reader.reads
+                log = context.error_log
+                if len(log) != seen:
+                    pending.extend(schema_error_entries(list(log)[seen:]))
+                    seen = len(log)
+                for entry in list(pending):
+                    if _schema_error_element(entry.message) == el.tag:
+                        located.append(
+                            SchemaError(entry.message, el.sourceline, entry.level_name)
+                        )
+                        pending.remove(entry)
+                if event == "end":
+                    el.clear()
+                    parent = el.getparent()
+                    if parent is not None:
+                        while el.getprevious() is not None:
+                            del parent[0]
+        except etree.XMLSyntaxError:
+            pass
+        entries = schema_error_entries(context.error_log)
+    if complete and not pending and len(located) == len(entries) == len(errors):
+        return located
+    return schema_errors_from_tree(path, schema, recover=recover)
+
+
 def load_audit_file(path: Path) -> Tuple[etree._ElementTree, etree._Element, str]:
-    """Load *path* and return the parsed tree, root element and namespace."""
+    """Load *path* and return the parsed tree, root element and namespace.
+
+    *path* may also be a ``.zip``, ``.gz`` or ``.xz`` file holding the XML.
+    """
 
-    tree = etree.parse(str(path))
+    tree = parse_xml(path)
     root = tree.getroot()
     namespace = detect_namespace(root)
     return tree, root, namespace
+
+
+__all__ = [
+    "SCHEMA_REGISTRY",
+    "SchemaError",
+    "SchemaRegistry",
+    "compiled_schema",
+    "load_audit_file",
+    "load_schema",
+    "locate_schema_errors",
+    "schema_error_entries",
+    "schema_errors_from_tree",
+]
@@ -0,0 +1,391 @@
+"""Write fixed SAF-T trees by splicing changed elements into the source bytes.
+
+``tree.write(..., pretty_print=True)`` re-serialises the whole document even
+when the autofix touched a few dozen elements, which costs time and turns a
+handful of fixes into a diff of the entire file. :class:`SpliceWriter` keeps
+the parsed bytes and, when writing, copies every unchanged element verbatim
+and only re-serialises the ones that differ from the parsed tree.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Dict, Iterator, Optional
+
+from lxml import etree
+
+from . import archive
+
+_START_TAG_REST = re.compile(rb"(?:[^>\"']|\"[^\"]*\"|'[^']*')*>")
+_NAME_END = b" \t\r\n/>"
+_BIG_LINE = 65535
+_XMLNS = re.compile(rb'\s+xmlns(?::([^\s=]+))?="([^"]*)"')
+
+
+class SpliceError(ValueError):
+    """Raised when the source bytes cannot be mapped onto the parsed tree."""
+
+
+@dataclass(frozen=True)
+class _Span:
+    """Byte offsets of an element: ``start`` of ``<tag``, end of the start
+    tag, start of ``</tag`` (``None`` when self-closing) and ``end``."""
+
+    start: int
+    open_end: int
+    close_start: Optional[int]
+    end: int
+
+
+@dataclass(frozen=True)
+class Edit:
+    """Replace ``data[start:end]`` of the source with ``data``.
+
+    ``element`` is the changed element, or the container that receives new
+    children when ``start == end``.
+    """
+
+    start: int
+    end: int
+    data: bytes
+    element: etree._Element
+
+
+@dataclass(frozen=True)
+class _Container:
+    """Parsed state of an element whose children are spliced one by one."""
+
+    tag: tuple
+    nsmap: tuple
+    text: Optional[str]
+    children: tuple
+    tails: tuple
+
+
+def _qname(element: etree._Element) -> bytes:
+    local = etree.QName(element).localname
+    name = f"{element.prefix}:{local}" if element.prefix else local
+    return name.encode("ascii")
+
+
+def _local(element: etree._Element) -> str:
+    return etree.QName(element).localname
+
+
+def _digest(element: etree._Element) -> bytes:
+    """Digest of the content of ``element`` (its start tag excluded).
+
+    The start tag is left out because lxml repeats the in-scope namespace
+    declarations there, which change when an ancestor is cleaned up.
+    """
+
+    data = etree.tostring(element, with_tail=False)
+    content = data[_START_TAG_REST.match(data, 1).end() :]
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def _tag_state(element: etree._Element) -> tuple:
+    return element.prefix, tuple(element.attrib.items())
+
+
+def _own_namespaces(element: etree._Element) -> tuple:
+    """Namespace declarations ``element`` adds to those of its parent.
+
+    Declarations dropped from an ancestor (``cleanup_namespaces``) leave the
+    start tags of its descendants valid, so only these are compared.
+    """
+
+    parent = element.getparent()
+    inherited = parent.nsmap if parent is not None else {}
+    own = [item for item in element.nsmap.items() if inherited.get(item[0]) != item[1]]
+    return tuple(sorted(own, key=lambda item: item[0] or ""))
+
+
+def _container_state(element: etree._Element) -> _Container:
+    children = tuple(element)
+    return _Container(
+        tag=_tag_state(element),
+        nsmap=_own_namespaces(element),
+        text=element.text,
+        children=children,
+        tails=tuple(child.tail for child in children),
+    )
+
+
+class SpliceWriter:
+    """Serialise ``tree`` reusing the bytes it was parsed from.
+
+    Create the writer right after parsing (before any fix): it indexes the
+    byte offsets of the root, its children (``Header``, ``MasterFiles``,
+    ``SourceDocuments``, ...) and the ``SourceDocuments`` sections, and a
+    digest of every element below them (header fields, ``MasterFiles``
+    entries, documents). :meth:`write` then copies unchanged elements and the
+    text between them verbatim, re-serialises changed ones (keeping their
+    original start and end tags) and appends new children before the closing
+    tag of their container. The prolog and the source encoding are kept.
+
+    When the bytes cannot be mapped onto the tree (recovered parses,
+    ASCII-incompatible encodings) or the root itself changed, the whole tree
+    is written as ``tree.write(pretty_print=True)`` would; :attr:`spliced`
+    tells which path was taken. :attr:`namespaces` are those in scope at the
+    root of the source, before any fix cleans them up.
+    """
+
+    def __init__(self, tree: etree._ElementTree, data: bytes) -> None:
+        self.tree = tree
+        self.data = data
+        self.encoding = tree.docinfo.encoding or "UTF-8"
+        self.namespaces = dict(tree.getroot().nsmap)
+        self.spliced = False
+        self._spans: Dict[etree._Element, _Span] = {}
+        self._containers: Dict[etree._Element, _Container] = {}
+        self._digests: Dict[etree._Element, tuple] = {}
+        self._pos = 0
+        self._line = 1
+        self._line_pos = 0
+        self.indexed = False
+        try:
+            if "<r>".encode(self.encoding) != b"<r>":
+                raise SpliceError(f"encoding {self.encoding} is not ASCII-compatible")
+            self._index(tree.getroot(), 1, False)
+        except (SpliceError, LookupError):
+            self._spans.clear()
+            self._containers.clear()
+            self._digests.clear()
+        else:
+            self.indexed = True
+
+    # -- index -------------------------------------------------------------
+
+    def _index(self, element: etree._Element, depth: int, in_source: bool) -> None:
+        span_start, open_end, self_closing = self._find_start(element)
+        self._pos = open_end
+        if depth <= 2 or (depth == 3 and in_source):
+            self._containers[element] = _container_state(element)
+            if not self_closing:
+                sections = depth == 2 and _local(element) == "SourceDocuments"
+                for child in element.iterchildren(etree.Element):
+                    self._index(child, depth + 1, sections)
+        else:
+            self._digests[element] = (_digest(element), _tag_state(element))
+        if self_closing:
+            span = _Span(span_start, open_end, None, open_end)
+        else:
+            close_start, end = self._find_end(_qname(element), self._pos)
+            span = _Span(span_start, open_end, close_start, end)
+        self._spans[element] = span
+        self._pos = span.end
+
+    def _find_start(self, element: etree._Element) -> tuple[int, int, bool]:
+        data = self.data
+        token = b"<" + _qname(element)
+        pos = self._pos
+        while True:
+            start = data.find(token, pos)
+            if start < 0:
+                raise SpliceError(f"start tag of {element.tag} not found")
+            after = start + len(token)
+            if after >= len(data) or data[after] not in _NAME_END:
+                pos = after
+                continue
+            match = _START_TAG_REST.match(data, after)
+            if match is None:
+                raise SpliceError(f"unterminated start tag of {element.tag}")
+            open_end = match.end()
+            line, expected = self._line_at(open_end - 1), element.sourceline
+            # Past 65535 libxml2 derives element lines from the next text node.
+            if line != expected and not (expected >= _BIG_LINE and line <= expected):
+                raise SpliceError(f"{element.tag} not found at line {expected}")
+            return start, open_end, data[open_end - 2 : open_end - 1] == b"/"
+
+    def _find_end(self, qname: bytes, pos: int) -> tuple[int, int]:
+        data = self.data
+        opening, closing = b"<" + qname, b"</" + qname
+        depth = 1
+        while True:
+            close = data.find(closing, pos)
+            while close >= 0 and data[close + len(closing)] not in b" \t\r\n>":
+                close = data.find(closing, close + 1)
+            if close < 0:
+                raise SpliceError(f"end tag of {qname!r} not found")
+            nested = data.find(opening, pos, close)
+            if nested >= 0:
+                after = nested + len(opening)
+                pos = after
+                if data[after] in _NAME_END:
+                    match = _START_TAG_REST.match(data, after)
+                    if match is not None:
+                        pos = match.end()
+                        if data[pos - 2 : pos - 1] != b"/":
+                            depth += 1
+                continue
+            end = data.index(b">", close) + 1
+            depth -= 1
+            if depth == 0:
+                return close, end
+            pos = end
+
+    def _line_at(self, offset: int) -> int:
+        if offset < self._line_pos:
+            raise SpliceError("source offsets out of order")
+        self._line += self.data.count(b"\n", self._line_pos, offset)
+        self._line_pos = offset
+        return self._line
+
+    # -- write -------------------------------------------------------------
+
+    def write(self, path: Path | str) -> None:
+        """Write the current tree to ``path`` (compressed per its suffix)."""
+
+        with archive.open_output(path) as handle:
+            self.write_to(handle)
+
+    def write_to(self, handle: IO[bytes]) -> None:
+        data = memoryview(self.data)
+        pos = 0
+        for edit in self.edits():
+            handle.write(data[pos : edit.start])
+            handle.write(edit.data)
+            pos = edit.end
+        handle.write(data[pos:])
+
+    def edits(self) -> Iterator[Edit]:
+        """Yield the replacements that turn the source bytes into the tree.
+
+        Edits come in source order and do not overlap; applying them to
+        :attr:`data` gives what :meth:`write_to` writes. When the tree cannot
+        be spliced a single edit replaces the whole source.
+        """
+
+        root = self.tree.getroot()
+        if not self.indexed or not self._children_kept(root):
+            self.spliced = False
+            output = BytesIO()
+            self.tree.write(
+                output, pretty_print=True, xml_declaration=True, encoding="UTF-8"
+            )
+            yield Edit(0, len(self.data), output.getvalue(), root)
+            return
+        self.spliced = True
+        yield from self._element_edits(root)
+
+    def _children_kept(self, element: etree._Element) -> bool:
+        """Whether the parsed children of ``element`` are still in place.
+
+        New children may only follow them, and not inside a self-closing tag.
+        """
+
+        state = self._containers[element]
+        current = _container_state(element)
+        count = len(state.children)
+        if (
+            current.text != state.text
+            or current.children[:count] != state.children
+            or current.tails[:count] != state.tails
+        ):
+            return False
+        return self._spans[element].close_start is not None or (
+            len(current.children) == count
+        )
+
+    def _element_edits(self, element: etree._Element) -> Iterator[Edit]:
+        span = self._spans[element]
+        state = self._containers.get(element)
+        if state is None:
+            digest, tag = self._digests[element]
+            if _tag_state(element) != tag or _digest(element) != digest:
+                yield Edit(
+                    span.start, span.end, self._serialize(element, span), element
+                )
+            return
+
+        if not self._children_kept(element):
+            yield Edit(span.start, span.end, self._serialize(element, span), element)
+            return
+        if (
+            _tag_state(element) != state.tag
+            or _container_state(element).nsmap != state.nsmap
+        ):
+            if element.getparent() is not None:
+                yield Edit(span.start, span.end, self._serialize(element), element)
+                return
+            yield Edit(
+                span.start, span.open_end, self._root_start_tag(element, span), element
+            )
+        if span.close_start is None:
+            return
+        for child in state.children:
+            if child in self._spans:
+                yield from self._element_edits(child)
+        added = list(element)[len(state.children) :]
+        if added:
+            data = b"".join(self._serialize(child, with_tail=True) for child in added)
+            yield Edit(span.close_start, span.close_start, data, element)
+
+    def _parsed_tag(self, element: etree._Element) -> tuple:
+        state = self._containers.get(element)
+        return state.tag if state is not None else self._digests[element][1]
+
+    def _root_start_tag(self, root: etree._Element, span: _Span) -> bytes:
+        shallow = etree.Element(root.tag, dict(root.attrib), nsmap=root.nsmap)
+        tag = etree.tostring(shallow, encoding=self.encoding, xml_declaration=False)
+        return tag[: -len(b"/>")] + (b">" if span.close_start is not None else b"/>")
+
+    def _serialize(
+        self,
+        element: etree._Element,
+        span: Optional[_Span] = None,
+        *,
+        with_tail: bool = False,
+    ) -> bytes:
+        """Serialise ``element`` where it stands in the tree.
+
+        With ``span`` the original start and end tags are kept when the
+        element still has content, the same prefix and the same attributes;
+        otherwise the namespace declarations lxml copies from the ancestors
+        are dropped from the start tag.
+        """
+
+        data = etree.tostring(
+            element,
+            encoding=self.encoding,
+            xml_declaration=False,
+            with_tail=with_tail,
+        )
+        if not isinstance(element.tag, str):
+            return data
+        tail = b""
+        if with_tail and element.tail:
+            cut = data.rindex(b">") + 1
+            data, tail = data[:cut], data[cut:]
+        open_end = _START_TAG_REST.match(data, 1).end()
+        if (
+            span is not None
+            and span.close_start is not None
+            and not data.endswith(b"/>")
+            and _tag_state(element) == self._parsed_tag(element)
+        ):
+            source = self.data
+            return (
+                source[span.start : span.open_end]
+                + data[open_end : data.rindex(b"</")]
+                + source[span.close_start : span.end]
+                + tail
+            )
+        parent = element.getparent()
+        inherited = parent.nsmap if parent is not None else {}
+
+        def _drop_inherited(match: re.Match) -> bytes:
+            prefix = match.group(1).decode() if match.group(1) else None
+            if inherited.get(prefix) == match.group(2).decode():
+                return b""
+            return match.group(0)
+
+        return _XMLNS.sub(_drop_inherited, data[:open_end]) + data[open_end:] + tail
+
+
+__all__ = ["Edit", "SpliceError", "SpliceWriter"]
@@ -4,7 +4,14 @@
 
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Iterable
+from typing import Dict, Iterable, Iterator, Optional
+
+from lxml import etree
+
+from . import money
+
+TaxKey = tuple[str, str, money.Scaled]
+"""``(TaxType, TaxCode, normalised TaxPercentage)`` identifying an entry."""
 
 
 @dataclass
@@ -16,11 +23,124 @@ class TaxEntry:
     rate: Decimal
 
 
-def load_tax_table() -> Iterable[TaxEntry]:
-    """Load tax entries from a SAFT AO source.
+def tax_key(
+    tax_type: Optional[str],
+    tax_code: Optional[str],
+    percentage: money.Scaled | str | None,
+) -> Optional[TaxKey]:
+    """Return the index key for a tax, or ``None`` if the percentage is invalid.
 
-    The concrete implementation will parse XML nodes and reuse utilities from
-    :mod:`saftao.utils` once the refactor takes place.
+    Missing types and codes default to ``IVA``/``NOR`` as in the fixers, and
+    the percentage is normalised so ``14``, ``14.0`` and ``14.00`` share a key.
     """
 
-    raise NotImplementedError("Tax table loader not yet implemented")
+    if percentage is None or isinstance(percentage, str):
+        percentage = money.parse_scaled(percentage or "0")
+        if percentage is None:
+            return None
+    return (tax_type or "IVA", tax_code or "NOR", money.normalize(percentage))
+
+
+def _child_text(element: etree._Element, tag: str) -> Optional[str]:
+    child = element.find(tag)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip()
+
+
+class TaxTable:
+    """Hash index over the ``TaxTableEntry`` elements of one document.
+
+    Built once per document (see :func:`load_tax_table`) so that checking or
+    adding the entry used by each invoice line is a dictionary lookup instead
+    of a scan of the whole table. Entries are keyed by :func:`tax_key`; when
+    several entries share a key the first one in document order is kept.
+
+    ``element`` is the ``TaxTable`` node, or ``None`` while the document has
+    none; :meth:`insert` requires it. The validator indexes bare keys only,
+    so streamed entries can still be discarded.
+    """
+
+    def __init__(self, keys: Iterable[TaxKey] = ()) -> None:
+        self.element: Optional[etree._Element] = None
+        self._entries: Dict[TaxKey, Optional[etree._Element]] = dict.fromkeys(keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[TaxKey]:
+        return iter(self._entries)
+
+    def keys(self) -> frozenset[TaxKey]:
+        """Return a snapshot of the indexed keys."""
+
+        return frozenset(self._entries)
+
+    def get(self, key: Optional[TaxKey]) -> Optional[etree._Element]:
+        """Return the entry element indexed under *key*, if any."""
+
+        return self._entries.get(key) if key is not None else None
+
+    def add(self, key: TaxKey, entry: Optional[etree._Element] = None) -> None:
+        """Index *key* (and its element) unless it is already present."""
+
+        self._entries.setdefault(key, entry)
+
+    def index(self, entry: etree._Element) -> Optional[TaxKey]:
+        """Index an existing ``TaxTableEntry`` and return its key.
+
+        Entries whose ``TaxPercentage`` is not a decimal are not indexed.
+        """
+
+        nsuri = etree.QName(entry).namespace
+        prefix = f"{{{nsuri}}}" if nsuri else ""
+        key = tax_key(
+            _child_text(entry, f"{prefix}TaxType"),
+            _child_text(entry, f"{prefix}TaxCode"),
+            _child_text(entry, f"{prefix}TaxPercentage"),
+        )
+        if key is not None:
+            self.add(key, entry)
+        return key
+
+    def insert(
+        self,
+        tax_type: Optional[str],
+        tax_code: Optional[str],
+        percentage: str,
+        description: str = "Auto-added for consistency",
+    ) -> etree._Element:
+        """Append a minimal ``TaxTableEntry`` to :attr:`element` and index it.
+
+        *percentage* is written as given, so callers format it first.
+        """
+
+        if self.element is None:
+            raise ValueError("TaxTable element is required to insert entries")
+        nsuri = etree.QName(self.element).namespace
+        prefix = f"{{{nsuri}}}" if nsuri else ""
+        entry = etree.SubElement(self.element, f"{prefix}TaxTableEntry")
+        for tag, text in (
+            ("TaxType", tax_type or "IVA"),
+            ("TaxCode", tax_code or "NOR"),
+            ("Description", description),
+            ("TaxPercentage", percentage),
+        ):
+            etree.SubElement(entry, f"{prefix}{tag}").text = text
+        self.index(entry)
+        return entry
+
+
+def load_tax_table(root: etree._Element, nsuri: str) -> TaxTable:
+    """Index the ``MasterFiles/TaxTable`` entries of the document at *root*."""
+
+    ns = {"n": nsuri}
+    table = TaxTable()
+    table.element = root.find(".//n:MasterFiles/n:TaxTable", namespaces=ns)
+    if table.element is not None:
+        for entry in table.element.iterchildren(f"{{{nsuri}}}TaxTableEntry"):
+            table.index(entry)
+    return table
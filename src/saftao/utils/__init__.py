@@ -17,6 +17,73 @@ def detect_namespace(root: Element) -> str:
     return NS_DEFAULT
 
 
+class LazyXPath:
+    """XPath of ``element`` computed only when the handle is rendered.
+
+    ``getpath`` walks every ancestor and its preceding siblings, which adds
+    up when a handle is built for each document line but only a handful end
+    up in a log row. Loggers call :func:`str` on the handle when writing.
+    """
+
+    __slots__ = ("element",)
+
+    def __init__(self, element) -> None:
+        self.element = element
+
+    def __str__(self) -> str:
+        return self.element.getroottree().getpath(self.element)
+
+    def __repr__(self) -> str:
+        return f"LazyXPath({self.element!r})"
+
+
+def path_step(el: Element) -> tuple[str, tuple[str, str | None]]:
+    """Nome e chave de contagem usados por ``getpath`` (libxml2) para ``el``."""
+
+    tag = el.tag
+    if tag.startswith("{"):
+        local = tag.split("}", 1)[1]
+        if el.prefix:
+            return f"{el.prefix}:{local}", (tag, el.prefix)
+        # Elementos no namespace por omissão são expressos como ``*`` e
+        # contados entre todos os irmãos.
+        return "*", ("*", None)
+    return tag, (tag, None)
+
+
+def step_matches(el: Element, key: tuple[str, str | None]) -> bool:
+    if not isinstance(el.tag, str):
+        return False
+    if key[0] == "*":
+        return True
+    return el.tag == key[0] and el.prefix == key[1]
+
+
+def relative_path(anchor: Element, target: Element) -> str:
+    """Caminho de ``target`` relativo a ``anchor`` no formato de ``getpath``.
+
+    Permite reconstruir o XPath de um elemento quando os irmãos anteriores do
+    ``anchor`` já foram descartados (leitura ``iterparse``).
+    """
+
+    steps: list[str] = []
+    node = target
+    while node is not anchor:
+        name, key = path_step(node)
+        occur = sum(
+            1 for sib in node.itersiblings(preceding=True) if step_matches(sib, key)
+        )
+        if occur == 0:
+            if any(step_matches(sib, key) for sib in node.itersiblings()):
+                steps.append(f"{name}[1]")
+            else:
+                steps.append(name)
+        else:
+            steps.append(f"{name}[{occur + 1}]")
+        node = node.getparent()
+    return "".join(f"/{step}" for step in reversed(steps))
+
+
 def parse_decimal(
     value: str | Decimal | None, *, default: Decimal = Decimal("0")
 ) -> Decimal:
@@ -41,4 +108,12 @@ def parse_decimal(
         return default
 
 
-__all__ = ["NS_DEFAULT", "detect_namespace", "parse_decimal"]
+__all__ = [
+    "NS_DEFAULT",
+    "LazyXPath",
+    "detect_namespace",
+    "parse_decimal",
+    "path_step",
+    "relative_path",
+    "step_matches",
+]
@@ -2,22 +2,74 @@
 
 from __future__ import annotations
 
+import csv
+import json
 import os
+import pickle
+import tempfile
+from abc import ABC, abstractmethod
 from copy import copy
 from dataclasses import dataclass, field
 from decimal import Decimal
+from functools import reduce
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Iterable
+from typing import IO, Any, Collection, Iterable, Iterator, Mapping, Sequence
 
 from lxml import etree
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
 from openpyxl.utils import get_column_letter
 
+from .. import columnar, money
+from ..archive import source_stem, xml_source
 from ..rules import iter_sales_invoices
-from ..utils import parse_decimal
+from . import NS_DEFAULT, detect_namespace
 
 REPORT_OUTPUT_ENV = "SAFTAO_REPORT_DIR"
 DEFAULT_REPORT_DIR = Path(__file__).resolve().parents[3] / "work" / "destino" / "relatorios"
+# Output formats of the ``report`` command; all but ``xlsx`` are the flat
+# tables of :func:`write_report_tables`.
+EXPORT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+TOTALS_COLUMNS = (
+    "file",
+    "month",
+    "document_type",
+    "net_total",
+    "tax_total",
+    "gross_total",
+)
+TAX_COLUMNS = ("file", "month", "document_type", "tax_rate", "tax_amount")
+AMOUNT_COLUMNS = frozenset({"net_total", "tax_total", "gross_total", "tax_amount"})
+DOCUMENT_COLUMNS = (
+    "file",
+    "document_type",
+    "document_number",
+    "document_date",
+    "customer_id",
+    "net_total",
+    "tax_total",
+    "gross_total",
+)
+# Invoices per vectorised batch of :func:`aggregate_documents_stream`.
+COLUMN_BATCH_SIZE = 2000
+# Rows per row group of :class:`ParquetTableWriter`.
+PARQUET_ROW_GROUP_SIZE = 65536
+# Containers of the entries the streamed report reads (the documents) or
+# drops as soon as they are read (everything else it does not need).
+_STREAM_CONTAINERS = {
+    "Invoice": "SalesInvoices",
+    "WorkDocument": "WorkingDocuments",
+    "Account": "GeneralLedgerAccounts",
+    "Customer": "MasterFiles",
+    "Supplier": "MasterFiles",
+    "Product": "MasterFiles",
+    "TaxTableEntry": "TaxTable",
+    "Transaction": "Journal",
+    "Payment": "Payments",
+    "StockMovement": "MovementOfGoods",
+}
 
 
 @dataclass
@@ -45,6 +97,32 @@ def add(
             for rate, amount in tax_by_rate.items():
                 self.tax_by_rate[rate] = self.tax_by_rate.get(rate, Decimal("0")) + amount
 
+    def merge(self, other: "Totals") -> "Totals":
+        """Return new totals with the sums of these and *other*.
+
+        The merge is associative and commutative (up to the order of the
+        ``tax_by_rate`` keys), with ``Totals()`` as identity.
+        """
+
+        merged = Totals()
+        for totals in (self, other):
+            merged.add(
+                totals.net_total,
+                totals.tax_total,
+                totals.gross_total,
+                totals.tax_by_rate,
+            )
+        return merged
+
+
+def _merge_buckets(
+    first: Mapping[str, Totals], second: Mapping[str, Totals]
+) -> dict[str, Totals]:
+    return {
+        key: first.get(key, Totals()).merge(second.get(key, Totals()))
+        for key in {**first, **second}
+    }
+
 
 @dataclass
 class NonAccountingDocument:
@@ -57,6 +135,71 @@ class NonAccountingDocument:
     totals: Totals
 
 
+class DocumentSpool:
+    """Non-accounting documents kept in an anonymous temporary file.
+
+    :meth:`append` pickles each document to the file and iterating reads them
+    back in order, so the listing is never held in memory by the aggregation
+    nor by the report writers. ``spool + other`` concatenates spools by
+    reference without copying their records. Spools compare equal to spools
+    or lists with the same documents; pickling one (e.g. to return it from a
+    worker process) sends its documents, which are spooled again on arrival.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[NonAccountingDocument] = (),
+        *,
+        parts: Sequence["DocumentSpool"] = (),
+    ) -> None:
+        self._parts = tuple(parts)
+        self._file: IO[bytes] | None = None
+        self._count = 0
+        for document in documents:
+            self.append(document)
+
+    def append(self, document: NonAccountingDocument) -> None:
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        self._file.seek(0, os.SEEK_END)
+        pickle.dump(document, self._file, pickle.HIGHEST_PROTOCOL)
+        self._count += 1
+
+    def __iter__(self) -> Iterator[NonAccountingDocument]:
+        for part in self._parts:
+            yield from part
+        offset = 0
+        for _ in range(self._count):
+            # Seek before each read so that interleaved iterations and
+            # appends do not disturb each other's file position.
+            self._file.seek(offset)
+            document = pickle.load(self._file)
+            offset = self._file.tell()
+            yield document
+
+    def __len__(self) -> int:
+        return self._count + sum(len(part) for part in self._parts)
+
+    def __add__(self, other: "DocumentSpool") -> "DocumentSpool":
+        if not isinstance(other, DocumentSpool):
+            return NotImplemented
+        return DocumentSpool(parts=[part for part in (self, other) if len(part)])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (DocumentSpool, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"DocumentSpool(<{len(self)} documents>)"
+
+    def __getstate__(self) -> list[NonAccountingDocument]:
+        return list(self)
+
+    def __setstate__(self, documents: list[NonAccountingDocument]) -> None:
+        self.__init__(documents)
+
+
 @dataclass
 class ReportData:
     """Container for the aggregated data extracted from a SAF-T file."""
@@ -65,40 +208,155 @@ class ReportData:
     totals_by_type: dict[str, Totals]
     month_overall_totals: dict[str, Totals]
     overall_totals: Totals
-    non_accounting_documents: list[NonAccountingDocument]
+    non_accounting_documents: DocumentSpool
     tax_rates: list[str]
 
+    @classmethod
+    def empty(cls) -> "ReportData":
+        """Report without documents, the identity of :meth:`merge`."""
+
+        return cls({}, {}, {}, Totals(), DocumentSpool(), [])
+
+    def merge(self, other: "ReportData") -> "ReportData":
+        """Return the report of the documents of both *self* and *other*.
+
+        Buckets are merged with :meth:`Totals.merge` and the non-accounting
+        documents of *other* follow those of *self*, so merging the reports
+        of several files in order is associative.
+        """
+
+        months = {**self.totals_by_month, **other.totals_by_month}
+        return ReportData(
+            totals_by_month={
+                month: _merge_buckets(
+                    self.totals_by_month.get(month, {}),
+                    other.totals_by_month.get(month, {}),
+                )
+                for month in months
+            },
+            totals_by_type=_merge_buckets(self.totals_by_type, other.totals_by_type),
+            month_overall_totals=_merge_buckets(
+                self.month_overall_totals, other.month_overall_totals
+            ),
+            overall_totals=self.overall_totals.merge(other.overall_totals),
+            non_accounting_documents=(
+                self.non_accounting_documents + other.non_accounting_documents
+            ),
+            tax_rates=sorted(
+                {*self.tax_rates, *other.tax_rates}, key=_tax_rate_sort_key
+            ),
+        )
+
+
+def merge_reports(reports: Iterable[ReportData]) -> ReportData:
+    """Merge the reports of several SAF-T files, in order, into one."""
+
+    return reduce(ReportData.merge, reports, ReportData.empty())
+
+
+_TEMPLATE_CELLS = {
+    "month_cell": "A1",
+    "header_text": "A2",
+    "header_number": "B2",
+    "detail_text": "A3",
+    "detail_number": "B3",
+    "detail_number_negative": "B5",
+    "subtotal_text": "A7",
+    "subtotal_number": "B7",
+}
+_TEMPLATE_CACHE: dict[Path, tuple[int, "TemplateStyles"]] = {}
+
 
 @dataclass(frozen=True)
 class TemplateStyles:
-    month_cell: object
-    header_text: object
-    header_number: object
-    detail_text: object
-    detail_number: object
-    detail_number_negative: object
-    subtotal_text: object
-    subtotal_number: object
+    """Formatting of the totals template, compiled into named styles."""
+
+    month_cell: NamedStyle
+    header_text: NamedStyle
+    header_number: NamedStyle
+    detail_text: NamedStyle
+    detail_number: NamedStyle
+    detail_number_negative: NamedStyle
+    subtotal_text: NamedStyle
+    subtotal_number: NamedStyle
     row_heights: dict[str, float]
     column_widths: dict[str, float]
 
+    def register(self, workbook: Workbook) -> None:
+        """Add the named styles to *workbook* so cells can refer to them."""
 
-def _load_template_styles() -> TemplateStyles | None:
+        for attribute in _TEMPLATE_CELLS:
+            # Each workbook binds its own copy of the style; ``copy()`` of a
+            # NamedStyle would drop its number format.
+            style = getattr(self, attribute)
+            workbook.add_named_style(_named_style(style.name, style))
+
+    def cell_style(
+        self,
+        row_type: str,
+        column: int,
+        *,
+        negative: bool = False,
+        text_columns: int = 1,
+    ) -> NamedStyle | None:
+        """Style of column *column* (1-based) in a row of *row_type*.
+
+        The first *text_columns* columns take the text styles, the others
+        the number styles.
+        """
+
+        text = column <= text_columns
+        if row_type == "month":
+            return self.month_cell if column == 1 else None
+        if row_type == "header":
+            return self.header_text if text else self.header_number
+        if row_type == "subtotal":
+            return self.subtotal_text if text else self.subtotal_number
+        if row_type == "detail":
+            if text:
+                return self.detail_text
+            return self.detail_number_negative if negative else self.detail_number
+        return None
+
+    def column_width(self, column: int, total_columns: int) -> float:
+        if column == 1:
+            return self.column_widths["A"]
+        if column == 2:
+            return self.column_widths["B"]
+        if column == total_columns:
+            return self.column_widths["E"]
+        if column == 3:
+            return self.column_widths["C"]
+        return self.column_widths["D"]
+
+
+def _template_path() -> Path | None:
     base_dir = Path(__file__).resolve().parents[3]
     candidates = list((base_dir / "log_files").glob("Template - rel*totais com IVA por tipo.xlsx"))
-    if not candidates:
-        return None
-    template = load_workbook(candidates[0])
+    return candidates[0] if candidates else None
+
+
+def _named_style(name: str, source) -> NamedStyle:
+    """Named style with the formatting of *source* (a cell or named style)."""
+
+    return NamedStyle(
+        name=name,
+        font=copy(source.font),
+        fill=copy(source.fill),
+        border=copy(source.border),
+        alignment=copy(source.alignment),
+        number_format=source.number_format,
+    )
+
+
+def _read_template_styles(path: Path) -> TemplateStyles:
+    template = load_workbook(path)
     ws = template.active
     return TemplateStyles(
-        month_cell=ws["A1"],
-        header_text=ws["A2"],
-        header_number=ws["B2"],
-        detail_text=ws["A3"],
-        detail_number=ws["B3"],
-        detail_number_negative=ws["B5"],
-        subtotal_text=ws["A7"],
-        subtotal_number=ws["B7"],
+        **{
+            attribute: _named_style(f"saftao {attribute}", ws[coordinate])
+            for attribute, coordinate in _TEMPLATE_CELLS.items()
+        },
         row_heights={
             "month": ws.row_dimensions[1].height or 24.0,
             "header": ws.row_dimensions[2].height or 21.0,
@@ -114,6 +372,22 @@ def _load_template_styles() -> TemplateStyles | None:
     )
 
 
+def _load_template_styles() -> TemplateStyles | None:
+    """Styles of the totals template, read once per process.
+
+    The template is read again only when its modification time changes.
+    """
+
+    path = _template_path()
+    if path is None:
+        return None
+    mtime = path.stat().st_mtime_ns
+    cached = _TEMPLATE_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _TEMPLATE_CACHE[path] = (mtime, _read_template_styles(path))
+    return cached[1]
+
+
 def resolve_report_directory() -> Path:
     """Return the base directory for generated totals reports."""
 
@@ -132,7 +406,7 @@ def default_report_destination(
     if saft_path is None:
         stem = "relatorio_totais"
     else:
-        stem = saft_path.stem or "relatorio_totais"
+        stem = source_stem(saft_path) or "relatorio_totais"
     destination = directory / f"{stem}_totais.xlsx"
     return destination
 
@@ -160,37 +434,132 @@ def _extract_document_totals(element: etree._Element, namespace: str) -> Totals:
     if totals_node is None:
         return Totals()
 
-    net = parse_decimal(_find_child_text(totals_node, namespace, "NetTotal"))
-    tax = parse_decimal(_find_child_text(totals_node, namespace, "TaxPayable"))
-    gross = parse_decimal(_find_child_text(totals_node, namespace, "GrossTotal"))
+    net = _parse_amount(_find_child_text(totals_node, namespace, "NetTotal"))
+    tax = _parse_amount(_find_child_text(totals_node, namespace, "TaxPayable"))
+    gross = _parse_amount(_find_child_text(totals_node, namespace, "GrossTotal"))
 
     totals = Totals()
-    totals.add(net, tax, gross)
+    totals.add(money.to_decimal(net), money.to_decimal(tax), money.to_decimal(gross))
     return totals
 
 
+def _parse_amount(text: str) -> money.Scaled:
+    return money.parse_scaled(text, money.ZERO)
+
+
 def _format_tax_rate_label(rate: str) -> str:
     if rate == "ND":
         return "IVA-ND"
     return f"IVA-{rate}%"
 
 
-def _extract_tax_by_rate(element: etree._Element, namespace: str) -> dict[str, Decimal]:
+def _iter_tax_amounts(
+    element: etree._Element, namespace: str
+) -> Iterator[tuple[str, money.Scaled]]:
+    """Yield the rate label and ``TaxAmount`` of every ``Tax`` under *element*."""
+
     if namespace:
         tax_nodes = element.xpath(".//n:Tax", namespaces={"n": namespace})
     else:
         tax_nodes = element.findall(".//Tax")
-    totals: dict[str, Decimal] = {}
     for tax_node in tax_nodes:
         percentage_text = _find_child_text(tax_node, namespace, "TaxPercentage")
-        tax_amount = parse_decimal(_find_child_text(tax_node, namespace, "TaxAmount"))
+        tax_amount = _parse_amount(_find_child_text(tax_node, namespace, "TaxAmount"))
         if percentage_text:
             rate_key = percentage_text
         else:
-            rate_key = "ND" if tax_amount != 0 else "0"
-        label = _format_tax_rate_label(rate_key)
-        totals[label] = totals.get(label, Decimal("0")) + tax_amount
-    return totals
+            rate_key = "ND" if tax_amount[0] != 0 else "0"
+        yield _format_tax_rate_label(rate_key), tax_amount
+
+
+def _extract_tax_by_rate(element: etree._Element, namespace: str) -> dict[str, Decimal]:
+    # Exact integer sums; only the per-rate result is turned into a Decimal.
+    totals: dict[str, money.Scaled] = {}
+    for label, tax_amount in _iter_tax_amounts(element, namespace):
+        totals[label] = money.add(totals.get(label, money.ZERO), tax_amount)
+    return {label: money.to_decimal(amount) for label, amount in totals.items()}
+
+
+def _tax_by_rate_columnar(
+    invoices: list[etree._Element], namespace: str
+) -> list[dict[str, Decimal]]:
+    """:func:`_extract_tax_by_rate` for many invoices with NumPy segment sums.
+
+    ``TaxAmount`` values are collected in one pass into ``int64`` columns
+    (units, scale, invoice index and rate label). Each (invoice, rate) group
+    is summed with ``np.add.reduceat`` at the largest scale of the group, the
+    scale :func:`saftao.money.add` produces. Invoices whose values may not
+    fit ``int64`` are summed by the scalar code instead.
+    """
+
+    np = columnar.np
+    label_ids: dict[str, int] = {}
+    labels_by_invoice: list[list[str]] = []
+    owners: list[int] = []
+    rates: list[int] = []
+    units: list[int] = []
+    scales: list[int] = []
+    fallback: set[int] = set()
+    for index, invoice in enumerate(invoices):
+        seen: list[str] = []
+        for label, (amount, scale) in _iter_tax_amounts(invoice, namespace):
+            if label not in seen:
+                seen.append(label)
+            if abs(amount) >= 2**59 or scale > columnar.MAX_EXPONENT:
+                fallback.add(index)
+                continue
+            owners.append(index)
+            rates.append(label_ids.setdefault(label, len(label_ids)))
+            units.append(amount)
+            scales.append(scale)
+        labels_by_invoice.append(seen)
+
+    sums: dict[tuple[int, int], money.Scaled] = {}
+    if owners:
+        key = np.array(owners, dtype=np.int64) * len(label_ids) + np.array(
+            rates, dtype=np.int64
+        )
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        unit_column = np.array(units, dtype=np.int64)[order]
+        scale_column = np.array(scales, dtype=np.int64)[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        lengths = np.diff(np.append(starts, len(key)))
+        top = np.maximum.reduceat(scale_column, starts)
+        target = np.repeat(top, lengths)
+        magnitude = np.abs(unit_column.astype(np.float64)) * np.power(
+            10.0, target - scale_column
+        )
+        safe = np.add.reduceat(magnitude, starts) < columnar.INT64_LIMIT
+        row_safe = np.repeat(safe, lengths)
+        totals = np.add.reduceat(
+            columnar.rescale(
+                np.where(row_safe, unit_column, 0),
+                scale_column,
+                np.where(row_safe, target, scale_column),
+            ),
+            starts,
+        )
+        for group, total, scale, ok in zip(
+            key[starts].tolist(), totals.tolist(), top.tolist(), safe.tolist()
+        ):
+            index, rate = divmod(group, len(label_ids))
+            if not ok:
+                fallback.add(index)
+            sums[index, rate] = (total, scale)
+
+    results: list[dict[str, Decimal]] = []
+    for index, invoice in enumerate(invoices):
+        if index in fallback:
+            results.append(_extract_tax_by_rate(invoice, namespace))
+            continue
+        results.append(
+            {
+                label: money.to_decimal(sums[index, label_ids[label]])
+                for label in labels_by_invoice[index]
+            }
+        )
+    return results
 
 
 def _resolve_invoice_month(element: etree._Element, namespace: str) -> str:
@@ -219,19 +588,26 @@ def _iter_work_documents(root: etree._Element, namespace: str) -> Iterable[etree
     return root.findall(".//SourceDocuments/WorkingDocuments/WorkDocument")
 
 
-def aggregate_documents(root: etree._Element, namespace: str) -> ReportData:
-    """Aggregate accounting and non-accounting documents from *root*."""
+class _ReportBuilder:
+    """Fold documents, one at a time, into the buckets of a :class:`ReportData`."""
 
-    totals_by_month: dict[str, dict[str, Totals]] = {}
-    totals_by_type: dict[str, Totals] = {}
-    month_overall_totals: dict[str, Totals] = {}
-    overall = Totals()
-    tax_rates: set[str] = set()
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.totals_by_month: dict[str, dict[str, Totals]] = {}
+        self.totals_by_type: dict[str, Totals] = {}
+        self.month_overall_totals: dict[str, Totals] = {}
+        self.overall = Totals()
+        self.tax_rates: set[str] = set()
+        self.non_accounting = DocumentSpool()
 
-    for invoice in iter_sales_invoices(root, namespace):
+    def add_invoice(
+        self, invoice: etree._Element, tax_by_rate: dict[str, Decimal] | None = None
+    ) -> None:
+        namespace = self.namespace
         invoice_type = _find_child_text(invoice, namespace, "InvoiceType") or "DESCONHECIDO"
         document_totals = _extract_document_totals(invoice, namespace)
-        tax_by_rate = _extract_tax_by_rate(invoice, namespace)
+        if tax_by_rate is None:
+            tax_by_rate = _extract_tax_by_rate(invoice, namespace)
         month = _resolve_invoice_month(invoice, namespace)
         if document_totals.tax_total != 0 and sum(tax_by_rate.values()) == 0 and len(tax_by_rate) == 1:
             rate = next(iter(tax_by_rate))
@@ -246,194 +622,284 @@ def aggregate_documents(root: etree._Element, namespace: str) -> ReportData:
                 },
             )
             tax_by_rate = document_totals.tax_by_rate
-        tax_rates.update(tax_by_rate.keys())
-
-        if invoice_type not in totals_by_type:
-            totals_by_type[invoice_type] = Totals()
-        totals_by_type[invoice_type].add(
-            document_totals.net_total,
-            document_totals.tax_total,
-            document_totals.gross_total,
-            tax_by_rate,
-        )
-        overall.add(
-            document_totals.net_total,
-            document_totals.tax_total,
-            document_totals.gross_total,
-            tax_by_rate,
-        )
-
-        month_totals = totals_by_month.setdefault(month, {})
-        if invoice_type not in month_totals:
-            month_totals[invoice_type] = Totals()
-        month_totals[invoice_type].add(
-            document_totals.net_total,
-            document_totals.tax_total,
-            document_totals.gross_total,
-            tax_by_rate,
-        )
-        month_overall = month_overall_totals.setdefault(month, Totals())
-        month_overall.add(
-            document_totals.net_total,
-            document_totals.tax_total,
-            document_totals.gross_total,
-            tax_by_rate,
-        )
+        self.tax_rates.update(tax_by_rate.keys())
+
+        month_totals = self.totals_by_month.setdefault(month, {})
+        for totals in (
+            self.totals_by_type.setdefault(invoice_type, Totals()),
+            self.overall,
+            month_totals.setdefault(invoice_type, Totals()),
+            self.month_overall_totals.setdefault(month, Totals()),
+        ):
+            totals.add(
+                document_totals.net_total,
+                document_totals.tax_total,
+                document_totals.gross_total,
+                tax_by_rate,
+            )
 
-    non_accounting: list[NonAccountingDocument] = []
-    for work_document in _iter_work_documents(root, namespace):
+    def add_work_document(self, work_document: etree._Element) -> None:
+        namespace = self.namespace
         doc_type = _find_child_text(work_document, namespace, "DocumentType") or "DESCONHECIDO"
-        doc_number = _find_child_text(work_document, namespace, "DocumentNumber")
-        doc_date = _find_child_text(work_document, namespace, "WorkDate")
-        customer = _find_child_text(work_document, namespace, "CustomerID")
-        totals = _extract_document_totals(work_document, namespace)
-        non_accounting.append(
+        self.non_accounting.append(
             NonAccountingDocument(
                 document_type=doc_type,
-                document_number=doc_number,
-                document_date=doc_date,
-                customer_id=customer,
-                totals=totals,
+                document_number=_find_child_text(
+                    work_document, namespace, "DocumentNumber"
+                ),
+                document_date=_find_child_text(work_document, namespace, "WorkDate"),
+                customer_id=_find_child_text(work_document, namespace, "CustomerID"),
+                totals=_extract_document_totals(work_document, namespace),
             )
         )
 
-    return ReportData(
-        totals_by_month=totals_by_month,
-        totals_by_type=totals_by_type,
-        month_overall_totals=month_overall_totals,
-        overall_totals=overall,
-        non_accounting_documents=non_accounting,
-        tax_rates=sorted(tax_rates, key=_tax_rate_sort_key),
-    )
+    def build(self) -> ReportData:
+        return ReportData(
+            totals_by_month=self.totals_by_month,
+            totals_by_type=self.totals_by_type,
+            month_overall_totals=self.month_overall_totals,
+            overall_totals=self.overall,
+            non_accounting_documents=self.non_accounting,
+            tax_rates=sorted(self.tax_rates, key=_tax_rate_sort_key),
+        )
 
 
-def write_excel_report(data: ReportData, destination: Path) -> None:
-    """Generate an Excel workbook with accounting totals and other documents."""
+def _check_backend(backend: str) -> None:
+    if backend not in ("python", "numpy"):
+        raise ValueError(f"Unknown backend: {backend!r}")
+    if backend == "numpy" and not columnar.available():
+        raise RuntimeError("The 'numpy' backend requires numpy")
+
+
+def aggregate_documents(
+    root: etree._Element, namespace: str, *, backend: str = "python"
+) -> ReportData:
+    """Aggregate accounting and non-accounting documents from *root*.
+
+    With ``backend="numpy"`` the per-rate tax sums of all invoices are
+    computed in one vectorised pass (see :func:`_tax_by_rate_columnar`); the
+    result is identical to the default ``"python"`` backend.
+    """
+
+    _check_backend(backend)
+    builder = _ReportBuilder(namespace)
+    if backend == "numpy":
+        invoices = list(iter_sales_invoices(root, namespace))
+        for invoice, tax_by_rate in zip(
+            invoices, _tax_by_rate_columnar(invoices, namespace)
+        ):
+            builder.add_invoice(invoice, tax_by_rate)
+    else:
+        for invoice in iter_sales_invoices(root, namespace):
+            builder.add_invoice(invoice)
+    for work_document in _iter_work_documents(root, namespace):
+        builder.add_work_document(work_document)
+    return builder.build()
+
+
+def _release(element: etree._Element) -> None:
+    """Drop a folded element and the already processed siblings before it."""
+
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def aggregate_documents_stream(
+    path: Path | str, *, backend: str = "python"
+) -> ReportData:
+    """:func:`aggregate_documents` over *path* read with ``iterparse``.
+
+    Each ``Invoice`` and ``WorkDocument`` is folded into the totals and then
+    cleared, and the ``MasterFiles`` entries, ledger transactions and other
+    documents are dropped as they are read, so memory depends on the number of (month, type, rate)
+    buckets rather than on the document count (non-accounting documents go
+    to a :class:`DocumentSpool`).
+    With ``backend="numpy"`` invoices are folded in batches of
+    :data:`COLUMN_BATCH_SIZE`. The result equals :func:`aggregate_documents`.
+    """
+
+    _check_backend(backend)
+    builder: _ReportBuilder | None = None
+    batch: list[etree._Element] = []
+
+    def fold_batch() -> None:
+        sums = _tax_by_rate_columnar(batch, builder.namespace)
+        for invoice, tax_by_rate in zip(batch, sums):
+            builder.add_invoice(invoice, tax_by_rate)
+            _release(invoice)
+        batch.clear()
+
+    tags = [f"{{*}}{name}" for name in _STREAM_CONTAINERS]
+    with xml_source(path) as source:
+        for _event, element in etree.iterparse(source, tag=tags):
+            if builder is None:
+                namespace = detect_namespace(element.getroottree().getroot())
+                builder = _ReportBuilder(namespace)
+                containers = {
+                    f"{{{namespace}}}{name}": f"{{{namespace}}}{container}"
+                    for name, container in _STREAM_CONTAINERS.items()
+                }
+                invoice_tag = f"{{{namespace}}}Invoice"
+                work_document_tag = f"{{{namespace}}}WorkDocument"
+            tag = element.tag
+            if containers.get(tag) != element.getparent().tag:
+                continue
+            if tag == invoice_tag:
+                if backend == "numpy":
+                    batch.append(element)
+                    if len(batch) >= COLUMN_BATCH_SIZE:
+                        fold_batch()
+                    continue
+                builder.add_invoice(element)
+            elif tag == work_document_tag:
+                builder.add_work_document(element)
+            _release(element)
+        if batch:
+            fold_batch()
+    if builder is None:
+        builder = _ReportBuilder(NS_DEFAULT)
+    return builder.build()
+
+
+def write_excel_report(
+    data: ReportData,
+    destination: Path,
+    *,
+    by_file: Mapping[str, ReportData] | None = None,
+) -> None:
+    """Generate an Excel workbook with accounting totals and other documents.
+
+    *data* fills the summary (per month when it spans several months); with
+    *by_file* a "Por ficheiro" sheet repeats the totals of each file.
+    """
 
     destination.parent.mkdir(parents=True, exist_ok=True)
 
-    workbook = Workbook()
-    summary_ws = workbook.active
-    summary_ws.title = "Resumo"
+    # Write-only workbook: rows go to disk as they are appended, so the
+    # listing of non-accounting documents streams from its spool into the
+    # sheet without building either in memory. Row heights and column widths
+    # must be set before the rows they affect.
+    workbook = Workbook(write_only=True)
+    summary_ws = workbook.create_sheet(title="Resumo")
+    sheets = [summary_ws]
+    if by_file:
+        files_ws = workbook.create_sheet(title="Por ficheiro")
+        sheets.append(files_ws)
+    other_ws = workbook.create_sheet(title="Documentos não contabilísticos")
+
     tax_columns = data.tax_rates
     header = ["Tipo", "Total sem IVA", *tax_columns, "Total com IVA"]
+    other_header = [
+        "Tipo",
+        "Número",
+        "Data",
+        "Cliente",
+        "Total sem IVA",
+        "IVA",
+        "Total com IVA",
+    ]
     template_styles = _load_template_styles()
-
-    def apply_style(cell, template_cell) -> None:
-        if template_cell is None:
-            return
-        cell.font = copy(template_cell.font)
-        cell.fill = copy(template_cell.fill)
-        cell.border = copy(template_cell.border)
-        cell.alignment = copy(template_cell.alignment)
-        cell.number_format = template_cell.number_format
-
-    def style_row(row_index: int, row_type: str, *, negative: bool = False) -> None:
+    if template_styles is not None:
+        template_styles.register(workbook)
+        for ws, columns in (
+            *((ws, header) for ws in sheets),
+            (other_ws, other_header),
+        ):
+            for col_index in range(1, len(columns) + 1):
+                width = template_styles.column_width(col_index, len(columns))
+                ws.column_dimensions[get_column_letter(col_index)].width = width
+    row_counts = {ws.title: 0 for ws in (*sheets, other_ws)}
+
+    def append_row(
+        ws,
+        values: list,
+        row_type: str,
+        *,
+        negative: bool = False,
+        text_columns: int = 1,
+    ) -> None:
+        row_counts[ws.title] += 1
         if template_styles is None:
+            ws.append(values)
             return
-        if row_type == "month":
-            template_cell = template_styles.month_cell
-            apply_style(summary_ws.cell(row=row_index, column=1), template_cell)
-            summary_ws.row_dimensions[row_index].height = template_styles.row_heights["month"]
-            return
-        if row_type == "header":
-            summary_ws.row_dimensions[row_index].height = template_styles.row_heights["header"]
-            for col_index in range(1, len(header) + 1):
-                template_cell = (
-                    template_styles.header_text
-                    if col_index == 1
-                    else template_styles.header_number
-                )
-                apply_style(summary_ws.cell(row=row_index, column=col_index), template_cell)
-            return
-        if row_type == "subtotal":
-            summary_ws.row_dimensions[row_index].height = template_styles.row_heights["subtotal"]
-            for col_index in range(1, len(header) + 1):
-                template_cell = (
-                    template_styles.subtotal_text
-                    if col_index == 1
-                    else template_styles.subtotal_number
-                )
-                apply_style(summary_ws.cell(row=row_index, column=col_index), template_cell)
-            return
-        if row_type == "detail":
-            for col_index in range(1, len(header) + 1):
-                if col_index == 1:
-                    template_cell = template_styles.detail_text
-                else:
-                    template_cell = (
-                        template_styles.detail_number_negative
-                        if negative
-                        else template_styles.detail_number
-                    )
-                apply_style(summary_ws.cell(row=row_index, column=col_index), template_cell)
-
-    def append_totals_row(label: str, totals: Totals) -> None:
-        summary_ws.append(
+        height = template_styles.row_heights.get(row_type)
+        if height is not None:
+            ws.row_dimensions[row_counts[ws.title]].height = height
+        cells = []
+        for col_index, value in enumerate(values, start=1):
+            cell = WriteOnlyCell(ws, value=value)
+            style = template_styles.cell_style(
+                row_type, col_index, negative=negative, text_columns=text_columns
+            )
+            if style is not None:
+                cell.style = style.name
+            cells.append(cell)
+        ws.append(cells)
+
+    def append_totals_row(
+        ws, label: str, totals: Totals, row_type: str = "detail"
+    ) -> None:
+        append_row(
+            ws,
             [
                 label,
                 totals.net_total,
                 *[totals.tax_by_rate.get(rate, Decimal("0")) for rate in tax_columns],
                 totals.gross_total,
-            ]
+            ],
+            row_type,
+            negative=totals.net_total < 0,
         )
-        row_index = summary_ws.max_row
-        style_row(row_index, "detail", negative=totals.net_total < 0)
+
+    def append_section(
+        ws,
+        title: str,
+        totals_by_type: Mapping[str, Totals],
+        subtotal_label: str,
+        subtotal: Totals,
+    ) -> None:
+        append_row(ws, [title], "month")
+        append_row(ws, header, "header")
+        for doc_type in sorted(totals_by_type):
+            append_totals_row(ws, doc_type, totals_by_type[doc_type])
+        append_totals_row(ws, subtotal_label, subtotal, "subtotal")
+        append_row(ws, [], "blank")
 
     months = sorted(data.totals_by_month)
     if len(months) > 1:
         for month in months:
-            summary_ws.append([f"Mês: {month}"])
-            style_row(summary_ws.max_row, "month")
-            summary_ws.append(header)
-            style_row(summary_ws.max_row, "header")
-            for doc_type in sorted(data.totals_by_month[month]):
-                append_totals_row(doc_type, data.totals_by_month[month][doc_type])
-            append_totals_row(f"Subtotal {month}", data.month_overall_totals[month])
-            style_row(summary_ws.max_row, "subtotal")
-            summary_ws.append([])
-        append_totals_row("Totais Gerais", data.overall_totals)
-        style_row(summary_ws.max_row, "subtotal")
+            append_section(
+                summary_ws,
+                f"Mês: {month}",
+                data.totals_by_month[month],
+                f"Subtotal {month}",
+                data.month_overall_totals[month],
+            )
+        append_totals_row(summary_ws, "Totais Gerais", data.overall_totals, "subtotal")
     else:
-        summary_ws.append(header)
-        style_row(summary_ws.max_row, "header")
+        append_row(summary_ws, header, "header")
         for doc_type in sorted(data.totals_by_type):
-            append_totals_row(doc_type, data.totals_by_type[doc_type])
-        summary_ws.append([])
-        append_totals_row("Totais Gerais", data.overall_totals)
-        style_row(summary_ws.max_row, "subtotal")
-
-    if template_styles is not None:
-        total_columns = len(header)
-        for col_index in range(1, total_columns + 1):
-            column_letter = get_column_letter(col_index)
-            if col_index == 1:
-                width = template_styles.column_widths["A"]
-            elif col_index == 2:
-                width = template_styles.column_widths["B"]
-            elif col_index == total_columns:
-                width = template_styles.column_widths["E"]
-            elif col_index == 3:
-                width = template_styles.column_widths["C"]
-            else:
-                width = template_styles.column_widths["D"]
-            summary_ws.column_dimensions[column_letter].width = width
-
-    other_ws = workbook.create_sheet(title="Documentos não contabilísticos")
-    other_ws.append(
-        [
-            "Tipo",
-            "Número",
-            "Data",
-            "Cliente",
-            "Total sem IVA",
-            "IVA",
-            "Total com IVA",
-        ]
-    )
+            append_totals_row(summary_ws, doc_type, data.totals_by_type[doc_type])
+        append_row(summary_ws, [], "blank")
+        append_totals_row(summary_ws, "Totais Gerais", data.overall_totals, "subtotal")
+
+    if by_file:
+        for label, file_data in by_file.items():
+            append_section(
+                files_ws,
+                f"Ficheiro: {label}",
+                file_data.totals_by_type,
+                f"Subtotal {label}",
+                file_data.overall_totals,
+            )
 
+    append_row(other_ws, other_header, "header", text_columns=4)
     for document in data.non_accounting_documents:
-        other_ws.append(
+        append_row(
+            other_ws,
             [
                 document.document_type,
                 document.document_number,
@@ -442,7 +908,235 @@ def append_totals_row(label: str, totals: Totals) -> None:
                 document.totals.net_total,
                 document.totals.tax_total,
                 document.totals.gross_total,
-            ]
+            ],
+            "detail",
+            negative=document.totals.net_total < 0,
+            text_columns=4,
         )
 
     workbook.save(destination)
+
+
+class TableWriter(ABC):
+    """Flat table written row by row, one file per table.
+
+    Amount columns (``amounts``) hold ``Decimal`` values; they are rounded to
+    cents and written as numbers with two decimals in every format. Usable as
+    a context manager; :meth:`close` returns the path of the file.
+    """
+
+    suffix = ""
+
+    def __init__(
+        self, path: Path, columns: Sequence[str], amounts: Collection[str] = ()
+    ) -> None:
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.amounts = [column in amounts for column in self.columns]
+        self.closed = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    @abstractmethod
+    def write(self, row: Sequence[Any]) -> None:
+        """Append *row*, one value per column."""
+
+    def close(self) -> Path:
+        self.closed = True
+        return self.path
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if not self.closed:
+            self.close()
+
+
+def _cents(value: Decimal) -> str:
+    return money.format_cents(money.q2(money.from_decimal(value)))
+
+
+class CsvTableWriter(TableWriter):
+    """CSV (UTF-8, ``,``) with a header row."""
+
+    suffix = ".csv"
+
+    def __init__(
+        self, path: Path, columns: Sequence[str], amounts: Collection[str] = ()
+    ) -> None:
+        super().__init__(path, columns, amounts)
+        self._handle = self.path.open("w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._handle)
+        self._writer.writerow(self.columns)
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._writer.writerow(
+            [
+                _cents(value) if amount else "" if value is None else value
+                for value, amount in zip(row, self.amounts)
+            ]
+        )
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._handle.close()
+        return super().close()
+
+
+class JsonlTableWriter(TableWriter):
+    """One JSON object per row; amounts are JSON numbers (``120.00``)."""
+
+    suffix = ".jsonl"
+
+    def __init__(
+        self, path: Path, columns: Sequence[str], amounts: Collection[str] = ()
+    ) -> None:
+        super().__init__(path, columns, amounts)
+        self._handle = self.path.open("w", encoding="utf-8")
+        self._keys = [json.dumps(column, ensure_ascii=False) for column in columns]
+
+    def write(self, row: Sequence[Any]) -> None:
+        fields = (
+            f"{key}: "
+            + (_cents(value) if amount else json.dumps(value, ensure_ascii=False))
+            for key, value, amount in zip(self._keys, row, self.amounts)
+        )
+        self._handle.write("{" + ", ".join(fields) + "}\n")
+
+    def close(self) -> Path:
+        if not self.closed:
+            self._handle.close()
+        return super().close()
+
+
+class ParquetTableWriter(TableWriter):
+    """Parquet file written with pyarrow, one row group at a time.
+
+    Rows are buffered until :data:`PARQUET_ROW_GROUP_SIZE` of them can be
+    written as a row group, so memory does not grow with the table. Amounts
+    are ``decimal128(18, 2)``; the other columns are strings.
+    """
+
+    suffix = ".parquet"
+
+    def __init__(
+        self, path: Path, columns: Sequence[str], amounts: Collection[str] = ()
+    ) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path, columns, amounts)
+        self._schema = pa.schema(
+            [
+                (column, pa.decimal128(18, 2) if amount else pa.string())
+                for column, amount in zip(self.columns, self.amounts)
+            ]
+        )
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._values: list[list[Any]] = [[] for _ in self.columns]
+
+    def write(self, row: Sequence[Any]) -> None:
+        for values, value, amount in zip(self._values, row, self.amounts):
+            values.append(Decimal(_cents(value)) if amount else value)
+        if len(self._values[0]) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        import pyarrow as pa
+
+        self._writer.write_table(pa.table(self._values, schema=self._schema))
+        for values in self._values:
+            values.clear()
+
+    def close(self) -> Path:
+        if not self.closed:
+            if self._values[0]:
+                self._flush()
+            self._writer.close()
+        return super().close()
+
+
+_TABLE_WRITERS: dict[str, type[TableWriter]] = {
+    "csv": CsvTableWriter,
+    "jsonl": JsonlTableWriter,
+    "parquet": ParquetTableWriter,
+}
+
+
+def parquet_available() -> bool:
+    """Return whether pyarrow is installed (needed for ``parquet``)."""
+
+    return find_spec("pyarrow") is not None
+
+
+def _totals_rows(label: str, data: ReportData) -> Iterator[tuple]:
+    for month in sorted(data.totals_by_month):
+        for doc_type, totals in sorted(data.totals_by_month[month].items()):
+            yield (
+                label,
+                month,
+                doc_type,
+                totals.net_total,
+                totals.tax_total,
+                totals.gross_total,
+            )
+
+
+def _tax_rows(label: str, data: ReportData) -> Iterator[tuple]:
+    for month in sorted(data.totals_by_month):
+        for doc_type, totals in sorted(data.totals_by_month[month].items()):
+            for rate in sorted(totals.tax_by_rate, key=_tax_rate_sort_key):
+                yield label, month, doc_type, rate, totals.tax_by_rate[rate]
+
+
+def _document_rows(label: str, data: ReportData) -> Iterator[tuple]:
+    for document in data.non_accounting_documents:
+        yield (
+            label,
+            document.document_type,
+            document.document_number,
+            document.document_date,
+            document.customer_id,
+            document.totals.net_total,
+            document.totals.tax_total,
+            document.totals.gross_total,
+        )
+
+
+def write_report_tables(
+    reports: Mapping[str, ReportData], destination: Path, table_format: str
+) -> list[Path]:
+    """Write *reports* (file label -> data) as flat tables for BI tools.
+
+    Three files are written next to *destination*, with its stem and the
+    suffix of *table_format* (``csv``, ``jsonl`` or ``parquet``):
+
+    * ``<stem>``: totals per file, month and document type;
+    * ``<stem>_iva``: tax per file, month, document type and tax rate;
+    * ``<stem>_documentos``: the non-accounting documents.
+
+    Amounts are numbers with two decimals (see :class:`TableWriter`).
+    """
+
+    try:
+        writer_cls = _TABLE_WRITERS[table_format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown table format: {table_format!r} "
+            f"(use one of: {', '.join(_TABLE_WRITERS)})"
+        ) from None
+    base = destination.with_suffix("")
+    tables = (
+        ("", TOTALS_COLUMNS, _totals_rows),
+        ("_iva", TAX_COLUMNS, _tax_rows),
+        ("_documentos", DOCUMENT_COLUMNS, _document_rows),
+    )
+    paths = []
+    for name, columns, rows in tables:
+        path = base.with_name(base.name + name + writer_cls.suffix)
+        with writer_cls(path, columns, AMOUNT_COLUMNS) as writer:
+            for label, data in reports.items():
+                for row in rows(label, data):
+                    writer.write(row)
+        paths.append(writer.path)
+    return paths
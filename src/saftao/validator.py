@@ -3,18 +3,13 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable
 
 from lxml import etree
 
 from lib.validators.rules_loader import get_rule
 
-from .rules import (
-    iter_masterfile_customers,
-    iter_sales_invoices,
-    iter_tax_elements,
-    resolve_tax_context,
-)
+from .rules import RuleEngine, resolve_tax_context
 from .schema import load_audit_file
 from .utils import detect_namespace
 
@@ -50,25 +45,116 @@ def validate_tree(tree: etree._ElementTree) -> list[ValidationIssue]:
     """Run the validation checks against an in-memory XML tree."""
 
     root = tree.getroot()
-    namespace = detect_namespace(root)
-
-    issues: list[ValidationIssue] = []
-
-    customer_issues, valid_customers, prefixed_customers = _check_masterfile_customers(
-        root, namespace
-    )
-    issues.extend(customer_issues)
-    issues.extend(
-        _check_invoice_customer_references(
-            root, namespace, valid_customers, prefixed_customers
+    engine = RuleEngine(detect_namespace(root))
+    checks = ValidatorChecks(engine.namespace)
+    checks.register(engine)
+    engine.run(root)
+    return checks.issues()
+
+
+class ValidatorChecks:
+    """The :func:`validate_tree` checks as :class:`~saftao.rules.RuleEngine` visitors.
+
+    Each check handles a single element, so the same instance serves a
+    one-pass walk over a tree and an ``iterparse`` stream that discards
+    documents once they are complete. :meth:`issues` returns customers,
+    invoice references, header and ``Tax`` issues in that order.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self._required, self._allowed_values = _tax_country_region_constraints()
+        self._valid_ids: set[str] = set()
+        self._prefixed_ids: set[str] = set()
+        self._masterfiles_done = False
+        self._pending_references: list[tuple[str, str]] = []
+        self._customer_issues: list[ValidationIssue] = []
+        self._invoice_issues: list[ValidationIssue] = []
+        self._header_issues: list[ValidationIssue] = []
+        self._tax_issues: list[ValidationIssue] = []
+
+    def handlers(self) -> list[tuple[str, Callable[[etree._Element], None]]]:
+        """Return the ``(kind, handler)`` pairs to register on an engine."""
+
+        return [
+            ("Header", self.check_header),
+            ("Customer", self.check_customer),
+            ("MasterFiles", self.close_masterfiles),
+            ("Invoice", self.check_invoice),
+            ("Tax", self.check_tax),
+        ]
+
+    def register(self, engine: RuleEngine) -> None:
+        for kind, handler in self.handlers():
+            engine.register(kind, handler)
+
+    def check_header(self, header: etree._Element) -> None:
+        for check in (
+            _check_tax_registration_number,
+            _check_header_building_number,
+            _check_header_postal_code,
+        ):
+            self._header_issues.extend(check(header, self.namespace))
+
+    def check_customer(self, customer: etree._Element) -> None:
+        customer_id = _extract_customer_id(customer, self.namespace)
+        if _subtree_has_prefixed_nodes(customer, self.namespace):
+            self._prefixed_ids.add(customer_id)
+            self._customer_issues.append(
+                ValidationIssue(
+                    "Customer no MasterFiles exportado com prefixo de namespace (ns:).",
+                    code="CUSTOMER_WRONG_NAMESPACE",
+                    details={"customer_id": customer_id},
+                )
+            )
+        elif customer_id:
+            self._valid_ids.add(customer_id)
+
+    def close_masterfiles(self, masterfiles: etree._Element) -> None:
+        self._masterfiles_done = True
+
+    def check_invoice(self, invoice: etree._Element) -> None:
+        reference = _invoice_customer_reference(invoice, self.namespace)
+        if reference is None:
+            return
+        if not self._masterfiles_done:
+            # Customers may still be declared further down the file.
+            self._pending_references.append(reference)
+            return
+        self._invoice_issues.extend(self._reference_issues([reference]))
+
+    def check_tax(self, tax: etree._Element) -> None:
+        issue = _check_tax_element_country_region(
+            tax, self.namespace, self._required, self._allowed_values
         )
-    )
-    issues.extend(_check_tax_registration_number(root, namespace))
-    issues.extend(_check_header_building_number(root, namespace))
-    issues.extend(_check_header_postal_code(root, namespace))
-    issues.extend(_check_tax_country_region(root, namespace))
-
-    return issues
+        if issue is not None:
+            self._tax_issues.append(issue)
+
+    def issues(self) -> list[ValidationIssue]:
+        """Return the collected issues in :func:`validate_tree` order."""
+
+        if self._pending_references:
+            # Pending references precede every invoice checked afterwards.
+            pending = self._reference_issues(self._pending_references)
+            self._invoice_issues[:0] = pending
+            self._pending_references = []
+        return [
+            *self._customer_issues,
+            *self._invoice_issues,
+            *self._header_issues,
+            *self._tax_issues,
+        ]
+
+    def _reference_issues(
+        self, references: Iterable[tuple[str, str]]
+    ) -> list[ValidationIssue]:
+        issues = (
+            _check_invoice_customer_reference(
+                reference, self._valid_ids, self._prefixed_ids
+            )
+            for reference in references
+        )
+        return [issue for issue in issues if issue is not None]
 
 
 def export_report(issues: Iterable[ValidationIssue], *, destination: Path) -> None:
@@ -82,84 +168,54 @@ def export_report(issues: Iterable[ValidationIssue], *, destination: Path) -> No
     logger.write_rows(issues)
 
 
-def _check_masterfile_customers(
-    root: etree._Element, namespace: str
-) -> tuple[list[ValidationIssue], set[str], set[str]]:
-    ns = {"n": namespace}
-    masterfiles = root.find(".//n:MasterFiles", namespaces=ns)
-    if masterfiles is None:
-        return [], set(), set()
-
-    issues: list[ValidationIssue] = []
-    valid_ids: set[str] = set()
-    prefixed_ids: set[str] = set()
-
-    for customer in iter_masterfile_customers(root, namespace):
-        customer_id = _extract_customer_id(customer, namespace)
-        has_prefix = _subtree_has_prefixed_nodes(customer, namespace)
-        if has_prefix:
-            prefixed_ids.add(customer_id)
-            issues.append(
-                ValidationIssue(
-                    "Customer no MasterFiles exportado com prefixo de namespace (ns:).",
-                    code="CUSTOMER_WRONG_NAMESPACE",
-                    details={"customer_id": customer_id},
-                )
-            )
-        elif customer_id:
-            valid_ids.add(customer_id)
+def _invoice_customer_reference(
+    invoice: etree._Element, namespace: str
+) -> tuple[str, str] | None:
+    """Return ``(invoice_no, customer_id)`` for invoices naming a customer."""
 
-    return issues, valid_ids, prefixed_ids
+    ns = {"n": namespace}
+    customer_el = invoice.find("./n:CustomerID", namespaces=ns)
+    if customer_el is None:
+        return None
+    customer_id = (customer_el.text or "").strip()
+    if not customer_id:
+        return None
+    invoice_no = _find_child_text(invoice, namespace, "InvoiceNo") or "(sem número)"
+    return invoice_no, customer_id
 
 
-def _check_invoice_customer_references(
-    root: etree._Element,
-    namespace: str,
+def _check_invoice_customer_reference(
+    reference: tuple[str, str],
     valid_ids: set[str],
     prefixed_ids: set[str],
-) -> list[ValidationIssue]:
-    ns = {"n": namespace}
-    issues: list[ValidationIssue] = []
-
-    for invoice in iter_sales_invoices(root, namespace):
-        customer_el = invoice.find("./n:CustomerID", namespaces=ns)
-        if customer_el is None:
-            continue
-        customer_id = (customer_el.text or "").strip()
-        if not customer_id or customer_id in valid_ids:
-            continue
-
-        invoice_no = _find_child_text(invoice, namespace, "InvoiceNo") or "(sem número)"
-        message = (
-            f"Fatura '{invoice_no}' referencia CustomerID '{customer_id}' que não existe no MasterFiles."
-        )
-        note = (
-            "CustomerID presente no MasterFiles mas com prefixo de namespace não padrão"
-            if customer_id in prefixed_ids
-            else "CustomerID não encontrado"
-        )
-        issues.append(
-            ValidationIssue(
-                message,
-                code="INVOICE_CUSTOMER_MISSING",
-                details={
-                    "invoice": invoice_no,
-                    "customer_id": customer_id,
-                    "note": note,
-                },
-            )
-        )
+) -> ValidationIssue | None:
+    invoice_no, customer_id = reference
+    if customer_id in valid_ids:
+        return None
 
-    return issues
+    message = (
+        f"Fatura '{invoice_no}' referencia CustomerID '{customer_id}' que não existe no MasterFiles."
+    )
+    note = (
+        "CustomerID presente no MasterFiles mas com prefixo de namespace não padrão"
+        if customer_id in prefixed_ids
+        else "CustomerID não encontrado"
+    )
+    return ValidationIssue(
+        message,
+        code="INVOICE_CUSTOMER_MISSING",
+        details={
+            "invoice": invoice_no,
+            "customer_id": customer_id,
+            "note": note,
+        },
+    )
 
 
 def _check_tax_registration_number(
-    root: etree._Element, namespace: str
+    header: etree._Element, namespace: str
 ) -> list[ValidationIssue]:
     ns = {"n": namespace}
-    header = root.find(".//n:Header", namespaces=ns)
-    if header is None:
-        return []
 
     tax_el = header.find("./n:TaxRegistrationNumber", namespaces=ns)
     if tax_el is None:
@@ -197,12 +253,9 @@ def _check_tax_registration_number(
 
 
 def _check_header_building_number(
-    root: etree._Element, namespace: str
+    header: etree._Element, namespace: str
 ) -> list[ValidationIssue]:
     ns = {"n": namespace}
-    header = root.find(".//n:Header", namespaces=ns)
-    if header is None:
-        return []
 
     address = header.find("./n:CompanyAddress", namespaces=ns)
     if address is None:
@@ -258,12 +311,9 @@ def _building_number_needs_normalisation(value: str, rule: object | None) -> boo
 
 
 def _check_header_postal_code(
-    root: etree._Element, namespace: str
+    header: etree._Element, namespace: str
 ) -> list[ValidationIssue]:
     ns = {"n": namespace}
-    header = root.find(".//n:Header", namespaces=ns)
-    if header is None:
-        return []
 
     address = header.find("./n:CompanyAddress", namespaces=ns)
     if address is None:
@@ -296,9 +346,7 @@ def _check_header_postal_code(
     ]
 
 
-def _check_tax_country_region(root: etree._Element, namespace: str) -> list[ValidationIssue]:
-    ns = {"n": namespace}
-    issues: list[ValidationIssue] = []
+def _tax_country_region_constraints() -> tuple[bool, set[str]]:
     rule = get_rule(_RULE_TAX_COUNTRY_REGION_REQUIRED)
     # Rule agt.tax.country_region.required consolidates AGT VAT rules requiring
     # AO as the country/region marker for applicable transactions.
@@ -308,62 +356,58 @@ def _check_tax_country_region(root: etree._Element, namespace: str) -> list[Vali
         constraints = rule.constraints
         required = constraints.get("required", True)
         allowed_values = {value.upper() for value in constraints.get("allowed_values", [])}
+    return required, allowed_values
 
-    for tax in iter_tax_elements(root, namespace):
-        region = tax.find(f"./{{{namespace}}}TaxCountryRegion")
-        if region is not None:
-            region_text = (region.text or "").strip()
-            if region_text:
-                if allowed_values and region_text.upper() not in allowed_values:
-                    doc_type, doc_id, line_no = resolve_tax_context(tax, namespace)
-                    context_parts = [doc_type]
-                    if doc_id:
-                        context_parts[-1] = f"{doc_type} '{doc_id}'" if doc_type else doc_id
-                    if line_no:
-                        context_parts.append(f"linha {line_no}")
-                    context = ", ".join(part for part in context_parts if part)
-                    if not context:
-                        context = "Tax"
-                    issues.append(
-                        ValidationIssue(
-                            f"TaxCountryRegion em {context} possui valor '{region_text}' fora do permitido.",
-                            code="TAX_COUNTRY_REGION_INVALID",
-                            details={
-                                "document_type": doc_type,
-                                "document_id": doc_id,
-                                "line": line_no,
-                                "allowed_values": sorted(allowed_values),
-                                "current_value": region_text,
-                            },
-                        )
-                    )
-                continue
-        if not required:
-            continue
 
-        doc_type, doc_id, line_no = resolve_tax_context(tax, namespace)
-        context_parts = [doc_type]
-        if doc_id:
-            context_parts[-1] = f"{doc_type} '{doc_id}'" if doc_type else doc_id
-        if line_no:
-            context_parts.append(f"linha {line_no}")
-        context = ", ".join(part for part in context_parts if part)
-        if not context:
-            context = "Tax"
-
-        issues.append(
-            ValidationIssue(
-                f"TaxCountryRegion em {context} está em falta ou vazio.",
-                code="TAX_COUNTRY_REGION_MISSING",
-                details={
-                    "document_type": doc_type,
-                    "document_id": doc_id,
-                    "line": line_no,
-                },
-            )
-        )
+def _check_tax_element_country_region(
+    tax: etree._Element,
+    namespace: str,
+    required: bool,
+    allowed_values: set[str],
+) -> ValidationIssue | None:
+    region = tax.find(f"./{{{namespace}}}TaxCountryRegion")
+    if region is not None:
+        region_text = (region.text or "").strip()
+        if region_text:
+            if allowed_values and region_text.upper() not in allowed_values:
+                doc_type, doc_id, line_no = resolve_tax_context(tax, namespace)
+                context = _describe_tax_context(doc_type, doc_id, line_no)
+                return ValidationIssue(
+                    f"TaxCountryRegion em {context} possui valor '{region_text}' fora do permitido.",
+                    code="TAX_COUNTRY_REGION_INVALID",
+                    details={
+                        "document_type": doc_type,
+                        "document_id": doc_id,
+                        "line": line_no,
+                        "allowed_values": sorted(allowed_values),
+                        "current_value": region_text,
+                    },
+                )
+            return None
+    if not required:
+        return None
+
+    doc_type, doc_id, line_no = resolve_tax_context(tax, namespace)
+    context = _describe_tax_context(doc_type, doc_id, line_no)
+    return ValidationIssue(
+        f"TaxCountryRegion em {context} está em falta ou vazio.",
+        code="TAX_COUNTRY_REGION_MISSING",
+        details={
+            "document_type": doc_type,
+            "document_id": doc_id,
+            "line": line_no,
+        },
+    )
+
 
-    return issues
+def _describe_tax_context(doc_type: str, doc_id: str, line_no: str) -> str:
+    context_parts = [doc_type]
+    if doc_id:
+        context_parts[-1] = f"{doc_type} '{doc_id}'" if doc_type else doc_id
+    if line_no:
+        context_parts.append(f"linha {line_no}")
+    context = ", ".join(part for part in context_parts if part)
+    return context or "Tax"
 
 
 def _find_child_text(
@@ -402,7 +446,13 @@ def _find_child_by_localname(
     return None
 
 
-__all__ = ["ValidationIssue", "validate_file", "validate_tree", "export_report"]
+__all__ = [
+    "ValidationIssue",
+    "ValidatorChecks",
+    "validate_file",
+    "validate_tree",
+    "export_report",
+]
 _RULE_TAX_REGISTRATION_DIGITS = "agt.header.tax_registration_number.digits_only"
 _RULE_BUILDING_NUMBER = "agt.header.building_number.normalised"
 _RULE_POSTAL_CODE_PLACEHOLDER = "agt.header.postal_code.placeholder"
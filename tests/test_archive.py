@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import gzip
+import lzma
+import zipfile
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from saftao import archive
+from saftao.commands import autofix_hard
+from saftao.commands.autofix_soft import next_version_paths
+from saftao.commands.validator_strict import validate_business_rules_stream
+
+from .test_validator_stream import _RowLogger, _write_multi_invoice_xml
+
+
+def _compress(xml_path: Path, kind: str, name: str | None = None) -> Path:
+    data = xml_path.read_bytes()
+    target = xml_path.with_name(name or f"{xml_path.name}.{kind}")
+    if kind == "zip":
+        with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(xml_path.name, data)
+    elif kind == "gz":
+        target.write_bytes(gzip.compress(data))
+    else:
+        target.write_bytes(lzma.compress(data))
+    return target
+
+
+@pytest.mark.parametrize("kind", archive.COMPRESSIONS)
+def test_parse_and_stream_compressed_inputs(tmp_path, kind):
+    xml_path = tmp_path / "multi.xml"
+    _write_multi_invoice_xml(xml_path)
+    compressed = _compress(xml_path, kind)
+
+    assert etree.tostring(archive.parse_xml(compressed)) == etree.tostring(
+        etree.parse(str(xml_path))
+    )
+
+    plain, packed = _RowLogger(), _RowLogger()
+    assert validate_business_rules_stream(
+        compressed, packed
+    ) == validate_business_rules_stream(xml_path, plain)
+    assert packed.rows == plain.rows
+
+
+def test_zip_member_without_xml_suffix_and_names(tmp_path):
+    xml_path = tmp_path / "SAFT_v.02.xml"
+    _write_multi_invoice_xml(xml_path)
+    compressed = _compress(xml_path, "zip", name="SAFT_v.02.zip")
+
+    assert archive.logical_name(compressed) == "SAFT_v.02.xml"
+    assert archive.source_stem(tmp_path / "SAFT_v.02.xml.gz") == "SAFT_v.02"
+    assert archive.read_xml_bytes(compressed) == xml_path.read_bytes()
+
+
+def test_next_version_paths_for_compressed_source(tmp_path):
+    source = tmp_path / "SAFT_v.02.xml.zip"
+    (tmp_path / "SAFT_v.03.xml").touch()
+
+    ok_path, bad_path, suffix = next_version_paths(source, tmp_path, "xz")
+
+    assert ok_path == tmp_path / "SAFT_v.04.xml.xz"
+    assert bad_path == tmp_path / "SAFT_v.04_invalido.xml.xz"
+    assert suffix == "_v.04"
+
+
+def test_autofix_hard_reads_and_writes_archives(tmp_path, monkeypatch):
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text("""<?xml version='1.0' encoding='UTF-8'?>
+<AuditFile xmlns="urn:OECD:StandardAuditFile-Tax:AO_1.01_01">
+  <Header />
+  <SourceDocuments>
+    <WorkingDocuments>
+      <WorkDocument><DocumentNumber>GT 1</DocumentNumber>
+    </WorkingDocuments>
+  </SourceDocuments>
+</AuditFile>
+""")
+    compressed = _compress(xml_path, "zip")
+    monkeypatch.setattr(autofix_hard, "fix_xml", lambda tree, _path, workers=1: tree)
+    monkeypatch.setattr(autofix_hard, "default_xsd_path", lambda: None)
+
+    with pytest.raises(SystemExit) as exc:
+        autofix_hard.main([str(compressed), "--compress", "gz"])
+
+    assert exc.value.code == 0
+    output = tmp_path / "sample_v.02.xml.gz"
+    tree = archive.parse_xml(output)
+    assert tree.find(".//{*}WorkDocument") is not None
+    # The WorkDocument repair happens in memory; the archive is untouched.
+    assert archive.read_xml_bytes(compressed) == xml_path.read_bytes()
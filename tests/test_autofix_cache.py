@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import pytest
+
+from saftao import cache as cache_module
+from saftao.cache import CACHE_DIRNAME
+from saftao.commands import autofix_hard, autofix_soft
+
+SAMPLE = """<?xml version="1.0" encoding="UTF-8"?>
+<AuditFile xmlns="urn:OECD:StandardAuditFile-Tax:AO_1.01_01">
+  <Header />
+  <MasterFiles />
+  <SourceDocuments />
+</AuditFile>
+"""
+
+
+def _run(command, argv) -> int:
+    with pytest.raises(SystemExit) as excinfo:
+        command.main(argv)
+    return excinfo.value.code
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    rules_index = tmp_path / "index.json"
+    rules_index.write_text("{}", encoding="utf-8")
+    monkeypatch.setattr(cache_module, "RULES_INDEX", rules_index)
+    for command in (autofix_soft, autofix_hard):
+        monkeypatch.setattr(command, "default_xsd_path", lambda: None)
+    path = tmp_path / "sample.xml"
+    path.write_text(SAMPLE, encoding="utf-8")
+    return path
+
+
+def _versions(tmp_path):
+    return sorted(path.name for path in tmp_path.glob("sample_v.*.xml"))
+
+
+def test_repeated_soft_run_reuses_output_and_log(source, tmp_path, capsys):
+    argv = [str(source), "--log-format", "jsonl"]
+    assert _run(autofix_soft, argv) == 0
+    (log,) = tmp_path.glob("sample_*_autofix.jsonl")
+    capsys.readouterr()
+
+    assert _run(autofix_soft, argv) == 0
+    out = capsys.readouterr().out
+    assert _versions(tmp_path) == ["sample_v.02.xml"]
+    assert str(tmp_path / "sample_v.02.xml") in out and str(log) in out
+    assert len(list(tmp_path.glob("sample_*_autofix.jsonl"))) == 1
+
+    # Outras opções, --force ou regras novas voltam a calcular.
+    assert _run(autofix_soft, argv + ["--splice"]) == 0
+    assert _run(autofix_soft, argv + ["--force"]) == 0
+    cache_module.RULES_INDEX.write_text('{"documents": []}', encoding="utf-8")
+    assert _run(autofix_soft, argv) == 0
+    assert _versions(tmp_path) == [f"sample_v.0{n}.xml" for n in range(2, 6)]
+
+
+def test_soft_run_is_recomputed_when_the_customer_listing_changes(
+    source, tmp_path, monkeypatch
+):
+    listing = tmp_path / "Listagem_de_Clientes.xlsx"
+    listing.write_bytes(b"primeira listagem")
+    monkeypatch.setenv("BWB_SAFTAO_CUSTOMER_FILE", str(listing))
+
+    assert _run(autofix_soft, [str(source)]) == 0
+    assert _run(autofix_soft, [str(source)]) == 0
+    assert _versions(tmp_path) == ["sample_v.02.xml"]
+
+    listing.write_bytes(b"segunda listagem")
+    assert _run(autofix_soft, [str(source)]) == 0
+    assert _versions(tmp_path) == ["sample_v.02.xml", "sample_v.03.xml"]
+
+
+def test_cache_entry_is_dropped_when_the_output_changes(source, tmp_path):
+    assert _run(autofix_hard, [str(source)]) == 0
+    assert _run(autofix_hard, [str(source)]) == 0
+    assert _versions(tmp_path) == ["sample_v.02.xml"]
+    assert len(list((tmp_path / CACHE_DIRNAME).glob("*.json"))) == 1
+
+    (tmp_path / "sample_v.02.xml").write_text(SAMPLE, encoding="utf-8")
+    assert _run(autofix_hard, [str(source)]) == 0
+    assert _versions(tmp_path) == ["sample_v.02.xml", "sample_v.03.xml"]
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from lxml import etree
+
+from saftao.autofix.documents import INVOICE, WORK_DOCUMENT, DocumentFixer
+from saftao.commands import autofix_hard, autofix_soft
+from saftao.tax_table import load_tax_table
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+
+class _RowLogger:
+    def __init__(self) -> None:
+        self.rows: list[tuple[tuple, dict]] = []
+
+    def log(self, *args, **kwargs) -> None:
+        kwargs.pop("xpath", None)
+        self.rows.append((args, kwargs))
+
+
+def _document(tag: str, number_tag: str, amounts: str) -> str:
+    return f"""
+      <{tag}>
+        <{number_tag}>DOC 1</{number_tag}>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>3</Quantity>
+          <UnitPrice>10.005</UnitPrice>
+          {amounts}
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>14.0</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>0.00</TaxPayable>
+          <NetTotal>0.00</NetTotal>
+          <GrossTotal>0.00</GrossTotal>
+          <Settlement>
+            <SettlementAmount>1.00</SettlementAmount>
+          </Settlement>
+        </DocumentTotals>
+      </{tag}>"""
+
+
+def _tree(document: str) -> etree._Element:
+    return etree.fromstring(f"""<AuditFile xmlns="{NAMESPACE}">
+  <MasterFiles>
+    <TaxTable>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType>
+        <TaxCode>NOR</TaxCode>
+        <Description>Normal</Description>
+        <TaxPercentage>14</TaxPercentage>
+      </TaxTableEntry>
+    </TaxTable>
+  </MasterFiles>
+  <SourceDocuments>{document}
+  </SourceDocuments>
+</AuditFile>""")
+
+
+def _fix(root, family, rules_for) -> etree._Element:
+    document = root.find(f".//{{{NAMESPACE}}}{family.document}")
+    table = load_tax_table(root, NAMESPACE)
+    rules_for(root, table).fix(document, set())
+    return document
+
+
+def _totals(document) -> dict[str, str]:
+    totals = document.find(f"{{{NAMESPACE}}}DocumentTotals")
+    return {etree.QName(el).localname: el.text for el in totals if el.text.strip()}
+
+
+def test_invoice_and_work_document_share_the_soft_fixes():
+    logs = []
+    fixed = []
+    for family in (INVOICE, WORK_DOCUMENT):
+        logger = _RowLogger()
+        root = _tree(
+            _document(family.document, family.number, "<CreditAmount>1</CreditAmount>")
+        )
+        document = _fix(
+            root,
+            family,
+            lambda root, table: autofix_soft.document_fixer(
+                family, root, NAMESPACE, table, logger
+            ),
+        )
+        logs.append(logger.rows)
+        fixed.append(document)
+
+    assert logs[0] == logs[1]
+    codes = [args[0] for args, _ in logs[0]]
+    assert codes == [
+        "FIX_LINE_AMOUNT",
+        "FIX_TAX_PERCENT",
+        "ADD_NODE",
+        "FIX_TOTAL",
+        "FIX_TOTAL",
+        "FIX_TOTAL",
+    ]
+    for document in fixed:
+        line = document.find(f"{{{NAMESPACE}}}Line")
+        assert line.findtext(f"{{{NAMESPACE}}}CreditAmount") == "30.02"
+        assert _totals(document) == {
+            "TaxPayable": "4.20",
+            "NetTotal": "30.02",
+            "GrossTotal": "33.22",
+        }
+
+
+def test_hard_rules_keep_debit_only_and_ignore_settlement():
+    root = _tree(
+        _document(
+            "Invoice",
+            "InvoiceNo",
+            "<DebitAmount>1</DebitAmount><CreditAmount>1</CreditAmount>",
+        )
+    )
+    document = _fix(
+        root,
+        INVOICE,
+        lambda root, table: DocumentFixer(
+            INVOICE, NAMESPACE, autofix_hard.line_rules(root, NAMESPACE, table)
+        ),
+    )
+
+    line = document.find(f"{{{NAMESPACE}}}Line")
+    assert line.find(f"{{{NAMESPACE}}}CreditAmount") is None
+    assert line.findtext(f"{{{NAMESPACE}}}DebitAmount") == "30.02"
+    totals = document.find(f"{{{NAMESPACE}}}DocumentTotals")
+    assert [etree.QName(el).localname for el in totals][:3] == [
+        "NetTotal",
+        "TaxPayable",
+        "GrossTotal",
+    ]
+    assert _totals(document)["GrossTotal"] == "34.22"
+
+
+def test_hard_workers_give_the_serial_result(monkeypatch):
+    monkeypatch.setattr(autofix_hard, "INVOICE_BATCH_SIZE", 1)
+    invoices = "".join(
+        _document("Invoice", "InvoiceNo", "<CreditAmount>1</CreditAmount>")
+        .replace("DOC 1", f"FT {index}")
+        .replace("14.0", percentage)
+        for index, percentage in enumerate(("14.0", "5", "7", "5.00"))
+    )
+    source = etree.tostring(_tree(f"<SalesInvoices>{invoices}</SalesInvoices>"))
+
+    results = []
+    for workers in (1, 2):
+        tree = etree.ElementTree(etree.fromstring(source))
+        autofix_hard.fix_xml(tree, "sample.xml", workers=workers)
+        results.append(etree.tostring(tree))
+
+    assert results[0] == results[1]
+    table = load_tax_table(etree.fromstring(results[1]), NAMESPACE)
+    assert len(table) == 3
@@ -26,10 +26,7 @@ def test_main_uses_cli_xsd_override(tmp_path, monkeypatch, capsys):
 """
     )
 
-    monkeypatch.setattr(
-        autofix_hard, "repair_workdocument_balance_in_file", lambda _path: False
-    )
-    monkeypatch.setattr(autofix_hard, "fix_xml", lambda tree, _path: tree)
+    monkeypatch.setattr(autofix_hard, "fix_xml", lambda tree, _path, workers=1: tree)
 
     captured: dict[str, Path] = {}
 
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from lxml import etree
+
+from saftao.autofix.scope import FixScope, load_scope
+from saftao.commands import autofix_soft
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+
+def _invoice(number: str, amount: str) -> str:
+    return f"""
+      <Invoice>
+        <InvoiceNo>{number}</InvoiceNo>
+        <InvoiceType>FT</InvoiceType>
+        <CustomerID>C1</CustomerID>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>1</Quantity>
+          <UnitPrice>100.00</UnitPrice>
+          <CreditAmount>{amount}</CreditAmount>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>14</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>0.00</TaxPayable>
+          <NetTotal>0.00</NetTotal>
+          <GrossTotal>0.00</GrossTotal>
+        </DocumentTotals>
+      </Invoice>"""
+
+
+SAMPLE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<AuditFile xmlns="{NAMESPACE}">
+  <Header>
+    <TaxRegistrationNumber>AO-123456789</TaxRegistrationNumber>
+  </Header>
+  <MasterFiles>
+    <Customer>
+      <CustomerID>C1</CustomerID>
+    </Customer>
+    <TaxTable>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType>
+        <TaxCode>NOR</TaxCode>
+        <Description>Normal</Description>
+        <TaxPercentage>14.000</TaxPercentage>
+      </TaxTableEntry>
+    </TaxTable>
+  </MasterFiles>
+  <SourceDocuments>
+    <SalesInvoices>{_invoice("FT 1/1", "90")}{_invoice("FT 1/2", "90")}
+    </SalesInvoices>
+  </SourceDocuments>
+</AuditFile>
+"""
+
+
+def _find(root, path: str):
+    return root.find(path.replace("n:", f"{{{NAMESPACE}}}"))
+
+
+def test_scope_matches_numbers_paths_lines_and_header_codes():
+    root = etree.fromstring(SAMPLE.encode())
+    tree = root.getroottree()
+    first, second = root.iterfind(f".//{{{NAMESPACE}}}Invoice")
+    entry = _find(root, ".//n:TaxTableEntry")
+    customer = _find(root, ".//n:Customer")
+    header = _find(root, "n:Header")
+
+    scope = FixScope.from_rows(
+        [
+            {"code": "AMT_MISMATCH", "invoice": "FT 1/2", "xpath": ""},
+            {"code": "PCT_FORMAT", "xpath": tree.getpath(entry[3])},
+        ]
+    )
+    assert not scope.covers(first) and scope.covers(second)
+    assert scope.covers(entry, tree.getpath(entry))
+    assert not scope.covers(customer, tree.getpath(customer))
+    assert not scope.covers(header, tree.getpath(header))
+
+    scope = FixScope.from_rows(
+        [
+            {"code": "XSD_ERROR", "line": first[4].sourceline},
+            {
+                "code": "CUSTOMER_WRONG_NAMESPACE",
+                "extra": json.dumps({"customer_id": "C1"}),
+            },
+            {"code": "HEADER_TAX_ID_INVALID"},
+        ]
+    )
+    assert scope.covers(first) and not scope.covers(second)
+    assert scope.covers(customer) and scope.covers(header)
+
+
+def test_autofix_only_issues_copies_other_documents(tmp_path, monkeypatch):
+    source = tmp_path / "sample.xml"
+    source.write_text(SAMPLE, encoding="utf-8")
+    issues = tmp_path / "issues.jsonl"
+    issues.write_text(
+        json.dumps(
+            {
+                "code": "TAX_COUNTRY_REGION_MISSING",
+                "invoice": "Invoice FT 1/2",
+                "extra": json.dumps({"document_id": "FT 1/2"}),
+            }
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+    assert load_scope(issues).documents == {"FT 1/2"}
+    monkeypatch.setattr(autofix_soft, "default_xsd_path", lambda: None)
+    monkeypatch.chdir(tmp_path)
+
+    outputs = []
+    for mode in ("dom", "stream"):
+        argv = [str(source), "--only-issues", str(issues), "--log-format", "jsonl"]
+        argv += ["--output-dir", str(tmp_path / mode)]
+        with pytest.raises(SystemExit) as excinfo:
+            autofix_soft.main(argv + (["--stream"] if mode == "stream" else []))
+        assert excinfo.value.code == 0
+        outputs.append(etree.parse(str(tmp_path / mode / "sample_v.02.xml")).getroot())
+
+    dom = (tmp_path / "dom" / "sample_v.02.xml").read_text(encoding="utf-8")
+    assert _invoice("FT 1/1", "90") in dom
+    assert "AO-123456789" in dom and "<TaxPercentage>14.000</TaxPercentage>" in dom
+    for root in outputs:
+        first, second = root.iterfind(f".//{{{NAMESPACE}}}Invoice")
+        assert _find(first, ".//n:CreditAmount").text == "90"
+        assert _find(second, ".//n:CreditAmount").text == "100.00"
+        assert _find(second, ".//n:TaxCountryRegion").text == "AO"
+        assert _find(second, ".//n:GrossTotal").text == "114.00"
+    assert etree.tostring(outputs[0], method="c14n") == etree.tostring(
+        outputs[1], method="c14n"
+    )
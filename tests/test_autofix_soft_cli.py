@@ -11,9 +11,15 @@
 class _DummyLogger:
     instance: "_DummyLogger | None" = None
 
-    def __init__(self, base_name: str, output_dir: Path | None = None) -> None:  # pragma: no cover - trivial
+    def __init__(
+        self,
+        base_name: str,
+        output_dir: Path | None = None,
+        log_format: str = "xlsx",
+    ) -> None:  # pragma: no cover - trivial
         self.base_name = base_name
         self.output_dir = output_dir
+        self.log_format = log_format
         self.records: list[tuple[tuple[Any, ...], dict[str, Any]]] = []
         _DummyLogger.instance = self
 
@@ -45,10 +51,7 @@ def test_main_uses_cli_xsd_override(tmp_path, monkeypatch):
 
     monkeypatch.setattr(autofix_soft, "ExcelLogger", _DummyLogger)
     monkeypatch.setattr(
-        autofix_soft, "repair_workdocument_balance_in_file", lambda _path: False
-    )
-    monkeypatch.setattr(
-        autofix_soft, "fix_xml", lambda tree, _path, _logger: tree
+        autofix_soft, "fix_xml", lambda tree, _path, _logger, _scope=None: tree
     )
 
     captured: dict[str, Path] = {}
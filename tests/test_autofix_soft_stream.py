@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from saftao.commands import autofix_soft
+from saftao.schema import load_schema
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+
+class _RowLogger:
+    def __init__(self) -> None:
+        self.rows: list[tuple[tuple, dict]] = []
+
+    def log(self, *args, **kwargs) -> None:
+        if kwargs.get("xpath") is not None:
+            kwargs["xpath"] = str(kwargs["xpath"])
+        self.rows.append((args, kwargs))
+
+
+def _invoice(number: int, invoice_type: str, pct: str) -> str:
+    return f"""
+      <Invoice>
+        <InvoiceNo>FT 1/{number}</InvoiceNo>
+        <InvoiceType>{invoice_type}</InvoiceType>
+        <CustomerID>C1</CustomerID>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>2</Quantity>
+          <UnitPrice>50.00</UnitPrice>
+          <DebitAmount>100.00</DebitAmount>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>{pct}</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>0.00</TaxPayable>
+          <NetTotal>0.00</NetTotal>
+          <GrossTotal>0.00</GrossTotal>
+        </DocumentTotals>
+      </Invoice>"""
+
+
+def _sample_xml() -> str:
+    invoices = "".join(
+        _invoice(n, "VD" if n == 2 else "FT", pct)
+        for n, pct in ((1, "14.00"), (2, "7.0"), (3, "7"))
+    )
+    return f"""<?xml version='1.0' encoding='UTF-8'?>
+<!-- exportado pelo ERP -->
+<AuditFile xmlns="{NAMESPACE}">
+  <Header>
+    <CompanyID>123456789</CompanyID>
+  </Header>
+  <MasterFiles>
+    <Customer>
+      <CustomerID>C1</CustomerID>
+    </Customer>
+  </MasterFiles>
+  <SourceDocuments>
+    <SalesInvoices>
+      <NumberOfEntries>3</NumberOfEntries>{invoices}
+    </SalesInvoices>
+    <Payments>
+      <Payment>
+        <PaymentRefNo>RC 1</PaymentRefNo>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <CreditAmount>100.00</CreditAmount>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>14</TaxPercentage>
+          </Tax>
+        </Line>
+      </Payment>
+    </Payments>
+  </SourceDocuments>
+</AuditFile>
+"""
+
+
+def _one_line(xml: str) -> bytes:
+    parser = etree.XMLParser(remove_blank_text=True)
+    tree = etree.parse(BytesIO(xml.encode()), parser)
+    return etree.tostring(tree, xml_declaration=True, encoding="UTF-8")
+
+
+def _mixed(xml: str) -> bytes:
+    # Só parte do ficheiro indentado: o libxml2 deixa de indentar a secção.
+    data = _one_line(xml)
+    return data.replace(b"<NumberOfEntries>", b"\n<NumberOfEntries>", 1)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [_sample_xml().encode(), _one_line(_sample_xml()), _mixed(_sample_xml())],
+    ids=["indented", "one-line", "mixed"],
+)
+def test_stream_output_and_log_match_dom(data):
+    dom_logger = _RowLogger()
+    tree = etree.parse(BytesIO(data))
+    autofix_soft.fix_xml(tree, Path("sample.xml"), dom_logger)
+    expected = BytesIO()
+    tree.write(expected, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+
+    stream_logger = _RowLogger()
+    skeleton = autofix_soft.scan_stream(BytesIO(data), stream_logger)
+    output = BytesIO()
+    autofix_soft.fix_xml_stream(BytesIO(data), skeleton, output, stream_logger)
+
+    assert output.getvalue() == expected.getvalue()
+    assert stream_logger.rows == dom_logger.rows
+    codes = [args[0] for args, _ in stream_logger.rows]
+    assert "ADD_TAXTABLEENTRY" in codes and "FIX_INVOICE_TYPE" in codes
+
+
+def test_stream_xsd_errors_keep_the_lines_of_the_written_file(tmp_path):
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    data = _sample_xml().encode()
+    skeleton = autofix_soft.scan_stream(BytesIO(data), _RowLogger())
+    written = tmp_path / "sample_v.02.xml"
+    with written.open("wb") as output:
+        autofix_soft.fix_xml_stream(BytesIO(data), skeleton, output, _RowLogger())
+
+    ok, errors = autofix_soft.validate_xsd_file(written, xsd_path)
+
+    expected = autofix_soft.validate_xsd(etree.parse(str(written)), xsd_path)
+    assert (ok, errors) == expected
+    assert errors and not any(error.startswith("line 0:") for error in errors)
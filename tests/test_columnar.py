@@ -0,0 +1,210 @@
+import random
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from saftao import money
+
+np = pytest.importorskip("numpy")
+
+from saftao import columnar  # noqa: E402
+from saftao.commands import validator_strict  # noqa: E402
+from saftao.commands.validator_strict import (  # noqa: E402
+    validate_business_rules,
+    validate_business_rules_stream,
+)
+from saftao.utils.reporting import aggregate_documents  # noqa: E402
+
+from .test_validator_detection import (  # noqa: E402
+    NAMESPACE,
+    _write_invalid_xml,
+    _write_prefixed_customer_xml,
+)
+from .test_validator_stream import _RowLogger, _write_multi_invoice_xml  # noqa: E402
+
+
+def test_kernels_match_scalar_money():
+    rng = random.Random(7)
+    rows = [
+        (
+            rng.randint(-(10**4), 10**4),
+            rng.randint(0, 4),
+            rng.randint(-(10**5), 10**5),
+            rng.randint(0, 8),
+            rng.choice([0, 5, 7, 14, 1425]),
+            rng.choice([0, 2]),
+        )
+        for _ in range(2000)
+    ]
+    qty, qty_s, unit, unit_s, pct, pct_s = (
+        np.array(column, dtype=np.int64) for column in zip(*rows)
+    )
+
+    assert columnar.fits_int64(qty, unit, qty_s, unit_s, 6).all()
+    base = columnar.line_base(qty, qty_s, unit, unit_s)
+    micro = np.full(len(rows), 6, dtype=np.int64)
+    assert columnar.fits_int64(base, pct, micro, pct_s + 2, 6).all()
+    tax = columnar.line_tax(base, pct, pct_s)
+    cents = columnar.micros_to_cents(base)
+    for index, (q, qs, u, us, p, ps) in enumerate(rows):
+        expected = money.line_base((q, qs), (u, us))
+        assert base[index] == expected
+        assert tax[index] == money.line_tax(expected, (p, ps))
+        assert cents[index] == money.micros_to_cents(expected)
+
+
+def test_fits_int64_rejects_overflowing_rows():
+    big = np.array([3 * 10**9, 10], dtype=np.int64)
+    scale = np.array([0, 0], dtype=np.int64)
+
+    assert columnar.fits_int64(big, big, scale, scale, 6).tolist() == [False, True]
+
+
+def test_segment_sum_handles_empty_segments():
+    values = np.array([1, 2, 3, 4], dtype=np.int64)
+    owners = np.array([0, 0, 2, 4], dtype=np.int64)
+
+    assert columnar.segment_sum(values, owners, 6).tolist() == [3, 0, 3, 0, 4, 0]
+    assert columnar.segment_sum([], [], 2).tolist() == [0, 0]
+
+
+def _invoice(number: int, debit: str, gross: str, withholding: str = "") -> str:
+    extra = (
+        f"<WithholdingTax><WithholdingTaxAmount>{withholding}"
+        "</WithholdingTaxAmount></WithholdingTax>"
+        if withholding
+        else ""
+    )
+    return f"""
+      <Invoice>
+        <InvoiceNo>FT 1/{number}</InvoiceNo>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>3</Quantity>
+          <UnitPrice>3.335</UnitPrice>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>14</TaxPercentage>
+          </Tax>
+          <CreditAmount>{debit}</CreditAmount>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>1.40</TaxPayable>
+          <NetTotal>10.01</NetTotal>
+          <GrossTotal>{gross}</GrossTotal>{extra}
+        </DocumentTotals>
+      </Invoice>"""
+
+
+def _write_amounts_xml(path: Path) -> None:
+    invoices = "".join(
+        (
+            _invoice(1, "10.01", "11.41"),
+            _invoice(2, "10.00", "11.41"),
+            _invoice(3, "10.01", "11.40"),
+            _invoice(4, "10.01", "10.41", withholding="1.00"),
+            _invoice(5, "10.01", "11.41", withholding="1.00"),
+        )
+    )
+    path.write_text(
+        f"""<?xml version='1.0' encoding='UTF-8'?>
+<AuditFile xmlns=\"{NAMESPACE}\">
+  <Header>
+    <AuditFileVersion>1.01_01</AuditFileVersion>
+  </Header>
+  <MasterFiles>
+    <TaxTable>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType>
+        <TaxCode>NOR</TaxCode>
+        <TaxPercentage>14</TaxPercentage>
+      </TaxTableEntry>
+    </TaxTable>
+  </MasterFiles>
+  <SourceDocuments>
+    <SalesInvoices>
+      <NumberOfEntries>5</NumberOfEntries>{invoices}
+    </SalesInvoices>
+  </SourceDocuments>
+</AuditFile>
+""",
+        encoding="utf-8",
+    )
+
+
+def _rows(xml_path: Path, *, stream: bool, backend: str) -> tuple[bool, list]:
+    logger = _RowLogger()
+    if stream:
+        ok = validate_business_rules_stream(xml_path, logger, backend=backend)
+    else:
+        tree = etree.parse(str(xml_path))
+        ok = validate_business_rules(tree, logger, backend=backend)
+    return ok, logger.rows
+
+
+def test_numpy_backend_matches_python_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(validator_strict, "COLUMN_BATCH_SIZE", 2)
+    writers = (
+        _write_invalid_xml,
+        _write_prefixed_customer_xml,
+        _write_multi_invoice_xml,
+        _write_amounts_xml,
+    )
+    for index, writer in enumerate(writers):
+        xml_path = tmp_path / f"sample_{index}.xml"
+        writer(xml_path)
+
+        expected = _rows(xml_path, stream=False, backend="python")
+        for stream in (False, True):
+            assert _rows(xml_path, stream=stream, backend="numpy") == expected
+
+
+def test_numpy_backend_only_reports_mismatching_invoices(tmp_path):
+    xml_path = tmp_path / "amounts.xml"
+    _write_amounts_xml(xml_path)
+
+    ok, rows = _rows(xml_path, stream=False, backend="numpy")
+
+    assert not ok
+    strict = [
+        (code, kwargs["ctx"]["invoice"])
+        for code, _, kwargs in rows
+        if code.startswith(("AMT_", "TOTALS_"))
+    ]
+    assert strict == [
+        ("AMT_MISMATCH", "FT 1/2"),
+        ("TOTALS_XML_MISMATCH", "FT 1/3"),
+        ("TOTALS_XML_MISMATCH", "FT 1/5"),
+    ]
+
+
+def test_report_numpy_backend_matches_python(tmp_path):
+    def tax(pct: str, amount: str) -> str:
+        percentage = f"<TaxPercentage>{pct}</TaxPercentage>" if pct else ""
+        return f"<Line><Tax>{percentage}<TaxAmount>{amount}</TaxAmount></Tax></Line>"
+
+    invoices = [
+        ("FT", [tax("14", "1.40"), tax("7", "0.7"), tax("14", "2.005")]),
+        ("NC", [tax("14", "-1.40")]),
+        ("FT", []),
+        ("FR", [tax("", "3.00"), tax("", "0"), tax("14", "1E+2")]),
+    ]
+    body = "".join(
+        f"""<Invoice><InvoiceType>{kind}</InvoiceType>
+        <InvoiceDate>2024-0{n}-01</InvoiceDate>{"".join(lines)}
+        <DocumentTotals><TaxPayable>1.00</TaxPayable><NetTotal>10.00</NetTotal>
+        <GrossTotal>11.00</GrossTotal></DocumentTotals></Invoice>"""
+        for n, (kind, lines) in enumerate(invoices, start=1)
+    )
+    root = etree.fromstring(
+        f"<AuditFile xmlns='{NAMESPACE}'><SourceDocuments><SalesInvoices>"
+        f"{body}</SalesInvoices></SourceDocuments></AuditFile>"
+    )
+
+    expected = aggregate_documents(root, NAMESPACE)
+    result = aggregate_documents(root, NAMESPACE, backend="numpy")
+
+    assert repr(result) == repr(expected)
+    assert str(result.overall_totals.tax_by_rate["IVA-14%"]) == "104.805"
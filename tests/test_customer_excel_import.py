@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
 from lxml import etree
@@ -420,3 +421,31 @@ def test_payment_customers_are_imported(tmp_path, monkeypatch):
         namespaces=NS,
     )
     assert len(customer) == 1
+
+
+def test_customer_listing_index_is_reused_until_the_file_changes(
+    tmp_path, monkeypatch
+):
+    import saftao.autofix.soft as soft_module
+
+    excel_path = tmp_path / "clientes.xlsx"
+    _create_excel(excel_path, country="Angola")
+
+    records = soft_module._lookup_customer_records(excel_path, ["1001", "404"])
+    assert list(records) == ["1001"]
+    assert records["1001"]["country"] == "AO"
+    assert (tmp_path / ".saftao-cache" / "clientes.xlsx.sqlite").is_file()
+
+    def _fail(_path):
+        raise AssertionError("the listing should not be read again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(soft_module, "_iter_records_from_excel", _fail)
+        cached = soft_module._lookup_customer_records(excel_path, ["1001"])
+    assert cached == {"1001": records["1001"]}
+
+    _create_excel(excel_path, customer_id="2002", customer_name="Cliente 2002")
+    os.utime(excel_path, ns=(0, 10**18))
+    records = soft_module._lookup_customer_records(excel_path, ["1001", "2002"])
+    assert list(records) == ["2002"]
+    assert records["2002"]["company_name"] == "Cliente 2002"
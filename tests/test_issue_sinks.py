@@ -0,0 +1,86 @@
+import csv
+import json
+import sqlite3
+
+import pytest
+from openpyxl import load_workbook
+
+from saftao.commands import autofix_hard
+from saftao.logging import LOG_FORMATS, open_issue_sink, read_issue_log
+
+COLUMNS = ["code", "message", "line"]
+ROWS = [
+    ["AMT_FORMAT", "Montante inválido", 3],
+    ["TOTALS", "Soma, com vírgula", None],
+]
+
+
+def _read_back(path, log_format):
+    if log_format == "xlsx":
+        worksheet = load_workbook(path).active
+        return [list(row) for row in worksheet.iter_rows(min_row=2, values_only=True)]
+    if log_format == "csv":
+        with path.open(encoding="utf-8", newline="") as handle:
+            return list(csv.reader(handle))[1:]
+    if log_format == "jsonl":
+        lines = path.read_text(encoding="utf-8").splitlines()
+        return [list(json.loads(line).values()) for line in lines]
+    connection = sqlite3.connect(str(path))
+    try:
+        return [list(row) for row in connection.execute('SELECT * FROM "Log"')]
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("log_format", LOG_FORMATS)
+def test_issue_sink_round_trip(tmp_path, log_format):
+    with open_issue_sink(tmp_path / "log", COLUMNS, log_format) as sink:
+        for row in ROWS:
+            sink.write(row)
+
+    assert sink.path == tmp_path / f"log.{log_format}"
+    rows = _read_back(sink.path, log_format)
+    if log_format == "csv":
+        assert rows == [
+            ["AMT_FORMAT", "Montante inválido", "3"],
+            ["TOTALS", "Soma, com vírgula", ""],
+        ]
+    else:
+        assert rows == ROWS
+
+
+def test_open_issue_sink_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_issue_sink(tmp_path / "log", COLUMNS, "xls")
+
+
+def test_autofix_hard_writes_log_when_requested(tmp_path, monkeypatch):
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text("<AuditFile />", encoding="utf-8")
+    monkeypatch.setattr(autofix_hard, "fix_xml", lambda tree, _path, workers=1: tree)
+    monkeypatch.setattr(autofix_hard, "default_xsd_path", lambda: None)
+
+    output_dir = tmp_path / "out"
+    with pytest.raises(SystemExit):
+        autofix_hard.main(
+            [str(xml_path), "--output-dir", str(output_dir), "--log-format", "jsonl"]
+        )
+
+    (log_path,) = output_dir.glob("sample_*_autofix_hard.jsonl")
+    codes = [
+        json.loads(line)["action_code"]
+        for line in log_path.read_text(encoding="utf-8").splitlines()
+    ]
+    assert codes == ["INFO_START", "XSD_MISSING", "INFO_END"]
+
+
+@pytest.mark.parametrize("log_format", LOG_FORMATS)
+def test_read_issue_log_returns_rows_by_column(tmp_path, log_format):
+    with open_issue_sink(tmp_path / "log", COLUMNS, log_format) as sink:
+        for row in ROWS:
+            sink.write(row)
+
+    rows = list(read_issue_log(sink.path))
+    assert [row["code"] for row in rows] == ["AMT_FORMAT", "TOTALS"]
+    assert str(rows[0]["line"]) == "3"
+    assert rows[1]["message"] == "Soma, com vírgula"
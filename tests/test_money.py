@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import pytest
+
+from saftao import money
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("12.50", (1250, 2)),
+        (" 7 ", (7, 0)),
+        (".5", (5, 1)),
+        ("-0.005", (-5, 3)),
+        ("1.50 ", (150, 2)),
+        ("1E+3", (1000, 0)),
+        ("", None),
+        ("abc", None),
+        ("NaN", None),
+    ],
+)
+def test_parse_scaled(text, expected):
+    assert money.parse_scaled(text) == expected
+
+
+def test_rounding_ties_go_away_from_zero():
+    assert money.q2(money.parse_scaled("0.005")) == 1
+    assert money.q2(money.parse_scaled("-0.005")) == -1
+    assert money.q2(money.parse_scaled("0.0049999")) == 0
+    assert money.line_base((3, 0), money.parse_scaled("0.3333335")) == 1000001
+
+
+def test_keeps_unit_price_precision_beyond_micro_units():
+    qty, unit = money.parse_scaled("1000"), money.parse_scaled("0.00000049")
+
+    assert money.line_base(qty, unit) == 490
+    assert money.to_decimal(unit) == Decimal("0.00000049")
+
+
+def test_format_and_normalize():
+    assert money.format_cents(-5) == "-0.05"
+    assert money.format_cents(123456) == "1234.56"
+    assert money.normalize(money.parse_scaled("14.00")) == money.normalize((14, 0))
+    assert money.scaled_str(money.parse_scaled("14.00")) == "14.00"
@@ -0,0 +1,109 @@
+"""Property-based equivalence of :mod:`saftao.money` with the Decimal rules."""
+
+from __future__ import annotations
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given  # noqa: E402
+from hypothesis import strategies as st  # noqa: E402
+
+from saftao import money  # noqa: E402
+
+AMT2 = Decimal("0.01")
+AMT6 = Decimal("0.000001")
+HUNDRED = Decimal("100")
+
+
+def q2(value: Decimal) -> Decimal:
+    return value.quantize(AMT2, rounding=ROUND_HALF_UP)
+
+
+def q6(value: Decimal) -> Decimal:
+    return value.quantize(AMT6, rounding=ROUND_HALF_UP)
+
+
+def _decimal_text(max_whole: int, max_fraction: int):
+    return st.builds(
+        lambda sign, whole, fraction: f"{sign}{whole}{fraction}",
+        st.sampled_from(["", "-", "+"]),
+        st.text("0123456789", min_size=1, max_size=max_whole),
+        st.one_of(
+            st.just(""),
+            st.text("0123456789", max_size=max_fraction).map(lambda f: "." + f),
+        ),
+    )
+
+
+# Quantities/prices up to 12 significant digits keep every product within
+# the default 28-digit Decimal context, like real SAF-T values.
+amounts = _decimal_text(7, 8)
+percentages = _decimal_text(3, 4)
+
+
+def _micros(value: int) -> Decimal:
+    return Decimal(value).scaleb(-6)
+
+
+def _cents(value: int) -> Decimal:
+    return Decimal(value).scaleb(-2)
+
+
+@given(amounts)
+def test_parse_matches_decimal(text):
+    scaled = money.parse_scaled(text)
+
+    assert money.to_decimal(scaled) == Decimal(text)
+    if Decimal(text) != 0:  # "-0.0" keeps its sign only in Decimal
+        assert money.scaled_str(scaled) == str(Decimal(text))
+
+
+@given(amounts, amounts)
+def test_line_base_matches_q6_product(qty_text, unit_text):
+    expected = q6(Decimal(qty_text) * Decimal(unit_text))
+
+    base = money.line_base(money.parse_scaled(qty_text), money.parse_scaled(unit_text))
+
+    cents = money.micros_to_cents(base)
+    assert _micros(base) == expected
+    assert _cents(cents) == q2(expected)
+    # Decimal keeps the sign of a zero ("-0.00"); integers cannot.
+    assert money.format_cents(cents) == f"{q2(expected):.2f}".replace("-0.00", "0.00")
+
+
+@given(amounts, amounts, percentages)
+def test_line_tax_matches_decimal(qty_text, unit_text, pct_text):
+    base = q6(Decimal(qty_text) * Decimal(unit_text))
+    expected = q6(base * Decimal(pct_text) / HUNDRED)
+
+    base_micros = money.line_base(
+        money.parse_scaled(qty_text), money.parse_scaled(unit_text)
+    )
+    vat = money.line_tax(base_micros, money.parse_scaled(pct_text))
+
+    assert _micros(vat) == expected
+
+
+@given(st.lists(amounts, min_size=1, max_size=5), amounts, amounts)
+def test_gross_identity_matches_decimal(lines, settlement, withholding):
+    net = sum((q6(Decimal(text)) for text in lines), Decimal("0"))
+    expected = q2(q2(net) - Decimal(settlement) - Decimal(withholding))
+
+    net_micros = sum(money.q6(money.parse_scaled(text)) for text in lines)
+    deductions = money.neg(
+        money.add(money.parse_scaled(settlement), money.parse_scaled(withholding))
+    )
+    gross = money.q2(money.add((money.micros_to_cents(net_micros), 2), deductions))
+
+    assert _cents(gross) == expected
+
+
+@given(amounts, amounts)
+def test_compare_and_normalize_match_decimal(left, right):
+    a, b = money.parse_scaled(left), money.parse_scaled(right)
+    da, db = Decimal(left), Decimal(right)
+
+    assert money.compare(a, b) == (da > db) - (da < db)
+    assert (money.normalize(a) == money.normalize(b)) == (da == db)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from saftao.commands import apply_plan as apply_plan_command
+from saftao.commands import autofix_soft
+from saftao.plan import (
+    FieldEdit,
+    PlanError,
+    apply_plan,
+    build_plan,
+    read_plan,
+    write_plan,
+)
+from saftao.schema import load_schema
+from saftao.splice import SpliceWriter
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+SAMPLE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<AuditFile xmlns="{NAMESPACE}">
+  <Header>
+    <CompanyID>123456789</CompanyID>
+  </Header>
+  <MasterFiles>
+    <Customer>
+      <CustomerID>C1</CustomerID>
+    </Customer>
+    <TaxTable>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType>
+        <TaxCode>NOR</TaxCode>
+        <Description>Normal</Description>
+        <TaxPercentage>14</TaxPercentage>
+      </TaxTableEntry>
+    </TaxTable>
+  </MasterFiles>
+  <SourceDocuments>
+    <SalesInvoices>
+      <NumberOfEntries>2</NumberOfEntries>
+      <Invoice>
+        <InvoiceNo>FT 1/1</InvoiceNo>
+        <InvoiceType>FT</InvoiceType>
+        <CustomerID>C1</CustomerID>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>1</Quantity>
+          <UnitPrice>100.00</UnitPrice>
+          <CreditAmount>100.00</CreditAmount>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCountryRegion>AO</TaxCountryRegion>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>14</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>14.00</TaxPayable>
+          <NetTotal>100.00</NetTotal>
+          <GrossTotal>114.00</GrossTotal>
+        </DocumentTotals>
+      </Invoice>
+      <Invoice>
+        <InvoiceNo>FT 1/2</InvoiceNo>
+        <InvoiceType>FT</InvoiceType>
+        <CustomerID>C1</CustomerID>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Quantity>2</Quantity>
+          <UnitPrice>50.00</UnitPrice>
+          <CreditAmount>90.00</CreditAmount>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCountryRegion>AO</TaxCountryRegion>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>7.0</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>0.00</TaxPayable>
+          <NetTotal>0.00</NetTotal>
+          <GrossTotal>0.00</GrossTotal>
+        </DocumentTotals>
+      </Invoice>
+    </SalesInvoices>
+  </SourceDocuments>
+</AuditFile>
+"""
+
+
+def _plan_and_expected(sample=SAMPLE):
+    data = sample.encode()
+    tree = etree.parse(BytesIO(data))
+    writer = SpliceWriter(tree, data)
+    recorder = autofix_soft._PlanLog(_NullLogger())
+    autofix_soft.fix_xml(tree, Path("sample.xml"), recorder)
+    plan = build_plan(writer, source="sample.xml", rows=recorder.rows)
+    expected = BytesIO()
+    writer.write_to(expected)
+    return data, plan, expected.getvalue()
+
+
+class _NullLogger:
+    stamp = "20250101T000000Z"
+
+    def log(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+@pytest.mark.parametrize("suffix", [".json", ".sqlite"])
+def test_plan_round_trip_applies_like_the_splice_writer(tmp_path, suffix):
+    data, plan, expected = _plan_and_expected()
+
+    stored = read_plan(write_plan(plan, tmp_path / f"plan{suffix}"))
+    output = BytesIO()
+    apply_plan(stored, BytesIO(data), output, chunk_size=7)
+
+    assert stored == plan
+    assert output.getvalue() == expected
+    by_path = {edit.path: edit for edit in plan.edits}
+    (table,) = by_path["/*/*[2]/*[2]"].fields
+    assert table.content and "<TaxPercentage>7</TaxPercentage>" in table.new
+    fixed = by_path["/*/*[3]/*/*[3]"]
+    assert fixed.new is None and not any(f.content for f in fixed.fields)
+    assert FieldEdit("Line/Tax/TaxPercentage", "7.0", "7") in fixed.fields
+    assert FieldEdit("DocumentTotals/GrossTotal", "0.00", "107.00") in fixed.fields
+    assert {"FIX_LINE_AMOUNT", "FIX_TAX_PERCENT", "FIX_TOTAL"} <= set(fixed.codes)
+    assert "ADD_TAXTABLEENTRY" in fixed.codes
+    assert set(by_path) == {"/*/*[2]/*[2]", "/*/*[3]/*/*[3]"}
+
+
+def test_plan_keeps_whole_elements_it_cannot_rebuild_from_fields():
+    sample = SAMPLE.replace(
+        f'<AuditFile xmlns="{NAMESPACE}">',
+        f'<AuditFile xmlns="{NAMESPACE}" xmlns:ns="{NAMESPACE}">',
+    ).replace(
+        "<Customer>\n      <CustomerID>C1</CustomerID>\n    </Customer>",
+        "<ns:Customer>\n      <ns:CustomerID>C1</ns:CustomerID>\n    </ns:Customer>",
+    )
+    data, plan, expected = _plan_and_expected(sample)
+
+    output = BytesIO()
+    apply_plan(plan, BytesIO(data), output)
+
+    assert output.getvalue() == expected
+    (customer,) = [edit for edit in plan.edits if edit.path == "/*/*[2]/*[1]"]
+    assert customer.fields == () and "<CustomerID>C1</CustomerID>" in customer.new
+    assert plan.namespaces == {None: NAMESPACE, "ns": NAMESPACE}
+
+
+def test_apply_plan_rejects_a_different_source():
+    data, plan, _ = _plan_and_expected()
+
+    with pytest.raises(PlanError):
+        apply_plan(plan, BytesIO(data.replace(b"123456789", b"987654321")), BytesIO())
+    with pytest.raises(PlanError):
+        apply_plan(plan, BytesIO(data.replace(b"FT 1/2", b"FT 9/2")), BytesIO())
+
+
+def test_autofix_plan_then_apply_plan(tmp_path, monkeypatch):
+    source = tmp_path / "sample.xml"
+    source.write_text(SAMPLE, encoding="utf-8")
+    monkeypatch.setattr(
+        autofix_soft, "ExcelLogger", lambda *args, **kwargs: _NullLogger()
+    )
+    monkeypatch.setattr(autofix_soft, "default_xsd_path", lambda: None)
+    monkeypatch.setattr(apply_plan_command, "default_xsd_path", lambda: None)
+
+    with pytest.raises(SystemExit) as excinfo:
+        autofix_soft.main([str(source), "--plan", "--plan-format", "sqlite"])
+    assert excinfo.value.code == 0
+    assert not list(tmp_path.glob("sample_v.*"))
+    (plan_path,) = tmp_path.glob("sample_*_autofix_plan.sqlite")
+
+    assert apply_plan_command.main([str(plan_path), str(source)]) == 0
+    _, _, expected = _plan_and_expected()
+    assert (tmp_path / "sample_v.02.xml").read_bytes() == expected
+
+
+def test_apply_plan_reports_the_xsd_lines_of_the_written_file(
+    tmp_path, monkeypatch, capsys
+):
+    source = tmp_path / "sample.xml"
+    source.write_text(SAMPLE, encoding="utf-8")
+    monkeypatch.setattr(
+        autofix_soft, "ExcelLogger", lambda *args, **kwargs: _NullLogger()
+    )
+    monkeypatch.setattr(autofix_soft, "default_xsd_path", lambda: None)
+    with pytest.raises(SystemExit):
+        autofix_soft.main([str(source), "--plan"])
+    (plan_path,) = tmp_path.glob("sample_*_autofix_plan.json")
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    capsys.readouterr()
+
+    argv = [str(plan_path), str(source), "--xsd", str(xsd_path)]
+    assert apply_plan_command.main(argv) == 2
+
+    written = tmp_path / "sample_v.02_invalido.xml"
+    _ok, expected = autofix_soft.validate_xsd(etree.parse(str(written)), xsd_path)
+    printed = [
+        line[len(" - ") :]
+        for line in capsys.readouterr().out.splitlines()
+        if line.startswith(" - ")
+    ]
+    assert printed == expected[:50]
+    assert printed and not any(line.startswith("line 0:") for line in printed)
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import os
+import pickle
+import shutil
 from decimal import Decimal
 
+import pytest
 from openpyxl import load_workbook
 
+from saftao.logging import read_issue_log
 from saftao.schema import load_audit_file
 from saftao.commands import report as report_command
+from saftao.utils import reporting
 from saftao.utils.reporting import (
     aggregate_documents,
+    aggregate_documents_stream,
+    ReportData,
     default_report_destination,
+    merge_reports,
     write_excel_report,
+    write_report_tables,
 )
 
 
@@ -97,8 +107,7 @@ def test_aggregate_documents_totals(tmp_path):
     assert report_data.overall_totals.tax_total == Decimal("17.00")
     assert report_data.overall_totals.gross_total == Decimal("102.00")
 
-    assert len(report_data.non_accounting_documents) == 2
-    first_doc = report_data.non_accounting_documents[0]
+    first_doc, _second_doc = report_data.non_accounting_documents
     assert first_doc.document_type == "GT"
     assert first_doc.document_number == "GT 1"
     assert first_doc.totals.net_total == Decimal("12.50")
@@ -106,6 +115,47 @@ def test_aggregate_documents_totals(tmp_path):
     assert first_doc.totals.gross_total == Decimal("15.00")
 
 
+def test_streamed_aggregation_matches_the_dom(tmp_path):
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text(
+        SAMPLE_XML.replace(
+            "<SourceDocuments>",
+            "<MasterFiles><Customer><CustomerID>C1</CustomerID></Customer>"
+            "</MasterFiles><SourceDocuments>",
+        ),
+        encoding="utf-8",
+    )
+
+    _tree, root, namespace = load_audit_file(xml_path)
+
+    assert aggregate_documents_stream(xml_path) == aggregate_documents(
+        root, namespace
+    )
+
+
+def test_merged_reports_sum_the_files(tmp_path):
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text(SAMPLE_XML, encoding="utf-8")
+    report = aggregate_documents_stream(xml_path)
+
+    assert report.merge(ReportData.empty()) == report
+    assert merge_reports([report, report]) == report.merge(report)
+    assert report.merge(report).merge(report) == report.merge(report.merge(report))
+
+    merged = merge_reports([report, report])
+    assert merged.totals_by_type["FT"].net_total == Decimal("200.00")
+    assert merged.overall_totals.gross_total == 2 * report.overall_totals.gross_total
+    assert len(merged.non_accounting_documents) == 4
+    assert [doc.document_number for doc in merged.non_accounting_documents] == [
+        "GT 1",
+        "RQ 1",
+        "GT 1",
+        "RQ 1",
+    ]
+    assert merged.tax_rates == report.tax_rates
+    assert pickle.loads(pickle.dumps(merged)) == merged
+
+
 def test_excel_report_contains_non_accounting_section(tmp_path):
     xml_path = tmp_path / "sample.xml"
     xml_path.write_text(SAMPLE_XML, encoding="utf-8")
@@ -141,6 +191,106 @@ def test_excel_report_contains_non_accounting_section(tmp_path):
     assert ("RQ", "RQ 1") == other_rows[2][:2]
 
 
+def test_excel_report_sheets_keep_values_and_styles(tmp_path, monkeypatch):
+    template = reporting._template_path()
+    if template is None:
+        pytest.skip("template de totais não disponível")
+    monkeypatch.setattr(reporting, "_TEMPLATE_CACHE", {})
+    styles = reporting._load_template_styles()
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text(SAMPLE_XML, encoding="utf-8")
+    report = aggregate_documents_stream(xml_path)
+    excel_path = tmp_path / "report.xlsx"
+
+    write_excel_report(
+        merge_reports([report, report]),
+        excel_path,
+        by_file={"janeiro": report, "fevereiro": report},
+    )
+
+    workbook = load_workbook(excel_path)
+    assert workbook.sheetnames == [
+        "Resumo",
+        "Por ficheiro",
+        "Documentos não contabilísticos",
+    ]
+    assert {
+        f"saftao {attribute}" for attribute in reporting._TEMPLATE_CELLS
+    } <= set(workbook.named_styles)
+    number_format = styles.detail_number.number_format
+
+    summary = workbook["Resumo"]
+    assert [cell.value for cell in summary[1]] == [
+        "Tipo",
+        "Total sem IVA",
+        "Total com IVA",
+    ]
+    assert [cell.style for cell in summary[1]] == [
+        "saftao header_text",
+        "saftao header_number",
+        "saftao header_number",
+    ]
+    assert [cell.value for cell in summary[2]] == ["FT", 200, 240]
+    assert summary["A2"].style == "saftao detail_text"
+    assert summary["B2"].style == "saftao detail_number"
+    assert summary["B2"].number_format == number_format
+    assert summary["A5"].value == "Totais Gerais"
+    assert summary["A5"].style == "saftao subtotal_text"
+    assert summary["B5"].style == "saftao subtotal_number"
+
+    files = workbook["Por ficheiro"]
+    assert files["A1"].value == "Ficheiro: janeiro"
+    assert files["A1"].style == "saftao month_cell"
+    assert [cell.value for cell in files[3]] == ["FT", 100, 120]
+    assert files["C3"].number_format == number_format
+    assert files["A5"].value == "Subtotal janeiro"
+    assert files["A7"].value == "Ficheiro: fevereiro"
+
+    other = workbook["Documentos não contabilísticos"]
+    assert [cell.style for cell in other[1]] == [
+        *["saftao header_text"] * 4,
+        *["saftao header_number"] * 3,
+    ]
+    rows = [[cell.value for cell in row] for row in other.iter_rows(min_row=2)]
+    assert rows == [
+        ["GT", "GT 1", "2023-01-03", "C2", 12.5, 2.5, 15],
+        ["RQ", "RQ 1", "2023-01-04", "C3", 5, 1, 6],
+    ] * 2
+    assert [cell.style for cell in other[2]] == [
+        *["saftao detail_text"] * 4,
+        *["saftao detail_number"] * 3,
+    ]
+    assert other["E2"].number_format == number_format
+
+
+def test_template_styles_are_cached_until_the_template_changes(
+    tmp_path, monkeypatch
+):
+    original = reporting._template_path()
+    if original is None:
+        pytest.skip("template de totais não disponível")
+    template = tmp_path / original.name
+    shutil.copy(original, template)
+    monkeypatch.setattr(reporting, "_template_path", lambda: template)
+    monkeypatch.setattr(reporting, "_TEMPLATE_CACHE", {})
+
+    styles = reporting._load_template_styles()
+    assert reporting._load_template_styles() is styles
+
+    stat = template.stat()
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert reporting._load_template_styles() is not styles
+
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text(SAMPLE_XML, encoding="utf-8")
+    excel_path = tmp_path / "report.xlsx"
+    for _ in range(2):
+        write_excel_report(aggregate_documents_stream(xml_path), excel_path)
+    summary = load_workbook(excel_path)["Resumo"]
+    assert summary["A1"].style == "saftao header_text"
+    assert summary["B2"].number_format == styles.detail_number.number_format
+
+
 def test_default_report_destination_uses_env_override(tmp_path, monkeypatch):
     saft_path = tmp_path / "Empresa.xml"
     saft_path.write_text("<AuditFile />", encoding="utf-8")
@@ -163,3 +313,166 @@ def test_report_command_generates_file_in_default_directory(tmp_path, monkeypatc
     assert exit_code == 0
     expected = destination_dir / "sample_totais.xlsx"
     assert expected.exists()
+
+
+def test_report_command_merges_the_files_of_a_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "safts"
+    folder.mkdir()
+    for name in ("janeiro", "fevereiro"):
+        (folder / f"{name}.xml").write_text(SAMPLE_XML, encoding="utf-8")
+    (folder / "notas.txt").write_text("ignorar", encoding="utf-8")
+    destination_dir = tmp_path / "reports"
+    monkeypatch.setenv("SAFTAO_REPORT_DIR", str(destination_dir))
+
+    assert report_command.main([str(folder), "--stream"]) == 0
+
+    workbook = load_workbook(destination_dir / "safts_totais.xlsx")
+    titles = [row[0] for row in workbook["Por ficheiro"].iter_rows(values_only=True)]
+    assert "Ficheiro: fevereiro" in titles and "Ficheiro: janeiro" in titles
+    other_rows = list(
+        workbook["Documentos não contabilísticos"].iter_rows(values_only=True)
+    )
+    assert len(other_rows) == 5
+
+
+def test_report_command_labels_same_named_files_by_folder(tmp_path, monkeypatch):
+    for year in ("2023", "2024"):
+        folder = tmp_path / "safts" / year
+        folder.mkdir(parents=True)
+        (folder / "janeiro.xml").write_text(SAMPLE_XML, encoding="utf-8")
+    destination_dir = tmp_path / "reports"
+    monkeypatch.setenv("SAFTAO_REPORT_DIR", str(destination_dir))
+
+    argv = [
+        str(tmp_path / "safts" / "2023"),
+        str(tmp_path / "safts" / "2024"),
+        "--format",
+        "xlsx",
+        "--format",
+        "csv",
+    ]
+    assert report_command.main(argv) == 0
+
+    workbook = load_workbook(destination_dir / "relatorio_totais_totais.xlsx")
+    titles = [row[0] for row in workbook["Por ficheiro"].iter_rows(values_only=True)]
+    assert "Ficheiro: 2023/janeiro" in titles and "Ficheiro: 2024/janeiro" in titles
+    totals = list(read_issue_log(destination_dir / "relatorio_totais_totais.csv"))
+    assert [row["file"] for row in totals] == [
+        "2023/janeiro",
+        "2023/janeiro",
+        "2024/janeiro",
+        "2024/janeiro",
+    ]
+    assert report_command._file_labels(
+        [tmp_path / "janeiro.xml", tmp_path / "janeiro.xml.gz", tmp_path / "b.xml"]
+    ) == ["janeiro", "janeiro (2)", "b"]
+
+
+def test_report_command_exports_flat_tables(tmp_path, monkeypatch):
+    saft_path = tmp_path / "sample.xml"
+    saft_path.write_text(SAMPLE_XML, encoding="utf-8")
+    destination_dir = tmp_path / "reports"
+    monkeypatch.setenv("SAFTAO_REPORT_DIR", str(destination_dir))
+
+    argv = [str(saft_path), "--format", "csv", "--format", "jsonl"]
+    assert report_command.main(argv) == 0
+
+    assert not (destination_dir / "sample_totais.xlsx").exists()
+    totals = list(read_issue_log(destination_dir / "sample_totais.csv"))
+    assert totals[0] == {
+        "file": "sample",
+        "month": "2023-01",
+        "document_type": "FT",
+        "net_total": "100.00",
+        "tax_total": "20.00",
+        "gross_total": "120.00",
+    }
+    assert [row["document_type"] for row in totals] == ["FT", "NC"]
+    assert list(read_issue_log(destination_dir / "sample_totais_iva.csv")) == []
+    documents = list(read_issue_log(destination_dir / "sample_totais_documentos.jsonl"))
+    assert [row["document_number"] for row in documents] == ["GT 1", "RQ 1"]
+    assert documents[0]["gross_total"] == 15.0
+    jsonl = destination_dir / "sample_totais_documentos.jsonl"
+    lines = jsonl.read_text(encoding="utf-8").splitlines()
+    assert '"net_total": 12.50, "tax_total": 2.50, "gross_total": 15.00}' in lines[0]
+
+
+@pytest.mark.parametrize(
+    "writer_cls, expected",
+    [
+        (reporting.CsvTableWriter, ["file,amount", "zero,0.00", "half,1.01"]),
+        (
+            reporting.JsonlTableWriter,
+            ['{"file": "zero", "amount": 0.00}', '{"file": "half", "amount": 1.01}'],
+        ),
+    ],
+)
+def test_table_writers_write_amounts_with_two_decimals(tmp_path, writer_cls, expected):
+    with writer_cls(tmp_path / "table", ("file", "amount"), {"amount"}) as writer:
+        writer.write(("zero", Decimal("0")))
+        writer.write(("half", Decimal("1.005")))
+
+    assert writer.path.read_text(encoding="utf-8").splitlines() == expected
+
+
+def test_table_writer_requires_a_write_method(tmp_path):
+    with pytest.raises(TypeError):
+        reporting.TableWriter(tmp_path / "table", ("file",))
+
+
+def test_parquet_writer_flushes_row_groups(tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(reporting, "PARQUET_ROW_GROUP_SIZE", 2)
+
+    path = tmp_path / "table.parquet"
+    with reporting.ParquetTableWriter(path, ("file", "amount"), {"amount"}) as writer:
+        for index in range(5):
+            writer.write((f"f{index}", Decimal(index) / 3))
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 3
+    amounts = ["0.00", "0.33", "0.67", "1.00", "1.33"]
+    assert parquet_file.read().to_pylist() == [
+        {"file": f"f{index}", "amount": Decimal(amount)}
+        for index, amount in enumerate(amounts)
+    ]
+
+
+def test_parquet_tables_keep_decimal_amounts(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    xml_path = tmp_path / "sample.xml"
+    xml_path.write_text(SAMPLE_XML, encoding="utf-8")
+
+    totals_path, tax_path, documents_path = write_report_tables(
+        {"sample": aggregate_documents_stream(xml_path)},
+        tmp_path / "sample_totais.xlsx",
+        "parquet",
+    )
+
+    amount = pa.decimal128(18, 2)
+    totals = pq.read_table(totals_path)
+    assert totals.schema == pa.schema(
+        [
+            ("file", pa.string()),
+            ("month", pa.string()),
+            ("document_type", pa.string()),
+            ("net_total", amount),
+            ("tax_total", amount),
+            ("gross_total", amount),
+        ]
+    )
+    assert totals.to_pylist()[1] == {
+        "file": "sample",
+        "month": "2023-01",
+        "document_type": "NC",
+        "net_total": Decimal("15.00"),
+        "tax_total": Decimal("3.00"),
+        "gross_total": Decimal("18.00"),
+    }
+    tax = pq.read_table(tax_path)
+    assert tax.num_rows == 0 and tax.schema.field("tax_amount").type == amount
+    documents = pq.read_table(documents_path).to_pylist()
+    assert [row["document_number"] for row in documents] == ["GT 1", "RQ 1"]
+    assert documents[0]["net_total"] == Decimal("12.50")
+    assert str(documents[0]["gross_total"]) == "15.00"
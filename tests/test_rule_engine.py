@@ -0,0 +1,63 @@
+import pytest
+from lxml import etree
+
+from saftao.rules import RuleEngine
+
+from .test_validator_detection import NAMESPACE, _write_invalid_xml
+
+
+def _collect(engine: RuleEngine) -> list[tuple[str, str]]:
+    seen: list[tuple[str, str]] = []
+    for kind in ("Header", "Customer", "Invoice", "Line", "Tax"):
+        engine.register(
+            kind,
+            lambda element, kind=kind: seen.append(
+                (kind, etree.QName(element).localname)
+            ),
+        )
+    return seen
+
+
+def test_rule_engine_dispatches_in_document_order(tmp_path):
+    xml_path = tmp_path / "invalid.xml"
+    _write_invalid_xml(xml_path)
+    tree = etree.parse(str(xml_path))
+
+    engine = RuleEngine(NAMESPACE)
+    seen = _collect(engine)
+    engine.run(tree.getroot())
+
+    assert [kind for kind, _ in seen] == [
+        "Header",
+        "Customer",
+        "Tax",
+        "Line",
+        "Invoice",
+        "Tax",
+        "Line",
+        "Tax",
+        "Line",
+    ]
+
+
+def test_rule_engine_accepts_iterparse_events(tmp_path):
+    xml_path = tmp_path / "invalid.xml"
+    _write_invalid_xml(xml_path)
+
+    dom_engine = RuleEngine(NAMESPACE)
+    dom_seen = _collect(dom_engine)
+    dom_engine.run(etree.parse(str(xml_path)).getroot())
+
+    stream_engine = RuleEngine(NAMESPACE)
+    stream_seen = _collect(stream_engine)
+    for event, element in etree.iterparse(str(xml_path), events=("start", "end")):
+        stream_engine.feed(event, element)
+
+    assert stream_seen == dom_seen
+
+
+def test_rule_engine_rejects_unknown_kind():
+    engine = RuleEngine(NAMESPACE)
+
+    with pytest.raises(ValueError):
+        engine.register("Payment", lambda element: None)
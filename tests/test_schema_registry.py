@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import os
+
+from lxml import etree
+
+from saftao.schema import SchemaRegistry, compiled_schema, load_schema
+
+_XSD = """<?xml version='1.0' encoding='UTF-8'?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="{name}" type="xs:string"/>
+</xs:schema>
+"""
+
+
+def test_registry_reuses_compiled_schema_until_file_changes(tmp_path):
+    xsd_path = tmp_path / "schema.xsd"
+    xsd_path.write_text(_XSD.format(name="a"), encoding="utf-8")
+    registry = SchemaRegistry()
+
+    first = registry.get(xsd_path)
+    assert registry.get(tmp_path / "." / "schema.xsd") is first
+    assert first.validate(etree.fromstring("<a>x</a>"))
+
+    xsd_path.write_text(_XSD.format(name="b"), encoding="utf-8")
+    stat = xsd_path.stat()
+    os.utime(xsd_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    second = registry.get(xsd_path)
+    assert second is not first
+    assert second.validate(etree.fromstring("<b>x</b>"))
+    assert len(registry) == 1
+
+
+def test_compiled_schema_shares_the_process_registry():
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+
+    assert compiled_schema(xsd_path) is compiled_schema(str(xsd_path))
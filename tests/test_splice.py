@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+from lxml import etree
+
+from saftao.splice import SpliceWriter
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+SAMPLE = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<!-- exportado pelo ERP -->
+<AuditFile xmlns="{NAMESPACE}">
+\t<Header>
+\t\t<CompanyID>123456789</CompanyID>
+\t</Header>
+\t<MasterFiles>
+\t\t<Customer>
+\t\t\t<CustomerID>C1</CustomerID>
+\t\t</Customer>
+\t\t<TaxTable>
+\t\t\t<TaxTableEntry>
+\t\t\t\t<TaxType>IVA</TaxType>
+\t\t\t\t<TaxCode>NOR</TaxCode>
+\t\t\t\t<Description>Normal</Description>
+\t\t\t\t<TaxPercentage>14</TaxPercentage>
+\t\t\t</TaxTableEntry>
+\t\t</TaxTable>
+\t</MasterFiles>
+\t<SourceDocuments>
+\t\t<SalesInvoices>
+\t\t\t<NumberOfEntries>2</NumberOfEntries>
+\t\t\t<Invoice>
+\t\t\t\t<InvoiceNo>FT 1/1</InvoiceNo>
+\t\t\t\t<CustomerID>C1</CustomerID>
+\t\t\t</Invoice>
+\t\t\t<Invoice>
+\t\t\t\t<InvoiceNo>FT 1/2</InvoiceNo>
+\t\t\t\t<CustomerID>C2</CustomerID>
+\t\t\t</Invoice>
+\t\t</SalesInvoices>
+\t</SourceDocuments>
+</AuditFile>
+"""
+
+
+def _write(writer: SpliceWriter) -> bytes:
+    output = BytesIO()
+    writer.write_to(output)
+    return output.getvalue()
+
+
+def _parse(data: bytes) -> tuple[etree._ElementTree, SpliceWriter]:
+    tree = etree.parse(BytesIO(data))
+    return tree, SpliceWriter(tree, data)
+
+
+def test_unchanged_tree_is_copied_verbatim():
+    data = SAMPLE.encode()
+    _, writer = _parse(data)
+
+    assert _write(writer) == data
+    assert writer.spliced
+
+
+def test_only_changed_elements_are_rewritten():
+    data = SAMPLE.encode()
+    tree, writer = _parse(data)
+    ns = {"n": NAMESPACE}
+    root = tree.getroot()
+    root.find(".//n:Invoice[2]/n:CustomerID", ns).text = "C1"
+    masterfiles = root.find("n:MasterFiles", ns)
+    customer = etree.Element(f"{{{NAMESPACE}}}Customer")
+    etree.SubElement(customer, f"{{{NAMESPACE}}}CustomerID").text = "C3"
+    customer.tail = "\n\t\t"
+    masterfiles.find("n:TaxTable", ns).addprevious(customer)
+
+    output = _write(writer)
+
+    assert writer.spliced
+    assert output.startswith(SAMPLE.split("<AuditFile")[0].encode())
+    assert b"<CustomerID>C2</CustomerID>" not in output
+    assert b"<Customer><CustomerID>C3</CustomerID></Customer>" in output
+    assert b"xmlns" not in output.split(b"<AuditFile", 1)[1].split(b">", 1)[1]
+    changed = [
+        line for line in output.decode().splitlines() if line not in SAMPLE.splitlines()
+    ]
+    assert changed == ["\t\t<Customer><CustomerID>C3</CustomerID></Customer>"]
+    assert etree.tostring(etree.fromstring(output), method="c14n") == etree.tostring(
+        root, method="c14n"
+    )
+
+
+def test_reordered_children_fall_back_to_full_write():
+    data = SAMPLE.encode()
+    tree, writer = _parse(data)
+    root = tree.getroot()
+    root.append(root[0])
+
+    output = _write(writer)
+
+    assert not writer.spliced
+    assert output == etree.tostring(
+        tree, pretty_print=True, xml_declaration=True, encoding="UTF-8"
+    )
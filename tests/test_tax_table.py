@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from lxml import etree
+
+from saftao.tax_table import TaxTable, load_tax_table, tax_key
+
+NAMESPACE = "urn:OECD:StandardAuditFile-Tax:AO_1.01_01"
+
+
+def _root(entries: str) -> etree._Element:
+    return etree.fromstring(f"""<AuditFile xmlns="{NAMESPACE}">
+  <MasterFiles>
+    <TaxTable>{entries}</TaxTable>
+  </MasterFiles>
+</AuditFile>""")
+
+
+def test_load_tax_table_indexes_normalised_percentages():
+    root = _root("""
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType><TaxCode>NOR</TaxCode>
+        <TaxPercentage>14.00</TaxPercentage>
+      </TaxTableEntry>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType><TaxCode>ISE</TaxCode>
+        <TaxPercentage>x</TaxPercentage>
+      </TaxTableEntry>
+      <TaxTableEntry>
+        <TaxCode>RED</TaxCode><TaxPercentage>7</TaxPercentage>
+      </TaxTableEntry>""")
+
+    table = load_tax_table(root, NAMESPACE)
+
+    assert len(table) == 2
+    assert tax_key("IVA", "NOR", "14") in table
+    assert tax_key("IVA", "NOR", (140, 1)) in table
+    assert tax_key(None, "RED", "7.0") in table
+    assert tax_key("IVA", "ISE", "x") is None
+    entries = root.findall(f".//{{{NAMESPACE}}}TaxTableEntry")
+    assert table.get(tax_key("IVA", "NOR", "14")) is entries[0]
+
+
+def test_insert_appends_entry_and_indexes_it():
+    root = _root("")
+    table = load_tax_table(root, NAMESPACE)
+
+    entry = table.insert("IVA", "RED", "5")
+
+    assert entry.getparent() is table.element
+    assert [etree.QName(child).localname for child in entry] == [
+        "TaxType",
+        "TaxCode",
+        "Description",
+        "TaxPercentage",
+    ]
+    assert table.get(tax_key("IVA", "RED", "5.00")) is entry
+    assert TaxTable(table.keys()).keys() == table.keys()
@@ -0,0 +1,284 @@
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from saftao.commands import validator_strict
+from saftao.commands.validator_strict import (
+    _validate_dom,
+    _validate_stream,
+    validate_business_rules,
+    validate_business_rules_stream,
+)
+from saftao import schema
+from saftao.schema import load_schema
+
+from .test_validator_detection import (
+    NAMESPACE,
+    _write_invalid_xml,
+    _write_prefixed_customer_xml,
+)
+
+
+class _RowLogger:
+    def __init__(self) -> None:
+        self.rows: list[tuple[str, str, dict[str, object]]] = []
+
+    def log(self, code: str, message: str, **kwargs: object) -> None:
+        if kwargs.get("xpath") is not None:
+            kwargs["xpath"] = str(kwargs["xpath"])
+        self.rows.append((code, message, kwargs))
+
+
+def _write_multi_invoice_xml(path: Path) -> None:
+    invoices = "".join(f"""
+      <Invoice>
+        <InvoiceNo>FT 1/{n}</InvoiceNo>
+        <Line>
+          <LineNumber>1</LineNumber>
+          <Tax>
+            <TaxType>IVA</TaxType>
+            <TaxCode>NOR</TaxCode>
+            <TaxPercentage>{pct}</TaxPercentage>
+          </Tax>
+        </Line>
+        <DocumentTotals>
+          <TaxPayable>1.00</TaxPayable>
+          <NetTotal>10.00</NetTotal>
+          <GrossTotal>12.00</GrossTotal>
+        </DocumentTotals>
+      </Invoice>""" for n, pct in enumerate(("14", "7", "14"), start=1))
+    path.write_text(
+        f"""<?xml version='1.0' encoding='UTF-8'?>
+<!-- exportado por teste -->
+<AuditFile xmlns=\"{NAMESPACE}\">
+  <Header>
+    <AuditFileVersion>1.00_01</AuditFileVersion>
+  </Header>
+  <MasterFiles>
+    <TaxTable>
+      <TaxTableEntry>
+        <TaxType>IVA</TaxType>
+        <TaxCode>NOR</TaxCode>
+        <TaxPercentage>14</TaxPercentage>
+      </TaxTableEntry>
+    </TaxTable>
+  </MasterFiles>
+  <SourceDocuments>
+    <SalesInvoices>
+      <NumberOfEntries>3</NumberOfEntries>{invoices}
+    </SalesInvoices>
+  </SourceDocuments>
+</AuditFile>
+""",
+        encoding="utf-8",
+    )
+
+
+def _rows_from_dom(xml_path: Path) -> tuple[bool, list]:
+    logger = _RowLogger()
+    ok = validate_business_rules(etree.parse(str(xml_path)), logger)
+    return ok, logger.rows
+
+
+def _rows_from_stream(xml_path: Path) -> tuple[bool, list]:
+    logger = _RowLogger()
+    ok = validate_business_rules_stream(xml_path, logger)
+    return ok, logger.rows
+
+
+def test_stream_matches_dom_rows(tmp_path):
+    writers = (
+        _write_invalid_xml,
+        _write_prefixed_customer_xml,
+        _write_multi_invoice_xml,
+    )
+    for index, writer in enumerate(writers):
+        xml_path = tmp_path / f"sample_{index}.xml"
+        writer(xml_path)
+
+        assert _rows_from_stream(xml_path) == _rows_from_dom(xml_path)
+
+
+def test_stream_reports_indexed_invoice_xpaths(tmp_path):
+    xml_path = tmp_path / "multi.xml"
+    _write_multi_invoice_xml(xml_path)
+
+    ok, rows = _rows_from_stream(xml_path)
+
+    assert not ok
+    xpaths = [row[2].get("xpath") for row in rows if row[0] == "TOTALS_XML_MISMATCH"]
+    assert xpaths == [
+        "/*/*[3]/*/*[2]/*[3]",
+        "/*/*[3]/*/*[3]/*[3]",
+        "/*/*[3]/*/*[4]/*[3]",
+    ]
+
+
+def test_parallel_workers_match_serial_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(validator_strict, "INVOICE_BATCH_SIZE", 1)
+    xml_path = tmp_path / "multi.xml"
+    _write_multi_invoice_xml(xml_path)
+
+    serial = _rows_from_dom(xml_path)
+
+    logger = _RowLogger()
+    ok = validate_business_rules(etree.parse(str(xml_path)), logger, workers=2)
+    assert (ok, logger.rows) == serial
+
+    logger = _RowLogger()
+    ok = validate_business_rules_stream(xml_path, logger, workers=2)
+    assert (ok, logger.rows) == serial
+
+
+def test_xsd_on_parse_matches_separate_schema_pass(tmp_path):
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    xml_path = tmp_path / "multi.xml"
+    _write_multi_invoice_xml(xml_path)
+    broken_path = tmp_path / "broken.xml"
+    broken_path.write_text(
+        xml_path.read_text(encoding="utf-8").replace("</Header>", "</Headr>"),
+        encoding="utf-8",
+    )
+
+    for path in (xml_path, broken_path):
+        separate = _RowLogger()
+        expected = _validate_stream(path, xsd_path, separate)
+        single = _RowLogger()
+        outcome = _validate_stream(path, xsd_path, single, xsd_on_parse=True)
+
+        assert outcome == expected == (False, False)
+        assert single.rows == separate.rows
+        assert any(row[0] == "XSD_ERROR" for row in single.rows)
+
+
+_PATTERN_XSD = f"""<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+    targetNamespace="{NAMESPACE}" xmlns="{NAMESPACE}"
+    elementFormDefault="qualified">
+  <xs:simpleType name="Amount">
+    <xs:restriction base="xs:string">
+      <xs:pattern value="\\d+\\.\\d{{2}}"/>
+    </xs:restriction>
+  </xs:simpleType>
+  <xs:element name="AuditFile">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Header">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="Amount" type="Amount" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+
+def test_stream_xsd_rows_keep_dom_lines(tmp_path, monkeypatch):
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    for index, writer in enumerate(
+        (_write_invalid_xml, _write_prefixed_customer_xml, _write_multi_invoice_xml)
+    ):
+        xml_path = tmp_path / f"sample_{index}.xml"
+        writer(xml_path)
+        dom = _RowLogger()
+        expected = _validate_dom(xml_path, xsd_path, dom)
+
+        for xsd_on_parse in (False, True):
+            stream = _RowLogger()
+            outcome = _validate_stream(
+                xml_path, xsd_path, stream, xsd_on_parse=xsd_on_parse
+            )
+            assert outcome == expected
+            assert stream.rows == dom.rows
+
+        lines = [row[2]["ctx"]["line"] for row in dom.rows if row[0] == "XSD_ERROR"]
+        assert lines and 0 not in lines
+
+    # Erros de faceta são localizados na leitura em fluxo, sem a árvore.
+    xsd_path = tmp_path / "amounts.xsd"
+    xsd_path.write_text(_PATTERN_XSD, encoding="utf-8")
+    xml_path = tmp_path / "amounts.xml"
+    xml_path.write_text(
+        f"""<AuditFile xmlns="{NAMESPACE}">
+  <Header>
+    <Amount>1.00</Amount>
+    <Amount>1</Amount>
+    <Amount>2.5</Amount>
+  </Header>
+</AuditFile>
+""",
+        encoding="utf-8",
+    )
+    dom = _RowLogger()
+    expected = _validate_dom(xml_path, xsd_path, dom)
+
+    def whole_tree(*args):
+        raise AssertionError("os erros deviam ser localizados em fluxo")
+
+    monkeypatch.setattr(schema, "schema_errors_from_tree", whole_tree)
+    for xsd_on_parse in (False, True):
+        stream = _RowLogger()
+        outcome = _validate_stream(
+            xml_path, xsd_path, stream, xsd_on_parse=xsd_on_parse
+        )
+        assert outcome == expected
+        assert stream.rows == dom.rows
+    lines = [row[2]["ctx"]["line"] for row in dom.rows if row[0] == "XSD_ERROR"]
+    assert lines == [4, 5]
+
+
+BAD_EXAMPLES = Path(__file__).parent / "bad-examples"
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "SAF-T-AO_5417272795_01092025_000000_30092025_235959.xml.zip",
+        "5000174645_1_20250901_000000_20250930_235959_20251105103057 "
+        "(aprovado - Loja 1 - heather).xml",
+        "5000174645_2_20250901_000000_20250930_235959_20251103174715_v.02  "
+        "(recusado - Loja 2 - heather).xml",
+    ],
+)
+def test_stream_matches_dom_on_recovered_samples(name):
+    xml_path = BAD_EXAMPLES / name
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    dom = _RowLogger()
+    expected = _validate_dom(xml_path, xsd_path, dom)
+
+    assert any(row[0] == "XML_PARSE_RECOVER_OK" for row in dom.rows)
+    assert expected[0] is False
+    for xsd_on_parse in (False, True):
+        stream = _RowLogger()
+        outcome = _validate_stream(
+            xml_path, xsd_path, stream, xsd_on_parse=xsd_on_parse
+        )
+        assert outcome == expected
+        assert stream.rows == dom.rows
+
+
+def test_stream_reports_missing_children_of_truncated_file(tmp_path):
+    xml_path = tmp_path / "truncated.xml"
+    _write_multi_invoice_xml(xml_path)
+    text = xml_path.read_text(encoding="utf-8")
+    xml_path.write_text(text[: text.index("<MasterFiles>")], encoding="utf-8")
+    xsd_path = load_schema("SAFTAO1.01_01.xsd")
+    dom = _RowLogger()
+    expected = _validate_dom(xml_path, xsd_path, dom)
+
+    assert expected[0] is False
+    for xsd_on_parse in (False, True):
+        stream = _RowLogger()
+        outcome = _validate_stream(
+            xml_path, xsd_path, stream, xsd_on_parse=xsd_on_parse
+        )
+        assert outcome == expected
+        assert stream.rows == dom.rows
+        assert any(
+            row[0] == "XSD_ERROR" and "Missing child element(s)" in row[1]
+            for row in stream.rows
+        )
@@ -1,12 +1,35 @@
+import gzip
+from io import BytesIO
 from pathlib import Path
 
 import pytest
+from lxml import etree
 
 from saftao.autofix.workdocument_balance import (
+    WorkDocumentBalanceReader,
+    open_balanced_xml,
     repair_workdocument_balance,
     repair_workdocument_balance_in_file,
 )
 
+UNBALANCED = (
+    "<AuditFile>\n"
+    "  <SourceDocuments>\n"
+    "    <WorkingDocuments>\n"
+    "      <WorkDocument>\n"
+    "        <DocumentNumber>1</DocumentNumber>\n"
+    "      </WorkDocument>\n"
+    "      </WorkDocument>\n"
+    "      <WorkDocument>\n"
+    "        <DocumentNumber>2</DocumentNumber>\n"
+    "      <WorkDocument>\n"
+    "        <DocumentNumber>3</DocumentNumber>\n"
+    "      </WorkDocument>\n"
+    "    </WorkingDocuments>\n"
+    "  </SourceDocuments>\n"
+    "</AuditFile>\n"
+)
+
 
 def test_repair_inserts_missing_closing_between_documents(tmp_path: Path) -> None:
     xml = (
@@ -90,3 +113,34 @@ def test_repair_handles_cp1252_input(tmp_path: Path) -> None:
     assert text.count("<WorkDocument>") == 1
     assert text.count("</WorkDocument>") == 1
     assert "Ç" in text
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 16])
+def test_reader_matches_text_repair_for_any_chunk_size(chunk_size: int) -> None:
+    reader = WorkDocumentBalanceReader(
+        BytesIO(UNBALANCED.encode()), chunk_size=chunk_size
+    )
+    data = b"".join(iter(lambda: reader.read(5), b""))
+
+    assert data.decode() == repair_workdocument_balance(UNBALANCED)[0]
+    assert reader.changed is True and reader.closed
+
+
+def test_reader_closes_open_documents_and_keeps_the_encoding(tmp_path: Path) -> None:
+    xml = (
+        "<?xml version='1.0' encoding='ISO-8859-1'?>\n"
+        "<WorkingDocuments>\n"
+        "  <WorkDocument>Ç</WorkDocument>\n"
+        "  <WorkDocument><DocumentNumber>2</DocumentNumber>\n"
+        "</WorkingDocuments>\n"
+    )
+    path = tmp_path / "legacy.xml.gz"
+    path.write_bytes(gzip.compress(xml.encode("cp1252")))
+
+    reader = open_balanced_xml(path)
+    root = etree.parse(reader).getroot()
+
+    assert reader.changed is True
+    assert [len(document) for document in root] == [0, 1]
+    assert root[0].text == "Ç"
+    assert gzip.decompress(path.read_bytes()) == xml.encode("cp1252")